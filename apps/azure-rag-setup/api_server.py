@@ -5,6 +5,9 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from query_interface import M365SearchInterface
 from config_elasticsearch import Config
+from utils.cooccurrence_matrix import CooccurrenceService
+from utils.bulk_indexer import BulkIndexer
+from utils.elasticsearch_graph_builder import ElasticsearchGraphBuilder
 import logging
 
 logging.basicConfig(level=Config.LOG_LEVEL)
@@ -15,6 +18,21 @@ CORS(app)
 
 search = M365SearchInterface()
 
+# Entity co-occurrence counts kept in memory and refreshed in the background
+cooccurrence = CooccurrenceService(
+    search.es, search.index_name,
+    refresh_seconds=Config.COOCCURRENCE_REFRESH_SECONDS,
+    rebuild_seconds=Config.COOCCURRENCE_REBUILD_SECONDS
+)
+if Config.COOCCURRENCE_ENABLED:
+    cooccurrence.start()
+
+# Entity networks come from the matrix once it is built, from aggregations until then
+graph_builder = ElasticsearchGraphBuilder(BulkIndexer(pipelined=False), cooccurrence)
+
+def _clamp(value: int, low: int, high: int) -> int:
+    return max(low, min(value, high))
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -190,7 +208,8 @@ def entity_search_endpoint():
             "results": formatted_results,
             "total": len(formatted_results),
             "entity_searched": entity_value,
-            "entity_type": entity_type
+            "entity_type": entity_type,
+            "related_entities": cooccurrence.neighbors(entity_value, 5)
         })
 
     except Exception as e:
@@ -233,6 +252,83 @@ def relationship_search_endpoint(doc_id):
             "error": str(e)
         }), 500
 
+@app.route('/documents/<doc_id>/similar', methods=['GET'])
+def similar_documents_endpoint(doc_id):
+    """Documents sharing entities or topics with a document"""
+    try:
+        limit = _clamp(request.args.get('limit', 10, type=int), 1, 100)
+
+        results = graph_builder.find_similar_documents(doc_id, limit)
+
+        return jsonify({
+            "success": True,
+            "results": [{
+                "doc_id": r['doc_id'],
+                "title": r.get('title'),
+                "source": r.get('source_type'),
+                "score": r['similarity_score'],
+                "topics": r.get('topics', [])
+            } for r in results],
+            "total": len(results),
+            "source_doc_id": doc_id
+        })
+
+    except Exception as e:
+        logger.error(f"Similar documents error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/entities/<path:entity>/neighbors', methods=['GET'])
+def entity_neighbors_endpoint(entity):
+    """Entities that most often appear in the same documents (from memory)"""
+    try:
+        k = _clamp(request.args.get('k', 10, type=int), 1, Config.COOCCURRENCE_MAX_NEIGHBORS)
+
+        if not cooccurrence.ready:
+            return jsonify({
+                "success": False,
+                "error": "Co-occurrence matrix is still being built"
+            }), 503
+
+        return jsonify({
+            "success": True,
+            "entity": entity,
+            "frequency": cooccurrence.get_frequency(entity),
+            "neighbors": cooccurrence.neighbors(entity, k)
+        })
+
+    except Exception as e:
+        logger.error(f"Entity neighbors error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/entities/<path:entity>/network', methods=['GET'])
+def entity_network_endpoint(entity):
+    """Entities reachable through co-occurrence within a few hops"""
+    try:
+        depth = _clamp(request.args.get('depth', 2, type=int), 1, 3)
+        max_neighbors = _clamp(request.args.get('max_neighbors', 20, type=int), 1,
+                               Config.COOCCURRENCE_MAX_NEIGHBORS)
+
+        network = graph_builder.get_entity_network(entity, depth, max_neighbors)
+
+        return jsonify({
+            "success": bool(network),
+            "from_matrix": cooccurrence.ready,
+            **network
+        })
+
+    except Exception as e:
+        logger.error(f"Entity network error: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 @app.route('/stats', methods=['GET'])
 def stats_endpoint():
     """Get index statistics"""
@@ -396,6 +492,9 @@ if __name__ == '__main__':
     print("  POST /search/multimodal   - Multimodal content search")
     print("  POST /search/entity       - Entity-based search")
     print("  GET  /search/relationships/<doc_id> - Document relationships")
+    print("  GET  /entities/<entity>/neighbors   - Co-occurring entities")
+    print("  GET  /entities/<entity>/network     - Co-occurrence network")
+    print("  GET  /documents/<doc_id>/similar    - Documents with shared entities/topics")
     print("  GET  /stats               - Index statistics")
     print("  GET  /recent              - Recent documents")
     print("  GET  /enhanced            - Enhanced documents")
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Storage Codec Benchmark
+Compression ratio and encode/decode speed of the storage codec on our record
+types (Teams messages, calendar events, contacts), per record and as bundles
+
+Usage:
+    python3 benchmark_storage_codec.py                        # synthetic records
+    python3 benchmark_storage_codec.py --samples ./exports    # real .json/.ndjson exports
+    python3 benchmark_storage_codec.py --train codec_dictionaries/m365-records.zdict
+"""
+
+# Standard library imports
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Any
+
+# Local application imports
+from storage_codec import ZSTD_AVAILABLE, train_dictionary
+
+if ZSTD_AVAILABLE:
+    import zstandard as zstd
+
+WORDS = (
+    "project meeting review budget quarterly report deadline client proposal draft "
+    "contract invoice team update schedule follow-up action items agenda notes "
+    "migration sharepoint onedrive teams calendar release roadmap customer feedback "
+    "design approval legal finance marketing sales support incident retrospective"
+).split()
+NAMES = ["Alex Morgan", "Sam Lee", "Jordan Patel", "Taylor Kim", "Casey Nguyen",
+         "Riley Garcia", "Jamie Chen", "Morgan Silva", "Drew Novak", "Avery Brooks"]
+
+
+def _sentence(rng: random.Random, low: int, high: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize() + '.'
+
+
+def _timestamp(rng: random.Random) -> str:
+    return (f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T"
+            f"{rng.randint(7, 19):02d}:{rng.randint(0, 59):02d}:00.000Z")
+
+
+def teams_message(rng: random.Random, i: int) -> Dict[str, Any]:
+    """Record shaped like m365_teams_indexer._compact_message"""
+    created = _timestamp(rng)
+    return {
+        'id': f"{1700000000000 + i}",
+        'reply_to_id': f"{1700000000000 + i - rng.randint(1, 5)}" if rng.random() < 0.7 else None,
+        'from': rng.choice(NAMES),
+        'created': created,
+        'modified': created,
+        'subject': _sentence(rng, 2, 5) if rng.random() < 0.1 else '',
+        'body': ' '.join(_sentence(rng, 4, 14) for _ in range(rng.randint(1, 3))),
+        'importance': 'normal',
+        'messageType': 'message',
+        'web_url': f"https://teams.microsoft.com/l/message/19:abc{i % 7}@thread.tacv2/{1700000000000 + i}"
+    }
+
+
+def calendar_event(rng: random.Random, i: int) -> Dict[str, Any]:
+    """Record shaped like m365_calendar_indexer._compact_event"""
+    start = _timestamp(rng)
+    return {
+        'id': f"AAMkAGI2TG93AAA{i:08d}" + 'A' * 100,
+        'subject': _sentence(rng, 2, 6),
+        'organizer': rng.choice(NAMES),
+        'start': start[:19] + '.0000000',
+        'end': start[:11] + f"{min(int(start[11:13]) + 1, 23):02d}" + start[13:19] + '.0000000',
+        'timeZone': 'UTC',
+        'location': rng.choice(['', 'Microsoft Teams Meeting', 'Room 4.12', 'Head office']),
+        'attendees': rng.sample(NAMES, rng.randint(1, 6)),
+        'body': ' '.join(_sentence(rng, 5, 15) for _ in range(rng.randint(0, 4))),
+        'isOnlineMeeting': rng.random() < 0.6,
+        'onlineMeetingUrl': '',
+        'isCancelled': rng.random() < 0.05,
+        'importance': 'normal',
+        'categories': rng.sample(['Blue category', 'Red category', 'Project'], rng.randint(0, 1)),
+        'seriesMasterId': None,
+        'webLink': f"https://outlook.office365.com/owa/?itemid=AAMkAGI2TG93AAA{i:08d}&exvsurl=1&path=/calendar/item"
+    }
+
+
+def contact(rng: random.Random, i: int) -> Dict[str, Any]:
+    """Record shaped like m365_contacts_indexer._compact_contact"""
+    given, surname = rng.choice(NAMES).split()
+    company = rng.choice(['Contoso', 'Fabrikam', 'Northwind Traders', 'Tailspin Toys'])
+    return {
+        'id': f"AAMkADNkNmU0ZjAwLTk{i:08d}" + 'A' * 90,
+        'displayName': f"{given} {surname}",
+        'givenName': given,
+        'surname': surname,
+        'emailAddresses': [f"{given.lower()}.{surname.lower()}@{company.split()[0].lower()}.com"],
+        'businessPhones': [f"+1 425 555 {rng.randint(1000, 9999)}"],
+        'mobilePhone': f"+1 206 555 {rng.randint(1000, 9999)}" if rng.random() < 0.5 else '',
+        'jobTitle': rng.choice(['Account Manager', 'Engineer', 'Director', 'Consultant']),
+        'companyName': company,
+        'department': rng.choice(['Sales', 'IT', 'Finance', '']),
+        'officeLocation': '',
+        'businessAddress': {'street': f"{rng.randint(1, 999)} Main St", 'city': 'Redmond',
+                            'state': 'WA', 'countryOrRegion': 'USA', 'postalCode': '98052'},
+        'categories': []
+    }
+
+
+GENERATORS: Dict[str, Callable[[random.Random, int], Dict[str, Any]]] = {
+    'teams': teams_message,
+    'calendar': calendar_event,
+    'contacts': contact
+}
+
+
+def load_samples(directory: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Records from .ndjson files and .json bundles ('items'), grouped by file stem prefix"""
+    records: Dict[str, List[Dict[str, Any]]] = {}
+    for path in sorted(Path(directory).rglob('*')):
+        if path.suffix == '.ndjson':
+            items = [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+        elif path.suffix == '.json':
+            data = json.loads(path.read_text())
+            items = data.get('items', [data]) if isinstance(data, dict) else data
+        else:
+            continue
+        records.setdefault(path.relative_to(directory).parts[0], []).extend(items)
+    return records
+
+
+def measure(payloads: List[bytes], encode: Callable[[bytes], bytes],
+            decode: Callable[[bytes], bytes], repeat: int) -> Dict[str, float]:
+    """Stored size and encode/decode throughput (MB/s of raw data)"""
+    raw_bytes = sum(len(p) for p in payloads)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        encoded = [encode(p) for p in payloads]
+    encode_seconds = (time.perf_counter() - started) / repeat
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for e in encoded:
+            decode(e)
+    decode_seconds = (time.perf_counter() - started) / repeat
+
+    return {
+        'stored_bytes': sum(len(e) for e in encoded),
+        'encode_mb_s': raw_bytes / 1e6 / encode_seconds if encode_seconds else 0,
+        'decode_mb_s': raw_bytes / 1e6 / decode_seconds if decode_seconds else 0
+    }
+
+
+def benchmark(name: str, records: List[Dict[str, Any]], repeat: int, dict_size: int):
+    """Print a comparison table for one record type"""
+    legacy = [json.dumps(r, indent=2).encode() for r in records]
+    compact = [json.dumps(r, ensure_ascii=False, separators=(',', ':')).encode() for r in records]
+    bundle = [b'\n'.join(compact) + b'\n']
+    identity = lambda data: data
+
+    # Dictionary trained on half of the records, measured on the other half
+    half = len(compact) // 2
+    dictionary = train_dictionary(compact[:half], dict_size)
+    held_out = compact[half:]
+
+    rows = [
+        ('per record, indented JSON (before)', legacy, identity, identity),
+        ('per record, compact JSON', compact, identity, identity)
+    ]
+    for level in (3, 9):
+        compressor = zstd.ZstdCompressor(level=level)
+        rows.append((f'per record, zstd-{level}', compact, compressor.compress,
+                     zstd.ZstdDecompressor().decompress))
+    dict_compressor = zstd.ZstdCompressor(level=3, dict_data=dictionary)
+    dict_decompressor = zstd.ZstdDecompressor(dict_data=dictionary)
+    rows.append(('per record, zstd-3 + dictionary*', held_out, dict_compressor.compress,
+                 dict_decompressor.decompress))
+    rows.append(('bundle NDJSON', bundle, identity, identity))
+    for level in (3, 9, 19):
+        compressor = zstd.ZstdCompressor(level=level)
+        rows.append((f'bundle NDJSON, zstd-{level}', bundle, compressor.compress,
+                     zstd.ZstdDecompressor().decompress))
+
+    baseline_per_record = sum(len(p) for p in legacy) / len(legacy)
+    print(f"\n📦 {name}: {len(records)} records, "
+          f"{baseline_per_record:.0f} bytes/record as indented JSON")
+    print(f"   {'format':38} {'bytes/record':>12} {'ratio':>7} {'enc MB/s':>9} {'dec MB/s':>9}")
+
+    for label, payloads, encode, decode in rows:
+        count = len(held_out) if payloads is held_out else len(records)
+        result = measure(payloads, encode, decode, repeat)
+        per_record = result['stored_bytes'] / count
+        speed = (f"{result['encode_mb_s']:9.0f} {result['decode_mb_s']:9.0f}"
+                 if encode is not identity else f"{'-':>9} {'-':>9}")
+        print(f"   {label:38} {per_record:12.0f} {baseline_per_record / per_record:6.1f}x {speed}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the storage codec on M365 record types')
+    parser.add_argument('--samples', help='Directory of exported .json/.ndjson records (subdirectory = type)')
+    parser.add_argument('--count', type=int, default=2000, help='Synthetic records per type')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions')
+    parser.add_argument('--dict-size', type=int, default=16 * 1024, help='Dictionary size in bytes')
+    parser.add_argument('--train', help='Write a dictionary trained on all records to this path')
+    args = parser.parse_args()
+
+    if not ZSTD_AVAILABLE:
+        print("❌ zstandard is not installed: pip install zstandard")
+        return 1
+
+    if args.samples:
+        records = load_samples(args.samples)
+    else:
+        rng = random.Random(42)
+        records = {name: [gen(rng, i) for i in range(args.count)] for name, gen in GENERATORS.items()}
+
+    for name, items in records.items():
+        if len(items) < 20:
+            print(f"⚠️  Skipping {name}: too few records to train a dictionary")
+            continue
+        benchmark(name, items, args.repeat, args.dict_size)
+
+    print("\n* dictionary trained on the first half of the records, measured on the second half")
+
+    if args.train:
+        samples = [
+            json.dumps(r, ensure_ascii=False, separators=(',', ':')).encode()
+            for items in records.values() for r in items
+        ]
+        dictionary = train_dictionary(samples, args.dict_size)
+        Path(args.train).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.train).write_bytes(dictionary.as_bytes())
+        print(f"\n✅ Dictionary {dictionary.dict_id()} written to {args.train} "
+              f"(set azure_storage.compression.dictionary to use it)")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,6 +25,15 @@ class Config:
     # RAG-Anything Configuration
     RAG_ANYTHING_ENABLED = os.getenv('RAG_ANYTHING_ENABLED', 'true').lower() == 'true'
     RAG_ANYTHING_GRAPH_ENABLED = os.getenv('RAG_ANYTHING_GRAPH_ENABLED', 'true').lower() == 'true'
+    # Enrichment process pool (utils/enrichment_executor.py); 0 or 1 enriches inline
+    ENRICHMENT_WORKERS = int(os.getenv('ENRICHMENT_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+    ENRICHMENT_BATCH_SIZE = int(os.getenv('ENRICHMENT_BATCH_SIZE', 32))
+    # In-memory entity co-occurrence matrix of the API server (utils/cooccurrence_matrix.py)
+    COOCCURRENCE_ENABLED = os.getenv('COOCCURRENCE_ENABLED', 'true').lower() == 'true'
+    COOCCURRENCE_REFRESH_SECONDS = int(os.getenv('COOCCURRENCE_REFRESH_SECONDS', 60))
+    COOCCURRENCE_REBUILD_SECONDS = int(os.getenv('COOCCURRENCE_REBUILD_SECONDS', 3600))
+    # Upper bound for k / max_neighbors on the entity endpoints
+    COOCCURRENCE_MAX_NEIGHBORS = int(os.getenv('COOCCURRENCE_MAX_NEIGHBORS', 100))
 
     # Azure AD Configuration
     AZURE_TENANT_ID = os.getenv('AZURE_TENANT_ID')
@@ -42,6 +51,16 @@ class Config:
     ENABLE_OCR = os.getenv('ENABLE_OCR', 'true').lower() == 'true'
     ENABLE_AI_ENRICHMENT = os.getenv('ENABLE_AI_ENRICHMENT', 'false').lower() == 'true'
 
+    # Bulk indexing (utils/bulk_indexer.py): batches are cut at BATCH_SIZE
+    # documents or BULK_MAX_MB; failed actions go to the spill file
+    BULK_MAX_MB = int(os.getenv('BULK_MAX_MB', 10))
+    BULK_MAX_RETRIES = int(os.getenv('BULK_MAX_RETRIES', 5))
+    BULK_SPILL_FILE = os.getenv('BULK_SPILL_FILE', 'logs/bulk_failures.jsonl')
+    # Pipelined mode: background flush threads fed through bounded queues
+    BULK_PIPELINED = os.getenv('BULK_PIPELINED', 'true').lower() == 'true'
+    BULK_THREADS = int(os.getenv('BULK_THREADS', 4))
+    BULK_QUEUE_SIZE = int(os.getenv('BULK_QUEUE_SIZE', 2))
+
     # Date Filtering
     DATE_FILTER_ENABLED = os.getenv('DATE_FILTER_ENABLED', 'false').lower() == 'true'
     DATE_FILTER_FROM = os.getenv('DATE_FILTER_FROM', '2020-01-01')
@@ -236,7 +236,10 @@ class ConfigManager:
         m365_config = self.get_m365_yaml_config()
 
         if source in m365_config:
-            extensions = m365_config[source].get('supported_extensions', [])
+            # Exchange lists its types under attachment_extensions
+            extensions = m365_config[source].get(
+                'supported_extensions', m365_config[source].get('attachment_extensions', [])
+            )
             # Add dots to extensions
             return [f'.{ext}' if not ext.startswith('.') else ext for ext in extensions]
 
@@ -292,6 +295,41 @@ class ConfigManager:
             'max_delay_seconds': retry_config.get('max_delay_seconds', 30)
         }
 
+    def get_coordinator_config(self) -> Dict[str, Any]:
+        """Get sync coordinator configuration"""
+        m365_config = self.get_m365_yaml_config()
+        coordinator_config = m365_config.get('coordinator', {})
+
+        return {
+            'backend': coordinator_config.get('backend', 'sqlite'),
+            'sqlite_path': coordinator_config.get('sqlite_path', 'sync_coordinator.db'),
+            'postgres_dsn': os.getenv('M365_COORDINATOR_DSN', os.getenv('DATABASE_URL')),
+            'workers': coordinator_config.get('workers', 4),
+            'lease_seconds': coordinator_config.get('lease_seconds', 300),
+            'renew_interval_seconds': coordinator_config.get('renew_interval_seconds', 60),
+            'max_attempts': coordinator_config.get('max_attempts', 3),
+            'unit_progress_dir': coordinator_config.get('unit_progress_dir', 'progress'),
+            'progress_interval': m365_config.get('monitoring', {}).get('progress_interval', 30)
+        }
+
+    def get_scheduler_config(self) -> Dict[str, Any]:
+        """Get priority scheduler configuration"""
+        m365_config = self.get_m365_yaml_config()
+        scheduler_config = m365_config.get('scheduler', {})
+
+        return {
+            'state_file': scheduler_config.get('state_file', 'sync_scheduler_state.json'),
+            'request_budget_per_hour': scheduler_config.get('request_budget_per_hour', 6000),
+            'min_interval_minutes': scheduler_config.get('min_interval_minutes', 15),
+            'max_interval_minutes': scheduler_config.get('max_interval_minutes', 1440),
+            'change_weight': scheduler_config.get('change_weight', 1.0),
+            'demand_weight': scheduler_config.get('demand_weight', 0.5),
+            'ema_alpha': scheduler_config.get('ema_alpha', 0.3),
+            'demand_window_days': scheduler_config.get('demand_window_days', 7),
+            'discovery_interval_hours': scheduler_config.get('discovery_interval_hours', 24),
+            'database_url': os.getenv('DATABASE_URL')
+        }
+
     def get_exclusions(self) -> Dict[str, Any]:
         """Get exclusion rules"""
         m365_config = self.get_m365_yaml_config()
@@ -3,25 +3,66 @@ Set up Elasticsearch indices and mappings for M365 data with RAG-Anything enhanc
 """
 from elasticsearch import Elasticsearch
 from config_elasticsearch import Config
+import sys
 import logging
 
 logging.basicConfig(level=Config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
-def create_index():
-    """Create Elasticsearch index with proper mappings including RAG-Anything fields"""
+# Exact-value subfield of entities.value, used by term queries and terms aggregations
+ENTITY_VALUE_MAPPING = {
+    "type": "text",
+    "fields": {
+        "keyword": {"type": "keyword", "ignore_above": 256}
+    }
+}
 
-    # Connect to Elasticsearch Cloud Cluster
+def connect() -> Elasticsearch:
+    """Connect to the Elasticsearch cluster"""
     es = Elasticsearch(
         Config.ELASTIC_HOST,
         basic_auth=(Config.ELASTIC_USERNAME, Config.ELASTIC_PASSWORD),
         verify_certs=True,
         ssl_show_warn=False
     )
-
-    # Check connection
     if not es.ping():
         raise Exception("Could not connect to Elasticsearch")
+    return es
+
+def migrate_entity_keyword(es: Elasticsearch, index: str = None) -> str:
+    """
+    Add entities.value.keyword to an existing index and backfill it
+
+    Adding a multi-field is an in-place mapping update; update_by_query then
+    re-indexes every document so existing entities get the subfield.
+    Returns the update_by_query task id.
+    """
+    index = index or Config.ELASTIC_INDEX
+    es.indices.put_mapping(index=index, body={
+        "properties": {
+            "entities": {
+                "type": "nested",
+                "properties": {"value": ENTITY_VALUE_MAPPING}
+            }
+        }
+    })
+    logger.info(f"Added entities.value.keyword to '{index}'")
+
+    response = es.update_by_query(
+        index=index,
+        query={"nested": {"path": "entities", "query": {"exists": {"field": "entities.value"}}}},
+        conflicts="proceed",
+        slices="auto",
+        wait_for_completion=False
+    )
+    logger.info(f"Backfilling entities.value.keyword (task {response['task']})")
+    return response['task']
+
+def create_index():
+    """Create Elasticsearch index with proper mappings including RAG-Anything fields"""
+
+    # Connect to Elasticsearch Cloud Cluster
+    es = connect()
 
     logger.info("Connected to Elasticsearch successfully")
 
@@ -114,7 +155,7 @@ def create_index():
                     "type": "nested",
                     "properties": {
                         "type": {"type": "keyword"},
-                        "value": {"type": "text"},
+                        "value": ENTITY_VALUE_MAPPING,
                         "confidence": {"type": "float"},
                         "position": {"type": "integer"},
                         "context": {"type": "text"}
@@ -232,6 +273,10 @@ def create_index():
             logger.info(f"Deleted existing index '{Config.ELASTIC_INDEX}'")
         else:
             logger.info("Keeping existing index")
+            mapping = es.indices.get_mapping(index=Config.ELASTIC_INDEX)
+            entities = next(iter(mapping.values()))["mappings"]["properties"].get("entities", {})
+            if "fields" not in entities.get("properties", {}).get("value", {}):
+                migrate_entity_keyword(es)
             return
 
     # Create the index
@@ -264,6 +309,10 @@ if __name__ == "__main__":
     print("="*60)
 
     try:
+        if "--migrate-entity-keyword" in sys.argv:
+            task = migrate_entity_keyword(connect())
+            print(f"\n✅ entities.value.keyword added; backfill running as task {task}")
+            sys.exit(0)
         create_index()
         print("\n✅ Setup completed successfully!")
         print("\nNext steps:")
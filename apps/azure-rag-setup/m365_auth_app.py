@@ -5,9 +5,11 @@ M365 Authentication using Application Permissions (Client Credentials Flow)
 
 import os
 from typing import Optional, Dict
-from msal import ConfidentialClientApplication
+from msal import ConfidentialClientApplication, TokenCache
 from dotenv import load_dotenv
 
+from m365_token_broker import get_token_broker
+
 class M365Auth:
     """Handle M365 authentication with application permissions"""
 
@@ -24,37 +26,36 @@ class M365Auth:
         self.authority = f"https://login.microsoftonline.com/{self.tenant_id}"
         self.scope = ["https://graph.microsoft.com/.default"]
 
-        self.app = ConfidentialClientApplication(
+        # One broker (and MSAL app) per process, shared by all M365Auth instances
+        self.broker = get_token_broker(
+            self.tenant_id, self.client_id, self.scope, self._create_token_acquirer
+        )
+
+    def _create_token_acquirer(self):
+        """Build the MSAL client credentials call used by the token broker"""
+        app = ConfidentialClientApplication(
             client_id=self.client_id,
             client_credential=self.client_secret,
             authority=self.authority
         )
 
-        self._access_token = None
+        def acquire():
+            # The broker caches tokens itself and asks for a new one ahead of
+            # expiry; drop MSAL's cached token so the request reaches Entra.
+            # search() is a generator over the cache, so collect before removing
+            for token in list(app.token_cache.search(TokenCache.CredentialType.ACCESS_TOKEN)):
+                app.token_cache.remove_at(token)
+            return app.acquire_token_for_client(scopes=self.scope)
 
-    def get_access_token(self) -> Optional[str]:
-        """Get access token using client credentials flow"""
-        result = self.app.acquire_token_silent(self.scope, account=None)
-
-        if not result:
-            result = self.app.acquire_token_for_client(scopes=self.scope)
+        return acquire
 
-        if 'access_token' in result:
-            self._access_token = result['access_token']
-            return self._access_token
-        else:
-            error = result.get('error_description', result.get('error', 'Unknown error'))
-            raise ValueError(f"Failed to acquire token: {error}")
+    def get_access_token(self) -> Optional[str]:
+        """Get access token using client credentials flow (cached by the token broker)"""
+        return self.broker.get_token()
 
     def get_graph_headers(self) -> Optional[Dict[str, str]]:
         """Get headers for Microsoft Graph API requests"""
-        token = self.get_access_token()
-        if token:
-            return {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json'
-            }
-        return None
+        return self.broker.get_graph_headers()
 
     def validate_credentials(self) -> bool:
         """Validate that all required credentials are present"""
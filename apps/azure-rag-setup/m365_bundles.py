@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Bundle Storage for Small M365 Items
+Packs many small items (Teams messages, events, contacts) into one blob per
+bundle instead of one blob per item, merging incremental changes by id
+
+Bundles are either one JSON document ('json') or newline-delimited JSON with
+one self-contained record per item ('ndjson', for the blob indexer's
+jsonLines parsing mode). Payloads go through the storage codec, so they are
+zstd-compressed when azure_storage.compression is enabled.
+"""
+
+# Standard library imports
+import json
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Any, Optional
+
+# Third-party imports
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+# Local application imports
+from storage_codec import StorageCodec
+
+
+def bundle_day(timestamp: Optional[str]) -> str:
+    """Day (YYYY-MM-DD) of a Graph timestamp, 'undated' when missing"""
+    return timestamp[:10] if timestamp and len(timestamp) >= 10 else 'undated'
+
+
+def group_by_day(items: Iterable[Dict[str, Any]], date_field: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Group items by the day of one of their timestamp fields"""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        groups.setdefault(bundle_day(item.get(date_field)), []).append(item)
+    return groups
+
+
+def safe_blob_part(value: str) -> str:
+    """Make a display name usable as a blob path segment"""
+    return value.replace('/', '_').replace(' ', '_').replace('\\', '_')
+
+
+class BlobBundleStore:
+    """
+    Read-merge-write bundles in Azure Blob Storage
+
+    A 'json' bundle is one document: header fields, a searchable 'content'
+    text rendered from the items, and the items themselves keyed by 'id'.
+    An 'ndjson' bundle has one line per item: header fields, the item and
+    its rendered 'content'.
+    """
+
+    def __init__(self, container_client, render: Callable[[Dict[str, Any]], str],
+                 sort_key: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                 fmt: str = 'json', codec: Optional[StorageCodec] = None):
+        if fmt not in ('json', 'ndjson'):
+            raise ValueError(f"Unknown bundle format: {fmt}")
+
+        self.container_client = container_client
+        self.render = render
+        self.sort_key = sort_key
+        self.fmt = fmt
+        self.codec = codec or StorageCodec.from_config()
+
+    def load(self, blob_name: str) -> Dict[str, Dict[str, Any]]:
+        """Load a bundle's items by id (empty if the bundle does not exist)"""
+        try:
+            downloader = self.container_client.get_blob_client(blob_name).download_blob()
+            raw = self.codec.decode(downloader.readall(), downloader.properties.metadata)
+        except ResourceNotFoundError:
+            return {}
+
+        if self.fmt == 'ndjson':
+            items = [json.loads(line) for line in raw.splitlines() if line.strip()]
+        else:
+            items = json.loads(raw).get('items', [])
+
+        return {item['id']: item for item in items}
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=30),
+        reraise=True
+    )
+    def merge(self, blob_name: str, changed: List[Dict[str, Any]], removed_ids: Iterable[str] = (),
+              header: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+        """
+        Apply changed and removed items to a bundle and write it back
+
+        Returns counts of items in the bundle after the merge and of items
+        added/updated/removed; an emptied bundle is deleted.
+        """
+        items = self.load(blob_name)
+        counts = {'added': 0, 'updated': 0, 'removed': 0}
+
+        for item in changed:
+            counts['updated' if item['id'] in items else 'added'] += 1
+            items[item['id']] = item
+
+        for item_id in removed_ids:
+            if items.pop(item_id, None) is not None:
+                counts['removed'] += 1
+
+        blob_client = self.container_client.get_blob_client(blob_name)
+
+        if not items:
+            try:
+                blob_client.delete_blob()
+            except ResourceNotFoundError:
+                pass
+            counts['items'] = 0
+            return counts
+
+        ordered = sorted(items.values(), key=self.sort_key) if self.sort_key else list(items.values())
+
+        if self.fmt == 'ndjson':
+            # Header fields and content are rewritten on every merge
+            data = '\n'.join(
+                json.dumps({**item, **(header or {}), 'content': self.render(item)},
+                           ensure_ascii=False, separators=(',', ':'))
+                for item in ordered
+            ) + '\n'
+            content_type = 'application/x-ndjson'
+        else:
+            document = {
+                **(header or {}),
+                'item_count': len(ordered),
+                'updated_at': datetime.now().isoformat(),
+                'content': '\n\n'.join(text for text in (self.render(item) for item in ordered) if text),
+                'items': ordered
+            }
+            data = json.dumps(document, ensure_ascii=False, separators=(',', ':'))
+            content_type = 'application/json'
+
+        payload, codec_metadata = self.codec.encode(data.encode('utf-8'), content_type)
+        blob_client.upload_blob(
+            payload,
+            overwrite=True,
+            content_settings=ContentSettings(content_type=content_type),
+            # Blob metadata must be ASCII
+            metadata={
+                **{
+                    key: str(value).encode('ascii', 'ignore').decode()
+                    for key, value in (header or {}).items() if value is not None
+                },
+                **codec_metadata
+            }
+        )
+
+        counts['items'] = len(ordered)
+        return counts
+
+
+class ElasticsearchItemSink:
+    """
+    Write items straight to Elasticsearch with bulk requests instead of bundles
+
+    Documents are keyed '<source_type>_<owner>_<item id>', so changes
+    overwrite and removals delete the same document.
+    """
+
+    def __init__(self, source_type: str, to_document: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]):
+        # Imported here so blob-only runs do not need Elasticsearch settings
+        from utils.bulk_indexer import BulkIndexer
+
+        self.source_type = source_type
+        self.to_document = to_document
+        self.indexer = BulkIndexer()
+
+    def doc_id(self, owner_id: str, item_id: str) -> str:
+        return f"{self.source_type}_{owner_id}_{item_id}"
+
+    def apply(self, owner_id: str, changed: List[Dict[str, Any]], removed_ids: Iterable[str] = (),
+              header: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+        """Queue changed items for indexing and removed ones for deletion"""
+        counts = {'added': 0, 'updated': 0, 'removed': 0}
+
+        for item in changed:
+            doc_id = self.doc_id(owner_id, item['id'])
+            document = {
+                'id': doc_id,
+                'source_type': self.source_type,
+                'source_id': item['id'],
+                **self.to_document(item, header or {})
+            }
+            self.indexer.add_document(doc_id, document)
+            counts['updated'] += 1
+
+        for item_id in removed_ids:
+            self.indexer.delete_document(self.doc_id(owner_id, item_id))
+            counts['removed'] += 1
+
+        return counts
+
+    def flush(self):
+        self.indexer.flush()
@@ -2,46 +2,72 @@
 """
 Microsoft Calendar Indexer
 Index calendar events and meetings for all users
+
+Events are read incrementally with calendarView/delta and written per user,
+either as one NDJSON bundle in Azure Blob Storage or straight into
+Elasticsearch with bulk requests (calendar.sink in m365_config.yaml)
 """
 
 # Standard library imports
 import os
+import re
 import json
-import time
+import html
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
 # Third-party imports
-import requests
 from azure.storage.blob import BlobServiceClient
-from tenacity import retry, stop_after_attempt, wait_exponential
 from tqdm import tqdm
 
 # Local application imports
 from config_manager import get_config_manager
 from logger import setup_logging
 from m365_auth import M365Auth
+from m365_bundles import BlobBundleStore, ElasticsearchItemSink, safe_blob_part
+from m365_throttle import get_throttle
+
+GRAPH_BASE = 'https://graph.microsoft.com/v1.0'
 
 class CalendarIndexer:
-    """Index Microsoft Calendar data to Azure Blob Storage"""
+    """Index Microsoft Calendar data to Azure Blob Storage or Elasticsearch"""
 
-    def __init__(self, progress_file: str = "calendar_progress.json"):
+    def __init__(self, progress_file: str = None, sink: str = None):
+        self.config = get_config_manager()
         self.logger = setup_logging('calendar-indexer', level='INFO')
         self.auth = M365Auth()
-        self.progress_file = Path(progress_file)
+        self.throttle = get_throttle('calendar')
+        self.progress_file = Path(progress_file or self.config.get_progress_file('calendar'))
         self.progress = self._load_progress()
 
-        # Azure Blob Storage setup
-        self.connection_string = self._get_connection_string()
-        self.blob_service = BlobServiceClient.from_connection_string(self.connection_string)
-        self.container_client = self.blob_service.get_container_client("training-data")
+        calendar_config = self.config.get_m365_yaml_config().get('calendar', {})
+        self.days_back = calendar_config.get('days_back', 90)
+        self.days_ahead = calendar_config.get('days_ahead', 180)
+        self.sink = sink or calendar_config.get('sink', 'blob')
+
+        if self.sink == 'elasticsearch':
+            self.es_sink = ElasticsearchItemSink('calendar', self._to_document)
+        else:
+            # Azure Blob Storage setup
+            self.es_sink = None
+            self.connection_string = self._get_connection_string()
+            self.blob_service = BlobServiceClient.from_connection_string(self.connection_string)
+            self.container_client = self.blob_service.get_container_client("training-data")
+            self.bundles = BlobBundleStore(
+                self.container_client,
+                render=self._render_event,
+                sort_key=lambda event: event.get('start') or '',
+                fmt='ndjson'
+            )
 
         # Statistics
         self.stats = {
             'users_processed': 0,
             'events_processed': 0,
             'events_uploaded': 0,
+            'events_removed': 0,
+            'bundles_written': 0,
             'errors': 0,
             'start_time': datetime.now()
         }
@@ -79,71 +105,153 @@ class CalendarIndexer:
 
         return f"DefaultEndpointsProtocol=https;AccountName={account_name};AccountKey={account_key};EndpointSuffix=core.windows.net"
 
-    def get_user_calendar_events(self, user_id: str, days_back: int = 90) -> List[Dict[str, Any]]:
-        """Get calendar events for a user"""
+    def _new_window(self, user_progress: Dict[str, Any], days_back: int):
+        """Start a fresh delta round over the current window"""
+        now = datetime.now(timezone.utc)
+        user_progress.pop('delta_link', None)
+        user_progress['window_start'] = (now - timedelta(days=days_back)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        user_progress['window_end'] = (now + timedelta(days=self.days_ahead)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def get_user_calendar_events(self, user_id: str, days_back: int = None,
+                                 user_progress: Dict[str, Any] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Get events changed since the last sync and ids of removed events
+
+        A delta link only covers the window it was started with, so a new
+        round starts once less than half of the look-ahead period is left.
+        A new round lists every event in the window, so events written
+        earlier (user_progress['event_ids']) that it does not return have
+        left the window and are reported as removed.
+        """
+        user_progress = user_progress if user_progress is not None else {}
         headers = self.auth.get_graph_headers()
         if not headers:
-            return []
-
-        try:
-            # Get events from last N days
-            start_date = (datetime.now() - timedelta(days=days_back)).isoformat()
-
-            response = requests.get(
-                f'https://graph.microsoft.com/v1.0/users/{user_id}/calendar/events?$top=100&$filter=start/dateTime ge \'{start_date}\'',
-                headers=headers,
-                timeout=30
-            )
-
-            if response.status_code == 200:
-                return response.json().get('value', [])
-            else:
-                return []
+            return [], []
+
+        days_back = days_back if days_back is not None else self.days_back
+        window_end = user_progress.get('window_end')
+        half_ahead = (datetime.now(timezone.utc) + timedelta(days=self.days_ahead / 2)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if not user_progress.get('delta_link') or not window_end or window_end < half_ahead:
+            self._new_window(user_progress, days_back)
+
+        new_round = not user_progress.get('delta_link')
+        url = user_progress.get('delta_link') or (
+            f"{GRAPH_BASE}/users/{user_id}/calendarView/delta"
+            f"?startDateTime={user_progress['window_start']}&endDateTime={user_progress['window_end']}"
+        )
+        delta_headers = dict(headers, Prefer='odata.maxpagesize=100')
+        changed, removed = [], []
+
+        while url:
+            response = self.throttle.get(url, headers=delta_headers)
+
+            if response.status_code == 410:
+                # Delta token expired: start the window over
+                self._new_window(user_progress, days_back)
+                return self.get_user_calendar_events(user_id, days_back, user_progress)
+
+            if response.status_code != 200:
+                raise ValueError(f'Failed to get calendar events: {response.status_code}')
+
+            data = response.json()
+            for event in data.get('value', []):
+                if '@removed' in event:
+                    removed.append(event['id'])
+                else:
+                    changed.append(event)
+
+            url = data.get('@odata.nextLink')
+            if data.get('@odata.deltaLink'):
+                user_progress['delta_link'] = data['@odata.deltaLink']
+
+        if new_round:
+            seen = {event['id'] for event in changed} | set(removed)
+            removed.extend(event_id for event_id in user_progress.get('event_ids', []) if event_id not in seen)
+
+        return changed, removed
+
+    @staticmethod
+    def _compact_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep the searchable fields of a Graph event"""
+        body = event_data.get('body', {})
+        text = body.get('content', '') or event_data.get('bodyPreview', '')
+        if body.get('contentType') == 'html':
+            text = html.unescape(re.sub(r'<[^>]+>', ' ', re.sub(r'(?is)<(style|script)[^>]*>.*?</\1>', '', text)))
+            text = re.sub(r'\s+', ' ', text).strip()
 
-        except Exception as e:
-            print(f"⚠️  Error getting calendar events: {e}")
-            return []
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
-    def _upload_event_to_blob(self, event_data: Dict[str, Any], user_name: str):
-        """Upload calendar event to blob storage"""
-        event_id = event_data.get('id', 'unknown')
-
-        # Create a searchable document from the event
-        content = {
-            'user': user_name,
-            'subject': event_data.get('subject', 'No Subject'),
-            'organizer': event_data.get('organizer', {}).get('emailAddress', {}).get('name', 'Unknown'),
-            'start': event_data.get('start', {}).get('dateTime', ''),
-            'end': event_data.get('end', {}).get('dateTime', ''),
-            'location': event_data.get('location', {}).get('displayName', ''),
+        return {
+            'id': event_data.get('id'),
+            'subject': event_data.get('subject') or 'No Subject',
+            'organizer': (event_data.get('organizer') or {}).get('emailAddress', {}).get('name', 'Unknown'),
+            'start': (event_data.get('start') or {}).get('dateTime', ''),
+            'end': (event_data.get('end') or {}).get('dateTime', ''),
+            'timeZone': (event_data.get('start') or {}).get('timeZone', ''),
+            'location': (event_data.get('location') or {}).get('displayName', ''),
             'attendees': [att.get('emailAddress', {}).get('name', '') for att in event_data.get('attendees', [])],
-            'body': event_data.get('body', {}).get('content', ''),
+            'body': text,
             'isOnlineMeeting': event_data.get('isOnlineMeeting', False),
-            'onlineMeetingUrl': event_data.get('onlineMeetingUrl', ''),
+            'onlineMeetingUrl': event_data.get('onlineMeetingUrl') or '',
+            'isCancelled': event_data.get('isCancelled', False),
             'importance': event_data.get('importance', 'normal'),
-            'categories': event_data.get('categories', [])
+            'categories': event_data.get('categories', []),
+            'seriesMasterId': event_data.get('seriesMasterId'),
+            'webLink': event_data.get('webLink')
+        }
+
+    @staticmethod
+    def _render_event(event: Dict[str, Any]) -> str:
+        """Render an event as searchable text"""
+        lines = [
+            f"{event.get('subject', 'No Subject')}{' (cancelled)' if event.get('isCancelled') else ''}",
+            f"When: {event.get('start', '')[:16]} - {event.get('end', '')[:16]} {event.get('timeZone', '')}".rstrip(),
+            f"Organizer: {event.get('organizer', 'Unknown')}"
+        ]
+        if event.get('location'):
+            lines.append(f"Location: {event['location']}")
+        if event.get('attendees'):
+            lines.append(f"Attendees: {', '.join(name for name in event['attendees'] if name)}")
+        if event.get('body'):
+            lines.append(event['body'])
+        return '\n'.join(lines)
+
+    def _to_document(self, event: Dict[str, Any], header: Dict[str, Any]) -> Dict[str, Any]:
+        """Elasticsearch document for an event"""
+        return {
+            'title': event.get('subject', ''),
+            'content': self._render_event(event),
+            'user': header.get('user'),
+            'organizer': event.get('organizer'),
+            'attendees': event.get('attendees', []),
+            'location': event.get('location'),
+            'start': event.get('start'),
+            'end': event.get('end'),
+            'categories': event.get('categories', []),
+            'web_url': event.get('webLink'),
+            'created_date': event.get('start') or None,
+            'processing_status': 'completed'
         }
 
-        # Create blob name
-        safe_user = user_name.replace('/', '_').replace(' ', '_')
-        blob_name = f"calendar/{safe_user}/{event_id}.json"
+    @staticmethod
+    def _bundle_name(user_name: str) -> str:
+        return f"calendar/{safe_blob_part(user_name)}/events.ndjson"
 
-        # Upload to blob storage
-        blob_client = self.container_client.get_blob_client(blob_name)
-        blob_client.upload_blob(
-            json.dumps(content, indent=2),
-            overwrite=True,
-            content_type='application/json'
-        )
+    def _write_events(self, user_id: str, user_name: str, changed: List[Dict[str, Any]],
+                      removed_ids: List[str]):
+        """Apply changed and removed events to the user's bundle or the search index"""
+        header = {'source': 'calendar', 'user': user_name}
 
-        self.stats['events_uploaded'] += 1
+        if self.es_sink:
+            counts = self.es_sink.apply(user_id, changed, removed_ids, header)
+            # Flushed per user so the saved delta link never runs ahead of the index
+            self.es_sink.flush()
+        else:
+            counts = self.bundles.merge(self._bundle_name(user_name), changed, removed_ids, header)
+            self.stats['bundles_written'] += 1
 
-    def index_user(self, user_id: str, user_name: str, days_back: int = 90) -> Dict[str, Any]:
+        self.stats['events_uploaded'] += counts['added'] + counts['updated']
+        self.stats['events_removed'] += counts['removed']
+
+    def index_user(self, user_id: str, user_name: str, days_back: int = None) -> Dict[str, Any]:
         """Index calendar events for a user"""
         result = {
             'user_id': user_id,
@@ -152,56 +260,71 @@ class CalendarIndexer:
             'errors': 0
         }
 
+        user_progress = self.progress['users'].setdefault(user_id, {})
+        previous = dict(user_progress)
+
         try:
-            # Get calendar events
-            events = self.get_user_calendar_events(user_id, days_back)
-
-            for event in events:
-                try:
-                    self._upload_event_to_blob(event, user_name)
-                    result['events'] += 1
-                    self.stats['events_processed'] += 1
-                except Exception as e:
-                    result['errors'] += 1
-                    self.stats['errors'] += 1
+            if 'event_ids' not in user_progress and not self.es_sink:
+                # Progress from before event ids were tracked: take them from the bundle
+                user_progress['event_ids'] = sorted(self.bundles.load(self._bundle_name(user_name)))
 
+            # Get changed calendar events
+            events, removed_ids = self.get_user_calendar_events(user_id, days_back, user_progress)
+            changed = [self._compact_event(event) for event in events]
+
+            if changed or removed_ids:
+                self._write_events(user_id, user_name, changed, removed_ids)
+
+            result['events'] = len(changed)
+            self.stats['events_processed'] += len(changed)
             self.stats['users_processed'] += 1
 
-            # Update progress
-            self.progress['users'][user_id] = {
+            # Update progress (the delta link is only kept once the changes are written)
+            user_progress.update({
                 'name': user_name,
+                'event_ids': sorted(
+                    ({event['id'] for event in changed} | set(user_progress.get('event_ids', []))) - set(removed_ids)
+                ),
                 'last_sync': datetime.now().isoformat(),
-                'events': result['events']
-            }
+                'events': previous.get('events', 0) + len(changed)
+            })
             self._save_progress()
 
         except Exception as e:
             print(f"❌ Error processing user {user_name}: {e}")
+            self.progress['users'][user_id] = previous
             result['errors'] += 1
+            self.stats['errors'] += 1
 
         return result
 
-    def index_all_users(self, days_back: int = 90, limit: int = None) -> Dict[str, Any]:
-        """Index calendar events for all users"""
-        print("🚀 Starting Calendar indexing for all users...")
-
+    def _get_users(self) -> List[Dict[str, Any]]:
+        """Get all users (following @odata.nextLink)"""
         headers = self.auth.get_graph_headers()
         if not headers:
-            return {'error': 'Authentication failed'}
+            raise ValueError('Authentication failed')
 
-        try:
-            # Get all users
-            users_response = requests.get(
-                'https://graph.microsoft.com/v1.0/users?$select=id,displayName,userPrincipalName',
-                headers=headers,
-                timeout=30
-            )
+        url = f'{GRAPH_BASE}/users?$select=id,displayName,userPrincipalName&$top=999'
+        users = []
 
-            if users_response.status_code != 200:
-                return {'error': f'Failed to get users: {users_response.status_code}'}
+        while url:
+            response = self.throttle.get(url, headers=headers)
+            if response.status_code != 200:
+                raise ValueError(f'Failed to get users: {response.status_code}')
 
-            users_data = users_response.json()
-            users = users_data.get('value', [])
+            data = response.json()
+            users.extend(data.get('value', []))
+            url = data.get('@odata.nextLink')
+
+        return users
+
+    def index_all_users(self, days_back: int = None, limit: int = None) -> Dict[str, Any]:
+        """Index calendar events for all users"""
+        print("🚀 Starting Calendar indexing for all users...")
+
+        try:
+            # Get all users
+            users = self._get_users()
 
             if limit:
                 users = users[:limit]
@@ -218,7 +341,9 @@ class CalendarIndexer:
 
             # Update overall progress
             self.progress['last_sync'] = datetime.now().isoformat()
-            self.progress['total_events'] = self.stats['events_processed']
+            self.progress['total_events'] = sum(
+                user.get('events', 0) for user in self.progress['users'].values()
+            )
             self._save_progress()
 
             return {
@@ -226,6 +351,8 @@ class CalendarIndexer:
                 'users_processed': self.stats['users_processed'],
                 'events_processed': self.stats['events_processed'],
                 'events_uploaded': self.stats['events_uploaded'],
+                'events_removed': self.stats['events_removed'],
+                'bundles_written': self.stats['bundles_written'],
                 'errors': self.stats['errors'],
                 'results': results
             }
@@ -244,7 +371,8 @@ class CalendarIndexer:
 
 if __name__ == "__main__":
     indexer = CalendarIndexer()
-    result = indexer.index_all_users(days_back=90)
+    result = indexer.index_all_users()
     print(f"\n✅ Calendar indexing complete!")
     print(f"   Users: {result.get('users_processed', 0)}")
     print(f"   Events: {result.get('events_processed', 0)}")
+    print(f"   Removed: {result.get('events_removed', 0)}")
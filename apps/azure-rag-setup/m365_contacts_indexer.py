@@ -2,46 +2,72 @@
 """
 Microsoft Contacts Indexer
 Index Outlook contacts for all users
+
+Contacts are read incrementally with per-folder contacts/delta and written
+per user, either as one NDJSON bundle in Azure Blob Storage or straight into
+Elasticsearch with bulk requests (contacts.sink in m365_config.yaml)
 """
 
 # Standard library imports
 import os
 import json
-import time
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
 # Third-party imports
-import requests
 from azure.storage.blob import BlobServiceClient
-from tenacity import retry, stop_after_attempt, wait_exponential
 from tqdm import tqdm
 
 # Local application imports
 from config_manager import get_config_manager
 from logger import setup_logging
 from m365_auth import M365Auth
+from m365_bundles import BlobBundleStore, ElasticsearchItemSink, safe_blob_part
+from m365_throttle import get_throttle
+
+GRAPH_BASE = 'https://graph.microsoft.com/v1.0'
+
+# Only the contact fields the indexer uses
+CONTACT_SELECT = ('id,displayName,givenName,surname,emailAddresses,businessPhones,mobilePhone,'
+                  'jobTitle,companyName,department,officeLocation,businessAddress,categories')
 
 class ContactsIndexer:
-    """Index Microsoft Outlook Contacts to Azure Blob Storage"""
+    """Index Microsoft Outlook Contacts to Azure Blob Storage or Elasticsearch"""
 
-    def __init__(self, progress_file: str = "contacts_progress.json"):
+    def __init__(self, progress_file: str = None, sink: str = None):
+        self.config = get_config_manager()
         self.logger = setup_logging('contacts-indexer', level='INFO')
         self.auth = M365Auth()
-        self.progress_file = Path(progress_file)
+        self.throttle = get_throttle('contacts')
+        self.progress_file = Path(progress_file or self.config.get_progress_file('contacts'))
         self.progress = self._load_progress()
 
-        # Azure Blob Storage setup
-        self.connection_string = self._get_connection_string()
-        self.blob_service = BlobServiceClient.from_connection_string(self.connection_string)
-        self.container_client = self.blob_service.get_container_client("training-data")
+        contacts_config = self.config.get_m365_yaml_config().get('contacts', {})
+        self.sink = sink or contacts_config.get('sink', 'blob')
+
+        if self.sink == 'elasticsearch':
+            self.es_sink = ElasticsearchItemSink('contact', self._to_document)
+        else:
+            # Azure Blob Storage setup
+            self.es_sink = None
+            self.connection_string = self._get_connection_string()
+            self.blob_service = BlobServiceClient.from_connection_string(self.connection_string)
+            self.container_client = self.blob_service.get_container_client("training-data")
+            self.bundles = BlobBundleStore(
+                self.container_client,
+                render=self._render_contact,
+                sort_key=lambda contact: (contact.get('displayName') or '').lower(),
+                fmt='ndjson'
+            )
 
         # Statistics
         self.stats = {
             'users_processed': 0,
             'contacts_processed': 0,
             'contacts_uploaded': 0,
+            'contacts_removed': 0,
+            'bundles_written': 0,
             'errors': 0,
             'start_time': datetime.now()
         }
@@ -79,68 +105,161 @@ class ContactsIndexer:
 
         return f"DefaultEndpointsProtocol=https;AccountName={account_name};AccountKey={account_key};EndpointSuffix=core.windows.net"
 
-    def get_user_contacts(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get contacts for a user"""
+    def _get_paged(self, url: str, headers: Dict[str, str]) -> List[Dict[str, Any]]:
+        """GET a collection, following @odata.nextLink"""
+        items = []
+        while url:
+            response = self.throttle.get(url, headers=headers)
+            if response.status_code != 200:
+                raise ValueError(f'Request failed: {response.status_code}')
+
+            data = response.json()
+            items.extend(data.get('value', []))
+            url = data.get('@odata.nextLink')
+
+        return items
+
+    def _get_contact_folders(self, user_id: str, headers: Dict[str, str]) -> List[str]:
+        """
+        Get the ids of a user's contact folders
+
+        Contact delta is per folder. The default folder is not listed under
+        contactFolders, so its id is taken from any contact's parentFolderId.
+        """
+        folder_ids = [folder['id'] for folder in self._get_paged(
+            f'{GRAPH_BASE}/users/{user_id}/contactFolders?$select=id&$top=100', headers
+        )]
+
+        response = self.throttle.get(
+            f'{GRAPH_BASE}/users/{user_id}/contacts?$select=parentFolderId&$top=1', headers=headers
+        )
+        if response.status_code == 200:
+            for contact in response.json().get('value', []):
+                if contact.get('parentFolderId') and contact['parentFolderId'] not in folder_ids:
+                    folder_ids.insert(0, contact['parentFolderId'])
+
+        return folder_ids
+
+    def _get_folder_delta(self, user_id: str, folder_id: str, headers: Dict[str, str],
+                          delta_links: Dict[str, str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Get contacts of one folder changed since its last delta link"""
+        url = delta_links.get(folder_id) or (
+            f'{GRAPH_BASE}/users/{user_id}/contactFolders/{folder_id}/contacts/delta?$select={CONTACT_SELECT}'
+        )
+        delta_headers = dict(headers, Prefer='odata.maxpagesize=100')
+        changed, removed = [], []
+
+        while url:
+            response = self.throttle.get(url, headers=delta_headers)
+
+            if response.status_code == 410:
+                # Delta token expired or invalid: start the folder over
+                delta_links.pop(folder_id, None)
+                return self._get_folder_delta(user_id, folder_id, headers, delta_links)
+
+            if response.status_code != 200:
+                raise ValueError(f'Failed to get contacts: {response.status_code}')
+
+            data = response.json()
+            for contact in data.get('value', []):
+                if '@removed' in contact:
+                    removed.append(contact['id'])
+                else:
+                    changed.append(contact)
+
+            url = data.get('@odata.nextLink')
+            if data.get('@odata.deltaLink'):
+                delta_links[folder_id] = data['@odata.deltaLink']
+
+        return changed, removed
+
+    def get_user_contacts(self, user_id: str, user_progress: Dict[str, Any] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Get contacts changed since the last sync and ids of removed contacts"""
+        user_progress = user_progress if user_progress is not None else {}
         headers = self.auth.get_graph_headers()
         if not headers:
-            return []
+            return [], []
 
-        try:
-            response = requests.get(
-                f'https://graph.microsoft.com/v1.0/users/{user_id}/contacts?$top=100',
-                headers=headers,
-                timeout=30
-            )
+        delta_links = user_progress.setdefault('delta_links', {})
+        changed, removed = [], []
 
-            if response.status_code == 200:
-                return response.json().get('value', [])
-            else:
-                return []
+        for folder_id in self._get_contact_folders(user_id, headers):
+            folder_changed, folder_removed = self._get_folder_delta(user_id, folder_id, headers, delta_links)
+            changed.extend(folder_changed)
+            removed.extend(folder_removed)
 
-        except Exception as e:
-            print(f"⚠️  Error getting contacts: {e}")
-            return []
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
-    def _upload_contact_to_blob(self, contact_data: Dict[str, Any], user_name: str):
-        """Upload contact to blob storage"""
-        contact_id = contact_data.get('id', 'unknown')
-
-        # Create a searchable document from the contact
-        content = {
-            'user': user_name,
-            'displayName': contact_data.get('displayName', ''),
-            'givenName': contact_data.get('givenName', ''),
-            'surname': contact_data.get('surname', ''),
+        return changed, removed
+
+    @staticmethod
+    def _compact_contact(contact_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep the searchable fields of a Graph contact"""
+        return {
+            'id': contact_data.get('id'),
+            'displayName': contact_data.get('displayName') or '',
+            'givenName': contact_data.get('givenName') or '',
+            'surname': contact_data.get('surname') or '',
             'emailAddresses': [email.get('address', '') for email in contact_data.get('emailAddresses', [])],
             'businessPhones': contact_data.get('businessPhones', []),
-            'mobilePhone': contact_data.get('mobilePhone', ''),
-            'jobTitle': contact_data.get('jobTitle', ''),
-            'companyName': contact_data.get('companyName', ''),
-            'department': contact_data.get('department', ''),
-            'officeLocation': contact_data.get('officeLocation', ''),
-            'businessAddress': contact_data.get('businessAddress', {}),
+            'mobilePhone': contact_data.get('mobilePhone') or '',
+            'jobTitle': contact_data.get('jobTitle') or '',
+            'companyName': contact_data.get('companyName') or '',
+            'department': contact_data.get('department') or '',
+            'officeLocation': contact_data.get('officeLocation') or '',
+            'businessAddress': contact_data.get('businessAddress') or {},
             'categories': contact_data.get('categories', [])
         }
 
-        # Create blob name
-        safe_user = user_name.replace('/', '_').replace(' ', '_')
-        safe_name = contact_data.get('displayName', 'unknown').replace('/', '_').replace(' ', '_')
-        blob_name = f"contacts/{safe_user}/{safe_name}_{contact_id}.json"
-
-        # Upload to blob storage
-        blob_client = self.container_client.get_blob_client(blob_name)
-        blob_client.upload_blob(
-            json.dumps(content, indent=2),
-            overwrite=True,
-            content_type='application/json'
-        )
+    @staticmethod
+    def _render_contact(contact: Dict[str, Any]) -> str:
+        """Render a contact as searchable text"""
+        role = ', '.join(part for part in (contact.get('jobTitle'), contact.get('department'),
+                                           contact.get('companyName')) if part)
+        address = ', '.join(str(value) for value in (contact.get('businessAddress') or {}).values() if value)
+        phones = [*contact.get('businessPhones', []), contact.get('mobilePhone')]
+
+        lines = [contact.get('displayName') or 'Unknown']
+        if role:
+            lines.append(role)
+        if contact.get('emailAddresses'):
+            lines.append(f"Email: {', '.join(contact['emailAddresses'])}")
+        if any(phones):
+            lines.append(f"Phone: {', '.join(phone for phone in phones if phone)}")
+        if contact.get('officeLocation'):
+            lines.append(f"Office: {contact['officeLocation']}")
+        if address:
+            lines.append(f"Address: {address}")
+        return '\n'.join(lines)
+
+    def _to_document(self, contact: Dict[str, Any], header: Dict[str, Any]) -> Dict[str, Any]:
+        """Elasticsearch document for a contact"""
+        return {
+            'title': contact.get('displayName', ''),
+            'content': self._render_contact(contact),
+            'user': header.get('user'),
+            'email_addresses': contact.get('emailAddresses', []),
+            'company': contact.get('companyName'),
+            'job_title': contact.get('jobTitle'),
+            'categories': contact.get('categories', []),
+            'processing_status': 'completed'
+        }
+
+    def _write_contacts(self, user_id: str, user_name: str, changed: List[Dict[str, Any]],
+                        removed_ids: List[str]):
+        """Apply changed and removed contacts to the user's bundle or the search index"""
+        header = {'source': 'contacts', 'user': user_name}
+
+        if self.es_sink:
+            counts = self.es_sink.apply(user_id, changed, removed_ids, header)
+            # Flushed per user so the saved delta links never run ahead of the index
+            self.es_sink.flush()
+        else:
+            counts = self.bundles.merge(
+                f"contacts/{safe_blob_part(user_name)}/contacts.ndjson", changed, removed_ids, header
+            )
+            self.stats['bundles_written'] += 1
 
-        self.stats['contacts_uploaded'] += 1
+        self.stats['contacts_uploaded'] += counts['added'] + counts['updated']
+        self.stats['contacts_removed'] += counts['removed']
 
     def index_user(self, user_id: str, user_name: str) -> Dict[str, Any]:
         """Index contacts for a user"""
@@ -151,32 +270,34 @@ class ContactsIndexer:
             'errors': 0
         }
 
+        user_progress = self.progress['users'].setdefault(user_id, {})
+        previous = json.loads(json.dumps(user_progress))
+
         try:
-            # Get contacts
-            contacts = self.get_user_contacts(user_id)
-
-            for contact in contacts:
-                try:
-                    self._upload_contact_to_blob(contact, user_name)
-                    result['contacts'] += 1
-                    self.stats['contacts_processed'] += 1
-                except Exception as e:
-                    result['errors'] += 1
-                    self.stats['errors'] += 1
+            # Get changed contacts
+            contacts, removed_ids = self.get_user_contacts(user_id, user_progress)
+            changed = [self._compact_contact(contact) for contact in contacts]
 
+            if changed or removed_ids:
+                self._write_contacts(user_id, user_name, changed, removed_ids)
+
+            result['contacts'] = len(changed)
+            self.stats['contacts_processed'] += len(changed)
             self.stats['users_processed'] += 1
 
-            # Update progress
-            self.progress['users'][user_id] = {
+            # Update progress (delta links are only kept once the changes are written)
+            user_progress.update({
                 'name': user_name,
                 'last_sync': datetime.now().isoformat(),
-                'contacts': result['contacts']
-            }
+                'contacts': previous.get('contacts', 0) + len(changed)
+            })
             self._save_progress()
 
         except Exception as e:
             print(f"❌ Error processing user {user_name}: {e}")
+            self.progress['users'][user_id] = previous
             result['errors'] += 1
+            self.stats['errors'] += 1
 
         return result
 
@@ -190,18 +311,10 @@ class ContactsIndexer:
 
         try:
             # Get all users
-            users_response = requests.get(
-                'https://graph.microsoft.com/v1.0/users?$select=id,displayName,userPrincipalName',
-                headers=headers,
-                timeout=30
+            users = self._get_paged(
+                f'{GRAPH_BASE}/users?$select=id,displayName,userPrincipalName&$top=999', headers
             )
 
-            if users_response.status_code != 200:
-                return {'error': f'Failed to get users: {users_response.status_code}'}
-
-            users_data = users_response.json()
-            users = users_data.get('value', [])
-
             if limit:
                 users = users[:limit]
 
@@ -217,7 +330,9 @@ class ContactsIndexer:
 
             # Update overall progress
             self.progress['last_sync'] = datetime.now().isoformat()
-            self.progress['total_contacts'] = self.stats['contacts_processed']
+            self.progress['total_contacts'] = sum(
+                user.get('contacts', 0) for user in self.progress['users'].values()
+            )
             self._save_progress()
 
             return {
@@ -225,6 +340,8 @@ class ContactsIndexer:
                 'users_processed': self.stats['users_processed'],
                 'contacts_processed': self.stats['contacts_processed'],
                 'contacts_uploaded': self.stats['contacts_uploaded'],
+                'contacts_removed': self.stats['contacts_removed'],
+                'bundles_written': self.stats['bundles_written'],
                 'errors': self.stats['errors'],
                 'results': results
             }
@@ -247,3 +364,4 @@ if __name__ == "__main__":
     print(f"\n✅ Contacts indexing complete!")
     print(f"   Users: {result.get('users_processed', 0)}")
     print(f"   Contacts: {result.get('contacts_processed', 0)}")
+    print(f"   Removed: {result.get('contacts_removed', 0)}")
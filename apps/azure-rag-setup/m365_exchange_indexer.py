@@ -7,8 +7,10 @@ Downloads and indexes Exchange emails and attachments for all users to Azure Blo
 # Standard library imports
 import os
 import json
-import time
+import base64
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Any, Optional
 
@@ -22,6 +24,12 @@ from tqdm import tqdm
 from config_manager import get_config_manager
 from logger import setup_logging
 from m365_auth import M365Auth
+from m365_throttle import get_throttle
+
+GRAPH_BASE = 'https://graph.microsoft.com/v1.0'
+
+# Only the message fields the indexer uses
+MESSAGE_SELECT = 'id,subject,sender,receivedDateTime,bodyPreview,hasAttachments,webLink'
 
 class ExchangeIndexer:
     """Index Exchange emails and attachments for all users to Azure Blob Storage"""
@@ -30,6 +38,7 @@ class ExchangeIndexer:
         self.config = get_config_manager()
         self.logger = setup_logging('exchange-indexer', level='INFO')
         self.auth = M365Auth()
+        self.throttle = get_throttle('exchange')
 
         # Use config manager for progress file
         self.progress_file = Path(progress_file or self.config.get_progress_file('exchange'))
@@ -45,6 +54,13 @@ class ExchangeIndexer:
         # Supported attachment file types from config
         self.supported_attachment_extensions = set(self.config.get_supported_file_extensions('exchange'))
 
+        exchange_config = self.config.get_m365_yaml_config().get('exchange', {})
+        self.attachment_workers = exchange_config.get('attachment_workers', 8)
+        self.use_delta = exchange_config.get('delta_sync', True)
+
+        # Stats and progress are updated from attachment worker threads
+        self._lock = threading.Lock()
+
         # Statistics
         self.stats = {
             'users_processed': 0,
@@ -52,6 +68,8 @@ class ExchangeIndexer:
             'attachments_found': 0,
             'attachments_uploaded': 0,
             'emails_skipped': 0,
+            # Graph requests for folder, message and attachment listings
+            'pages_fetched': 0,
             'errors': 0,
             'start_time': datetime.now()
         }
@@ -61,7 +79,10 @@ class ExchangeIndexer:
         if self.progress_file.exists():
             try:
                 with open(self.progress_file, 'r') as f:
-                    return json.load(f)
+                    progress = json.load(f)
+                # Stored as a list, used as a set
+                progress['processed_attachments'] = set(progress.get('processed_attachments', []))
+                return progress
             except Exception as e:
                 print(f"⚠️  Error loading progress: {e}")
 
@@ -69,14 +90,18 @@ class ExchangeIndexer:
             'last_sync': None,
             'users': {},
             'total_emails': 0,
-            'total_attachments': 0
+            'total_attachments': 0,
+            'processed_attachments': set()
         }
 
     def _save_progress(self):
         """Save progress tracking data"""
         try:
+            with self._lock:
+                progress = dict(self.progress)
+                progress['processed_attachments'] = sorted(self.progress.get('processed_attachments', set()))
             with open(self.progress_file, 'w') as f:
-                json.dump(self.progress, f, indent=2)
+                json.dump(progress, f, indent=2)
         except Exception as e:
             print(f"⚠️  Error saving progress: {e}")
 
@@ -119,75 +144,193 @@ class ExchangeIndexer:
             print(f"❌ Upload failed for {blob_name}: {e}")
             return False
 
+    def _email_info(self, message: Dict[str, Any], user_name: str) -> Dict[str, Any]:
+        """Extract the fields the indexer uses from a Graph message"""
+        return {
+            'id': message.get('id'),
+            'subject': message.get('subject') or 'No Subject',
+            'sender': message.get('sender', {}).get('emailAddress', {}).get('address', 'Unknown'),
+            'received': message.get('receivedDateTime'),
+            'body_preview': message.get('bodyPreview', ''),
+            'has_attachments': message.get('hasAttachments', False),
+            'web_url': message.get('webLink', ''),
+            'user_name': user_name
+        }
+
+    def _count_page(self):
+        with self._lock:
+            self.stats['pages_fetched'] += 1
+
+    def _get_mail_folders(self, user_id: str, headers: Dict[str, str]) -> List[Dict[str, Any]]:
+        """List all mail folders of a mailbox, including nested folders"""
+        folders = []
+        pending = [f'{GRAPH_BASE}/users/{user_id}/mailFolders?$select=id,displayName,childFolderCount&$top=100']
+
+        while pending:
+            url = pending.pop()
+            while url:
+                response = self.throttle.get(url, headers=headers)
+                self._count_page()
+                if response.status_code != 200:
+                    raise ValueError(f'Failed to list mail folders: {response.status_code}')
+
+                data = response.json()
+                for folder in data.get('value', []):
+                    folders.append(folder)
+                    if folder.get('childFolderCount'):
+                        pending.append(
+                            f"{GRAPH_BASE}/users/{user_id}/mailFolders/{folder['id']}/childFolders"
+                            '?$select=id,displayName,childFolderCount&$top=100'
+                        )
+
+                url = data.get('@odata.nextLink')
+
+        return folders
+
+    def _get_folder_delta(self, user_id: str, folder: Dict[str, Any], user_name: str,
+                          headers: Dict[str, str], delta_links: Dict[str, str],
+                          date_range_days: int = None) -> List[Dict[str, Any]]:
+        """
+        Get new and changed messages of one folder since its last delta link
+
+        Delta queries cannot filter on hasAttachments (only receivedDateTime),
+        so messages without attachments are filtered out here instead.
+        """
+        folder_id = folder['id']
+        url = delta_links.get(folder_id)
+
+        if not url:
+            url = f'{GRAPH_BASE}/users/{user_id}/mailFolders/{folder_id}/messages/delta?$select={MESSAGE_SELECT}'
+            if date_range_days:
+                start_date = datetime.now(timezone.utc) - timedelta(days=date_range_days)
+                url += f"&$filter=receivedDateTime ge {start_date.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+
+        delta_headers = dict(headers, Prefer='odata.maxpagesize=100')
+        emails = []
+
+        while url:
+            response = self.throttle.get(url, headers=delta_headers)
+            self._count_page()
+
+            if response.status_code == 410:
+                # Delta token expired or invalid: start the folder over
+                print(f"   ⚠️  Delta token expired for {folder.get('displayName')}, resyncing folder")
+                delta_links.pop(folder_id, None)
+                return self._get_folder_delta(user_id, folder, user_name, headers, delta_links, date_range_days)
+
+            if response.status_code != 200:
+                raise ValueError(f"Failed to get messages in {folder.get('displayName')}: {response.status_code}")
+
+            data = response.json()
+            for message in data.get('value', []):
+                if '@removed' in message:
+                    continue
+                with self._lock:
+                    self.stats['emails_found'] += 1
+                if message.get('hasAttachments'):
+                    emails.append(self._email_info(message, user_name))
+
+            url = data.get('@odata.nextLink')
+            if data.get('@odata.deltaLink'):
+                delta_links[folder_id] = data['@odata.deltaLink']
+
+        return emails
+
     def _get_user_emails(self, user_id: str, user_name: str, date_range_days: int = None) -> List[Dict[str, Any]]:
-        """Get emails from a user's mailbox"""
+        """
+        Get emails with attachments from a user's mailbox
+
+        Uses per-folder delta queries (only changes since the last run) when
+        delta sync is enabled, otherwise a filtered listing of all messages.
+        """
         headers = self.auth.get_graph_headers()
         if not headers:
             return []
 
-        emails = []
+        print(f"   📧 Processing emails for: {user_name}")
+
+        if not self.use_delta:
+            return self._get_filtered_emails(user_id, user_name, headers, date_range_days)
+
+        user_progress = self.progress['users'].setdefault(user_id, {'name': user_name})
+        delta_links = user_progress.setdefault('delta_links', {})
+        emails = list(user_progress.get('retry_emails', []))
 
         try:
-            # Build date filter if specified
-            date_filter = ""
-            if date_range_days:
-                start_date = datetime.now() - timedelta(days=date_range_days)
-                date_filter = f"&$filter=receivedDateTime ge {start_date.isoformat()}Z"
+            folders = self._get_mail_folders(user_id, headers)
+        except Exception as e:
+            print(f"❌ Error processing emails for {user_name}: {e}")
+            with self._lock:
+                self.stats['errors'] += 1
+            return []
 
-            # Get messages from inbox and other folders
-            messages_url = f'https://graph.microsoft.com/v1.0/users/{user_id}/messages?$top=1000{date_filter}'
+        for folder in folders:
+            try:
+                emails.extend(self._get_folder_delta(
+                    user_id, folder, user_name, headers, delta_links, date_range_days
+                ))
+            except Exception as e:
+                # The folder keeps its previous delta link and is retried next run
+                print(f"❌ Error processing folder {folder.get('displayName')} for {user_name}: {e}")
+                with self._lock:
+                    self.stats['errors'] += 1
 
-            print(f"   📧 Processing emails for: {user_name}")
+        return emails
+
+    def _get_filtered_emails(self, user_id: str, user_name: str, headers: Dict[str, str],
+                             date_range_days: int = None) -> List[Dict[str, Any]]:
+        """List all messages with attachments (server-side filter, no delta state)"""
+        filters = ['hasAttachments eq true']
+        if date_range_days:
+            start_date = datetime.now(timezone.utc) - timedelta(days=date_range_days)
+            filters.append(f"receivedDateTime ge {start_date.strftime('%Y-%m-%dT%H:%M:%SZ')}")
 
-            while messages_url:
-                response = requests.get(messages_url, headers=headers, timeout=30)
+        url = (f"{GRAPH_BASE}/users/{user_id}/messages"
+               f"?$select={MESSAGE_SELECT}&$top=1000&$filter={' and '.join(filters)}")
+        emails = []
+
+        try:
+            while url:
+                response = self.throttle.get(url, headers=headers)
+                self._count_page()
 
                 if response.status_code != 200:
                     print(f"⚠️  Failed to get emails for {user_name}: {response.status_code}")
                     break
 
                 data = response.json()
-                messages = data.get('value', [])
-
-                for message in messages:
-                    email_info = {
-                        'id': message.get('id'),
-                        'subject': message.get('subject', 'No Subject'),
-                        'sender': message.get('sender', {}).get('emailAddress', {}).get('address', 'Unknown'),
-                        'received': message.get('receivedDateTime'),
-                        'body_preview': message.get('bodyPreview', ''),
-                        'has_attachments': message.get('hasAttachments', False),
-                        'web_url': message.get('webLink', ''),
-                        'user_name': user_name
-                    }
-                    emails.append(email_info)
+                for message in data.get('value', []):
+                    emails.append(self._email_info(message, user_name))
 
-                # Get next page URL
-                messages_url = data.get('@odata.nextLink')
-                if messages_url:
-                    time.sleep(0.5)  # Rate limiting
+                url = data.get('@odata.nextLink')
 
         except Exception as e:
             print(f"❌ Error processing emails for {user_name}: {e}")
-            self.stats['errors'] += 1
+            with self._lock:
+                self.stats['errors'] += 1
 
+        with self._lock:
+            self.stats['emails_found'] += len(emails)
         return emails
 
-    def _get_email_attachments(self, user_id: str, message_id: str, user_name: str, subject: str) -> List[Dict[str, Any]]:
-        """Get attachments from a specific email"""
+    def _get_email_attachments(self, user_id: str, message_id: str, user_name: str,
+                               subject: str) -> Optional[List[Dict[str, Any]]]:
+        """Get attachments from a specific email (None if they could not be fetched)"""
         headers = self.auth.get_graph_headers()
         if not headers:
-            return []
+            return None
 
         attachments = []
 
         try:
             # Get attachments for this message
-            attachments_url = f'https://graph.microsoft.com/v1.0/users/{user_id}/messages/{message_id}/attachments'
-            response = requests.get(attachments_url, headers=headers, timeout=30)
+            attachments_url = f'{GRAPH_BASE}/users/{user_id}/messages/{message_id}/attachments'
+            response = self.throttle.get(attachments_url, headers=headers)
+            self._count_page()
 
             if response.status_code != 200:
-                return []
+                print(f"⚠️  Failed to get attachments for {subject}: {response.status_code}")
+                return None
 
             data = response.json()
             attachment_items = data.get('value', [])
@@ -210,9 +353,21 @@ class ExchangeIndexer:
 
         except Exception as e:
             print(f"⚠️  Error getting attachments for {subject}: {e}")
+            return None
 
         return attachments
 
+    def _process_email_attachments(self, user_id: str, email: Dict[str, Any]) -> Dict[str, int]:
+        """Fetch and upload the attachments of one email (runs in a worker thread)"""
+        attachments = self._get_email_attachments(user_id, email['id'], email['user_name'], email['subject'])
+        if attachments is None:
+            with self._lock:
+                self.stats['errors'] += 1
+            return {'found': 0, 'processed': 0, 'email': email, 'fetch_failed': True}
+
+        processed = sum(1 for attachment in attachments if self._process_attachment(attachment))
+        return {'found': len(attachments), 'processed': processed, 'email': email, 'fetch_failed': False}
+
     def _process_attachment(self, attachment: Dict[str, Any]) -> bool:
         """Process a single attachment (upload to blob storage)"""
         try:
@@ -228,7 +383,8 @@ class ExchangeIndexer:
 
             # Check if already processed
             if self._is_attachment_processed(attachment['id']):
-                self.stats['emails_skipped'] += 1
+                with self._lock:
+                    self.stats['emails_skipped'] += 1
                 return True
 
             # Get attachment content
@@ -238,7 +394,6 @@ class ExchangeIndexer:
                 return False
 
             # Decode base64 content
-            import base64
             content = base64.b64decode(content_bytes)
 
             print(f"   📎 Processing attachment: {filename}")
@@ -258,15 +413,18 @@ class ExchangeIndexer:
             # Upload to blob storage
             if self._upload_to_blob(content, blob_name, metadata):
                 self._mark_attachment_processed(attachment['id'])
-                self.stats['attachments_uploaded'] += 1
+                with self._lock:
+                    self.stats['attachments_uploaded'] += 1
                 return True
             else:
-                self.stats['errors'] += 1
+                with self._lock:
+                    self.stats['errors'] += 1
                 return False
 
         except Exception as e:
             print(f"❌ Error processing attachment {attachment.get('name', 'unknown')}: {e}")
-            self.stats['errors'] += 1
+            with self._lock:
+                self.stats['errors'] += 1
             return False
 
     def _is_attachment_processed(self, attachment_id: str) -> bool:
@@ -275,9 +433,8 @@ class ExchangeIndexer:
 
     def _mark_attachment_processed(self, attachment_id: str):
         """Mark attachment as processed"""
-        if 'processed_attachments' not in self.progress:
-            self.progress['processed_attachments'] = set()
-        self.progress['processed_attachments'].add(attachment_id)
+        with self._lock:
+            self.progress.setdefault('processed_attachments', set()).add(attachment_id)
 
     def index_user(self, user_id: str, user_name: str, date_range_days: int = None) -> Dict[str, Any]:
         """Index emails and attachments from a specific user's mailbox"""
@@ -287,37 +444,40 @@ class ExchangeIndexer:
         emails = self._get_user_emails(user_id, user_name, date_range_days)
 
         if not emails:
-            print(f"   ℹ️  No emails found for {user_name}")
+            print(f"   ℹ️  No new emails with attachments for {user_name}")
+            # Still persist delta links so the next run starts from here
+            self._save_progress()
             return {'success': True, 'emails': 0, 'attachments': 0}
 
-        print(f"   📊 Found {len(emails)} emails")
+        print(f"   📊 Found {len(emails)} emails with attachments")
 
-        # Process emails and their attachments
+        # Fetch attachments of many emails at once; the throttle keeps the request rate
         processed_attachments = 0
         total_attachments = 0
-
-        for email in tqdm(emails, desc=f"Processing {user_name}"):
-            if email.get('has_attachments'):
-                attachments = self._get_email_attachments(
-                    user_id,
-                    email['id'],
-                    user_name,
-                    email['subject']
-                )
-                total_attachments += len(attachments)
-
-                for attachment in attachments:
-                    if self._process_attachment(attachment):
-                        processed_attachments += 1
-
-        # Update progress
-        self.progress['users'][user_id] = {
+        failed_emails = []
+
+        with ThreadPoolExecutor(max_workers=self.attachment_workers) as executor:
+            futures = [
+                executor.submit(self._process_email_attachments, user_id, email)
+                for email in emails if email.get('has_attachments')
+            ]
+            for future in tqdm(as_completed(futures), total=len(futures), desc=f"Processing {user_name}"):
+                counts = future.result()
+                total_attachments += counts['found']
+                processed_attachments += counts['processed']
+                if counts['fetch_failed'] or counts['processed'] < counts['found']:
+                    failed_emails.append(counts['email'])
+
+        # Update progress (delta links were stored by _get_user_emails)
+        self.progress['users'].setdefault(user_id, {}).update({
             'name': user_name,
             'last_sync': datetime.now().isoformat(),
             'emails_found': len(emails),
             'attachments_found': total_attachments,
-            'attachments_processed': processed_attachments
-        }
+            'attachments_processed': processed_attachments,
+            # Delta links have moved past these; retry them explicitly next run
+            'retry_emails': failed_emails
+        })
 
         self._save_progress()
 
@@ -332,30 +492,41 @@ class ExchangeIndexer:
             'duration': str(duration)
         }
 
-    def index_all_users(self, limit: int = None, date_range_days: int = None) -> Dict[str, Any]:
-        """Index emails and attachments from all users' mailboxes"""
-        print("🚀 Starting Exchange indexing for all users...")
-
+    def list_users(self, limit: int = None) -> List[Dict[str, Any]]:
+        """List all users in the organization, following @odata.nextLink paging"""
         headers = self.auth.get_graph_headers()
         if not headers:
-            return {'error': 'Authentication failed'}
+            raise ValueError('Authentication failed')
 
-        try:
-            # Get all users in the organization
-            users_response = requests.get(
-                'https://graph.microsoft.com/v1.0/users?$select=id,displayName,userPrincipalName',
-                headers=headers,
-                timeout=30
-            )
+        users = []
+        url = 'https://graph.microsoft.com/v1.0/users?$select=id,displayName,userPrincipalName'
+
+        while url:
+            users_response = requests.get(url, headers=headers, timeout=30)
 
             if users_response.status_code != 200:
-                return {'error': f'Failed to get users: {users_response.status_code}'}
+                raise ValueError(f'Failed to get users: {users_response.status_code}')
 
             users_data = users_response.json()
-            users = users_data.get('value', [])
+            users.extend(users_data.get('value', []))
+
+            if limit and len(users) >= limit:
+                return users[:limit]
+
+            url = users_data.get('@odata.nextLink')
 
-            if limit:
-                users = users[:limit]
+        return users
+
+    def index_all_users(self, limit: int = None, date_range_days: int = None) -> Dict[str, Any]:
+        """Index emails and attachments from all users' mailboxes"""
+        print("🚀 Starting Exchange indexing for all users...")
+
+        try:
+            # Get all users in the organization
+            try:
+                users = self.list_users(limit)
+            except ValueError as e:
+                return {'error': str(e)}
 
             print(f"📊 Found {len(users)} users")
 
@@ -372,7 +543,6 @@ class ExchangeIndexer:
                 })
 
                 self.stats['users_processed'] += 1
-                self.stats['emails_found'] += result.get('emails', 0)
                 self.stats['attachments_found'] += result.get('attachments', 0)
 
             # Update overall progress
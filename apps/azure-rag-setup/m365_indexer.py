@@ -30,6 +30,15 @@ class M365IndexerCLI:
         self.logger = setup_logging('m365-indexer', level='INFO')
         self.auth = M365Auth()
 
+    def _charge_scheduler(self, source: str, indexer):
+        """Count this sync's Graph requests against the priority scheduler's budget"""
+        try:
+            from m365_sync_scheduler import charge_requests
+            requests_used = charge_requests(source, indexer.stats)
+            print(f"   Graph requests: ~{requests_used:.0f} (charged to the scheduler budget)")
+        except Exception as e:
+            self.logger.warning(f"Could not charge the scheduler budget: {e}")
+
     def cmd_estimate(self, args):
         """Run volume estimation"""
         print("🔍 Running M365 Volume Estimation...")
@@ -69,6 +78,8 @@ class M365IndexerCLI:
             limit = args.limit if hasattr(args, 'limit') else None
             result = indexer.index_all_sites(limit)
 
+        self._charge_scheduler('sharepoint', indexer)
+
         if result.get('success'):
             print(f"\n✅ SharePoint sync completed!")
             print(f"   Sites: {result.get('sites_processed', 0)}")
@@ -99,6 +110,8 @@ class M365IndexerCLI:
             # Sync all users
             result = indexer.index_all_users(args.limit)
 
+        self._charge_scheduler('onedrive', indexer)
+
         if result.get('success'):
             print(f"\n✅ OneDrive sync completed!")
             print(f"   Users: {result.get('users_processed', 0)}")
@@ -129,6 +142,8 @@ class M365IndexerCLI:
             # Sync all users
             result = indexer.index_all_users(args.limit, args.days)
 
+        self._charge_scheduler('exchange', indexer)
+
         if result.get('success'):
             print(f"\n✅ Exchange sync completed!")
             print(f"   Users: {result.get('users_processed', 0)}")
@@ -324,7 +339,7 @@ def main():
         indexer = TeamsIndexer()
 
         print("🔄 Syncing Microsoft Teams...")
-        result = indexer.index_all_teams(message_limit=args.message_limit if hasattr(args, 'message_limit') else 50)
+        result = indexer.index_all_teams(message_limit=getattr(args, 'message_limit', None))
 
         if result.get('success'):
             print(f"✅ Teams sync complete!")
@@ -341,7 +356,7 @@ def main():
 
         print("🔄 Syncing Calendar events...")
         result = indexer.index_all_users(
-            days_back=args.days_back if hasattr(args, 'days_back') else 90,
+            days_back=getattr(args, 'days_back', None),
             limit=args.limit if hasattr(args, 'limit') else None
         )
 
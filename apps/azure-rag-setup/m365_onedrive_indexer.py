@@ -51,6 +51,8 @@ class OneDriveIndexer:
             'documents_found': 0,
             'documents_uploaded': 0,
             'documents_skipped': 0,
+            # Graph listing requests (drives and folder pages)
+            'pages_fetched': 0,
             'errors': 0,
             'start_time': datetime.now()
         }
@@ -133,6 +135,7 @@ class OneDriveIndexer:
                 headers=headers,
                 timeout=30
             )
+            self.stats['pages_fetched'] += 1
 
             if onedrive_response.status_code != 200:
                 self.logger.warning(f"Failed to get OneDrive for user {user_name}: {onedrive_response.status_code}")
@@ -187,6 +190,7 @@ class OneDriveIndexer:
                 url = f'https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{folder_id}/children'
 
             response = requests.get(url, headers=headers, timeout=30)
+            self.stats['pages_fetched'] += 1
 
             if response.status_code != 200:
                 return []
@@ -329,30 +333,41 @@ class OneDriveIndexer:
             'duration': str(duration)
         }
 
-    def index_all_users(self, limit: int = None) -> Dict[str, Any]:
-        """Index documents from all users' OneDrive"""
-        self.logger.info("Starting OneDrive indexing for all users...")
-
+    def list_users(self, limit: int = None) -> List[Dict[str, Any]]:
+        """List all users in the organization, following @odata.nextLink paging"""
         headers = self.auth.get_graph_headers()
         if not headers:
-            return {'error': 'Authentication failed'}
+            raise ValueError('Authentication failed')
 
-        try:
-            # Get all users in the organization
-            users_response = requests.get(
-                'https://graph.microsoft.com/v1.0/users?$select=id,displayName,userPrincipalName',
-                headers=headers,
-                timeout=30
-            )
+        users = []
+        url = 'https://graph.microsoft.com/v1.0/users?$select=id,displayName,userPrincipalName'
+
+        while url:
+            users_response = requests.get(url, headers=headers, timeout=30)
 
             if users_response.status_code != 200:
-                return {'error': f'Failed to get users: {users_response.status_code}'}
+                raise ValueError(f'Failed to get users: {users_response.status_code}')
 
             users_data = users_response.json()
-            users = users_data.get('value', [])
+            users.extend(users_data.get('value', []))
 
-            if limit:
-                users = users[:limit]
+            if limit and len(users) >= limit:
+                return users[:limit]
+
+            url = users_data.get('@odata.nextLink')
+
+        return users
+
+    def index_all_users(self, limit: int = None) -> Dict[str, Any]:
+        """Index documents from all users' OneDrive"""
+        self.logger.info("Starting OneDrive indexing for all users...")
+
+        try:
+            # Get all users in the organization
+            try:
+                users = self.list_users(limit)
+            except ValueError as e:
+                return {'error': str(e)}
 
             self.logger.info(f"Found {len(users)} users")
 
@@ -51,6 +51,8 @@ class SharePointIndexer:
             'documents_found': 0,
             'documents_uploaded': 0,
             'documents_skipped': 0,
+            # Graph listing requests (drives and folder pages)
+            'pages_fetched': 0,
             'errors': 0,
             'start_time': datetime.now()
         }
@@ -143,6 +145,7 @@ class SharePointIndexer:
                 headers=headers,
                 timeout=30
             )
+            self.stats['pages_fetched'] += 1
 
             if drives_response.status_code != 200:
                 self.logger.warning(f"Failed to get drives for site {site_name}: {drives_response.status_code}")
@@ -201,6 +204,7 @@ class SharePointIndexer:
                 url = f'https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{folder_id}/children'
 
             response = requests.get(url, headers=headers, timeout=30)
+            self.stats['pages_fetched'] += 1
 
             # Handle rate limiting (429) with exponential backoff
             if response.status_code == 429:
@@ -356,30 +360,41 @@ class SharePointIndexer:
             'duration': str(duration)
         }
 
-    def index_all_sites(self, limit: int = None) -> Dict[str, Any]:
-        """Index documents from all SharePoint sites"""
-        self.logger.info("Starting SharePoint indexing...")
-
+    def list_sites(self, limit: int = None) -> List[Dict[str, Any]]:
+        """List all SharePoint sites, following @odata.nextLink paging"""
         headers = self.auth.get_graph_headers()
         if not headers:
-            return {'error': 'Authentication failed'}
+            raise ValueError('Authentication failed')
 
-        try:
-            # Get all SharePoint sites
-            sites_response = requests.get(
-                'https://graph.microsoft.com/v1.0/sites?search=*',
-                headers=headers,
-                timeout=30
-            )
+        sites = []
+        url = 'https://graph.microsoft.com/v1.0/sites?search=*'
+
+        while url:
+            sites_response = requests.get(url, headers=headers, timeout=30)
 
             if sites_response.status_code != 200:
-                return {'error': f'Failed to get sites: {sites_response.status_code}'}
+                raise ValueError(f'Failed to get sites: {sites_response.status_code}')
 
             sites_data = sites_response.json()
-            sites = sites_data.get('value', [])
+            sites.extend(sites_data.get('value', []))
 
-            if limit:
-                sites = sites[:limit]
+            if limit and len(sites) >= limit:
+                return sites[:limit]
+
+            url = sites_data.get('@odata.nextLink')
+
+        return sites
+
+    def index_all_sites(self, limit: int = None) -> Dict[str, Any]:
+        """Index documents from all SharePoint sites"""
+        self.logger.info("Starting SharePoint indexing...")
+
+        try:
+            # Get all SharePoint sites
+            try:
+                sites = self.list_sites(limit)
+            except ValueError as e:
+                return {'error': str(e)}
 
             self.logger.info(f"Found {len(sites)} SharePoint sites")
 
@@ -20,12 +20,17 @@ from dotenv import load_dotenv
 # Add raganything-processor to path
 sys.path.insert(0, str(Path(__file__).parent / "raganything-processor"))
 from graph_builder import GraphBuilder
+from compact_graph import CompactGraphBuilder
+from graph_store import SQLiteGraphBuilder
 
 # Import base SharePoint indexer
 from m365_auth import M365Auth
 
 load_dotenv()
 
+# JSON export of the graph; the in-memory backends persist to it
+GRAPH_FILE = "sharepoint_graph.json"
+
 class EnhancedSharePointIndexer:
     """
     Enhanced SharePoint indexer with:
@@ -44,14 +49,26 @@ class EnhancedSharePointIndexer:
         self.blob_service = BlobServiceClient.from_connection_string(self.connection_string)
         self.container_client = self.blob_service.get_container_client("training-data")
 
-        # Graph builder for relationships
-        self.graph_builder = GraphBuilder()
+        # Graph builder for relationships: persistent SQLite store by default,
+        # GRAPH_BACKEND=compact or memory for the in-memory builders
+        graph_backend = os.getenv('GRAPH_BACKEND', 'sqlite').lower()
+        graph_file = Path(GRAPH_FILE)
+        if graph_backend == 'sqlite':
+            self.graph_builder = SQLiteGraphBuilder(os.getenv('GRAPH_DB', 'sharepoint_graph.db'))
+            print(f"📊 Document graph: {len(self.graph_builder.documents)} documents")
+            if len(self.graph_builder.documents) == 0 and graph_file.exists():
+                # Not imported automatically: the export may be older than the last sync
+                print(f"   ℹ️  {GRAPH_FILE} found; import it with --import-graph {GRAPH_FILE}")
+        else:
+            if graph_backend == 'memory':
+                self.graph_builder = GraphBuilder()
+            else:
+                self.graph_builder = CompactGraphBuilder()
 
-        # Load existing graph if available
-        graph_file = Path("sharepoint_graph.json")
-        if graph_file.exists():
-            print("📊 Loading existing document graph...")
-            self._load_graph(graph_file)
+            # Load existing graph if available
+            if graph_file.exists():
+                print("📊 Loading existing document graph...")
+                self._load_graph(graph_file)
 
         # Supported file types
         self.supported_extensions = {
@@ -97,12 +114,24 @@ class EnhancedSharePointIndexer:
         except Exception as e:
             print(f"⚠️  Error saving progress: {e}")
 
+    def _save_graph(self):
+        """Persist the graph: the SQLite store commits in place, in-memory builders export JSON"""
+        if isinstance(self.graph_builder, SQLiteGraphBuilder):
+            self.graph_builder.commit()
+        else:
+            self.graph_builder.export_graph(GRAPH_FILE)
+
     def _load_graph(self, graph_file: Path):
         """Load existing graph data"""
         try:
             with open(graph_file, 'r') as f:
                 graph_data = json.load(f)
 
+            if graph_data.get('format') == 'compact' and hasattr(self.graph_builder, 'load_graph_data'):
+                self.graph_builder.load_graph_data(graph_data)
+                print(f"   Loaded {len(self.graph_builder.documents)} documents")
+                return
+
             # Reconstruct graph from saved data
             for doc_id, doc_data in graph_data.get('documents', {}).items():
                 content = doc_data.get('content', '')
@@ -474,8 +503,8 @@ class EnhancedSharePointIndexer:
 
         self._save_progress()
 
-        # Export graph periodically
-        self.graph_builder.export_graph("sharepoint_graph.json")
+        # Persist the graph after every site
+        self._save_graph()
 
         duration = datetime.now() - start_time
         print(f"   ✅ Completed {site_name}: {processed}/{len(documents)} documents in {duration}")
@@ -534,8 +563,7 @@ class EnhancedSharePointIndexer:
             self.progress['total_documents'] = self.stats['documents_found']
             self._save_progress()
 
-            # Final graph export
-            self.graph_builder.export_graph("sharepoint_graph.json")
+            self._save_graph()
 
             # Print graph statistics
             print("\n📊 Graph Statistics:")
@@ -582,11 +610,27 @@ def main():
     parser.add_argument('--site', help='Index specific site by ID')
     parser.add_argument('--limit', type=int, help='Limit number of sites to process')
     parser.add_argument('--status', action='store_true', help='Show indexing status')
+    parser.add_argument('--export-graph', nargs='?', const=GRAPH_FILE, metavar='FILE',
+                        help=f'Export the document graph to JSON (default: {GRAPH_FILE})')
+    parser.add_argument('--import-graph', metavar='FILE',
+                        help='Load a JSON graph export into the SQLite store')
 
     args = parser.parse_args()
 
     indexer = EnhancedSharePointIndexer()
 
+    if args.export_graph:
+        indexer.graph_builder.export_graph(args.export_graph)
+        return 0
+
+    if args.import_graph:
+        if not isinstance(indexer.graph_builder, SQLiteGraphBuilder):
+            print("❌ --import-graph needs the SQLite backend (GRAPH_BACKEND=sqlite)")
+            return 1
+        indexer.graph_builder.import_graph(args.import_graph)
+        print(f"✅ Imported {args.import_graph}: {len(indexer.graph_builder.documents)} documents in graph")
+        return 0
+
     if args.status:
         status = indexer.get_status()
         print("📊 Enhanced SharePoint Indexing Status:")
@@ -0,0 +1,875 @@
+#!/usr/bin/env python3
+"""
+Microsoft 365 Sync Coordinator
+Shards SharePoint sites, OneDrive drives and Exchange mailboxes across worker
+processes (or machines) through a shared lease table
+"""
+
+# Standard library imports
+import os
+import json
+import copy
+import time
+import socket
+import sqlite3
+import threading
+import multiprocessing
+from abc import ABC, abstractmethod
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+# Local application imports
+from config_manager import get_config_manager
+from logger import setup_logging
+
+SOURCES = ('sharepoint', 'onedrive', 'exchange')
+
+# Unit lifecycle: pending -> leased -> done | pending (retry) | failed
+STATUS_PENDING = 'pending'
+STATUS_LEASED = 'leased'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# Keys of the per-source progress files that hold one entry per unit
+UNIT_PROGRESS_KEYS = {'sharepoint': 'sites', 'onedrive': 'users', 'exchange': 'users'}
+
+LEASE_TABLE_COLUMNS = (
+    'id', 'run_id', 'source', 'unit_id', 'unit_name', 'priority', 'status',
+    'worker_id', 'lease_expires', 'attempts', 'result', 'error', 'updated_at'
+)
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker no longer holds the lease of the unit it is running"""
+
+
+class LeaseStore(ABC):
+    """
+    Shared work-unit table with leases
+
+    Workers pull units instead of being assigned a fixed slice, so an idle
+    worker keeps taking whatever is left (including units whose lease expired
+    because their worker died or stalled). Subclasses provide the SQL dialect.
+    """
+
+    @abstractmethod
+    def init_schema(self):
+        ...
+
+    @abstractmethod
+    def enqueue(self, run_id: str, units: List[Dict[str, Any]]) -> int:
+        ...
+
+    @abstractmethod
+    def claim(self, run_id: str, worker_id: str, lease_seconds: int,
+              max_attempts: int = None) -> Optional[Dict[str, Any]]:
+        """
+        Lease the next pending unit, or one whose lease expired
+
+        An expired unit that already used max_attempts is marked failed
+        instead, so a unit that keeps crashing its worker is not retried forever.
+        """
+        ...
+
+    @abstractmethod
+    def renew(self, unit_pk: int, worker_id: str, lease_seconds: int) -> bool:
+        ...
+
+    @abstractmethod
+    def complete(self, unit_pk: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def fail(self, unit_pk: int, worker_id: str, error: str, max_attempts: int) -> bool:
+        ...
+
+    @abstractmethod
+    def get_units(self, run_id: str) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def latest_run_id(self) -> Optional[str]:
+        ...
+
+    def has_outstanding(self, run_id: str) -> bool:
+        """Check whether any unit of the run is still pending or leased"""
+        return any(
+            unit['status'] in (STATUS_PENDING, STATUS_LEASED)
+            for unit in self.get_units(run_id)
+        )
+
+    def get_progress(self, run_id: str) -> Dict[str, Any]:
+        """Aggregate per-unit state and results into one progress view"""
+        now = time.time()
+        progress = {
+            'run_id': run_id,
+            'units': 0,
+            'by_status': {status: 0 for status in (STATUS_PENDING, STATUS_LEASED, STATUS_DONE, STATUS_FAILED)},
+            'by_source': {},
+            'totals': {},
+            'active_workers': [],
+            'expired_leases': 0
+        }
+
+        workers = set()
+        for unit in self.get_units(run_id):
+            status = unit['status']
+            source = unit['source']
+
+            progress['units'] += 1
+            progress['by_status'][status] = progress['by_status'].get(status, 0) + 1
+
+            source_progress = progress['by_source'].setdefault(
+                source, {'units': 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+            )
+            source_progress['units'] += 1
+            if status in (STATUS_DONE, STATUS_FAILED):
+                source_progress[status] += 1
+
+            if status == STATUS_LEASED:
+                if unit['lease_expires'] and unit['lease_expires'] < now:
+                    progress['expired_leases'] += 1
+                else:
+                    workers.add(unit['worker_id'])
+
+            # Sum numeric counters reported by the indexers
+            for key, value in (unit.get('result') or {}).get('stats', {}).items():
+                if isinstance(value, (int, float)):
+                    progress['totals'][key] = progress['totals'].get(key, 0) + value
+
+        progress['active_workers'] = sorted(workers)
+        finished = progress['by_status'][STATUS_DONE] + progress['by_status'][STATUS_FAILED]
+        progress['percent_complete'] = round(finished / progress['units'] * 100, 1) if progress['units'] else 0.0
+
+        return progress
+
+    def _row_to_unit(self, row) -> Dict[str, Any]:
+        """Convert a lease table row into a unit dict"""
+        unit = dict(zip(LEASE_TABLE_COLUMNS, row))
+        if unit.get('result'):
+            unit['result'] = json.loads(unit['result'])
+        return unit
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """Lease table in a local SQLite file (worker processes on one machine)"""
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode so claims can take an explicit write lock
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def init_schema(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_work_units (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    unit_id TEXT NOT NULL,
+                    unit_name TEXT,
+                    priority REAL DEFAULT 0,
+                    status TEXT DEFAULT 'pending',
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    updated_at REAL,
+                    UNIQUE (run_id, source, unit_id)
+                )
+            ''')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_sync_work_units_claim '
+                'ON sync_work_units(run_id, status, priority)'
+            )
+        finally:
+            conn.close()
+
+    def enqueue(self, run_id: str, units: List[Dict[str, Any]]) -> int:
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO sync_work_units '
+                '(run_id, source, unit_id, unit_name, priority, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (run_id, unit['source'], unit['unit_id'], unit.get('unit_name'),
+                     unit.get('priority', 0), time.time())
+                    for unit in units
+                ]
+            )
+            conn.execute('COMMIT')
+            return conn.total_changes - before
+        finally:
+            conn.close()
+
+    def claim(self, run_id: str, worker_id: str, lease_seconds: int,
+              max_attempts: int = None) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            now = time.time()
+            # BEGIN IMMEDIATE serializes claims across processes
+            conn.execute('BEGIN IMMEDIATE')
+            if max_attempts:
+                conn.execute(
+                    'UPDATE sync_work_units SET status = ?, error = ?, worker_id = NULL, '
+                    'lease_expires = NULL, updated_at = ? '
+                    'WHERE run_id = ? AND status = ? AND lease_expires < ? AND attempts >= ?',
+                    (STATUS_FAILED, f'Lease expired after {max_attempts} attempts', now,
+                     run_id, STATUS_LEASED, now, max_attempts)
+                )
+            row = conn.execute(
+                f'SELECT {", ".join(LEASE_TABLE_COLUMNS)} FROM sync_work_units '
+                'WHERE run_id = ? AND (status = ? OR (status = ? AND lease_expires < ?)) '
+                'ORDER BY priority DESC, id LIMIT 1',
+                (run_id, STATUS_PENDING, STATUS_LEASED, now)
+            ).fetchone()
+
+            if not row:
+                conn.execute('COMMIT')
+                return None
+
+            unit = self._row_to_unit(row)
+            conn.execute(
+                'UPDATE sync_work_units SET status = ?, worker_id = ?, lease_expires = ?, '
+                'attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                (STATUS_LEASED, worker_id, now + lease_seconds, now, unit['id'])
+            )
+            conn.execute('COMMIT')
+
+            unit.update(status=STATUS_LEASED, worker_id=worker_id, attempts=unit['attempts'] + 1)
+            return unit
+        finally:
+            conn.close()
+
+    def renew(self, unit_pk: int, worker_id: str, lease_seconds: int) -> bool:
+        conn = self._connect()
+        try:
+            now = time.time()
+            cursor = conn.execute(
+                'UPDATE sync_work_units SET lease_expires = ?, updated_at = ? '
+                'WHERE id = ? AND worker_id = ? AND status = ?',
+                (now + lease_seconds, now, unit_pk, worker_id, STATUS_LEASED)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, unit_pk: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'UPDATE sync_work_units SET status = ?, result = ?, error = NULL, '
+                'lease_expires = NULL, updated_at = ? WHERE id = ? AND worker_id = ? AND status = ?',
+                (STATUS_DONE, json.dumps(result, default=str), time.time(), unit_pk, worker_id, STATUS_LEASED)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def fail(self, unit_pk: int, worker_id: str, error: str, max_attempts: int) -> bool:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'UPDATE sync_work_units SET '
+                'status = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                'error = ?, worker_id = NULL, lease_expires = NULL, updated_at = ? '
+                'WHERE id = ? AND worker_id = ? AND status = ?',
+                (max_attempts, STATUS_FAILED, STATUS_PENDING, error, time.time(),
+                 unit_pk, worker_id, STATUS_LEASED)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def get_units(self, run_id: str) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f'SELECT {", ".join(LEASE_TABLE_COLUMNS)} FROM sync_work_units WHERE run_id = ? ORDER BY id',
+                (run_id,)
+            ).fetchall()
+            return [self._row_to_unit(row) for row in rows]
+        finally:
+            conn.close()
+
+    def latest_run_id(self) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT run_id FROM sync_work_units ORDER BY id DESC LIMIT 1'
+            ).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+
+class PostgresLeaseStore(LeaseStore):
+    """Lease table in a shared PostgreSQL database (workers across machines)"""
+
+    def __init__(self, dsn: str):
+        try:
+            import psycopg2
+        except ImportError:
+            raise ImportError("psycopg2 is required for the postgres backend: pip install psycopg2-binary")
+
+        if not dsn:
+            raise ValueError("M365_COORDINATOR_DSN or DATABASE_URL must be set for the postgres backend")
+
+        self._psycopg2 = psycopg2
+        self.dsn = dsn
+        self.init_schema()
+
+    def _connect(self):
+        return self._psycopg2.connect(self.dsn)
+
+    def _execute(self, sql: str, params: tuple = (), fetch: str = None):
+        """Run one statement in its own transaction"""
+        conn = self._connect()
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    if fetch == 'one':
+                        return cursor.fetchone()
+                    if fetch == 'all':
+                        return cursor.fetchall()
+                    return cursor.rowcount
+        finally:
+            conn.close()
+
+    def init_schema(self):
+        self._execute('''
+            CREATE TABLE IF NOT EXISTS sync_work_units (
+                id SERIAL PRIMARY KEY,
+                run_id VARCHAR(100) NOT NULL,
+                source VARCHAR(50) NOT NULL,
+                unit_id VARCHAR(255) NOT NULL,
+                unit_name TEXT,
+                priority DOUBLE PRECISION DEFAULT 0,
+                status VARCHAR(20) DEFAULT 'pending',
+                worker_id VARCHAR(255),
+                lease_expires DOUBLE PRECISION,
+                attempts INTEGER DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at DOUBLE PRECISION,
+                UNIQUE (run_id, source, unit_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sync_work_units_claim
+                ON sync_work_units(run_id, status, priority);
+        ''')
+
+    def enqueue(self, run_id: str, units: List[Dict[str, Any]]) -> int:
+        conn = self._connect()
+        try:
+            inserted = 0
+            with conn:
+                with conn.cursor() as cursor:
+                    for unit in units:
+                        cursor.execute(
+                            'INSERT INTO sync_work_units '
+                            '(run_id, source, unit_id, unit_name, priority, updated_at) '
+                            'VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING',
+                            (run_id, unit['source'], unit['unit_id'], unit.get('unit_name'),
+                             unit.get('priority', 0), time.time())
+                        )
+                        inserted += cursor.rowcount
+            return inserted
+        finally:
+            conn.close()
+
+    def claim(self, run_id: str, worker_id: str, lease_seconds: int,
+              max_attempts: int = None) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        if max_attempts:
+            self._execute(
+                'UPDATE sync_work_units SET status = %s, error = %s, worker_id = NULL, '
+                'lease_expires = NULL, updated_at = %s '
+                'WHERE run_id = %s AND status = %s AND lease_expires < %s AND attempts >= %s',
+                (STATUS_FAILED, f'Lease expired after {max_attempts} attempts', now,
+                 run_id, STATUS_LEASED, now, max_attempts)
+            )
+        # SKIP LOCKED lets concurrent workers claim different rows without blocking
+        row = self._execute(
+            f'''
+            UPDATE sync_work_units SET status = %s, worker_id = %s, lease_expires = %s,
+                attempts = attempts + 1, updated_at = %s
+            WHERE id = (
+                SELECT id FROM sync_work_units
+                WHERE run_id = %s AND (status = %s OR (status = %s AND lease_expires < %s AND attempts < %s))
+                ORDER BY priority DESC, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {", ".join(LEASE_TABLE_COLUMNS)}
+            ''',
+            (STATUS_LEASED, worker_id, now + lease_seconds, now,
+             run_id, STATUS_PENDING, STATUS_LEASED, now, max_attempts or 2 ** 31 - 1),
+            fetch='one'
+        )
+        return self._row_to_unit(row) if row else None
+
+    def renew(self, unit_pk: int, worker_id: str, lease_seconds: int) -> bool:
+        now = time.time()
+        return self._execute(
+            'UPDATE sync_work_units SET lease_expires = %s, updated_at = %s '
+            'WHERE id = %s AND worker_id = %s AND status = %s',
+            (now + lease_seconds, now, unit_pk, worker_id, STATUS_LEASED)
+        ) == 1
+
+    def complete(self, unit_pk: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        return self._execute(
+            'UPDATE sync_work_units SET status = %s, result = %s, error = NULL, '
+            'lease_expires = NULL, updated_at = %s WHERE id = %s AND worker_id = %s AND status = %s',
+            (STATUS_DONE, json.dumps(result, default=str), time.time(), unit_pk, worker_id, STATUS_LEASED)
+        ) == 1
+
+    def fail(self, unit_pk: int, worker_id: str, error: str, max_attempts: int) -> bool:
+        return self._execute(
+            'UPDATE sync_work_units SET '
+            'status = CASE WHEN attempts >= %s THEN %s ELSE %s END, '
+            'error = %s, worker_id = NULL, lease_expires = NULL, updated_at = %s '
+            'WHERE id = %s AND worker_id = %s AND status = %s',
+            (max_attempts, STATUS_FAILED, STATUS_PENDING, error, time.time(),
+             unit_pk, worker_id, STATUS_LEASED)
+        ) == 1
+
+    def get_units(self, run_id: str) -> List[Dict[str, Any]]:
+        rows = self._execute(
+            f'SELECT {", ".join(LEASE_TABLE_COLUMNS)} FROM sync_work_units WHERE run_id = %s ORDER BY id',
+            (run_id,),
+            fetch='all'
+        )
+        return [self._row_to_unit(row) for row in rows]
+
+    def latest_run_id(self) -> Optional[str]:
+        row = self._execute(
+            'SELECT run_id FROM sync_work_units ORDER BY id DESC LIMIT 1',
+            fetch='one'
+        )
+        return row[0] if row else None
+
+
+def get_lease_store(backend: str = None, dsn: str = None, sqlite_path: str = None) -> LeaseStore:
+    """Create the lease store configured in m365_config.yaml (arguments override)"""
+    coordinator_config = get_config_manager().get_coordinator_config()
+    backend = backend or coordinator_config['backend']
+
+    if backend == 'postgres':
+        return PostgresLeaseStore(dsn or coordinator_config['postgres_dsn'])
+    if backend == 'sqlite':
+        return SQLiteLeaseStore(sqlite_path or coordinator_config['sqlite_path'])
+
+    raise ValueError(f"Unknown coordinator backend: {backend}")
+
+
+class LeaseRenewer(threading.Thread):
+    """Background thread that keeps a unit's lease alive while it is processed"""
+
+    def __init__(self, store: LeaseStore, unit_pk: int, worker_id: str,
+                 lease_seconds: int, interval_seconds: int, logger):
+        super().__init__(daemon=True)
+        self.store = store
+        self.unit_pk = unit_pk
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval_seconds = interval_seconds
+        self.logger = logger
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                if not self.store.renew(self.unit_pk, self.worker_id, self.lease_seconds):
+                    self.lost = True
+                    self.logger.warning(f"Lease lost for unit {self.unit_pk}, another worker may take it over")
+                    return
+            except Exception as e:
+                # Keep trying; the lease only expires after lease_seconds
+                self.logger.warning(f"Lease renewal failed for unit {self.unit_pk}: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class SyncWorker:
+    """Pulls work units from the lease store and runs them with the regular indexers"""
+
+    def __init__(self, store: LeaseStore, run_id: str, worker_id: str = None,
+                 date_range_days: int = None):
+        self.config = get_config_manager()
+        self.coordinator_config = self.config.get_coordinator_config()
+        self.store = store
+        self.run_id = run_id
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.date_range_days = date_range_days
+        self.logger = setup_logging(f'sync-worker-{os.getpid()}', level='INFO')
+        self._indexers = {}
+        # Progress each indexer loaded from its per-source file, used to seed new units
+        self._legacy_progress = {}
+
+        self.stats = {
+            'units_completed': 0,
+            'units_failed': 0,
+            'leases_lost': 0
+        }
+
+    def _get_indexer(self, source: str):
+        """Create one indexer per source per worker process"""
+        if source not in self._indexers:
+            if source == 'sharepoint':
+                from m365_sharepoint_indexer import SharePointIndexer
+                self._indexers[source] = SharePointIndexer()
+            elif source == 'onedrive':
+                from m365_onedrive_indexer import OneDriveIndexer
+                self._indexers[source] = OneDriveIndexer()
+            elif source == 'exchange':
+                from m365_exchange_indexer import ExchangeIndexer
+                self._indexers[source] = ExchangeIndexer()
+            else:
+                raise ValueError(f"Unknown source: {source}")
+            self._legacy_progress[source] = self._indexers[source].progress
+
+        return self._indexers[source]
+
+    def _bind_unit_progress(self, indexer, source: str, unit_id: str):
+        """
+        Point the indexer at a per-unit progress file
+
+        Units move between workers, so skip state is kept per unit instead of
+        per process; this also keeps workers from overwriting each other's file.
+        """
+        safe_unit = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in unit_id)
+        progress_file = Path(self.coordinator_config['unit_progress_dir']) / source / f"{safe_unit}.json"
+        progress_file.parent.mkdir(parents=True, exist_ok=True)
+
+        indexer.progress_file = progress_file
+        legacy = self._legacy_progress.get(source)
+        if progress_file.exists() or not legacy:
+            indexer.progress = indexer._load_progress()
+        else:
+            # First coordinated run: start from the per-source progress file
+            # instead of re-downloading everything the unit already has
+            indexer.progress = self._seed_unit_progress(legacy, source, unit_id)
+
+    @staticmethod
+    def _seed_unit_progress(legacy: Dict[str, Any], source: str, unit_id: str) -> Dict[str, Any]:
+        """Copy of a per-source progress dict narrowed to one unit"""
+        unit_key = UNIT_PROGRESS_KEYS[source]
+        progress = {}
+        for key, value in legacy.items():
+            if key == unit_key and isinstance(value, dict):
+                progress[key] = {unit_id: copy.deepcopy(value[unit_id])} if unit_id in value else {}
+            else:
+                # Processed-id sets are shared across units in the legacy file
+                progress[key] = copy.copy(value)
+        return progress
+
+    @staticmethod
+    def _guard_progress(indexer, renewer: 'LeaseRenewer', unit_name: str):
+        """Make the indexer stop instead of saving progress once the lease is lost"""
+        save_progress = type(indexer)._save_progress
+
+        def guarded_save_progress():
+            if renewer.lost:
+                raise LeaseLostError(f"Lease lost for {unit_name}, progress not saved")
+            save_progress(indexer)
+
+        indexer._save_progress = guarded_save_progress
+
+    def _run_unit(self, unit: Dict[str, Any], renewer: 'LeaseRenewer') -> Dict[str, Any]:
+        """Run one unit with the matching indexer and return its result"""
+        source = unit['source']
+        indexer = self._get_indexer(source)
+        self._bind_unit_progress(indexer, source, unit['unit_id'])
+        self._guard_progress(indexer, renewer, unit['unit_name'])
+
+        stats_before = {k: v for k, v in indexer.stats.items() if isinstance(v, (int, float))}
+
+        try:
+            if source == 'sharepoint':
+                result = indexer.index_site(unit['unit_id'], unit['unit_name'])
+            elif source == 'onedrive':
+                result = indexer.index_user(unit['unit_id'], unit['unit_name'])
+            else:
+                result = indexer.index_user(unit['unit_id'], unit['unit_name'], self.date_range_days)
+        finally:
+            del indexer._save_progress
+
+        if renewer.lost:
+            # The indexer may have swallowed LeaseLostError; another worker owns the unit now
+            raise LeaseLostError(f"Lease lost for {unit['unit_name']}")
+
+        # Indexer stats are cumulative per process; report this unit's share
+        result['stats'] = {
+            key: value - stats_before.get(key, 0)
+            for key, value in indexer.stats.items()
+            if isinstance(value, (int, float))
+        }
+        return result
+
+    def run(self, poll_interval: int = 5) -> Dict[str, Any]:
+        """Process units until the run has nothing left to claim"""
+        lease_seconds = self.coordinator_config['lease_seconds']
+        renew_interval = self.coordinator_config['renew_interval_seconds']
+        max_attempts = self.coordinator_config['max_attempts']
+
+        self.logger.info(f"Worker {self.worker_id} started for run {self.run_id}")
+
+        while True:
+            unit = self.store.claim(self.run_id, self.worker_id, lease_seconds, max_attempts)
+
+            if not unit:
+                # Other workers still hold leases; wait in case one expires
+                if self.store.has_outstanding(self.run_id):
+                    time.sleep(poll_interval)
+                    continue
+                break
+
+            self.logger.info(
+                f"Claimed {unit['source']} unit {unit['unit_name']} (attempt {unit['attempts']})"
+            )
+
+            renewer = LeaseRenewer(
+                self.store, unit['id'], self.worker_id, lease_seconds, renew_interval, self.logger
+            )
+            renewer.start()
+
+            try:
+                result = self._run_unit(unit, renewer)
+                renewer.stop()
+
+                if result.get('success') is False or result.get('error'):
+                    raise RuntimeError(result.get('error', 'Indexer reported failure'))
+
+                if self.store.complete(unit['id'], self.worker_id, result):
+                    self.stats['units_completed'] += 1
+                else:
+                    self.stats['leases_lost'] += 1
+                    self.logger.warning(f"Result for {unit['unit_name']} discarded, lease was taken over")
+
+            except LeaseLostError as e:
+                renewer.stop()
+                self.stats['leases_lost'] += 1
+                self.logger.warning(f"Aborted {unit['unit_name']}: {e}")
+
+            except Exception as e:
+                renewer.stop()
+                self.stats['units_failed'] += 1
+                self.logger.error(f"Unit {unit['unit_name']} failed: {e}")
+                self.store.fail(unit['id'], self.worker_id, str(e), max_attempts)
+
+        self.logger.info(f"Worker {self.worker_id} finished: {self.stats}")
+        return self.stats
+
+
+class SyncCoordinator:
+    """Plan a sharded sync run, start local workers and report aggregated progress"""
+
+    def __init__(self, store: LeaseStore = None):
+        self.config = get_config_manager()
+        self.coordinator_config = self.config.get_coordinator_config()
+        self.logger = setup_logging('sync-coordinator', level='INFO')
+        self.store = store or get_lease_store()
+
+    def discover_units(self, sources: List[str], limit: int = None) -> List[Dict[str, Any]]:
+        """List the work units (site, drive, mailbox) for each requested source"""
+        units = []
+
+        if 'sharepoint' in sources:
+            from m365_sharepoint_indexer import SharePointIndexer
+            for site in SharePointIndexer().list_sites(limit):
+                units.append({
+                    'source': 'sharepoint',
+                    'unit_id': site.get('id'),
+                    'unit_name': site.get('displayName', 'Unknown')
+                })
+
+        user_sources = [source for source in ('onedrive', 'exchange') if source in sources]
+        if user_sources:
+            from m365_onedrive_indexer import OneDriveIndexer
+            users = OneDriveIndexer().list_users(limit)
+            for source in user_sources:
+                for user in users:
+                    units.append({
+                        'source': source,
+                        'unit_id': user.get('id'),
+                        'unit_name': user.get('displayName', user.get('userPrincipalName', 'Unknown'))
+                    })
+
+        return units
+
+    def plan(self, sources: List[str], limit: int = None, run_id: str = None,
+             units: List[Dict[str, Any]] = None) -> str:
+        """Enqueue work units for a new run and return its run id"""
+        run_id = run_id or datetime.now().strftime('run-%Y%m%d-%H%M%S')
+        units = units if units is not None else self.discover_units(sources, limit)
+
+        inserted = self.store.enqueue(run_id, units)
+        self.logger.info(f"Planned run {run_id}: {inserted} units ({', '.join(sources)})")
+
+        return run_id
+
+    def start_workers(self, run_id: str, workers: int = None, backend: str = None,
+                      dsn: str = None, date_range_days: int = None) -> List[multiprocessing.Process]:
+        """Start worker processes on this machine"""
+        workers = workers or self.coordinator_config['workers']
+        processes = []
+
+        for index in range(workers):
+            process = multiprocessing.Process(
+                target=_worker_main,
+                args=(run_id, backend, dsn, date_range_days),
+                name=f"sync-worker-{index}"
+            )
+            process.start()
+            processes.append(process)
+
+        self.logger.info(f"Started {len(processes)} worker processes for run {run_id}")
+        return processes
+
+    def wait(self, run_id: str, processes: List[multiprocessing.Process]) -> Dict[str, Any]:
+        """Print aggregated progress until all local workers exit"""
+        interval = self.coordinator_config['progress_interval']
+
+        while any(process.is_alive() for process in processes):
+            print_progress(self.store.get_progress(run_id))
+            for process in processes:
+                process.join(timeout=interval / max(len(processes), 1))
+
+        progress = self.store.get_progress(run_id)
+        print_progress(progress)
+        return progress
+
+    def run(self, sources: List[str], workers: int = None, limit: int = None,
+            backend: str = None, dsn: str = None, date_range_days: int = None) -> Dict[str, Any]:
+        """Plan a run, process it with local workers and return the final progress"""
+        run_id = self.plan(sources, limit)
+        processes = self.start_workers(run_id, workers, backend, dsn, date_range_days)
+        return self.wait(run_id, processes)
+
+
+def _worker_main(run_id: str, backend: str = None, dsn: str = None, date_range_days: int = None):
+    """Entry point for worker processes (each builds its own store and indexers)"""
+    store = get_lease_store(backend, dsn)
+    SyncWorker(store, run_id, date_range_days=date_range_days).run()
+
+
+def print_progress(progress: Dict[str, Any]):
+    """Print the aggregated progress view"""
+    by_status = progress['by_status']
+    print(f"\n📊 Run {progress['run_id']}: {progress['percent_complete']}% complete")
+    print(f"   Units: {progress['units']} "
+          f"(pending {by_status.get(STATUS_PENDING, 0)}, leased {by_status.get(STATUS_LEASED, 0)}, "
+          f"done {by_status.get(STATUS_DONE, 0)}, failed {by_status.get(STATUS_FAILED, 0)})")
+
+    for source, source_progress in sorted(progress['by_source'].items()):
+        print(f"   {source}: {source_progress['done']}/{source_progress['units']} done, "
+              f"{source_progress['failed']} failed")
+
+    if progress['totals']:
+        totals = ', '.join(f"{key}={value}" for key, value in sorted(progress['totals'].items()))
+        print(f"   Totals: {totals}")
+
+    print(f"   Active workers: {len(progress['active_workers'])}"
+          f"{' (' + str(progress['expired_leases']) + ' expired leases)' if progress['expired_leases'] else ''}")
+
+
+def main():
+    """CLI interface for the sync coordinator"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Sharded M365 sync across worker processes or machines',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Full sync on this machine with 8 workers
+  python3 m365_sync_coordinator.py run --workers 8
+
+  # Across machines: plan once, then start workers on every machine
+  python3 m365_sync_coordinator.py --backend postgres plan
+  python3 m365_sync_coordinator.py --backend postgres work --run-id <run_id> --workers 4
+
+  # Aggregated progress
+  python3 m365_sync_coordinator.py status
+        """
+    )
+    parser.add_argument('--backend', choices=['sqlite', 'postgres'], help='Lease table backend')
+    parser.add_argument('--dsn', help='PostgreSQL DSN (postgres backend)')
+
+    subparsers = parser.add_subparsers(dest='command', help='Available commands')
+
+    plan_parser = subparsers.add_parser('plan', help='Enqueue work units for a new run')
+    plan_parser.add_argument('--sources', default=','.join(SOURCES), help='Comma-separated sources')
+    plan_parser.add_argument('--limit', type=int, help='Limit number of sites/users per source')
+    plan_parser.add_argument('--run-id', help='Explicit run id')
+
+    work_parser = subparsers.add_parser('work', help='Start workers for an existing run')
+    work_parser.add_argument('--run-id', help='Run id (default: latest run)')
+    work_parser.add_argument('--workers', type=int, help='Number of worker processes')
+    work_parser.add_argument('--days', type=int, help='Only index emails from last N days')
+
+    run_parser = subparsers.add_parser('run', help='Plan a run and process it with local workers')
+    run_parser.add_argument('--sources', default=','.join(SOURCES), help='Comma-separated sources')
+    run_parser.add_argument('--limit', type=int, help='Limit number of sites/users per source')
+    run_parser.add_argument('--workers', type=int, help='Number of worker processes')
+    run_parser.add_argument('--days', type=int, help='Only index emails from last N days')
+
+    status_parser = subparsers.add_parser('status', help='Show aggregated progress for a run')
+    status_parser.add_argument('--run-id', help='Run id (default: latest run)')
+    status_parser.add_argument('--json', action='store_true', help='Print progress as JSON')
+
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    coordinator = SyncCoordinator(get_lease_store(args.backend, args.dsn))
+
+    if args.command == 'plan':
+        sources = [s.strip() for s in args.sources.split(',') if s.strip()]
+        run_id = coordinator.plan(sources, args.limit, args.run_id)
+        print(f"✅ Planned run: {run_id}")
+        return 0
+
+    if args.command == 'run':
+        sources = [s.strip() for s in args.sources.split(',') if s.strip()]
+        progress = coordinator.run(sources, args.workers, args.limit, args.backend, args.dsn, args.days)
+        return 0 if progress['by_status'].get(STATUS_FAILED, 0) == 0 else 1
+
+    run_id = args.run_id or coordinator.store.latest_run_id()
+    if not run_id:
+        print("❌ No sync runs found")
+        return 1
+
+    if args.command == 'work':
+        processes = coordinator.start_workers(run_id, args.workers, args.backend, args.dsn, args.days)
+        coordinator.wait(run_id, processes)
+        return 0
+
+    if args.command == 'status':
+        progress = coordinator.store.get_progress(run_id)
+        if args.json:
+            print(json.dumps(progress, indent=2))
+        else:
+            print_progress(progress)
+        return 0
+
+    return 1
+
+
+if __name__ == "__main__":
+    exit(main())
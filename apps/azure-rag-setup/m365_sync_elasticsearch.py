@@ -5,6 +5,7 @@ from utils.graph_client import GraphClientWrapper
 from utils.document_processor import DocumentProcessor
 from utils.bulk_indexer import BulkIndexer
 from utils.raganything_processor import RAGAnythingProcessor
+from utils.enrichment_executor import EnrichmentExecutor
 from utils.elasticsearch_graph_builder import ElasticsearchGraphBuilder
 from datetime import datetime
 from tqdm import tqdm
@@ -31,6 +32,8 @@ class M365Sync:
         self.processor = DocumentProcessor()
         self.indexer = BulkIndexer()
         self.raganything_processor = RAGAnythingProcessor()
+        # Enrichment runs in worker processes while the crawler keeps fetching
+        self.enrichment = EnrichmentExecutor(self.raganything_processor, self._index_enhanced)
         self.graph_builder = ElasticsearchGraphBuilder(self.indexer)
         self.stats = {
             'sites_processed': 0,
@@ -62,6 +65,7 @@ class M365Sync:
                 continue
 
         # Flush remaining documents
+        self.enrichment.flush()
         self.indexer.flush()
 
         logger.info(f"SharePoint sync complete: {self.stats}")
@@ -166,14 +170,16 @@ class M365Sync:
             "processing_status": "completed"
         }
 
-        # Process with RAG-Anything for enhanced features
-        enhanced_document = self.raganything_processor.process_document(document)
+        # Process with RAG-Anything for enhanced features (indexed by _index_enhanced)
+        self.enrichment.submit(document)
 
+    def _index_enhanced(self, enhanced_document):
+        """Add an enriched document to the bulk batch (called in submission order)"""
         if enhanced_document.get('entities') or enhanced_document.get('relationships'):
             self.stats['documents_enhanced'] += 1
 
         # Add to batch
-        self.indexer.add_document(doc_id, enhanced_document)
+        self.indexer.add_document(enhanced_document['id'], enhanced_document)
         self.stats['documents_indexed'] += 1
 
     def sync_onedrive(self):
@@ -194,6 +200,7 @@ class M365Sync:
                 logger.error(f"Error processing OneDrive for {user.get('displayName')}: {e}")
                 continue
 
+        self.enrichment.flush()
         self.indexer.flush()
         logger.info(f"OneDrive sync complete: {self.stats}")
 
@@ -241,6 +248,7 @@ class M365Sync:
                 logger.error(f"Error processing emails for {user.get('displayName')}: {e}")
                 continue
 
+        self.enrichment.flush()
         self.indexer.flush()
         logger.info(f"Email sync complete: {self.stats}")
 
@@ -275,10 +283,7 @@ class M365Sync:
                 }
 
                 # Process with RAG-Anything
-                enhanced_document = self.raganything_processor.process_document(document)
-
-                self.indexer.add_document(doc_id, enhanced_document)
-                self.stats['documents_indexed'] += 1
+                self.enrichment.submit(document)
 
             except Exception as e:
                 logger.error(f"Error processing email: {e}")
@@ -324,11 +329,13 @@ class M365Sync:
         except KeyboardInterrupt:
             logger.warning("Sync interrupted by user")
             print("\n⚠️ Sync interrupted. Flushing remaining documents...")
+            self.enrichment.flush()
             self.indexer.flush()
         except Exception as e:
             logger.error(f"Sync failed: {e}")
             raise
         finally:
+            self.enrichment.close()
             end_time = datetime.utcnow()
             duration = (end_time - start_time).total_seconds()
 
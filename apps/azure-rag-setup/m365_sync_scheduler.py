@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Microsoft 365 Priority Sync Scheduler
+Syncs frequently changing, frequently searched sites and mailboxes more often
+while keeping total Graph API load within a fixed request budget
+"""
+
+# Standard library imports
+import json
+import math
+import time
+import fcntl
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any
+
+# Local application imports
+from config_manager import get_config_manager
+from logger import setup_logging
+from m365_sync_coordinator import (
+    STATUS_DONE, STATUS_PENDING, STATUS_LEASED, SyncCoordinator, get_lease_store
+)
+
+# Graph items returned per page when listing drive items or messages
+GRAPH_PAGE_SIZE = 200
+
+
+def estimate_requests(source: str, result: Dict[str, Any]) -> float:
+    """
+    Estimate the Graph requests one unit sync cost
+
+    The indexers count their listing requests in pages_fetched (for Exchange
+    this includes the attachment fetch of every email); SharePoint and
+    OneDrive add one download per uploaded document. Results without
+    pages_fetched fall back to one page per GRAPH_PAGE_SIZE items seen.
+    """
+    stats = result.get('stats', {})
+
+    if source == 'exchange':
+        if 'pages_fetched' in stats:
+            return 1 + stats['pages_fetched']
+        listed = stats.get('emails_found', 0) or result.get('emails', 0)
+        return 1 + math.ceil(listed / GRAPH_PAGE_SIZE) + stats.get('attachments_uploaded', 0)
+
+    fetched = stats.get('documents_uploaded', 0)
+    if 'pages_fetched' in stats:
+        return 1 + stats['pages_fetched'] + fetched
+    listed = max(fetched + stats.get('documents_skipped', 0), result.get('documents', 0))
+    return 1 + math.ceil(listed / GRAPH_PAGE_SIZE) + fetched
+
+
+@contextmanager
+def _state_lock(state_file: Path):
+    """Exclusive lock on the scheduler state, so overlapping ticks cannot clobber it"""
+    with open(f"{state_file}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def charge_requests(source: str, stats: Dict[str, Any], state_file: str = None) -> float:
+    """
+    Count a sync run outside the scheduler (the daily full sync) against its budget
+
+    The estimated requests are added to request_debt in the state file and
+    taken out of the budget of the following ticks.
+    """
+    state_file = Path(state_file or get_config_manager().get_scheduler_config()['state_file'])
+    requests_used = estimate_requests(source, {'stats': stats})
+
+    with _state_lock(state_file):
+        state = {}
+        if state_file.exists():
+            with open(state_file, 'r') as f:
+                state = json.load(f)
+        state['request_debt'] = state.get('request_debt', 0) + requests_used
+        with open(state_file, 'w') as f:
+            json.dump(state, f, indent=2)
+
+    return requests_used
+
+
+def count_changes(source: str, result: Dict[str, Any]) -> int:
+    """Count items a unit sync found new or modified"""
+    stats = result.get('stats', {})
+    if source == 'exchange':
+        return stats.get('attachments_uploaded', 0)
+    return stats.get('documents_uploaded', 0)
+
+
+class SyncScheduler:
+    """Decide which sync units are due and enqueue them through the coordinator"""
+
+    def __init__(self, coordinator: SyncCoordinator = None):
+        self.config = get_config_manager()
+        self.scheduler_config = self.config.get_scheduler_config()
+        self.logger = setup_logging('sync-scheduler', level='INFO')
+        self.coordinator = coordinator or SyncCoordinator(get_lease_store())
+        self.state_file = Path(self.scheduler_config['state_file'])
+        self.state = self._load_state()
+        # Units queued in open runs and not finished yet
+        self.in_flight = set()
+
+    def _load_state(self) -> Dict[str, Any]:
+        """Load scheduler state"""
+        state = {
+            'units': {},
+            # run_id -> ids of units already folded into the estimates
+            'open_runs': {},
+            'last_discovery': 0,
+            'last_tick': None,
+            # Requests used by syncs outside the scheduler, not yet taken from a budget
+            'request_debt': 0
+        }
+
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, 'r') as f:
+                    state.update(json.load(f))
+            except Exception as e:
+                self.logger.warning(f"Could not load scheduler state: {e}")
+
+        return state
+
+    @contextmanager
+    def locked_state(self):
+        """Reload the state under the file lock and save it on exit"""
+        with _state_lock(self.state_file):
+            self.state = self._load_state()
+            yield self.state
+            self._save_state()
+
+    def _save_state(self):
+        """Save scheduler state"""
+        try:
+            with open(self.state_file, 'w') as f:
+                json.dump(self.state, f, indent=2)
+        except Exception as e:
+            self.logger.error(f"Could not save scheduler state: {e}")
+
+    @staticmethod
+    def _unit_key(source: str, unit_id: str) -> str:
+        return f"{source}:{unit_id}"
+
+    def discover(self, force: bool = False) -> int:
+        """Refresh the unit list from Graph (at most once per discovery interval)"""
+        interval = self.scheduler_config['discovery_interval_hours'] * 3600
+        if not force and self.state['units'] and time.time() - self.state['last_discovery'] < interval:
+            return 0
+
+        from m365_sharepoint_indexer import SharePointIndexer
+        from m365_onedrive_indexer import OneDriveIndexer
+
+        discovered = []
+        for site in SharePointIndexer().list_sites():
+            name = site.get('displayName', 'Unknown')
+            discovered.append(('sharepoint', site.get('id'), name, [name]))
+
+        for user in OneDriveIndexer().list_users():
+            name = user.get('displayName', user.get('userPrincipalName', 'Unknown'))
+            # Search metadata identifies users by email
+            aliases = [alias for alias in (user.get('userPrincipalName'), user.get('mail')) if alias]
+            for source in ('onedrive', 'exchange'):
+                discovered.append((source, user.get('id'), name, aliases))
+
+        added = 0
+        seen = set()
+        for source, unit_id, name, aliases in discovered:
+            key = self._unit_key(source, unit_id)
+            seen.add(key)
+            unit = self.state['units'].setdefault(key, {
+                'source': source,
+                'unit_id': unit_id,
+                'change_rate': None,
+                'requests_per_sync': None,
+                'last_sync': None,
+                'syncs': 0
+            })
+            if unit['syncs'] == 0 and unit['last_sync'] is None:
+                added += 1
+            unit['unit_name'] = name
+            unit['aliases'] = aliases
+
+        # Drop sites and users that no longer exist
+        for key in list(self.state['units']):
+            if key not in seen:
+                del self.state['units'][key]
+
+        self.state['last_discovery'] = time.time()
+        self.logger.info(f"Discovered {len(seen)} units ({added} new)")
+        return added
+
+    def ingest_results(self) -> int:
+        """Fold finished coordinator units into the change-rate estimates"""
+        alpha = self.scheduler_config['ema_alpha']
+        ingested = 0
+        still_open = {}
+        self.in_flight = set()
+
+        for run_id, seen_ids in self.state['open_runs'].items():
+            units = self.coordinator.store.get_units(run_id)
+
+            for unit in units:
+                if unit['status'] in (STATUS_PENDING, STATUS_LEASED):
+                    self.in_flight.add(self._unit_key(unit['source'], unit['unit_id']))
+                if unit['status'] != STATUS_DONE or unit['id'] in seen_ids:
+                    continue
+                seen_ids.append(unit['id'])
+
+                key = self._unit_key(unit['source'], unit['unit_id'])
+                state_unit = self.state['units'].get(key)
+                if not state_unit:
+                    continue
+
+                result = unit.get('result') or {}
+                synced_at = unit['updated_at'] or time.time()
+                changes = count_changes(unit['source'], result)
+                requests_used = estimate_requests(unit['source'], result)
+
+                # Change rate is changes per hour since the previous sync
+                if state_unit['last_sync']:
+                    hours = max((synced_at - state_unit['last_sync']) / 3600, 1 / 60)
+                    rate = changes / hours
+                    previous = state_unit['change_rate']
+                    state_unit['change_rate'] = rate if previous is None else alpha * rate + (1 - alpha) * previous
+
+                previous = state_unit['requests_per_sync']
+                state_unit['requests_per_sync'] = (
+                    requests_used if previous is None else alpha * requests_used + (1 - alpha) * previous
+                )
+                state_unit['last_sync'] = synced_at
+                state_unit['syncs'] += 1
+                ingested += 1
+
+            if any(unit['status'] in (STATUS_PENDING, STATUS_LEASED) for unit in units):
+                still_open[run_id] = seen_ids
+
+        self.state['open_runs'] = still_open
+        return ingested
+
+    def load_demand(self) -> Dict[str, float]:
+        """
+        Load search hits per day from the search_queries table
+
+        Returns counts keyed "<source>" and "<source>:<site or user>"; empty
+        when the search database is not configured.
+        """
+        database_url = self.scheduler_config['database_url']
+        if not database_url:
+            return {}
+
+        try:
+            import psycopg2
+        except ImportError:
+            self.logger.warning("psycopg2 not installed, scheduling on change rate only")
+            return {}
+
+        window_days = self.scheduler_config['demand_window_days']
+        demand = {}
+
+        try:
+            conn = psycopg2.connect(database_url)
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        SELECT sources.key, SUM(sources.value::numeric)
+                        FROM search_queries, jsonb_each_text(result_sources) AS sources
+                        WHERE created_at > NOW() - make_interval(days => %s)
+                          AND result_sources IS NOT NULL
+                        GROUP BY sources.key
+                        """,
+                        (window_days,)
+                    )
+                    for key, hits in cursor.fetchall():
+                        demand[key] = float(hits) / window_days
+            finally:
+                conn.close()
+        except Exception as e:
+            self.logger.warning(f"Could not load search demand: {e}")
+
+        return demand
+
+    def _unit_demand(self, unit: Dict[str, Any], demand: Dict[str, float]) -> float:
+        """Search hits per day for one unit, falling back to its source's average"""
+        source = unit['source']
+        hits = sum(demand.get(f"{source}:{alias}", 0) for alias in unit.get('aliases', []))
+        if hits:
+            return hits
+
+        units_in_source = sum(1 for u in self.state['units'].values() if u['source'] == source)
+        return demand.get(source, 0) / max(units_in_source, 1)
+
+    def score_units(self, demand: Dict[str, float], now: float = None) -> List[Dict[str, Any]]:
+        """
+        Compute each unit's target interval and how overdue it is
+
+        score = change_weight * changes/hour + demand_weight * hits/day; the
+        target interval shrinks from max_interval towards min_interval as the
+        score grows. Priority is the fraction of the interval elapsed, so
+        hot units come due sooner and long-overdue cold units still get a turn.
+        """
+        now = now or time.time()
+        min_interval = self.scheduler_config['min_interval_minutes'] * 60
+        max_interval = self.scheduler_config['max_interval_minutes'] * 60
+        change_weight = self.scheduler_config['change_weight']
+        demand_weight = self.scheduler_config['demand_weight']
+
+        known_costs = [u['requests_per_sync'] for u in self.state['units'].values() if u['requests_per_sync']]
+        default_cost = sum(known_costs) / len(known_costs) if known_costs else 10
+
+        scored = []
+        for key, unit in self.state['units'].items():
+            score = (change_weight * (unit['change_rate'] or 0)
+                     + demand_weight * self._unit_demand(unit, demand))
+            interval = max(min_interval, max_interval / (1 + score))
+
+            if unit['last_sync'] is None:
+                # Never synced: due now, ahead of everything already indexed
+                overdue = float('inf')
+            else:
+                overdue = (now - unit['last_sync']) / interval
+
+            scored.append({
+                'key': key,
+                'source': unit['source'],
+                'unit_id': unit['unit_id'],
+                'unit_name': unit.get('unit_name'),
+                'score': round(score, 3),
+                'interval_minutes': round(interval / 60, 1),
+                'overdue': overdue,
+                'cost': unit['requests_per_sync'] or default_cost
+            })
+
+        return sorted(scored, key=lambda u: (u['overdue'], u['score']), reverse=True)
+
+    def select_due(self, scored: List[Dict[str, Any]], budget: float) -> List[Dict[str, Any]]:
+        """Pick due units in priority order until the request budget is spent"""
+        selected = []
+        remaining = budget
+
+        for unit in scored:
+            if unit['overdue'] < 1:
+                break
+            if unit['key'] in self.in_flight:
+                continue
+            if unit['cost'] > remaining:
+                # Cheaper units further down may still fit
+                continue
+            selected.append(unit)
+            remaining -= unit['cost']
+
+        return selected
+
+    def _tick_budget(self, now: float, dry_run: bool = False) -> float:
+        """
+        Requests available since the previous tick (capped at one hour)
+
+        Requests charged by syncs outside the scheduler are paid off first;
+        what the budget cannot cover carries over to the next tick.
+        """
+        per_hour = self.scheduler_config['request_budget_per_hour']
+        last_tick = self.state.get('last_tick')
+        if not last_tick:
+            budget = per_hour * self.scheduler_config['min_interval_minutes'] / 60
+        else:
+            budget = per_hour * min((now - last_tick) / 3600, 1)
+
+        debt = self.state.get('request_debt', 0)
+        if not dry_run:
+            self.state['request_debt'] = max(debt - budget, 0)
+        return max(budget - debt, 0)
+
+    def tick(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Run one scheduling round: ingest results, score units, enqueue the due ones"""
+        with self.locked_state():
+            return self._tick(dry_run)
+
+    def _tick(self, dry_run: bool) -> Dict[str, Any]:
+        now = time.time()
+
+        self.discover()
+        ingested = self.ingest_results()
+        demand = self.load_demand()
+        scored = self.score_units(demand, now)
+        budget = self._tick_budget(now, dry_run)
+        selected = self.select_due(scored, budget)
+
+        run_id = None
+        if selected and not dry_run:
+            max_score = max(unit['score'] for unit in selected) or 1
+            units = [
+                {
+                    'source': unit['source'],
+                    'unit_id': unit['unit_id'],
+                    'unit_name': unit['unit_name'],
+                    # Workers claim higher priority first
+                    'priority': unit['score'] / max_score
+                }
+                for unit in selected
+            ]
+            sources = sorted({unit['source'] for unit in units})
+            run_id = self.coordinator.plan(
+                sources, run_id=datetime.now().strftime('sched-%Y%m%d-%H%M%S'), units=units
+            )
+            self.state['open_runs'][run_id] = []
+
+        if not dry_run:
+            self.state['last_tick'] = now
+
+        summary = {
+            'run_id': run_id,
+            'ingested_results': ingested,
+            'units': len(scored),
+            'due': sum(1 for unit in scored if unit['overdue'] >= 1),
+            'selected': len(selected),
+            'budget': round(budget),
+            'planned_requests': round(sum(unit['cost'] for unit in selected))
+        }
+        self.logger.info(f"Scheduler tick: {summary}")
+        return summary
+
+
+def main():
+    """CLI interface for the priority scheduler"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Priority scheduler for M365 sync (change rate + search demand, within a request budget)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Schedule due units and process them with local workers (cron every 15 minutes)
+  python3 m365_sync_scheduler.py tick --work
+
+  # Show what would be scheduled
+  python3 m365_sync_scheduler.py tick --dry-run
+
+  # Show per-unit scores and intervals
+  python3 m365_sync_scheduler.py scores --top 20
+        """
+    )
+    subparsers = parser.add_subparsers(dest='command', help='Available commands')
+
+    tick_parser = subparsers.add_parser('tick', help='Run one scheduling round')
+    tick_parser.add_argument('--dry-run', action='store_true', help='Score units without enqueueing')
+    tick_parser.add_argument('--work', action='store_true', help='Process the scheduled units with local workers')
+    tick_parser.add_argument('--workers', type=int, help='Number of worker processes')
+
+    scores_parser = subparsers.add_parser('scores', help='Show unit scores and sync intervals')
+    scores_parser.add_argument('--top', type=int, default=20, help='Number of units to show')
+
+    subparsers.add_parser('discover', help='Refresh the site and user list')
+
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    scheduler = SyncScheduler()
+
+    if args.command == 'discover':
+        with scheduler.locked_state():
+            scheduler.discover(force=True)
+        print(f"✅ {len(scheduler.state['units'])} units tracked")
+        return 0
+
+    if args.command == 'scores':
+        scored = scheduler.score_units(scheduler.load_demand())
+        print(f"\n{'Unit':<50} {'Score':>8} {'Interval':>10} {'Overdue':>8} {'Cost':>6}")
+        for unit in scored[:args.top]:
+            name = f"{unit['source']}:{unit['unit_name']}"[:50]
+            overdue = 'new' if unit['overdue'] == float('inf') else f"{unit['overdue']:.2f}"
+            print(f"{name:<50} {unit['score']:>8} {unit['interval_minutes']:>9}m {overdue:>8} {unit['cost']:>6.0f}")
+        return 0
+
+    if args.command == 'tick':
+        summary = scheduler.tick(dry_run=args.dry_run)
+        print(f"📅 Scheduled {summary['selected']}/{summary['due']} due units "
+              f"(~{summary['planned_requests']}/{summary['budget']} requests)")
+
+        if args.work and summary['run_id']:
+            coordinator = scheduler.coordinator
+            processes = coordinator.start_workers(summary['run_id'], args.workers)
+            progress = coordinator.wait(summary['run_id'], processes)
+            # Record results right away instead of on the next tick
+            with scheduler.locked_state():
+                scheduler.ingest_results()
+            return 0 if progress['by_status'].get('failed', 0) == 0 else 1
+
+        return 0
+
+    return 1
+
+
+if __name__ == "__main__":
+    exit(main())
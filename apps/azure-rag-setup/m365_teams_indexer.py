@@ -6,22 +6,28 @@ Index Teams messages, channels, and conversations
 
 # Standard library imports
 import os
+import re
 import json
-import time
+import html
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional
 
 # Third-party imports
-import requests
 from azure.storage.blob import BlobServiceClient
-from tenacity import retry, stop_after_attempt, wait_exponential
 from tqdm import tqdm
 
 # Local application imports
 from config_manager import get_config_manager
 from logger import setup_logging
 from m365_auth import M365Auth
+from m365_bundles import BlobBundleStore, bundle_day, group_by_day, safe_blob_part
+from m365_throttle import get_throttle
+
+GRAPH_BASE = 'https://graph.microsoft.com/v1.0'
+
+# Delta is unavailable for some channel types; these statuses fall back to listing
+DELTA_UNSUPPORTED_CODES = (400, 403, 404, 501)
 
 class TeamsIndexer:
     """Index Microsoft Teams data to Azure Blob Storage"""
@@ -30,6 +36,7 @@ class TeamsIndexer:
         self.config = get_config_manager()
         self.logger = setup_logging('teams-indexer', level='INFO')
         self.auth = M365Auth()
+        self.throttle = get_throttle('teams')
 
         # Use config manager for progress file
         self.progress_file = Path(progress_file or self.config.get_progress_file('teams'))
@@ -40,12 +47,21 @@ class TeamsIndexer:
         self.blob_service = BlobServiceClient.from_connection_string(self.connection_string)
         self.container_client = self.blob_service.get_container_client("training-data")
 
+        # Messages are stored as one bundle per channel per day
+        self.bundles = BlobBundleStore(
+            self.container_client,
+            render=self._render_message,
+            sort_key=lambda message: message.get('created') or ''
+        )
+
         # Statistics
         self.stats = {
             'teams_processed': 0,
             'channels_processed': 0,
             'messages_processed': 0,
             'messages_uploaded': 0,
+            'messages_removed': 0,
+            'bundles_written': 0,
             'errors': 0,
             'start_time': datetime.now()
         }
@@ -83,113 +99,265 @@ class TeamsIndexer:
 
         return f"DefaultEndpointsProtocol=https;AccountName={account_name};AccountKey={account_key};EndpointSuffix=core.windows.net"
 
-    def get_all_teams(self) -> List[Dict[str, Any]]:
-        """Get all teams the user has access to"""
+    def _get_paged(self, url: str) -> List[Dict[str, Any]]:
+        """GET a collection, following @odata.nextLink"""
         headers = self.auth.get_graph_headers()
         if not headers:
-            return []
+            raise ValueError('Authentication failed')
 
-        try:
-            response = requests.get(
-                'https://graph.microsoft.com/v1.0/me/joinedTeams',
-                headers=headers,
-                timeout=30
-            )
+        items = []
+        while url:
+            response = self.throttle.get(url, headers=headers)
+            if response.status_code != 200:
+                raise ValueError(f'Request failed: {response.status_code}')
 
-            if response.status_code == 200:
-                teams = response.json().get('value', [])
-                print(f"📊 Found {len(teams)} teams")
-                return teams
-            else:
-                print(f"❌ Failed to get teams: {response.status_code}")
-                return []
+            data = response.json()
+            items.extend(data.get('value', []))
+            url = data.get('@odata.nextLink')
+
+        return items
 
+    def get_all_teams(self) -> List[Dict[str, Any]]:
+        """Get all teams the user has access to"""
+        try:
+            teams = self._get_paged(f'{GRAPH_BASE}/me/joinedTeams')
+            print(f"📊 Found {len(teams)} teams")
+            return teams
         except Exception as e:
             print(f"❌ Error getting teams: {e}")
             return []
 
     def get_team_channels(self, team_id: str) -> List[Dict[str, Any]]:
         """Get all channels for a team"""
-        headers = self.auth.get_graph_headers()
-        if not headers:
-            return []
-
         try:
-            response = requests.get(
-                f'https://graph.microsoft.com/v1.0/teams/{team_id}/channels',
-                headers=headers,
-                timeout=30
-            )
-
-            if response.status_code == 200:
-                return response.json().get('value', [])
-            else:
-                return []
-
+            return self._get_paged(f'{GRAPH_BASE}/teams/{team_id}/channels')
         except Exception as e:
             print(f"⚠️  Error getting channels: {e}")
             return []
 
-    def get_channel_messages(self, team_id: str, channel_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get messages from a channel"""
+    def get_channel_messages(self, team_id: str, channel_id: str, limit: int = None,
+                             channel_progress: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Get root messages of a channel that changed since the last sync
+
+        Uses the channel's messages delta (link kept in channel_progress);
+        an expired link starts a new delta round, keeping only messages
+        newer than the last-modified cursor. Falls back to listing where
+        delta is not available. Returns all history on the first sync, or at
+        most `limit` root messages when given.
+        """
+        channel_progress = channel_progress if channel_progress is not None else {}
         headers = self.auth.get_graph_headers()
         if not headers:
             return []
 
-        try:
-            response = requests.get(
-                f'https://graph.microsoft.com/v1.0/teams/{team_id}/channels/{channel_id}/messages?$top={limit}',
-                headers=headers,
-                timeout=30
+        base = f'{GRAPH_BASE}/teams/{team_id}/channels/{channel_id}/messages'
+        url = channel_progress.get('delta_link') or f'{base}/delta?$top=50'
+        messages = []
+        since = None
+
+        while url:
+            response = self.throttle.get(url, headers=headers)
+
+            if response.status_code == 410 and since is None:
+                # Delta token expired: start a new round so a new delta link is
+                # stored, and skip what the cursor says was already written
+                channel_progress.pop('delta_link', None)
+                since = channel_progress.get('last_modified') or ''
+                url = f'{base}/delta?$top=50'
+                messages = []
+                continue
+
+            if response.status_code in DELTA_UNSUPPORTED_CODES and not messages:
+                channel_progress.pop('delta_link', None)
+                return self._list_messages_since(base, channel_progress.get('last_modified'), limit)
+
+            if response.status_code != 200:
+                raise ValueError(f'Failed to get messages: {response.status_code}')
+
+            data = response.json()
+            messages.extend(
+                message for message in data.get('value', [])
+                if not since or '@removed' in message
+                or (message.get('lastModifiedDateTime') or message.get('createdDateTime') or '') > since
             )
 
-            if response.status_code == 200:
-                return response.json().get('value', [])
-            else:
-                return []
+            if limit and len(messages) >= limit:
+                # Partial first sync: do not keep a delta link that skips the rest
+                return messages[:limit]
 
-        except Exception as e:
-            print(f"⚠️  Error getting messages: {e}")
-            return []
+            url = data.get('@odata.nextLink')
+            if data.get('@odata.deltaLink'):
+                channel_progress['delta_link'] = data['@odata.deltaLink']
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
-    def _upload_message_to_blob(self, message_data: Dict[str, Any], team_name: str, channel_name: str):
-        """Upload Teams message to blob storage"""
-        message_id = message_data.get('id', 'unknown')
-
-        # Create a searchable text document from the message
-        content = {
-            'team': team_name,
-            'channel': channel_name,
-            'from': message_data.get('from', {}).get('user', {}).get('displayName', 'Unknown'),
-            'created': message_data.get('createdDateTime', ''),
-            'subject': message_data.get('subject', ''),
-            'body': message_data.get('body', {}).get('content', ''),
-            'importance': message_data.get('importance', 'normal'),
-            'messageType': message_data.get('messageType', 'message')
-        }
+        return messages
+
+    def _list_messages_since(self, base_url: str, since: Optional[str], limit: int = None) -> List[Dict[str, Any]]:
+        """Page through a channel's messages, keeping those modified after `since`"""
+        headers = self.auth.get_graph_headers()
+        url = f'{base_url}?$top=50'
+        messages = []
+
+        while url:
+            response = self.throttle.get(url, headers=headers)
+            if response.status_code != 200:
+                raise ValueError(f'Failed to list messages: {response.status_code}')
+
+            data = response.json()
+            for message in data.get('value', []):
+                modified = message.get('lastModifiedDateTime') or message.get('createdDateTime') or ''
+                if not since or modified > since:
+                    messages.append(message)
+
+            if limit and len(messages) >= limit:
+                return messages[:limit]
+
+            url = data.get('@odata.nextLink')
 
-        # Create blob name
-        safe_team = team_name.replace('/', '_').replace(' ', '_')
-        safe_channel = channel_name.replace('/', '_').replace(' ', '_')
-        blob_name = f"teams/{safe_team}/{safe_channel}/{message_id}.json"
-
-        # Upload to blob storage
-        blob_client = self.container_client.get_blob_client(blob_name)
-        blob_client.upload_blob(
-            json.dumps(content, indent=2),
-            overwrite=True,
-            content_type='application/json'
+        return messages
+
+    def get_message_replies(self, team_id: str, channel_id: str, message_id: str) -> List[Dict[str, Any]]:
+        """Get all replies of a channel message"""
+        return self._get_paged(
+            f'{GRAPH_BASE}/teams/{team_id}/channels/{channel_id}/messages/{message_id}/replies?$top=50'
         )
 
-        self.stats['messages_uploaded'] += 1
+    @staticmethod
+    def _html_to_text(content: str) -> str:
+        """Reduce Teams message HTML to plain text"""
+        text = re.sub(r'<br\s*/?>|</p>|</div>', '\n', content or '', flags=re.IGNORECASE)
+        text = re.sub(r'<[^>]+>', '', text)
+        return html.unescape(text).strip()
+
+    def _compact_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep the searchable fields of a Graph chatMessage"""
+        sender = (message.get('from') or {}).get('user') or (message.get('from') or {}).get('application') or {}
+        body = message.get('body', {})
+        text = body.get('content', '')
+        if body.get('contentType') == 'html':
+            text = self._html_to_text(text)
+
+        return {
+            'id': message.get('id'),
+            'reply_to_id': message.get('replyToId'),
+            'from': sender.get('displayName', 'Unknown'),
+            'created': message.get('createdDateTime', ''),
+            'modified': message.get('lastModifiedDateTime'),
+            'subject': message.get('subject') or '',
+            'body': text,
+            'importance': message.get('importance', 'normal'),
+            'messageType': message.get('messageType', 'message'),
+            'web_url': message.get('webUrl')
+        }
 
-    def index_team(self, team_id: str, team_name: str, message_limit: int = 50) -> Dict[str, Any]:
-        """Index all channels and messages for a team"""
+    @staticmethod
+    def _render_message(message: Dict[str, Any]) -> str:
+        """Render one message as a transcript line of its bundle"""
+        prefix = '  ↳ ' if message.get('reply_to_id') else ''
+        subject = f"{message['subject']}: " if message.get('subject') else ''
+        return f"{prefix}[{message.get('created', '')[:16]}] {message.get('from', 'Unknown')}: {subject}{message.get('body', '')}"
+
+    def _find_message_days(self, prefix: str, message_ids: List[str]) -> Dict[str, List[str]]:
+        """Search a channel's bundles for messages missing from the id -> day index"""
+        wanted = set(message_ids)
+        found: Dict[str, List[str]] = {}
+
+        for blob in self.container_client.list_blobs(name_starts_with=f"{prefix}/"):
+            if not wanted:
+                break
+            hits = wanted & set(self.bundles.load(blob.name))
+            if hits:
+                day = blob.name[len(prefix) + 1:].rsplit('.', 1)[0]
+                found[day] = sorted(hits)
+                wanted -= hits
+
+        return found
+
+    def _write_bundles(self, team_name: str, channel_name: str, changed: List[Dict[str, Any]],
+                       removed: List[Dict[str, Any]], message_days: Dict[str, str]) -> int:
+        """
+        Merge changed and deleted messages into their channel-day bundles
+
+        '@removed' delta entries carry only an id, so deletions are routed
+        through message_days (message id -> bundle day, kept in the channel
+        progress) and, for ids it does not know, a search of the bundles.
+        """
+        changed_by_day = group_by_day(changed, 'created')
+        prefix = f"teams/{safe_blob_part(team_name)}/{safe_blob_part(channel_name)}"
+
+        removed_by_day: Dict[str, List[str]] = {}
+        unknown = []
+        for message in removed:
+            day = message_days.get(message['id']) or (message.get('created') and bundle_day(message['created']))
+            if day:
+                removed_by_day.setdefault(day, []).append(message['id'])
+            else:
+                unknown.append(message['id'])
+        if unknown:
+            for day, message_ids in self._find_message_days(prefix, unknown).items():
+                removed_by_day.setdefault(day, []).extend(message_ids)
+
+        written = 0
+        for day in sorted(set(changed_by_day) | set(removed_by_day)):
+            counts = self.bundles.merge(
+                f"{prefix}/{day}.json",
+                changed_by_day.get(day, []),
+                removed_by_day.get(day, []),
+                header={'source': 'teams', 'team': team_name, 'channel': channel_name, 'date': day}
+            )
+            self.stats['messages_uploaded'] += counts['added'] + counts['updated']
+            self.stats['messages_removed'] += counts['removed']
+            written += 1
+
+        for day, messages in changed_by_day.items():
+            for message in messages:
+                message_days[message['id']] = day
+        for message_ids in removed_by_day.values():
+            for message_id in message_ids:
+                message_days.pop(message_id, None)
+
+        self.stats['bundles_written'] += written
+        return written
+
+    def index_channel(self, team_id: str, team_name: str, channel: Dict[str, Any],
+                      channel_progress: Dict[str, Any], message_limit: int = None) -> int:
+        """Fetch a channel's changed threads (roots and replies) and update its bundles"""
+        channel_id = channel.get('id')
+        channel_name = channel.get('displayName', 'Unknown')
+
+        roots = self.get_channel_messages(team_id, channel_id, message_limit, channel_progress)
+        changed, removed = [], []
+        cursor = channel_progress.get('last_modified') or ''
+
+        for root in roots:
+            messages = [root]
+            if not root.get('deletedDateTime'):
+                # A changed thread is re-read whole; bundles merge by id
+                messages.extend(self.get_message_replies(team_id, channel_id, root['id']))
+
+            for message in messages:
+                compact = self._compact_message(message)
+                if message.get('deletedDateTime') or '@removed' in message:
+                    removed.append(compact)
+                else:
+                    changed.append(compact)
+                cursor = max(cursor, message.get('lastModifiedDateTime') or message.get('createdDateTime') or '')
+
+        if changed or removed:
+            self._write_bundles(team_name, channel_name, changed, removed,
+                                channel_progress.setdefault('message_days', {}))
+
+        self.stats['messages_processed'] += len(changed) + len(removed)
+        channel_progress.update({
+            'name': channel_name,
+            'last_modified': cursor or None,
+            'last_sync': datetime.now().isoformat(),
+            'messages': channel_progress.get('messages', 0) + len(changed)
+        })
+        return len(changed) + len(removed)
+
+    def index_team(self, team_id: str, team_name: str, message_limit: int = None) -> Dict[str, Any]:
+        """Index all channels and messages for a team (full history first, then changes)"""
         print(f"\n📁 Processing team: {team_name}")
 
         result = {
@@ -200,42 +368,43 @@ class TeamsIndexer:
             'errors': 0
         }
 
+        team_progress = self.progress['teams'].setdefault(team_id, {})
+        team_progress['name'] = team_name
+        channels_progress = team_progress.setdefault('channels', {})
+
         try:
             # Get channels
             channels = self.get_team_channels(team_id)
             result['channels'] = len(channels)
 
             for channel in tqdm(channels, desc=f"  Channels in {team_name}"):
-                channel_id = channel.get('id')
                 channel_name = channel.get('displayName', 'Unknown')
+                channel_progress = channels_progress.setdefault(channel.get('id'), {})
+                previous = json.loads(json.dumps(channel_progress))
 
                 try:
-                    # Get messages
-                    messages = self.get_channel_messages(team_id, channel_id, message_limit)
-
-                    for message in messages:
-                        try:
-                            self._upload_message_to_blob(message, team_name, channel_name)
-                            result['messages'] += 1
-                            self.stats['messages_processed'] += 1
-                        except Exception as e:
-                            result['errors'] += 1
-                            self.stats['errors'] += 1
-
+                    result['messages'] += self.index_channel(
+                        team_id, team_name, channel, channel_progress, message_limit
+                    )
                     self.stats['channels_processed'] += 1
-
                 except Exception as e:
                     print(f"  ⚠️  Error processing channel {channel_name}: {e}")
+                    # The delta link may already point past messages that were
+                    # not written; keep the previous one so they are fetched again
+                    channels_progress[channel.get('id')] = previous
                     result['errors'] += 1
+                    self.stats['errors'] += 1
+
+                # Cursors are saved per channel so an interrupted run resumes
+                self._save_progress()
 
             self.stats['teams_processed'] += 1
 
             # Update progress
-            self.progress['teams'][team_id] = {
-                'name': team_name,
+            team_progress.update({
                 'last_sync': datetime.now().isoformat(),
-                'messages': result['messages']
-            }
+                'messages': sum(c.get('messages', 0) for c in channels_progress.values())
+            })
             self._save_progress()
 
         except Exception as e:
@@ -244,7 +413,7 @@ class TeamsIndexer:
 
         return result
 
-    def index_all_teams(self, message_limit: int = 50) -> Dict[str, Any]:
+    def index_all_teams(self, message_limit: int = None) -> Dict[str, Any]:
         """Index all teams"""
         print("🚀 Starting Teams indexing...")
 
@@ -262,7 +431,9 @@ class TeamsIndexer:
 
         # Update overall progress
         self.progress['last_sync'] = datetime.now().isoformat()
-        self.progress['total_messages'] = self.stats['messages_processed']
+        self.progress['total_messages'] = sum(
+            team.get('messages', 0) for team in self.progress['teams'].values()
+        )
         self._save_progress()
 
         return {
@@ -271,6 +442,8 @@ class TeamsIndexer:
             'channels_processed': self.stats['channels_processed'],
             'messages_processed': self.stats['messages_processed'],
             'messages_uploaded': self.stats['messages_uploaded'],
+            'messages_removed': self.stats['messages_removed'],
+            'bundles_written': self.stats['bundles_written'],
             'errors': self.stats['errors'],
             'results': results
         }
@@ -285,8 +458,9 @@ class TeamsIndexer:
 
 if __name__ == "__main__":
     indexer = TeamsIndexer()
-    result = indexer.index_all_teams(message_limit=50)
+    result = indexer.index_all_teams()
     print(f"\n✅ Teams indexing complete!")
     print(f"   Teams: {result.get('teams_processed', 0)}")
     print(f"   Channels: {result.get('channels_processed', 0)}")
     print(f"   Messages: {result.get('messages_processed', 0)}")
+    print(f"   Bundles written: {result.get('bundles_written', 0)}")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Shared Microsoft Graph Throttle
+Token-bucket rate limiting per source (sync.rate_limit in m365_config.yaml)
+with Retry-After handling, shared by all threads of a process
+"""
+
+# Standard library imports
+import time
+import random
+import threading
+from typing import Dict, Optional
+
+# Third-party imports
+import requests
+
+# Local application imports
+from config_manager import get_config_manager
+
+# Status codes Graph uses for throttling and transient overload
+RETRY_STATUS_CODES = (429, 503, 504)
+
+
+class GraphThrottle:
+    """
+    Rate limiter for Graph requests of one source
+
+    Threads take a token from the bucket before each request. A 429/503
+    response pauses every thread of the source for the Retry-After period,
+    since Graph throttles per app and mailbox rather than per connection.
+    """
+
+    def __init__(self, requests_per_minute: int, max_attempts: int = 5,
+                 base_delay: float = 2, max_delay: float = 60):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(requests_per_minute / 6.0, 1)  # Up to 10 seconds of burst
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'wait_seconds': 0.0
+        }
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    self.stats['requests'] += 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+
+                self.stats['wait_seconds'] += wait
+
+            time.sleep(wait)
+
+    def block_for(self, seconds: float):
+        """Pause all requests of this source"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self.stats['throttled'] += 1
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                timeout: int = 30, **kwargs) -> requests.Response:
+        """
+        Send a Graph request under the rate limit, retrying throttled responses
+
+        Returns the last response; callers check status codes as before.
+        """
+        response = None
+        for attempt in range(self.max_attempts):
+            self.acquire()
+            response = self._session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = min(self.base_delay * (2 ** attempt), self.max_delay) * (0.5 + random.random() / 2)
+            self.block_for(delay)
+
+        return response
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: int = 30,
+            **kwargs) -> requests.Response:
+        return self.request('GET', url, headers=headers, timeout=timeout, **kwargs)
+
+
+_throttles: Dict[str, GraphThrottle] = {}
+_throttles_lock = threading.Lock()
+
+
+def get_throttle(source: str) -> GraphThrottle:
+    """Get the process-wide throttle for a source"""
+    with _throttles_lock:
+        if source not in _throttles:
+            config = get_config_manager()
+            retry_config = config.get_retry_config()
+            _throttles[source] = GraphThrottle(
+                config.get_rate_limit(source),
+                max_attempts=max(retry_config['max_attempts'], 5),
+                base_delay=retry_config['base_delay_seconds'],
+                max_delay=retry_config['max_delay_seconds']
+            )
+        return _throttles[source]
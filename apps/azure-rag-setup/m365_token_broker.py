@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Shared Graph Token Broker
+Process-wide access token cache with proactive background refresh, optionally
+shared across processes through Redis or a locked file
+
+Environment:
+    M365_TOKEN_CACHE           memory (default), redis or file
+    M365_TOKEN_CACHE_PATH      token file for the file backend (default .m365_token_cache.json)
+    M365_TOKEN_REFRESH_AHEAD   seconds before expiry to refresh (default 240, at most 1800)
+    REDIS_URL                  Redis connection for the redis backend
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Dict, Optional, Any
+
+from logger import setup_logging
+
+# A token closer than this to expiry is never served
+MIN_VALIDITY_SECONDS = 60
+
+# The acquirer bypasses MSAL's token cache, so every refresh returns a new
+# token; Graph tokens live 60-90 minutes, and refreshing more than half a
+# lifetime ahead only adds requests to Entra
+DEFAULT_REFRESH_AHEAD_SECONDS = 240
+MAX_REFRESH_AHEAD_SECONDS = 1800
+
+# Wait between refreshes that did not produce a newer token
+MIN_REFRESH_INTERVAL_SECONDS = 30
+
+
+class TokenCacheBackend(ABC):
+    """Token storage shared between processes"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, entry: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def lock(self, key: str):
+        """Context manager held while one process acquires a new token"""
+        ...
+
+
+class RedisTokenCache(TokenCacheBackend):
+    """Share tokens between processes and machines through Redis"""
+
+    def __init__(self, redis_url: str):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("redis is required for the redis token cache: pip install redis")
+
+        self.client = redis.Redis.from_url(redis_url)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(f"m365:token:{key}")
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        ttl = max(int(entry['expires_at'] - time.time()), 1)
+        self.client.set(f"m365:token:{key}", json.dumps(entry), ex=ttl)
+
+    def lock(self, key: str):
+        # Expires on its own if the holder dies mid-acquisition
+        return self.client.lock(f"m365:token-lock:{key}", timeout=30, blocking_timeout=35)
+
+
+class FileTokenCache(TokenCacheBackend):
+    """Share tokens between processes on one machine through a locked file"""
+
+    def __init__(self, path: str):
+        import fcntl
+
+        self._fcntl = fcntl
+        self.path = Path(path)
+        self.lock_path = self.path.with_suffix(self.path.suffix + '.lock')
+
+    def _read_all(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._read_all().get(key)
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        entries = self._read_all()
+        entries[key] = entry
+
+        # Write then rename so readers never see a partial file
+        temp_path = self.path.with_suffix(self.path.suffix + f'.{os.getpid()}.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(entries, f)
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, self.path)
+
+    def lock(self, key: str):
+        return _FileLock(self.lock_path, self._fcntl)
+
+
+class _FileLock:
+    """Exclusive flock on a lock file"""
+
+    def __init__(self, path: Path, fcntl_module):
+        self.path = path
+        self._fcntl = fcntl_module
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        self._fcntl.flock(self._file, self._fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._fcntl.flock(self._file, self._fcntl.LOCK_UN)
+        self._file.close()
+        return False
+
+
+class TokenBroker:
+    """
+    Serve Graph access tokens from memory and refresh them before they expire
+
+    get_token() only reads the cached tuple while the token is valid;
+    MSAL is called by the background refresher (or on a cold start), and a
+    shared backend lets one process acquire for all the others.
+    """
+
+    def __init__(self, key: str, acquire: Callable[[], Dict[str, Any]],
+                 backend: Optional[TokenCacheBackend] = None, refresh_ahead: int = DEFAULT_REFRESH_AHEAD_SECONDS):
+        self.key = key
+        self._acquire = acquire
+        self.backend = backend
+        self.refresh_ahead = min(max(refresh_ahead, 2 * MIN_VALIDITY_SECONDS), MAX_REFRESH_AHEAD_SECONDS)
+        self.logger = setup_logging('token-broker', level='INFO', log_to_file=False)
+
+        # (access_token, expires_at) swapped as one object so readers need no lock
+        self._cached: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+        self.stats = {
+            'acquired': 0,
+            'shared_hits': 0,
+            'refresh_failures': 0,
+            'stale_refreshes': 0
+        }
+
+    def get_token(self) -> str:
+        """Return a valid access token (hot path: no locks, no MSAL)"""
+        cached = self._cached
+        if cached and cached[1] - time.time() > MIN_VALIDITY_SECONDS:
+            return cached[0]
+
+        with self._lock:
+            if self._expires_in() <= MIN_VALIDITY_SECONDS:
+                self._refresh()
+            self._start_refresher()
+            return self._cached[0]
+
+    def get_graph_headers(self) -> Dict[str, str]:
+        return {
+            'Authorization': f'Bearer {self.get_token()}',
+            'Content-Type': 'application/json'
+        }
+
+    def _is_fresh(self, entry: Optional[Dict[str, Any]]) -> bool:
+        return bool(entry) and entry['expires_at'] - time.time() > self.refresh_ahead
+
+    def _refresh(self):
+        """Load a fresh token from the shared backend or acquire a new one"""
+        if not self.backend:
+            self._set(self._acquire_new())
+            return
+
+        entry = self.backend.get(self.key)
+        if self._is_fresh(entry):
+            self.stats['shared_hits'] += 1
+            self._set(entry)
+            return
+
+        with self.backend.lock(self.key):
+            # Another process may have refreshed while we waited for the lock
+            entry = self.backend.get(self.key)
+            if self._is_fresh(entry):
+                self.stats['shared_hits'] += 1
+            else:
+                entry = self._acquire_new()
+                self.backend.set(self.key, entry)
+            self._set(entry)
+
+    def _acquire_new(self) -> Dict[str, Any]:
+        result = self._acquire()
+        if 'access_token' not in result:
+            error = result.get('error_description', result.get('error', 'Unknown error'))
+            raise ValueError(f"Failed to acquire token: {error}")
+
+        self.stats['acquired'] += 1
+        return {
+            'access_token': result['access_token'],
+            'expires_at': time.time() + int(result.get('expires_in', 3599))
+        }
+
+    def _set(self, entry: Dict[str, Any]):
+        self._cached = (entry['access_token'], entry['expires_at'])
+
+    def _expires_in(self) -> float:
+        return self._cached[1] - time.time() if self._cached else 0.0
+
+    def _start_refresher(self):
+        if self._refresher and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name='token-refresher', daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        """Refresh refresh_ahead seconds before expiry; retry quickly on failure"""
+        while not self._stop_event.is_set():
+            delay = self._expires_in() - self.refresh_ahead
+            if self._stop_event.wait(max(delay, 0)):
+                return
+
+            try:
+                with self._lock:
+                    refreshed = self._expires_in() <= self.refresh_ahead
+                    if refreshed:
+                        self._refresh()
+
+                if refreshed and self._expires_in() <= self.refresh_ahead:
+                    # The refresh returned a token no newer than the one held (a
+                    # cache upstream is still serving it): back off instead of
+                    # asking again right away
+                    self.stats['stale_refreshes'] += 1
+                    if self._stop_event.wait(MIN_REFRESH_INTERVAL_SECONDS):
+                        return
+            except Exception as e:
+                self.stats['refresh_failures'] += 1
+                self.logger.warning(f"Background token refresh failed: {e}")
+                # The current token stays usable until MIN_VALIDITY_SECONDS before expiry
+                if self._stop_event.wait(min(30, max(self._expires_in() - MIN_VALIDITY_SECONDS, 5))):
+                    return
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_brokers: Dict[str, TokenBroker] = {}
+_brokers_lock = threading.Lock()
+
+
+def _cache_backend_from_env() -> Optional[TokenCacheBackend]:
+    backend = os.getenv('M365_TOKEN_CACHE', 'memory').lower()
+
+    if backend == 'redis':
+        return RedisTokenCache(os.getenv('REDIS_URL', 'redis://localhost:6379'))
+    if backend == 'file':
+        return FileTokenCache(os.getenv('M365_TOKEN_CACHE_PATH', '.m365_token_cache.json'))
+    return None
+
+
+def get_token_broker(tenant_id: str, client_id: str, scopes: list,
+                     acquire_factory: Callable[[], Callable[[], Dict[str, Any]]]) -> TokenBroker:
+    """
+    Get the process-wide broker for an app registration and scope set
+
+    acquire_factory is only called the first time, so the MSAL application it
+    builds is shared by every M365Auth instance in the process.
+    """
+    scope_hash = hashlib.sha256(' '.join(sorted(scopes)).encode()).hexdigest()[:12]
+    key = f"{tenant_id}:{client_id}:{scope_hash}"
+
+    with _brokers_lock:
+        if key not in _brokers:
+            _brokers[key] = TokenBroker(
+                key,
+                acquire_factory(),
+                backend=_cache_backend_from_env(),
+                refresh_ahead=int(os.getenv('M365_TOKEN_REFRESH_AHEAD', DEFAULT_REFRESH_AHEAD_SECONDS))
+            )
+        return _brokers[key]
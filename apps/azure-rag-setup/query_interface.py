@@ -107,7 +107,7 @@ class M365SearchInterface:
                     "nested": {
                         "path": "entities",
                         "query": {
-                            "terms": {"entities.value": filters['entities']}
+                            "terms": {"entities.value.keyword": filters['entities']}
                         }
                     }
                 })
@@ -200,7 +200,7 @@ class M365SearchInterface:
                 "query": {
                     "bool": {
                         "must": [
-                            {"term": {"entities.value": entity_value}}
+                            {"term": {"entities.value.keyword": entity_value}}
                         ]
                     }
                 }
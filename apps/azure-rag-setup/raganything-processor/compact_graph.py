@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Compact Document Relationship Graph
+Same interface as GraphBuilder, with memory bounded by the number of
+documents and distinct entities instead of total text size:
+
+- document ids and entity/topic keys are interned to integers once
+- postings (entity -> documents) are roaring bitmaps when pyroaring is
+  installed, sorted uint32 arrays otherwise
+- document content is never kept; per document only the interned feature
+  ids, the relationship score and scalar metadata fields remain
+"""
+
+import json
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Set, Any, Iterator, Optional
+
+from graph_builder import GraphBuilder
+
+try:
+    from pyroaring import BitMap  # type: ignore
+    ROARING_AVAILABLE = True
+except ImportError:
+    ROARING_AVAILABLE = False
+
+ENTITY_TYPES = ('people', 'organizations', 'locations', 'emails', 'urls')
+
+
+class Interner:
+    """Two-way mapping between strings and dense integer ids"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def intern(self, value: str) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+    def get(self, value: str) -> Optional[int]:
+        return self.ids.get(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class Postings:
+    """Set of document ids, roaring-backed when available"""
+
+    __slots__ = ('ids',)
+
+    def __init__(self):
+        self.ids = BitMap() if ROARING_AVAILABLE else array('I')
+
+    def add(self, doc: int):
+        if ROARING_AVAILABLE:
+            self.ids.add(doc)
+            return
+        ids = self.ids
+        if not ids or ids[-1] < doc:
+            ids.append(doc)  # New documents get increasing ids
+            return
+        position = bisect_left(ids, doc)
+        if position == len(ids) or ids[position] != doc:
+            ids.insert(position, doc)
+
+    def discard(self, doc: int):
+        if ROARING_AVAILABLE:
+            self.ids.discard(doc)
+            return
+        position = bisect_left(self.ids, doc)
+        if position < len(self.ids) and self.ids[position] == doc:
+            del self.ids[position]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class _DocumentRecord:
+    __slots__ = ('entities', 'topics', 'citations', 'metadata', 'score')
+
+    def __init__(self):
+        self.entities = array('I')
+        self.topics = array('I')
+        self.citations = array('I')
+        self.metadata: Dict[str, Any] = {}
+        self.score = 0.0
+
+
+class _DocumentView:
+    """Read-only mapping of doc id -> summary, so len()/in/[] keep working"""
+
+    def __init__(self, graph: 'CompactGraphBuilder'):
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return len(self.graph.records)
+
+    def __contains__(self, doc_id: str) -> bool:
+        doc = self.graph.doc_ids.get(doc_id)
+        return doc is not None and doc in self.graph.records
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.graph.doc_ids.values[doc] for doc in self.graph.records)
+
+    def keys(self):
+        return list(iter(self))
+
+    def values(self):
+        return [self[doc_id] for doc_id in self]
+
+    def items(self):
+        return [(doc_id, self[doc_id]) for doc_id in self]
+
+    def __getitem__(self, doc_id: str) -> Dict[str, Any]:
+        record = self.graph.records[self.graph.doc_ids.ids[doc_id]]
+        return {
+            'id': doc_id,
+            'metadata': record.metadata,
+            'relationships': {'relationship_score': record.score}
+        }
+
+
+class CompactGraphBuilder(GraphBuilder):
+    """GraphBuilder with interned ids, compact postings and no retained content"""
+
+    def __init__(self):
+        super().__init__()
+        self.doc_ids = Interner()
+        self.entity_keys = Interner()  # "<type>:<value>"
+        self.topic_keys = Interner()
+        self.records: Dict[int, _DocumentRecord] = {}
+        self.entity_postings: Dict[int, Postings] = {}
+        self.topic_postings: Dict[int, Postings] = {}
+        self.cited_by: Dict[int, Postings] = {}
+        self.documents = _DocumentView(self)
+        # The string-keyed indexes of GraphBuilder are not used
+        self.entity_index = None
+        self.topic_index = None
+        self.citation_graph = None
+
+    def add_document(
+        self,
+        doc_id: str,
+        content: str,
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Add a document and extract its relationships (content is not stored)"""
+        entities = self._extract_entities(content, metadata)
+        topics = self._extract_topics(content, metadata)
+        citations = self._extract_citations(content, metadata)
+        return self._add_features(doc_id, entities, topics, citations, metadata)
+
+    def _add_features(
+        self,
+        doc_id: str,
+        entities: Dict[str, Set[str]],
+        topics: Set[str],
+        citations: Set[str],
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        doc = self.doc_ids.intern(doc_id)
+        if doc in self.records:
+            self._remove(doc)
+
+        record = _DocumentRecord()
+        # Scalar metadata only; entity/topic lists are already in the postings
+        record.metadata = {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
+
+        for entity_type, entity_values in entities.items():
+            for entity in entity_values:
+                entity_id = self.entity_keys.intern(f"{entity_type}:{entity}")
+                record.entities.append(entity_id)
+                self.entity_postings.setdefault(entity_id, Postings()).add(doc)
+        for topic in topics:
+            topic_id = self.topic_keys.intern(topic)
+            record.topics.append(topic_id)
+            self.topic_postings.setdefault(topic_id, Postings()).add(doc)
+        for citation in citations:
+            cited = self.doc_ids.intern(citation)
+            record.citations.append(cited)
+            self.cited_by.setdefault(cited, Postings()).add(doc)
+
+        self.records[doc] = record
+        relationships = self._relationships(doc, record)
+        record.score = relationships['relationship_score']
+        return relationships
+
+    def _remove(self, doc: int):
+        record = self.records.pop(doc)
+        for entity_id in record.entities:
+            self.entity_postings[entity_id].discard(doc)
+        for topic_id in record.topics:
+            self.topic_postings[topic_id].discard(doc)
+        for cited in record.citations:
+            self.cited_by[cited].discard(doc)
+
+    def _relationships(self, doc: int, record: _DocumentRecord) -> Dict[str, Any]:
+        """Same structure as GraphBuilder._build_relationships"""
+        names = self.doc_ids.values
+        relationships = {
+            'doc_id': names[doc],
+            'relationships': {
+                'cites': [names[cited] for cited in record.citations],
+                'cited_by': [names[citing] for citing in self.cited_by.get(doc, ()) if citing != doc],
+                'shares_entities': {},
+                'similar_topics': [],
+                'related_by_email': [],
+                'related_by_url': []
+            },
+            'entity_connections': {},
+            'topic_connections': {},
+            'relationship_score': 0.0
+        }
+        by_email: Set[int] = set()
+        by_url: Set[int] = set()
+        by_topic: Set[int] = set()
+
+        for entity_id in record.entities:
+            related = [other for other in self.entity_postings[entity_id] if other != doc]
+            if not related:
+                continue
+            entity_type, entity = self.entity_keys.values[entity_id].split(':', 1)
+            related_names = [names[other] for other in related]
+            relationships['entity_connections'].setdefault(entity_type, {})[entity] = related_names
+            if entity_type == 'emails':
+                by_email.update(related)
+            elif entity_type == 'urls':
+                by_url.update(related)
+            else:
+                relationships['relationships']['shares_entities'].setdefault(entity, []).extend(related_names)
+
+        for topic_id in record.topics:
+            related = [other for other in self.topic_postings[topic_id] if other != doc]
+            if related:
+                relationships['topic_connections'][self.topic_keys.values[topic_id]] = [names[o] for o in related]
+                by_topic.update(related)
+
+        relationships['relationships']['similar_topics'] = [names[other] for other in by_topic]
+        relationships['relationships']['related_by_email'] = [names[other] for other in by_email]
+        relationships['relationships']['related_by_url'] = [names[other] for other in by_url]
+        relationships['relationship_score'] = self._calculate_relationship_score(relationships)
+        return relationships
+
+    def get_document_relationships(self, doc_id: str) -> Dict[str, Any]:
+        """Get relationship data for a specific document, computed from the postings"""
+        doc = self.doc_ids.get(doc_id)
+        if doc is None or doc not in self.records:
+            return None
+        return self._relationships(doc, self.records[doc])
+
+    def find_related_documents(
+        self,
+        doc_id: str,
+        relationship_types: List[str] = None,
+        min_score: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """Find documents related to the given document (see GraphBuilder)"""
+        relationships = self.get_document_relationships(doc_id)
+        if not relationships:
+            return []
+
+        related_docs: Dict[str, List[str]] = {}
+        by_type = relationships['relationships']
+        for rel_type in relationship_types or by_type.keys():
+            value = by_type.get(rel_type)
+            if isinstance(value, list):
+                for related_id in value:
+                    related_docs.setdefault(related_id, []).append(rel_type)
+            elif isinstance(value, dict):
+                for entity, doc_list in value.items():
+                    for related_id in doc_list:
+                        related_docs.setdefault(related_id, []).append(f"{rel_type}:{entity}")
+
+        results = []
+        for related_id, rel_types in related_docs.items():
+            doc = self.doc_ids.get(related_id)
+            record = self.records.get(doc) if doc is not None else None
+            if record and record.score >= min_score:
+                results.append({
+                    'doc_id': related_id,
+                    'relationship_types': rel_types,
+                    'relationship_score': record.score,
+                    'metadata': record.metadata
+                })
+
+        results.sort(key=lambda x: x['relationship_score'], reverse=True)
+        return results
+
+    def graph_data(self) -> Dict[str, Any]:
+        """Serializable graph: interned tables plus per-document feature ids"""
+        return {
+            'format': 'compact',
+            'doc_ids': self.doc_ids.values,
+            'entity_keys': self.entity_keys.values,
+            'topic_keys': self.topic_keys.values,
+            'documents': {
+                self.doc_ids.values[doc]: {
+                    'entities': record.entities.tolist(),
+                    'topics': record.topics.tolist(),
+                    'citations': record.citations.tolist(),
+                    'metadata': record.metadata
+                }
+                for doc, record in self.records.items()
+            },
+            'stats': self.get_statistics()
+        }
+
+    def load_graph_data(self, graph_data: Dict[str, Any]):
+        """Restore a graph written by export_graph (compact format)"""
+        doc_ids = graph_data['doc_ids']
+        entity_keys = graph_data['entity_keys']
+        topic_keys = graph_data['topic_keys']
+
+        for doc_id, doc in graph_data['documents'].items():
+            entities: Dict[str, Set[str]] = {entity_type: set() for entity_type in ENTITY_TYPES}
+            for entity_id in doc['entities']:
+                entity_type, entity = entity_keys[entity_id].split(':', 1)
+                entities.setdefault(entity_type, set()).add(entity)
+            self._add_features(
+                doc_id,
+                entities,
+                {topic_keys[topic_id] for topic_id in doc['topics']},
+                {doc_ids[cited] for cited in doc['citations']},
+                doc.get('metadata', {})
+            )
+
+    def export_graph(self, output_file: str):
+        """Export the relationship graph to JSON (compact format, no content)"""
+        graph_data = self.graph_data()
+        with open(output_file, 'w') as f:
+            json.dump(graph_data, f)
+
+        print(f"✅ Graph exported to {output_file}")
+        print(f"   Documents: {graph_data['stats']['total_documents']}")
+        print(f"   Entities: {graph_data['stats']['total_entities']}")
+        print(f"   Topics: {graph_data['stats']['total_topics']}")
+        print(f"   Citations: {graph_data['stats']['total_citations']}")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get graph statistics"""
+        records = self.records.values()
+        return {
+            'total_documents': len(self.records),
+            'total_entities': sum(1 for postings in self.entity_postings.values() if len(postings)),
+            'total_topics': sum(1 for postings in self.topic_postings.values() if len(postings)),
+            'total_citations': sum(len(record.citations) for record in records),
+            'avg_relationships_per_doc': sum(record.score for record in records) / len(self.records)
+            if self.records else 0,
+            'most_connected_entities': sorted(
+                [(self.entity_keys.values[k], len(v)) for k, v in self.entity_postings.items()],
+                key=lambda x: x[1],
+                reverse=True
+            )[:10],
+            'most_common_topics': sorted(
+                [(self.topic_keys.values[k], len(v)) for k, v in self.topic_postings.items()],
+                key=lambda x: x[1],
+                reverse=True
+            )[:10],
+            'postings': 'roaring' if ROARING_AVAILABLE else 'array'
+        }
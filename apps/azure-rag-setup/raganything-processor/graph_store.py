@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Persistent Document Relationship Graph
+GraphBuilder backed by a SQLite file:
+
+- postings (entity/topic -> documents) and citations are indexed tables,
+  so adding a document is an append plus one lookup per feature
+- opening the store reads nothing up front; there is no full reload
+- export_graph streams the compact JSON format of CompactGraphBuilder
+"""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Set, Any, Iterator
+
+from graph_builder import GraphBuilder
+from compact_graph import ENTITY_TYPES
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY,
+        doc_id TEXT UNIQUE NOT NULL,
+        metadata TEXT,
+        score REAL DEFAULT 0,
+        indexed INTEGER DEFAULT 0
+    )''',
+    'CREATE TABLE IF NOT EXISTS entities (id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS topics (id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS doc_entities (entity INTEGER, doc INTEGER, PRIMARY KEY (entity, doc)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS doc_topics (topic INTEGER, doc INTEGER, PRIMARY KEY (topic, doc)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS citations (doc INTEGER, cited INTEGER, PRIMARY KEY (doc, cited)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS doc_entities_doc ON doc_entities (doc)',
+    'CREATE INDEX IF NOT EXISTS doc_topics_doc ON doc_topics (doc)',
+    'CREATE INDEX IF NOT EXISTS citations_cited ON citations (cited)',
+]
+
+
+class _StoreDocumentView:
+    """Read-only mapping of indexed doc ids, answered by queries"""
+
+    def __init__(self, store: 'SQLiteGraphBuilder'):
+        self.store = store
+
+    def __len__(self) -> int:
+        return self.store.conn.execute('SELECT COUNT(*) FROM documents WHERE indexed = 1').fetchone()[0]
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.store.conn.execute(
+            'SELECT 1 FROM documents WHERE doc_id = ? AND indexed = 1', (doc_id,)
+        ).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for (doc_id,) in self.store.conn.execute('SELECT doc_id FROM documents WHERE indexed = 1 ORDER BY id'):
+            yield doc_id
+
+    def __getitem__(self, doc_id: str) -> Dict[str, Any]:
+        row = self.store.conn.execute(
+            'SELECT metadata, score FROM documents WHERE doc_id = ? AND indexed = 1', (doc_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(doc_id)
+        return {
+            'id': doc_id,
+            'metadata': json.loads(row[0] or '{}'),
+            'relationships': {'relationship_score': row[1]}
+        }
+
+
+class SQLiteGraphBuilder(GraphBuilder):
+    """GraphBuilder persisted in SQLite; content is not stored"""
+
+    def __init__(self, db_path: str = "sharepoint_graph.db", commit_every: int = 500):
+        super().__init__()
+        self.db_path = Path(db_path)
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+        self.documents = _StoreDocumentView(self)
+        # The in-memory indexes of GraphBuilder are not used
+        self.entity_index = None
+        self.topic_index = None
+        self.citation_graph = None
+
+    def _intern(self, table: str, column: str, value: str) -> int:
+        row = self.conn.execute(f'SELECT id FROM {table} WHERE {column} = ?', (value,)).fetchone()
+        if row:
+            return row[0]
+        return self.conn.execute(f'INSERT INTO {table} ({column}) VALUES (?)', (value,)).lastrowid
+
+    def add_document(
+        self,
+        doc_id: str,
+        content: str,
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Add a document and extract its relationships (content is not stored)"""
+        entities = self._extract_entities(content, metadata)
+        topics = self._extract_topics(content, metadata)
+        citations = self._extract_citations(content, metadata)
+        return self._add_features(doc_id, entities, topics, citations, metadata)
+
+    def _add_features(
+        self,
+        doc_id: str,
+        entities: Dict[str, Set[str]],
+        topics: Set[str],
+        citations: Set[str],
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        conn = self.conn
+        doc = self._intern('documents', 'doc_id', doc_id)
+        # Re-adding a document replaces its features
+        conn.execute('DELETE FROM doc_entities WHERE doc = ?', (doc,))
+        conn.execute('DELETE FROM doc_topics WHERE doc = ?', (doc,))
+        conn.execute('DELETE FROM citations WHERE doc = ?', (doc,))
+
+        entity_ids = [
+            self._intern('entities', 'key', f"{entity_type}:{entity}")
+            for entity_type, entity_values in entities.items()
+            for entity in entity_values
+        ]
+        topic_ids = [self._intern('topics', 'key', topic) for topic in topics]
+        cited_ids = [self._intern('documents', 'doc_id', citation) for citation in citations]
+        conn.executemany('INSERT OR IGNORE INTO doc_entities VALUES (?, ?)', [(e, doc) for e in entity_ids])
+        conn.executemany('INSERT OR IGNORE INTO doc_topics VALUES (?, ?)', [(t, doc) for t in topic_ids])
+        conn.executemany('INSERT OR IGNORE INTO citations VALUES (?, ?)', [(doc, c) for c in cited_ids])
+
+        relationships = self._relationships(doc, doc_id)
+        # Scalar metadata only; entity/topic lists are already in the postings
+        scalar = {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
+        conn.execute(
+            'UPDATE documents SET metadata = ?, score = ?, indexed = 1 WHERE id = ?',
+            (json.dumps(scalar), relationships['relationship_score'], doc)
+        )
+
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+        return relationships
+
+    def _relationships(self, doc: int, doc_id: str) -> Dict[str, Any]:
+        """Same structure as GraphBuilder._build_relationships"""
+        conn = self.conn
+        relationships = {
+            'doc_id': doc_id,
+            'relationships': {
+                'cites': [name for (name,) in conn.execute(
+                    'SELECT d.doc_id FROM citations c JOIN documents d ON d.id = c.cited WHERE c.doc = ?', (doc,))],
+                'cited_by': [name for (name,) in conn.execute(
+                    'SELECT d.doc_id FROM citations c JOIN documents d ON d.id = c.doc '
+                    'WHERE c.cited = ? AND c.doc != ?', (doc, doc))],
+                'shares_entities': {},
+                'similar_topics': [],
+                'related_by_email': [],
+                'related_by_url': []
+            },
+            'entity_connections': {},
+            'topic_connections': {},
+            'relationship_score': 0.0
+        }
+        by_email: Set[str] = set()
+        by_url: Set[str] = set()
+        by_topic: Set[str] = set()
+
+        for entity_id, key in conn.execute(
+                'SELECT e.id, e.key FROM doc_entities p JOIN entities e ON e.id = p.entity WHERE p.doc = ?', (doc,)
+        ).fetchall():
+            related = [name for (name,) in conn.execute(
+                'SELECT d.doc_id FROM doc_entities p JOIN documents d ON d.id = p.doc '
+                'WHERE p.entity = ? AND p.doc != ?', (entity_id, doc))]
+            if not related:
+                continue
+            entity_type, entity = key.split(':', 1)
+            relationships['entity_connections'].setdefault(entity_type, {})[entity] = related
+            if entity_type == 'emails':
+                by_email.update(related)
+            elif entity_type == 'urls':
+                by_url.update(related)
+            else:
+                relationships['relationships']['shares_entities'].setdefault(entity, []).extend(related)
+
+        for topic_id, topic in conn.execute(
+                'SELECT t.id, t.key FROM doc_topics p JOIN topics t ON t.id = p.topic WHERE p.doc = ?', (doc,)
+        ).fetchall():
+            related = [name for (name,) in conn.execute(
+                'SELECT d.doc_id FROM doc_topics p JOIN documents d ON d.id = p.doc '
+                'WHERE p.topic = ? AND p.doc != ?', (topic_id, doc))]
+            if related:
+                relationships['topic_connections'][topic] = related
+                by_topic.update(related)
+
+        relationships['relationships']['similar_topics'] = list(by_topic)
+        relationships['relationships']['related_by_email'] = list(by_email)
+        relationships['relationships']['related_by_url'] = list(by_url)
+        relationships['relationship_score'] = self._calculate_relationship_score(relationships)
+        return relationships
+
+    def get_document_relationships(self, doc_id: str) -> Dict[str, Any]:
+        """Get relationship data for a specific document, computed from the postings"""
+        row = self.conn.execute('SELECT id FROM documents WHERE doc_id = ? AND indexed = 1', (doc_id,)).fetchone()
+        return self._relationships(row[0], doc_id) if row else None
+
+    def find_related_documents(
+        self,
+        doc_id: str,
+        relationship_types: List[str] = None,
+        min_score: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """Find documents related to the given document (see GraphBuilder)"""
+        relationships = self.get_document_relationships(doc_id)
+        if not relationships:
+            return []
+
+        related_docs: Dict[str, List[str]] = {}
+        by_type = relationships['relationships']
+        for rel_type in relationship_types or by_type.keys():
+            value = by_type.get(rel_type)
+            if isinstance(value, list):
+                for related_id in value:
+                    related_docs.setdefault(related_id, []).append(rel_type)
+            elif isinstance(value, dict):
+                for entity, doc_list in value.items():
+                    for related_id in doc_list:
+                        related_docs.setdefault(related_id, []).append(f"{rel_type}:{entity}")
+
+        results = []
+        for related_id, rel_types in related_docs.items():
+            if related_id not in self.documents:
+                continue
+            related = self.documents[related_id]
+            score = related['relationships']['relationship_score']
+            if score >= min_score:
+                results.append({
+                    'doc_id': related_id,
+                    'relationship_types': rel_types,
+                    'relationship_score': score,
+                    'metadata': related['metadata']
+                })
+
+        results.sort(key=lambda x: x['relationship_score'], reverse=True)
+        return results
+
+    def import_graph(self, graph_file: str):
+        """Load a JSON graph export (compact or legacy format) into the store"""
+        with open(graph_file, 'r') as f:
+            graph_data = json.load(f)
+
+        if graph_data.get('format') == 'compact':
+            doc_ids = graph_data['doc_ids']
+            entity_keys = graph_data['entity_keys']
+            topic_keys = graph_data['topic_keys']
+            for doc_id, doc in graph_data['documents'].items():
+                entities: Dict[str, Set[str]] = {entity_type: set() for entity_type in ENTITY_TYPES}
+                for entity_id in doc['entities']:
+                    entity_type, entity = entity_keys[entity_id].split(':', 1)
+                    entities.setdefault(entity_type, set()).add(entity)
+                self._add_features(
+                    doc_id,
+                    entities,
+                    {topic_keys[topic_id] for topic_id in doc['topics']},
+                    {doc_ids[cited] for cited in doc['citations']},
+                    doc.get('metadata', {})
+                )
+        else:
+            for doc_id, doc_data in graph_data.get('documents', {}).items():
+                self.add_document(doc_id, doc_data.get('content', ''), doc_data.get('metadata', {}))
+        self.commit()
+
+    def export_graph(self, output_file: str):
+        """Stream the graph to JSON in the compact format, one row at a time"""
+        self.commit()
+        conn = self.conn
+
+        def write_table(f, name: str, query: str):
+            # Row ids are dense from 1, so list position = id - 1
+            f.write(f', "{name}": [')
+            for position, (value,) in enumerate(conn.execute(query)):
+                f.write((', ' if position else '') + json.dumps(value))
+            f.write(']')
+
+        def features(query: str) -> Iterator[tuple]:
+            # (doc, ids) per document, from one ordered scan
+            current, ids = None, []
+            for doc, feature in conn.execute(query):
+                if doc != current:
+                    if current is not None:
+                        yield current, ids
+                    current, ids = doc, []
+                ids.append(feature - 1)
+            if current is not None:
+                yield current, ids
+
+        with open(output_file, 'w') as f:
+            f.write('{"format": "compact"')
+            write_table(f, 'doc_ids', 'SELECT doc_id FROM documents ORDER BY id')
+            write_table(f, 'entity_keys', 'SELECT key FROM entities ORDER BY id')
+            write_table(f, 'topic_keys', 'SELECT key FROM topics ORDER BY id')
+
+            f.write(', "documents": {')
+            streams = {
+                'entities': features('SELECT doc, entity FROM doc_entities INDEXED BY doc_entities_doc ORDER BY doc'),
+                'topics': features('SELECT doc, topic FROM doc_topics INDEXED BY doc_topics_doc ORDER BY doc'),
+                'citations': features('SELECT doc, cited FROM citations ORDER BY doc'),
+            }
+            pending = {name: next(stream, None) for name, stream in streams.items()}
+            for position, (doc, doc_id, metadata) in enumerate(conn.execute(
+                    'SELECT id, doc_id, metadata FROM documents WHERE indexed = 1 ORDER BY id')):
+                record = {}
+                for name, stream in streams.items():
+                    # Postings of each document arrive in doc order; catch up to this one
+                    while pending[name] is not None and pending[name][0] < doc:
+                        pending[name] = next(stream, None)
+                    if pending[name] is not None and pending[name][0] == doc:
+                        record[name] = pending[name][1]
+                        pending[name] = next(stream, None)
+                    else:
+                        record[name] = []
+                record['metadata'] = json.loads(metadata or '{}')
+                f.write((', ' if position else '') + f'{json.dumps(doc_id)}: {json.dumps(record)}')
+            f.write('}')
+
+            stats = self.get_statistics()
+            f.write(f', "stats": {json.dumps(stats)}}}')
+
+        print(f"✅ Graph exported to {output_file}")
+        print(f"   Documents: {stats['total_documents']}")
+        print(f"   Entities: {stats['total_entities']}")
+        print(f"   Topics: {stats['total_topics']}")
+        print(f"   Citations: {stats['total_citations']}")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get graph statistics"""
+        conn = self.conn
+        total_documents, avg_score = conn.execute(
+            'SELECT COUNT(*), COALESCE(AVG(score), 0) FROM documents WHERE indexed = 1').fetchone()
+        return {
+            'total_documents': total_documents,
+            'total_entities': conn.execute('SELECT COUNT(DISTINCT entity) FROM doc_entities').fetchone()[0],
+            'total_topics': conn.execute('SELECT COUNT(DISTINCT topic) FROM doc_topics').fetchone()[0],
+            'total_citations': conn.execute('SELECT COUNT(*) FROM citations').fetchone()[0],
+            'avg_relationships_per_doc': avg_score,
+            'most_connected_entities': [tuple(row) for row in conn.execute(
+                'SELECT e.key, COUNT(*) AS n FROM doc_entities p JOIN entities e ON e.id = p.entity '
+                'GROUP BY p.entity ORDER BY n DESC LIMIT 10')],
+            'most_common_topics': [tuple(row) for row in conn.execute(
+                'SELECT t.key, COUNT(*) AS n FROM doc_topics p JOIN topics t ON t.id = p.topic '
+                'GROUP BY p.topic ORDER BY n DESC LIMIT 10')],
+            'db_path': str(self.db_path)
+        }
+
+    def commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """Commit pending documents and close the database"""
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Storage Codec
+Transparent zstd compression for text-heavy blobs (Teams message bundles,
+calendar and contact records, extracted text)
+
+The codec is recorded in blob metadata (codec, codec_dict, raw_size) so
+reads decompress transparently; blobs without it are returned as stored.
+Small JSON records compress much better with a dictionary trained on
+samples of the same record type (benchmark_storage_codec.py --train).
+"""
+
+# Standard library imports
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Local application imports
+from config_manager import get_config_manager
+
+try:
+    import zstandard as zstd
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstd = None
+    ZSTD_AVAILABLE = False
+
+CODEC_KEY = 'codec'
+DICT_KEY = 'codec_dict'
+RAW_SIZE_KEY = 'raw_size'
+
+# Only these payloads are worth compressing; documents (PDF, DOCX, ...) already are
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+# Compressed output must save at least this fraction to be kept
+MIN_SAVING = 0.1
+
+
+class StorageCodec:
+    """
+    Encode/decode blob payloads with zstd
+
+    encode() returns the payload to store and the metadata to store with it;
+    decode() takes the stored payload and its metadata. Compressor objects
+    are kept per thread (zstandard contexts are not thread-safe).
+    """
+
+    def __init__(self, enabled: bool = True, level: int = 3, min_size: int = 512,
+                 dictionary_dir: Optional[str] = None, dictionary: Optional[str] = None,
+                 dictionary_max_size: int = 64 * 1024):
+        if enabled and not ZSTD_AVAILABLE:
+            print("⚠️  zstandard not installed: blobs are stored uncompressed (pip install zstandard)")
+
+        self.enabled = enabled and ZSTD_AVAILABLE
+        self.level = level
+        self.min_size = min_size
+        self.dictionary_dir = Path(dictionary_dir) if dictionary_dir else None
+        # A dictionary only pays off for small payloads; large bundles skip it
+        self.dictionary_max_size = dictionary_max_size
+
+        self._dictionaries: Optional[Dict[int, 'zstd.ZstdCompressionDict']] = None
+        self._encode_dict = self._load_dictionary(dictionary) if dictionary and self.enabled else None
+        self._local = threading.local()
+
+        self.stats = {
+            'encoded': 0,
+            'compressed': 0,
+            'raw_bytes': 0,
+            'stored_bytes': 0
+        }
+
+    @classmethod
+    def from_config(cls) -> 'StorageCodec':
+        """Codec configured by azure_storage.compression in m365_config.yaml"""
+        config = get_config_manager().get_azure_storage_config().get('compression', {}) or {}
+        return cls(
+            enabled=config.get('enabled', False),
+            level=config.get('level', 3),
+            min_size=config.get('min_size_bytes', 512),
+            dictionary_dir=config.get('dictionary_dir', 'codec_dictionaries'),
+            dictionary=config.get('dictionary')
+        )
+
+    def _load_dictionary(self, name: str) -> 'zstd.ZstdCompressionDict':
+        path = Path(name)
+        if not path.is_absolute() and self.dictionary_dir:
+            path = self.dictionary_dir / path
+        return zstd.ZstdCompressionDict(path.read_bytes())
+
+    def _dictionary(self, dict_id: int) -> 'zstd.ZstdCompressionDict':
+        """Dictionary by id, from the dictionary directory"""
+        if self._dictionaries is None:
+            self._dictionaries = {}
+            if self._encode_dict:
+                self._dictionaries[self._encode_dict.dict_id()] = self._encode_dict
+            if self.dictionary_dir and self.dictionary_dir.exists():
+                for path in self.dictionary_dir.glob('*.zdict'):
+                    dictionary = zstd.ZstdCompressionDict(path.read_bytes())
+                    self._dictionaries[dictionary.dict_id()] = dictionary
+
+        if dict_id not in self._dictionaries:
+            raise ValueError(f"Compression dictionary {dict_id} not found in {self.dictionary_dir}")
+        return self._dictionaries[dict_id]
+
+    def _compressor(self, use_dict: bool) -> 'zstd.ZstdCompressor':
+        key = 'dict_compressor' if use_dict else 'compressor'
+        compressor = getattr(self._local, key, None)
+        if compressor is None:
+            compressor = zstd.ZstdCompressor(
+                level=self.level, dict_data=self._encode_dict if use_dict else None
+            )
+            setattr(self._local, key, compressor)
+        return compressor
+
+    def is_compressible(self, content_type: Optional[str], size: int) -> bool:
+        return bool(content_type) and size >= self.min_size and content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def encode(self, data: bytes, content_type: Optional[str] = None) -> Tuple[bytes, Dict[str, str]]:
+        """Compress a payload if worthwhile; returns (payload, codec metadata)"""
+        self.stats['encoded'] += 1
+        self.stats['raw_bytes'] += len(data)
+
+        if not self.enabled or not self.is_compressible(content_type, len(data)):
+            self.stats['stored_bytes'] += len(data)
+            return data, {}
+
+        use_dict = self._encode_dict is not None and len(data) <= self.dictionary_max_size
+        compressed = self._compressor(use_dict).compress(data)
+
+        if len(compressed) > len(data) * (1 - MIN_SAVING):
+            self.stats['stored_bytes'] += len(data)
+            return data, {}
+
+        metadata = {CODEC_KEY: 'zstd', RAW_SIZE_KEY: str(len(data))}
+        if use_dict:
+            metadata[DICT_KEY] = str(self._encode_dict.dict_id())
+
+        self.stats['compressed'] += 1
+        self.stats['stored_bytes'] += len(compressed)
+        return compressed, metadata
+
+    def decode(self, data: bytes, metadata: Optional[Dict[str, str]] = None) -> bytes:
+        """Return the original payload of a stored blob"""
+        codec = (metadata or {}).get(CODEC_KEY)
+        if not codec:
+            return data
+        if codec != 'zstd':
+            raise ValueError(f"Unknown storage codec: {codec}")
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard is required to read compressed blobs: pip install zstandard")
+
+        dict_id = metadata.get(DICT_KEY)
+        decompressor = zstd.ZstdDecompressor(
+            dict_data=self._dictionary(int(dict_id)) if dict_id else None
+        )
+        return decompressor.decompress(data, max_output_size=int(metadata.get(RAW_SIZE_KEY, 0)))
+
+
+def train_dictionary(samples: List[bytes], dict_size: int = 16 * 1024) -> 'zstd.ZstdCompressionDict':
+    """Train a zstd dictionary on sample records of one type"""
+    if not ZSTD_AVAILABLE:
+        raise ImportError("zstandard is required to train dictionaries: pip install zstandard")
+    return zstd.train_dictionary(dict_size, samples)
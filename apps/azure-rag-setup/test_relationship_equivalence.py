@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Equivalence tests for the relationship and graph fast paths
+Each optimized structure is checked against the straightforward version it
+replaced, on small seeded random corpora:
+
+- SimilarityEngine candidate join vs. comparing every pair
+- KeywordScanner vs. `pattern in text` per keyword
+- CooccurrenceMatrix (CSR + delta) vs. plain dict counts
+- ElasticsearchGraphBuilder entity networks from the matrix vs. from
+  aggregations, and the similar-documents query
+- CompactGraphBuilder / SQLiteGraphBuilder vs. GraphBuilder, and the
+  JSON <-> SQLite export/import roundtrip
+
+Runs offline: python test_relationship_equivalence.py (or pytest)
+"""
+
+import os
+import sys
+import json
+import random
+import tempfile
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Any
+
+# Add this directory (utils) and raganything-processor (graph builders) to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, str(Path(__file__).parent / "raganything-processor"))
+
+from utils.similarity_engine import SimilarityEngine
+from utils.text_scanner import KeywordScanner
+from utils.cooccurrence_matrix import CooccurrenceMatrix, CooccurrenceService
+from utils.elasticsearch_graph_builder import ElasticsearchGraphBuilder
+from graph_builder import GraphBuilder
+from compact_graph import CompactGraphBuilder
+from graph_store import SQLiteGraphBuilder
+
+SEEDS = range(5)
+
+
+def _random_documents(rng: random.Random, count: int) -> List[Dict[str, Any]]:
+    entities = [f"entity{i}" for i in range(12)]
+    topics = [f"topic{i}" for i in range(6)]
+    return [{
+        "id": f"doc{i}",
+        "entities": [{"value": value} for value in rng.sample(entities, rng.randint(0, 5))],
+        # One topic most documents share, as in real enrichment output
+        "topics": rng.sample(topics, rng.randint(0, 3)) + (["common"] if rng.random() < 0.8 else [])
+    } for i in range(count)]
+
+
+def _all_pairs_relationships(documents: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """The comparison of every pair that SimilarityEngine replaced"""
+    relationships = []
+    for i, doc1 in enumerate(documents):
+        for doc2 in documents[i + 1:]:
+            entities1 = set(entity["value"] for entity in doc1.get("entities", []))
+            entities2 = set(entity["value"] for entity in doc2.get("entities", []))
+            topics1, topics2 = set(doc1.get("topics", [])), set(doc2.get("topics", []))
+            entity_similarity = len(entities1 & entities2) / len(entities1 | entities2) if entities1 | entities2 else 0
+            topic_similarity = len(topics1 & topics2) / len(topics1 | topics2) if topics1 | topics2 else 0
+            similarity = (entity_similarity + topic_similarity) / 2
+            if similarity > threshold:
+                relationships.append({
+                    "source_doc_id": doc1["id"],
+                    "target_doc_id": doc2["id"],
+                    "relationship_type": "similarity",
+                    "strength": similarity,
+                    "shared_entities": sorted(entities1 & entities2),
+                    "shared_topics": sorted(topics1 & topics2)
+                })
+    return relationships
+
+
+def test_similarity_engine_matches_all_pairs():
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        documents = _random_documents(rng, 150)
+        for threshold in (0.1, 0.3, 0.5):
+            found = SimilarityEngine(threshold).find_relationships(documents)
+            for relationship in found:
+                relationship["shared_entities"] = sorted(relationship["shared_entities"])
+                relationship["shared_topics"] = sorted(relationship["shared_topics"])
+            assert found == _all_pairs_relationships(documents, threshold), (seed, threshold)
+
+
+def test_keyword_scanner_matches_substring_checks():
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        # A small alphabet, so patterns overlap and nest (a, ab, bab, ...)
+        patterns = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(30)]
+        scanner = KeywordScanner(patterns)
+        for _ in range(50):
+            text = "".join(rng.choice("abc ") for _ in range(rng.randint(0, 80)))
+            expected = {pattern: text.find(pattern) for pattern in patterns if pattern in text}
+            assert scanner.first_positions(text) == expected, (seed, text)
+
+
+def test_cooccurrence_matrix_matches_dict_counts():
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        vocabulary = [f"e{i}" for i in range(15)]
+        # Compacts every few changes, so base and delta are both exercised
+        matrix = CooccurrenceMatrix(compact_threshold=7)
+        documents: Dict[str, set] = {}
+
+        for _ in range(200):
+            doc_id = f"doc{rng.randint(0, 40)}"
+            if rng.random() < 0.2:
+                matrix.remove_document(doc_id)
+                documents.pop(doc_id, None)
+            else:
+                values = set(rng.sample(vocabulary, rng.randint(0, 5)))
+                matrix.add_document(doc_id, values)
+                documents[doc_id] = values
+
+        counts: Dict[str, Counter] = defaultdict(Counter)
+        frequency: Counter = Counter()
+        for values in documents.values():
+            frequency.update(values)
+            for a in values:
+                for b in values:
+                    if a != b:
+                        counts[a][b] += 1
+
+        for entity in vocabulary:
+            assert matrix.get_frequency(entity) == frequency[entity], (seed, entity)
+            neighbors = matrix.neighbors(entity, k=len(vocabulary))
+            assert {n["entity"]: n["co_occurrence"] for n in neighbors} == dict(counts[entity]), (seed, entity)
+            assert [n["co_occurrence"] for n in neighbors] == sorted(counts[entity].values(), reverse=True)
+            for other in vocabulary:
+                count = counts[entity][other]
+                smaller = min(frequency[entity], frequency[other])
+                expected = min(count / smaller, 1.0) if count and smaller else 0.0
+                assert abs(matrix.co_occurrence(entity, other) - expected) < 1e-9, (seed, entity, other)
+
+
+class _AggregationES:
+    """Answers the graph builder's entity aggregations from in-memory documents"""
+
+    def __init__(self, documents: Dict[str, set]):
+        self.documents = documents
+        self.queries = 0
+
+    def search(self, index: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        self.queries += 1
+        aggs = body["aggs"]["entities"]["aggs"]
+        if "values" in aggs:
+            # Document frequencies of the included entities
+            include = aggs["values"]["terms"]["include"]
+            buckets = [{"key": entity, "docs": {"doc_count": self._frequency(entity)}}
+                       for entity in include if self._frequency(entity)]
+            return {"aggregations": {"entities": {"values": {"buckets": buckets}}}}
+
+        seeds = aggs["seeds"]["terms"]["include"]
+        size = aggs["seeds"]["aggs"]["docs"]["aggs"]["entities"]["aggs"]["neighbors"]["terms"]["size"]
+        buckets = []
+        for seed in seeds:
+            counts = Counter()
+            for values in self.documents.values():
+                if seed in values:
+                    counts.update(values)
+            if not counts:
+                continue
+            # terms aggregations order by count, then key
+            top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:size]
+            buckets.append({"key": seed, "docs": {"entities": {"neighbors": {"buckets": [
+                {"key": key, "docs": {"doc_count": count}} for key, count in top
+            ]}}}})
+        return {"aggregations": {"entities": {"seeds": {"buckets": buckets}}}}
+
+    def _frequency(self, entity: str) -> int:
+        return sum(1 for values in self.documents.values() if entity in values)
+
+
+def _network_edges(network: Dict[str, Any]) -> set:
+    """Edges without direction (which end is the source depends on visit order)"""
+    return {(frozenset((edge["source"], edge["target"])), edge["co_occurrence"],
+             round(edge["strength"], 9), edge["hop"]) for edge in network["edges"]}
+
+
+def test_entity_network_from_matrix_matches_aggregations():
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        vocabulary = [f"e{i}" for i in range(12)]
+        documents = {f"doc{i}": set(rng.sample(vocabulary, rng.randint(1, 4))) for i in range(60)}
+
+        es = _AggregationES(documents)
+        service = CooccurrenceService(es, "documents")
+        for doc_id, values in documents.items():
+            service.matrix.add_document(doc_id, values)
+        service.matrix.compact()
+
+        # No truncation (max_neighbors covers the vocabulary), so ties cannot differ
+        from_aggregations = ElasticsearchGraphBuilder(SimpleNamespace(es=es)).get_entity_network("e0", 2, 20)
+        queries = es.queries
+        service.ready = True
+        from_matrix = ElasticsearchGraphBuilder(SimpleNamespace(es=es), service).get_entity_network("e0", 2, 20)
+
+        assert queries and es.queries == queries, "matrix path must not query Elasticsearch"
+        assert from_matrix["nodes"] == from_aggregations["nodes"], seed
+        assert _network_edges(from_matrix) == _network_edges(from_aggregations), seed
+
+
+def test_entity_network_sees_documents_indexed_later():
+    documents = {"doc0": {"e0", "e1"}, "doc1": {"e0"}}
+    es = _AggregationES(documents)
+    # One long-lived builder, as in the API server
+    builder = ElasticsearchGraphBuilder(SimpleNamespace(es=es))
+
+    assert builder.get_entity_network("e0", 1, 20)["co_occurrences"] == {"e1": 1.0}
+    documents["doc2"] = {"e1"}
+    documents["doc3"] = {"e1"}
+    # e1 is now in three documents: strength = 1 / min(2, 3)
+    assert builder.get_entity_network("e0", 1, 20)["co_occurrences"] == {"e1": 0.5}
+
+
+def test_find_similar_documents_queries_nested_entities():
+    source = {"entities": [{"value": "budget"}, {"value": "roadmap"}], "topics": ["finance"]}
+    captured = {}
+
+    def search(index, body):
+        captured.update(body)
+        return {"hits": {"hits": [{"_id": "doc2", "_score": 1.5, "_source": {"title": "Plan"}}]}}
+
+    es = SimpleNamespace(get=lambda index, id: {"_source": source}, search=search)
+    results = ElasticsearchGraphBuilder(SimpleNamespace(es=es)).find_similar_documents("doc1", 5)
+
+    assert results == [{"title": "Plan", "similarity_score": 1.5, "doc_id": "doc2"}]
+    should = captured["query"]["bool"]["should"]
+    nested = should[0]["nested"]
+    assert nested["path"] == "entities"
+    assert sorted(nested["query"]["terms"]["entities.value.keyword"]) == ["budget", "roadmap"]
+    assert should[1] == {"terms": {"topics": ["finance"]}}
+    assert captured["size"] == 5
+
+
+def _random_graph_documents(rng: random.Random, count: int) -> List[tuple]:
+    people = ["Alice", "Bob", "Carol", "Dave"]
+    phrases = ["budget", "roadmap", "hiring", "migration", "audit"]
+    documents = []
+    for i in range(count):
+        content = " ".join([
+            f"Contact {rng.choice(['ops', 'hr', 'it'])}@example.com" if rng.random() < 0.5 else "",
+            f"See https://intranet.example.com/{rng.randint(0, 3)}" if rng.random() < 0.4 else "",
+            f"see document doc{rng.randint(0, count - 1)}" if rng.random() < 0.3 else ""
+        ])
+        metadata = {
+            "people": rng.sample(people, rng.randint(0, 2)),
+            "keyPhrases": rng.sample(phrases, rng.randint(0, 2)),
+            "title": f"Document {i}",
+            "size": rng.randint(1, 1000)
+        }
+        documents.append((f"doc{i}", content, metadata))
+    return documents
+
+
+def _normalized(relationships: Dict[str, Any]) -> Dict[str, Any]:
+    """Relationship lists are unordered; sort them for comparison"""
+    def sort(value):
+        if isinstance(value, dict):
+            return {key: sort(item) for key, item in value.items()}
+        if isinstance(value, (list, set)):
+            return sorted(value)
+        return value
+    return {
+        "doc_id": relationships["doc_id"],
+        "relationships": sort(relationships["relationships"]),
+        "entity_connections": sort(relationships["entity_connections"]),
+        "topic_connections": sort(relationships["topic_connections"]),
+        "relationship_score": round(relationships["relationship_score"], 9)
+    }
+
+
+def _snapshot(graph: GraphBuilder, doc_ids: List[str]) -> Dict[str, Any]:
+    return {doc_id: _normalized(graph.get_document_relationships(doc_id)) for doc_id in doc_ids}
+
+
+def _without_cited_by(graph: GraphBuilder, relationships: Dict[str, Any]) -> Dict[str, Any]:
+    """GraphBuilder never fills cited_by; drop it (and its score) to compare"""
+    relationships = dict(relationships, relationships=dict(relationships['relationships'], cited_by=[]))
+    relationships['relationship_score'] = graph._calculate_relationship_score(relationships)
+    return _normalized(relationships)
+
+
+def test_compact_and_sqlite_graphs_match_graph_builder():
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        documents = _random_graph_documents(rng, 40)
+        doc_ids = [doc_id for doc_id, _, _ in documents]
+
+        reference, compact = GraphBuilder(), CompactGraphBuilder()
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SQLiteGraphBuilder(os.path.join(tmp, "graph.db"))
+            for graph in (reference, compact, store):
+                for doc_id, content, metadata in documents:
+                    graph.add_document(doc_id, content, metadata)
+
+            # GraphBuilder returns relationships as of when a document was added;
+            # adding every document again yields its view of the full corpus
+            expected = {doc_id: _normalized(reference.add_document(doc_id, content, metadata))
+                        for doc_id, content, metadata in documents}
+            for graph in (compact, store):
+                found = {doc_id: _without_cited_by(graph, graph.get_document_relationships(doc_id))
+                         for doc_id in doc_ids}
+                assert found == expected, (seed, type(graph).__name__)
+            # The two backends also agree on cited_by
+            assert _snapshot(store, doc_ids) == _snapshot(compact, doc_ids), seed
+            store.close()
+
+
+def test_graph_export_import_roundtrip():
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        documents = _random_graph_documents(rng, 40)
+        doc_ids = [doc_id for doc_id, _, _ in documents]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            compact = CompactGraphBuilder()
+            for doc_id, content, metadata in documents:
+                compact.add_document(doc_id, content, metadata)
+            expected = _snapshot(compact, doc_ids)
+            expected_related = {
+                doc_id: {r["doc_id"]: (sorted(r["relationship_types"]), r["metadata"])
+                         for r in compact.find_related_documents(doc_id)}
+                for doc_id in doc_ids
+            }
+
+            # JSON -> SQLite
+            compact_file = os.path.join(tmp, "compact.json")
+            compact.export_graph(compact_file)
+            store = SQLiteGraphBuilder(os.path.join(tmp, "graph.db"))
+            store.import_graph(compact_file)
+            assert _snapshot(store, doc_ids) == expected, seed
+            assert store.get_statistics()["total_documents"] == len(doc_ids)
+
+            # SQLite -> JSON -> CompactGraphBuilder
+            store_file = os.path.join(tmp, "store.json")
+            store.export_graph(store_file)
+            store.close()
+            restored = CompactGraphBuilder()
+            with open(store_file) as f:
+                restored.load_graph_data(json.load(f))
+            assert _snapshot(restored, doc_ids) == expected, seed
+            # Stored scores are as of when each document was added (as in
+            # GraphBuilder), so only the related documents are compared
+            for doc_id in doc_ids:
+                related = {r["doc_id"]: (sorted(r["relationship_types"]), r["metadata"])
+                           for r in restored.find_related_documents(doc_id)}
+                assert related == expected_related[doc_id], (seed, doc_id)
+
+
+def run_equivalence_tests():
+    """Run every equivalence test and print a summary"""
+    print("=" * 60)
+    print("🧪 Relationship and Graph Equivalence Tests")
+    print("=" * 60)
+    print(f"Test started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    tests = [
+        ("SimilarityEngine vs. all pairs", test_similarity_engine_matches_all_pairs),
+        ("KeywordScanner vs. substring checks", test_keyword_scanner_matches_substring_checks),
+        ("CooccurrenceMatrix vs. dict counts", test_cooccurrence_matrix_matches_dict_counts),
+        ("Entity network: matrix vs. aggregations", test_entity_network_from_matrix_matches_aggregations),
+        ("Entity network after later indexing", test_entity_network_sees_documents_indexed_later),
+        ("Similar documents query", test_find_similar_documents_queries_nested_entities),
+        ("Compact/SQLite graphs vs. GraphBuilder", test_compact_and_sqlite_graphs_match_graph_builder),
+        ("Graph JSON <-> SQLite roundtrip", test_graph_export_import_roundtrip)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            passed += 1
+            print(f"✅ {test_name} - PASSED")
+        except AssertionError as e:
+            print(f"❌ {test_name} - FAILED: {e}")
+        except Exception as e:
+            print(f"❌ {test_name} - ERROR: {e}")
+
+    print(f"\nOverall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = run_equivalence_tests()
+    exit(0 if success else 1)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Tests for the sync coordinator's lease table
+Runs SQLiteLeaseStore against a temporary database:
+
+- claim order, renew by the holder only, and completion
+- expired leases are taken over and the old holder loses them
+- max_attempts marks crashing units failed instead of retrying forever
+- concurrent claimers never get the same unit
+- an incomplete LeaseStore subclass cannot be instantiated
+
+Runs offline: python test_sync_coordinator.py (or pytest)
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from m365_sync_coordinator import (
+    LeaseStore, SQLiteLeaseStore,
+    STATUS_PENDING, STATUS_LEASED, STATUS_DONE, STATUS_FAILED
+)
+
+RUN_ID = 'run-1'
+
+
+def _store(temp_dir: str, units: int = 3) -> SQLiteLeaseStore:
+    store = SQLiteLeaseStore(os.path.join(temp_dir, 'leases.db'))
+    store.enqueue(RUN_ID, [
+        {'source': 'sharepoint', 'unit_id': f'site-{i}', 'unit_name': f'Site {i}', 'priority': i}
+        for i in range(units)
+    ])
+    return store
+
+
+def _statuses(store: SQLiteLeaseStore) -> dict:
+    return {unit['unit_id']: unit['status'] for unit in store.get_units(RUN_ID)}
+
+
+def test_claim_renew_complete():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = _store(temp_dir)
+
+        first = store.claim(RUN_ID, 'worker-a', lease_seconds=60)
+        second = store.claim(RUN_ID, 'worker-b', lease_seconds=60)
+        assert first['unit_id'] == 'site-2', "highest priority first"
+        assert second['unit_id'] == 'site-1'
+        assert first['status'] == STATUS_LEASED and first['attempts'] == 1
+
+        assert store.renew(first['id'], 'worker-a', 60)
+        assert not store.renew(first['id'], 'worker-b', 60), "only the holder renews"
+
+        assert store.complete(first['id'], 'worker-a', {'stats': {'documents': 5}})
+        assert not store.complete(first['id'], 'worker-a', {}), "a done unit is not completed twice"
+        assert _statuses(store)['site-2'] == STATUS_DONE
+
+        progress = store.get_progress(RUN_ID)
+        assert progress['by_status'][STATUS_DONE] == 1
+        assert progress['totals'] == {'documents': 5}
+        assert progress['active_workers'] == ['worker-b']
+        assert store.has_outstanding(RUN_ID)
+        assert store.latest_run_id() == RUN_ID
+
+
+def test_expired_lease_is_taken_over():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = _store(temp_dir, units=1)
+
+        stalled = store.claim(RUN_ID, 'worker-a', lease_seconds=-1)
+        assert store.get_progress(RUN_ID)['expired_leases'] == 1
+
+        taken = store.claim(RUN_ID, 'worker-b', lease_seconds=60)
+        assert taken['id'] == stalled['id']
+        assert taken['worker_id'] == 'worker-b'
+        assert taken['attempts'] == 2
+
+        # The stalled worker finds out through renew/complete
+        assert not store.renew(stalled['id'], 'worker-a', 60)
+        assert not store.complete(stalled['id'], 'worker-a', {})
+        assert store.claim(RUN_ID, 'worker-c', lease_seconds=60) is None
+
+
+def test_max_attempts_fails_expired_unit():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = _store(temp_dir, units=1)
+
+        store.claim(RUN_ID, 'worker-a', lease_seconds=-1, max_attempts=2)
+        store.claim(RUN_ID, 'worker-b', lease_seconds=-1, max_attempts=2)
+
+        # Both attempts used up by workers that died: failed, not leased again
+        assert store.claim(RUN_ID, 'worker-c', lease_seconds=60, max_attempts=2) is None
+        unit = store.get_units(RUN_ID)[0]
+        assert unit['status'] == STATUS_FAILED
+        assert 'after 2 attempts' in unit['error']
+        assert not store.has_outstanding(RUN_ID)
+
+
+def test_fail_retries_until_max_attempts():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = _store(temp_dir, units=1)
+
+        unit = store.claim(RUN_ID, 'worker-a', lease_seconds=60)
+        assert store.fail(unit['id'], 'worker-a', 'throttled', max_attempts=2)
+        assert _statuses(store)['site-0'] == STATUS_PENDING
+
+        unit = store.claim(RUN_ID, 'worker-b', lease_seconds=60)
+        assert not store.fail(unit['id'], 'worker-a', 'stale', max_attempts=2), "only the holder fails"
+        assert store.fail(unit['id'], 'worker-b', 'throttled', max_attempts=2)
+        assert _statuses(store)['site-0'] == STATUS_FAILED
+
+
+def test_concurrent_claims_are_exclusive():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = _store(temp_dir, units=40)
+        claimed = []
+        lock = threading.Lock()
+
+        def work(worker_id: str):
+            worker_store = SQLiteLeaseStore(store.db_path)
+            while True:
+                unit = worker_store.claim(RUN_ID, worker_id, lease_seconds=60)
+                if not unit:
+                    return
+                with lock:
+                    claimed.append(unit['unit_id'])
+
+        threads = [threading.Thread(target=work, args=(f'worker-{i}',)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(claimed) == 40
+        assert len(set(claimed)) == 40, "a unit was leased to two workers"
+
+
+def test_incomplete_store_cannot_be_instantiated():
+    class PartialStore(LeaseStore):
+        def init_schema(self):
+            pass
+
+    try:
+        PartialStore()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("expected TypeError for missing abstract methods")
+
+
+def run_sync_coordinator_tests():
+    """Run all lease table tests"""
+    print("🧪 Sync Coordinator Lease Tests")
+    print("=" * 50)
+    print(f"Test started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    tests = [
+        ("Claim, renew, complete", test_claim_renew_complete),
+        ("Expired lease takeover", test_expired_lease_is_taken_over),
+        ("max_attempts on expiry", test_max_attempts_fails_expired_unit),
+        ("fail() retries", test_fail_retries_until_max_attempts),
+        ("Concurrent claims", test_concurrent_claims_are_exclusive),
+        ("Abstract LeaseStore", test_incomplete_store_cannot_be_instantiated)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            passed += 1
+            print(f"✅ {test_name} - PASSED")
+        except AssertionError as e:
+            print(f"❌ {test_name} - FAILED: {e}")
+        except Exception as e:
+            print(f"❌ {test_name} - ERROR: {e}")
+
+    print(f"\nOverall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = run_sync_coordinator_tests()
+    exit(0 if success else 1)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared Graph token broker and the MSAL acquirer behind it
+Uses a fake MSAL application (with a real msal TokenCache) and fake acquire
+callables, so nothing reaches Entra:
+
+- The acquirer clears MSAL's cached access token without breaking iteration
+- get_token() serves the cached token and refreshes close to expiry
+- The background refresher replaces a token refresh_ahead seconds early
+- A shared file backend lets a second broker reuse the first one's token
+- refresh_ahead is clamped and acquisition errors are raised
+- an incomplete TokenCacheBackend cannot be instantiated
+
+Runs offline: python test_token_broker.py (or pytest)
+"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from msal import TokenCache
+
+import m365_auth_app
+from m365_token_broker import (
+    TokenBroker, TokenCacheBackend, FileTokenCache, MIN_VALIDITY_SECONDS, MAX_REFRESH_AHEAD_SECONDS
+)
+
+TOKEN_ENDPOINT = "https://login.microsoftonline.com/tenant/oauth2/v2.0/token"
+
+
+class FakeConfidentialClientApplication:
+    """Stands in for msal.ConfidentialClientApplication: serves cached tokens like MSAL does"""
+
+    def __init__(self, client_id, client_credential, authority):
+        self.client_id = client_id
+        self.token_cache = TokenCache()
+        self.requests = 0
+
+    def acquire_token_for_client(self, scopes):
+        cached = list(self.token_cache.search(TokenCache.CredentialType.ACCESS_TOKEN))
+        if cached:
+            return {'access_token': cached[0]['secret'], 'expires_in': 3599}
+
+        self.requests += 1
+        response = {'access_token': f"token-{self.requests}", 'expires_in': 3599, 'token_type': 'Bearer'}
+        self.token_cache.add({
+            'client_id': self.client_id,
+            'scope': scopes,
+            'token_endpoint': TOKEN_ENDPOINT,
+            'response': dict(response)
+        })
+        return response
+
+
+def _counting_acquire(expires_in: int = 3599):
+    calls = []
+
+    def acquire():
+        calls.append(time.time())
+        return {'access_token': f"token-{len(calls)}", 'expires_in': expires_in}
+
+    return acquire, calls
+
+
+def _broker(acquire, **kwargs) -> TokenBroker:
+    broker = TokenBroker('tenant:client:scope', acquire, **kwargs)
+    # Hot-path tests drive refreshes themselves
+    broker._start_refresher = lambda: None
+    return broker
+
+
+def test_acquirer_bypasses_msal_cache():
+    original = m365_auth_app.ConfidentialClientApplication
+    m365_auth_app.ConfidentialClientApplication = FakeConfidentialClientApplication
+    try:
+        auth = SimpleNamespace(
+            client_id='client', client_secret='secret',
+            authority='https://login.microsoftonline.com/tenant',
+            scope=["https://graph.microsoft.com/.default"]
+        )
+        acquire = m365_auth_app.M365Auth._create_token_acquirer(auth)
+
+        first = acquire()
+        second = acquire()
+    finally:
+        m365_auth_app.ConfidentialClientApplication = original
+
+    assert first['access_token'] == 'token-1'
+    assert second['access_token'] == 'token-2', "refresh was served MSAL's cached token"
+
+
+def test_get_token_serves_cached_token():
+    acquire, calls = _counting_acquire()
+    broker = _broker(acquire)
+
+    assert broker.get_token() == 'token-1'
+    assert broker.get_token() == 'token-1'
+    assert broker.get_graph_headers()['Authorization'] == 'Bearer token-1'
+    assert len(calls) == 1
+    assert broker.stats['acquired'] == 1
+
+
+def test_get_token_refreshes_near_expiry():
+    acquire, calls = _counting_acquire(expires_in=MIN_VALIDITY_SECONDS)
+    broker = _broker(acquire)
+
+    assert broker.get_token() == 'token-1'
+    # Within MIN_VALIDITY_SECONDS of expiry: never served again
+    assert broker.get_token() == 'token-2'
+    assert len(calls) == 2
+
+
+def test_background_refresher_replaces_token_early():
+    refresh_ahead = 2 * MIN_VALIDITY_SECONDS
+    acquire, calls = _counting_acquire(expires_in=refresh_ahead + 1)
+    broker = TokenBroker('tenant:client:scope', acquire, refresh_ahead=refresh_ahead)
+
+    try:
+        assert broker.get_token() == 'token-1'
+        deadline = time.time() + 5
+        while len(calls) < 2 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        broker.stop()
+
+    assert len(calls) >= 2, "token was not refreshed ahead of expiry"
+    assert broker.get_token() != 'token-1'
+    assert broker.stats['refresh_failures'] == 0
+
+
+def test_shared_file_backend_reuses_token():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        backend = FileTokenCache(os.path.join(temp_dir, 'tokens.json'))
+        first_acquire, first_calls = _counting_acquire()
+        second_acquire, second_calls = _counting_acquire()
+
+        first = _broker(first_acquire, backend=backend)
+        second = _broker(second_acquire, backend=FileTokenCache(os.path.join(temp_dir, 'tokens.json')))
+
+        assert first.get_token() == 'token-1'
+        assert second.get_token() == 'token-1'
+        assert len(first_calls) == 1
+        assert len(second_calls) == 0
+        assert second.stats['shared_hits'] == 1
+
+
+def test_refresh_ahead_is_clamped():
+    acquire, _ = _counting_acquire()
+
+    assert _broker(acquire, refresh_ahead=10 ** 6).refresh_ahead == MAX_REFRESH_AHEAD_SECONDS
+    assert _broker(acquire, refresh_ahead=0).refresh_ahead == 2 * MIN_VALIDITY_SECONDS
+
+
+def test_acquisition_error_is_raised():
+    broker = _broker(lambda: {'error': 'invalid_client', 'error_description': 'bad secret'})
+
+    try:
+        broker.get_token()
+    except ValueError as e:
+        assert 'bad secret' in str(e)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_incomplete_backend_cannot_be_instantiated():
+    class PartialBackend(TokenCacheBackend):
+        def get(self, key):
+            return None
+
+    try:
+        PartialBackend()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("expected TypeError for missing abstract methods")
+
+
+def run_token_broker_tests():
+    """Run all token broker tests"""
+    print("🧪 Token Broker Tests")
+    print("=" * 50)
+    print(f"Test started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    tests = [
+        ("Acquirer bypasses MSAL cache", test_acquirer_bypasses_msal_cache),
+        ("Cached token served", test_get_token_serves_cached_token),
+        ("Refresh near expiry", test_get_token_refreshes_near_expiry),
+        ("Background refresh", test_background_refresher_replaces_token_early),
+        ("Shared file backend", test_shared_file_backend_reuses_token),
+        ("refresh_ahead clamp", test_refresh_ahead_is_clamped),
+        ("Acquisition errors", test_acquisition_error_is_raised),
+        ("Abstract TokenCacheBackend", test_incomplete_backend_cannot_be_instantiated)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            passed += 1
+            print(f"✅ {test_name} - PASSED")
+        except AssertionError as e:
+            print(f"❌ {test_name} - FAILED: {e}")
+        except Exception as e:
+            print(f"❌ {test_name} - ERROR: {e}")
+
+    print(f"\nOverall: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = run_token_broker_tests()
+    exit(0 if success else 1)
@@ -3,24 +3,87 @@ Bulk indexing utilities for Elasticsearch with RAG-Anything enhancements
 """
 from elasticsearch import Elasticsearch, helpers
 from config_elasticsearch import Config
+import os
+import json
+import atexit
+import time
+import queue
 import logging
+import threading
+import zlib
+import hashlib
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+_STOP = object()
+
+# Relationship types where (a, b) and (b, a) are the same edge
+SYMMETRIC_RELATIONSHIPS = {"similarity"}
+
+
+def relationship_id(source_doc_id, target_doc_id, relationship_type):
+    """Deterministic edge id, so re-running a graph build overwrites edges"""
+    ends = [str(source_doc_id), str(target_doc_id)]
+    if relationship_type in SYMMETRIC_RELATIONSHIPS:
+        ends.sort()
+    key = "\x1f".join([relationship_type] + ends)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
 class BulkIndexer:
-    """Handle bulk indexing to Elasticsearch with enhanced features"""
+    """
+    Handle bulk indexing to Elasticsearch with enhanced features
+
+    Batches are cut by document count (BATCH_SIZE) or payload size
+    (BULK_MAX_MB). Rejected items (429) are retried per item with backoff;
+    batches that still fail are appended to a spill file (BULK_SPILL_FILE)
+    instead of being dropped, and can be re-sent with replay_spill().
 
-    def __init__(self):
+    With BULK_PIPELINED=true, full batches are handed to background flush
+    threads through bounded queues, so crawling and indexing overlap. Actions
+    are routed to a thread by document id, which keeps the order of writes to
+    the same document. flush() waits until everything queued is written.
+    """
+
+    def __init__(self, pipelined=None):
         self.es = Elasticsearch(
             Config.ELASTIC_HOST,
             basic_auth=(Config.ELASTIC_USERNAME, Config.ELASTIC_PASSWORD)
         )
-        self.batch = []
         self.batch_size = Config.BATCH_SIZE
+        self.max_batch_bytes = Config.BULK_MAX_MB * 1024 * 1024
+        self.max_retries = Config.BULK_MAX_RETRIES
+        self.spill_file = Config.BULK_SPILL_FILE
+        self.pipelined = Config.BULK_PIPELINED if pipelined is None else pipelined
         self.total_indexed = 0
         self.total_failed = 0
+        self.total_spilled = 0
         self.enhanced_docs = 0  # Documents with RAG-Anything processing
+        self.relationship_index = f"{Config.ELASTIC_INDEX}-relationships"
+        self._relationship_index_ready = False
+        self._lock = threading.Lock()
+
+        lanes = Config.BULK_THREADS if self.pipelined else 1
+        self.batches = [[] for _ in range(lanes)]
+        self.batch_bytes = [0] * lanes
+        self.queues = []
+        self.threads = []
+        if self.pipelined:
+            for lane in range(lanes):
+                lane_queue = queue.Queue(maxsize=Config.BULK_QUEUE_SIZE)
+                thread = threading.Thread(target=self._flush_worker, args=(lane_queue,),
+                                          name=f"bulk-indexer-{lane}", daemon=True)
+                thread.start()
+                self.queues.append(lane_queue)
+                self.threads.append(thread)
+            # Queued batches are written even if a caller forgets to flush
+            atexit.register(self.close)
+
+    @property
+    def batch(self):
+        """Actions buffered and not yet sent"""
+        return [action for batch in self.batches for action in batch]
 
     def add_document(self, doc_id, document):
         """Add document to batch with RAG-Anything enhancements"""
@@ -37,54 +100,170 @@ class BulkIndexer:
         if document.get("entities") or document.get("relationships") or document.get("multimodal_content"):
             self.enhanced_docs += 1
 
-        self.batch.append({
+        self._add({
             "_index": Config.ELASTIC_INDEX,
             "_id": doc_id,
             "_source": document
         })
 
-        # Index if batch is full
-        if len(self.batch) >= self.batch_size:
-            self.flush()
+    def delete_document(self, doc_id):
+        """Queue deletion of a document (missing documents are not errors)"""
+        self._add({
+            "_op_type": "delete",
+            "_index": Config.ELASTIC_INDEX,
+            "_id": doc_id
+        })
+
+    def _add(self, action):
+        lane = zlib.crc32(str(action["_id"]).encode()) % len(self.batches)
+        self.batches[lane].append(action)
+        # Approximate payload: action line plus source line
+        self.batch_bytes[lane] += len(json.dumps(action.get("_source", {}), default=str)) + 100
+
+        # Send if the batch is full by count or size
+        if len(self.batches[lane]) >= self.batch_size or self.batch_bytes[lane] >= self.max_batch_bytes:
+            self._dispatch(lane)
+
+    def _dispatch(self, lane):
+        batch = self.batches[lane]
+        if not batch:
+            return 0
+        self.batches[lane] = []
+        self.batch_bytes[lane] = 0
+
+        if self.pipelined:
+            # Blocks when the lane is QUEUE_SIZE batches behind (backpressure)
+            self.queues[lane].put(batch)
+            return len(batch)
+        return self._send(batch)
+
+    def _flush_worker(self, lane_queue):
+        while True:
+            batch = lane_queue.get()
+            try:
+                if batch is _STOP:
+                    return
+                self._send(batch)
+            except Exception as e:
+                # _send spills what it cannot write; never let the thread die
+                logger.error(f"Bulk flush thread error: {e}")
+            finally:
+                lane_queue.task_done()
 
     def flush(self):
-        """Index current batch"""
-        if not self.batch:
-            return
+        """
+        Index current batch
 
-        try:
-            success, failed = helpers.bulk(
-                self.es,
-                self.batch,
-                raise_on_error=False,
-                raise_on_exception=False
-            )
+        In pipelined mode, hands over the partial batches and waits until the
+        flush threads have written everything queued.
+        """
+        sent = 0
+        for lane in range(len(self.batches)):
+            sent += self._dispatch(lane)
+        for lane_queue in self.queues:
+            lane_queue.join()
+        return sent
 
-            self.total_indexed += success
-            self.total_failed += len(failed) if failed else 0
+    def close(self):
+        """Flush and stop the background flush threads"""
+        if not self.threads:
+            return
+        self.flush()
+        for lane_queue in self.queues:
+            lane_queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.queues, self.threads = [], []
+        self.pipelined = False
+        self.batches, self.batch_bytes = [[]], [0]
 
-            if failed:
-                logger.warning(f"Failed to index {len(failed)} documents")
-                for item in failed[:5]:  # Log first 5 failures
-                    logger.debug(f"Failed item: {item}")
+    def _send(self, batch):
+        """Write one batch; returns the number of successful actions"""
+        success, failed = 0, []
+        for attempt in range(self.max_retries + 1):
+            try:
+                success, failed = 0, []
+                # streaming_bulk retries 429-rejected items on its own
+                for ok, item in helpers.streaming_bulk(
+                    self.es,
+                    batch,
+                    max_retries=self.max_retries,
+                    initial_backoff=2,
+                    raise_on_error=False,
+                    raise_on_exception=False
+                ):
+                    op_type, result = next(iter(item.items()))
+                    if ok or (op_type == "delete" and result.get("status") == 404):
+                        success += 1
+                    else:
+                        failed.append(result)
+                break
+            except Exception as e:
+                # Connection-level error: the whole batch is retried
+                if attempt == self.max_retries:
+                    logger.error(f"Bulk indexing error, spilling {len(batch)} actions: {e}")
+                    self._spill(batch, str(e))
+                    with self._lock:
+                        self.total_failed += len(batch)
+                    return 0
+                delay = min(60, 2 ** attempt)
+                logger.warning(f"Bulk indexing error (retry in {delay}s): {e}")
+                time.sleep(delay)
 
-            logger.info(f"Indexed batch: {success} succeeded, {len(failed) if failed else 0} failed")
+        if failed:
+            logger.warning(f"Failed to index {len(failed)} documents")
+            for item in failed[:5]:  # Log first 5 failures
+                logger.debug(f"Failed item: {item}")
+            failed_ids = {str(item.get("_id")): item.get("error") for item in failed}
+            self._spill([action for action in batch if str(action["_id"]) in failed_ids],
+                        failed_ids)
 
-            # Clear batch
-            self.batch = []
+        with self._lock:
+            self.total_indexed += success
+            self.total_failed += len(failed)
+        logger.info(f"Indexed batch: {success} succeeded, {len(failed)} failed")
+        return success
 
-            return success
+    def _spill(self, actions, error):
+        """Append failed actions to the spill file, one JSON line each"""
+        if not actions:
+            return
+        directory = os.path.dirname(self.spill_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            with open(self.spill_file, "a", encoding="utf-8") as f:
+                for action in actions:
+                    reason = error.get(str(action["_id"])) if isinstance(error, dict) else error
+                    f.write(json.dumps({
+                        "action": action,
+                        "error": reason,
+                        "failed_at": datetime.utcnow().isoformat()
+                    }, default=str) + "\n")
+            self.total_spilled += len(actions)
 
-        except Exception as e:
-            logger.error(f"Bulk indexing error: {e}")
-            self.batch = []
+    def replay_spill(self):
+        """Re-send actions from the spill file; ones that fail again are spilled anew"""
+        if not os.path.exists(self.spill_file):
             return 0
+        replay_file = f"{self.spill_file}.replaying"
+        os.replace(self.spill_file, replay_file)
+
+        with open(replay_file, "r", encoding="utf-8") as f:
+            actions = [json.loads(line)["action"] for line in f if line.strip()]
+        for action in actions:
+            self._add(action)
+        self.flush()
+        os.remove(replay_file)
+        logger.info(f"Replayed {len(actions)} spilled actions")
+        return len(actions)
 
     def get_stats(self):
         """Get indexing statistics including RAG-Anything metrics"""
         return {
             'total_indexed': self.total_indexed,
             'total_failed': self.total_failed,
+            'total_spilled': self.total_spilled,
             'enhanced_docs': self.enhanced_docs,
             'success_rate': (self.total_indexed / (self.total_indexed + self.total_failed) * 100)
                            if (self.total_indexed + self.total_failed) > 0 else 0,
@@ -108,15 +287,16 @@ class BulkIndexer:
             }
         }
 
-        relationship_index = f"{Config.ELASTIC_INDEX}-relationships"
+        relationship_index = self.relationship_index
 
         if not self.es.indices.exists(index=relationship_index):
             self.es.indices.create(index=relationship_index, body=relationship_mapping)
             logger.info(f"Created relationship index: {relationship_index}")
+        self._relationship_index_ready = True
 
-    def index_relationship(self, source_doc_id, target_doc_id, relationship_type, strength, shared_entities=None, shared_topics=None):
-        """Index a document relationship"""
-        relationship_doc = {
+    def _relationship_doc(self, source_doc_id, target_doc_id, relationship_type, strength,
+                          shared_entities=None, shared_topics=None):
+        return {
             "source_doc_id": source_doc_id,
             "target_doc_id": target_doc_id,
             "relationship_type": relationship_type,
@@ -126,8 +306,26 @@ class BulkIndexer:
             "created_date": datetime.utcnow().isoformat()
         }
 
-        relationship_index = f"{Config.ELASTIC_INDEX}-relationships"
+    def add_relationship(self, source_doc_id, target_doc_id, relationship_type, strength,
+                         shared_entities=None, shared_topics=None):
+        """Queue a document relationship for bulk indexing (upserted by edge id)"""
+        if not self._relationship_index_ready:
+            # Created with its mapping before the first bulk write auto-creates it
+            self.create_relationship_index()
+        self._add({
+            "_index": self.relationship_index,
+            "_id": relationship_id(source_doc_id, target_doc_id, relationship_type),
+            "_source": self._relationship_doc(source_doc_id, target_doc_id, relationship_type,
+                                              strength, shared_entities, shared_topics)
+        })
+
+    def index_relationship(self, source_doc_id, target_doc_id, relationship_type, strength, shared_entities=None, shared_topics=None):
+        """Index a single document relationship right away (prefer add_relationship for many)"""
+        relationship_doc = self._relationship_doc(source_doc_id, target_doc_id, relationship_type,
+                                                  strength, shared_entities, shared_topics)
+
         self.es.index(
-            index=relationship_index,
+            index=self.relationship_index,
+            id=relationship_id(source_doc_id, target_doc_id, relationship_type),
             body=relationship_doc
         )
@@ -0,0 +1,246 @@
+"""
+In-memory entity co-occurrence matrix for entity and relationship lookups
+"""
+import time
+import logging
+import threading
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from elasticsearch import helpers
+
+logger = logging.getLogger(__name__)
+
+
+class CooccurrenceMatrix:
+    """
+    Sparse entity x entity matrix of shared-document counts
+
+    The bulk of the counts lives in a compact CSR layout (typed arrays: row
+    pointers, column ids, counts), each row sorted by count so the top-k
+    neighbours of an entity are the first k entries. Documents added or
+    removed since the last compaction are kept in a small delta overlay and
+    merged in by compact(). Counts are per document, as in
+    ElasticsearchGraphBuilder.get_entity_network, and strength is
+    co-occurrences / min(frequency of both entities).
+    """
+
+    def __init__(self, compact_threshold: int = 10000):
+        self.compact_threshold = compact_threshold
+        self.vocabulary: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.frequency = array('I')
+        # CSR base
+        self.indptr = array('Q', [0])
+        self.indices = array('I')
+        self.data = array('I')
+        # Changes since the last compaction (counts may be negative)
+        self.delta: Dict[int, Counter] = defaultdict(Counter)
+        self.delta_documents = 0
+        self.documents: Dict[str, Tuple[int, ...]] = {}
+
+    def _id(self, entity: str) -> int:
+        entity_id = self.ids.get(entity)
+        if entity_id is None:
+            entity_id = len(self.vocabulary)
+            self.ids[entity] = entity_id
+            self.vocabulary.append(entity)
+            self.frequency.append(0)
+        return entity_id
+
+    def _apply(self, entity_ids: Tuple[int, ...], sign: int):
+        for i in entity_ids:
+            self.frequency[i] += sign
+            row = self.delta[i]
+            for j in entity_ids:
+                if j != i:
+                    row[j] += sign
+
+    def add_document(self, doc_id: str, entities: Iterable[str]):
+        """Add or replace the entities of a document"""
+        entity_ids = tuple(sorted({self._id(entity) for entity in entities}))
+        previous = self.documents.get(doc_id)
+        if previous == entity_ids:
+            return
+        if previous:
+            self._apply(previous, -1)
+        self._apply(entity_ids, 1)
+        self.documents[doc_id] = entity_ids
+        self._changed()
+
+    def remove_document(self, doc_id: str):
+        previous = self.documents.pop(doc_id, None)
+        if previous:
+            self._apply(previous, -1)
+            self._changed()
+
+    def _changed(self):
+        self.delta_documents += 1
+        if self.delta_documents >= self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """Merge the delta overlay into the CSR arrays"""
+        indptr, indices, data = array('Q', [0]), array('I'), array('I')
+        for i in range(len(self.vocabulary)):
+            row = self._row(i)
+            for j, count in sorted(row.items(), key=lambda item: (-item[1], item[0])):
+                indices.append(j)
+                data.append(count)
+            indptr.append(len(indices))
+        self.indptr, self.indices, self.data = indptr, indices, data
+        self.delta = defaultdict(Counter)
+        self.delta_documents = 0
+
+    def _row(self, i: int) -> Dict[int, int]:
+        """All non-zero counts of a row, base and delta combined"""
+        row: Dict[int, int] = {}
+        if i + 1 < len(self.indptr):
+            start, end = self.indptr[i], self.indptr[i + 1]
+            row = dict(zip(self.indices[start:end], self.data[start:end]))
+        for j, count in self.delta.get(i, {}).items():
+            row[j] = row.get(j, 0) + count
+        return {j: count for j, count in row.items() if count > 0}
+
+    def _strength(self, i: int, j: int, count: int) -> float:
+        smaller = min(self.frequency[i], self.frequency[j])
+        return min(count / smaller, 1.0) if smaller > 0 else 0.0
+
+    def neighbors(self, entity: str, k: int = 10) -> List[Dict[str, Any]]:
+        """Top-k co-occurring entities by shared documents"""
+        i = self.ids.get(entity)
+        if i is None:
+            return []
+
+        if not self.delta.get(i) and i + 1 < len(self.indptr):
+            # Rows are sorted by count: the first k entries are the answer
+            start = self.indptr[i]
+            end = min(self.indptr[i + 1], start + k)
+            top = list(zip(self.indices[start:end], self.data[start:end]))
+        else:
+            top = sorted(self._row(i).items(), key=lambda item: (-item[1], item[0]))[:k]
+
+        return [{
+            "entity": self.vocabulary[j],
+            "co_occurrence": count,
+            "strength": self._strength(i, j, count)
+        } for j, count in top]
+
+    def co_occurrence(self, entity1: str, entity2: str) -> float:
+        """Co-occurrence strength of two entities (0.0 if unknown)"""
+        i, j = self.ids.get(entity1), self.ids.get(entity2)
+        if i is None or j is None:
+            return 0.0
+        return self._strength(i, j, self._row(i).get(j, 0))
+
+    def get_frequency(self, entity: str) -> int:
+        i = self.ids.get(entity)
+        return self.frequency[i] if i is not None else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "entities": len(self.vocabulary),
+            "documents": len(self.documents),
+            "nonzero": len(self.indices),
+            "pending_changes": self.delta_documents,
+            "bytes": sum(a.itemsize * len(a) for a in (self.indptr, self.indices, self.data, self.frequency))
+        }
+
+
+class CooccurrenceService:
+    """
+    Keep a CooccurrenceMatrix in sync with the Elasticsearch index
+
+    A background thread builds the matrix with one scroll over the index,
+    then every refresh_seconds reads documents indexed since the last pass
+    (by indexed_date) and updates them in place. Deleted documents are
+    dropped by the periodic full rebuild. Lookups never touch Elasticsearch.
+    """
+
+    def __init__(self, es, index_name: str, refresh_seconds: int = 60, rebuild_seconds: int = 3600):
+        self.es = es
+        self.index_name = index_name
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.matrix = CooccurrenceMatrix()
+        self.ready = False
+        self.watermark: Optional[str] = None
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _scan(self, since: Optional[str] = None):
+        query = {"range": {"indexed_date": {"gte": since}}} if since else {"match_all": {}}
+        for hit in helpers.scan(self.es, index=self.index_name, query={"query": query},
+                                _source=["entities.value", "indexed_date"], size=1000):
+            source = hit.get("_source", {})
+            values = [entity.get("value") for entity in source.get("entities", []) or [] if entity.get("value")]
+            yield hit["_id"], values, source.get("indexed_date")
+
+    def build(self):
+        """Full rebuild; the new matrix replaces the old one when complete"""
+        started = time.time()
+        matrix = CooccurrenceMatrix()
+        watermark = None
+        for doc_id, values, indexed_date in self._scan():
+            matrix.add_document(doc_id, values)
+            if indexed_date and (watermark is None or indexed_date > watermark):
+                watermark = indexed_date
+        matrix.compact()
+
+        with self._lock:
+            self.matrix, self.watermark = matrix, watermark
+            self.ready = True
+            self.built_at = time.time()
+        logger.info(f"Built co-occurrence matrix in {time.time() - started:.1f}s: {matrix.get_stats()}")
+
+    def refresh(self):
+        """Apply documents indexed since the last pass"""
+        if not self.watermark:
+            return self.build()
+        updates = list(self._scan(self.watermark))
+        with self._lock:
+            for doc_id, values, indexed_date in updates:
+                self.matrix.add_document(doc_id, values)
+                if indexed_date and indexed_date > self.watermark:
+                    self.watermark = indexed_date
+        if updates:
+            logger.debug(f"Applied {len(updates)} documents to the co-occurrence matrix")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.ready or time.time() - self.built_at >= self.rebuild_seconds:
+                    self.build()
+                else:
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Co-occurrence matrix update failed: {e}")
+            self._stop.wait(self.refresh_seconds)
+
+    def start(self):
+        """Build and keep refreshing in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cooccurrence-matrix", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def neighbors(self, entity: str, k: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self.matrix.neighbors(entity, k)
+
+    def co_occurrence(self, entity1: str, entity2: str) -> float:
+        with self._lock:
+            return self.matrix.co_occurrence(entity1, entity2)
+
+    def get_frequency(self, entity: str) -> int:
+        with self._lock:
+            return self.matrix.get_frequency(entity)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"ready": self.ready, "watermark": self.watermark, **self.matrix.get_stats()}
@@ -12,8 +12,10 @@ logger = logging.getLogger(__name__)
 class ElasticsearchGraphBuilder:
     """Build and manage document relationship graphs in Elasticsearch"""
 
-    def __init__(self, bulk_indexer: BulkIndexer):
+    def __init__(self, bulk_indexer: BulkIndexer, cooccurrence=None):
         self.bulk_indexer = bulk_indexer
+        # Optional CooccurrenceService; entity lookups are answered from memory once it is ready
+        self.cooccurrence = cooccurrence
         self.raganything_processor = RAGAnythingProcessor()
         self.relationship_index = f"{Config.ELASTIC_INDEX}-relationships"
         self.stats = {
@@ -23,6 +25,10 @@ class ElasticsearchGraphBuilder:
             "graph_nodes": 0,
             "graph_edges": 0
         }
+        # Documents per entity value; cleared when new documents are graphed and
+        # at the start of each entity network, so a long-lived builder (the API
+        # server's) never serves counts from before later indexing
+        self._entity_frequencies: Dict[str, int] = {}
 
     def build_document_graph(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -48,6 +54,8 @@ class ElasticsearchGraphBuilder:
         # Index relationships in Elasticsearch
         self._index_relationships(document_relationships)
 
+        self._entity_frequencies.clear()
+
         # Update statistics
         self.stats["documents_processed"] += len(documents)
         self.stats["relationships_created"] += len(document_relationships)
@@ -63,10 +71,15 @@ class ElasticsearchGraphBuilder:
         }
 
     def _index_relationships(self, relationships: List[Dict[str, Any]]):
-        """Index document relationships in Elasticsearch"""
+        """
+        Index document relationships in Elasticsearch
+
+        Edges go out in bulk batches under deterministic ids, so a rebuild
+        overwrites the previous edges instead of adding duplicates.
+        """
         for relationship in relationships:
             try:
-                self.bulk_indexer.index_relationship(
+                self.bulk_indexer.add_relationship(
                     relationship["source_doc_id"],
                     relationship["target_doc_id"],
                     relationship["relationship_type"],
@@ -75,7 +88,10 @@ class ElasticsearchGraphBuilder:
                     relationship.get("shared_topics", [])
                 )
             except Exception as e:
-                logger.error(f"Failed to index relationship: {e}")
+                logger.error(f"Failed to queue relationship: {e}")
+
+        # Written (or spilled) before the graph stats are reported
+        self.bulk_indexer.flush()
 
     def get_document_relationships(self, doc_id: str) -> List[Dict[str, Any]]:
         """Get relationships for a specific document"""
@@ -171,7 +187,11 @@ class ElasticsearchGraphBuilder:
                     "bool": {
                         "must_not": [{"term": {"_id": doc_id}}],
                         "should": [
-                            {"terms": {"entities.value": list(source_entities)}},
+                            # entities is a nested field: a plain terms query never matches it
+                            {"nested": {
+                                "path": "entities",
+                                "query": {"terms": {"entities.value.keyword": list(source_entities)}}
+                            }},
                             {"terms": {"topics": list(source_topics)}}
                         ]
                     }
@@ -198,53 +218,167 @@ class ElasticsearchGraphBuilder:
             logger.error(f"Failed to find similar documents: {e}")
             return []
 
-    def get_entity_network(self, entity_value: str, depth: int = 2) -> Dict[str, Any]:
-        """Get network of entities connected to the given entity"""
-        try:
-            # Find documents containing this entity
-            query = {
-                "query": {
-                    "nested": {
-                        "path": "entities",
-                        "query": {
-                            "term": {"entities.value": entity_value}
-                        }
-                    }
-                },
-                "size": 100
-            }
-
-            response = self.bulk_indexer.es.search(
-                index=Config.ELASTIC_INDEX,
-                body=query
-            )
+    def get_entity_network(self, entity_value: str, depth: int = 2, max_neighbors: int = 100) -> Dict[str, Any]:
+        """
+        Get network of entities connected to the given entity
 
-            # Extract all entities from these documents
-            all_entities = set()
-            for hit in response["hits"]["hits"]:
-                entities = hit["_source"].get("entities", [])
-                for entity in entities:
-                    all_entities.add(entity["value"])
+        Each hop is one aggregation query for the co-occurrence counts of the
+        whole frontier, plus one for the document frequencies not cached yet,
+        so a network costs at most 2 * depth queries however many entities it
+        has; with a ready co-occurrence matrix it takes none. Edge strength is
+        co-occurrences / min(frequency of both ends).
 
-            # Find co-occurrence relationships
-            co_occurrences = {}
-            for entity in all_entities:
-                if entity != entity_value:
-                    co_occurrences[entity] = self._calculate_entity_co_occurrence(entity_value, entity)
+        Args:
+            entity_value: Entity to start from
+            depth: Number of hops to expand
+            max_neighbors: Most frequent co-occurring entities kept per entity,
+                and most entities expanded per hop
+        """
+        try:
+            # Shared by the hops of this network only
+            self._entity_frequencies.clear()
+            hops = {entity_value: 0}
+            edges = []
+            seen_pairs = set()
+            frontier = [entity_value]
+
+            for hop in range(1, max(1, depth) + 1):
+                counts = self._co_occurrence_counts(frontier, max_neighbors)
+                frequencies = self._get_entity_frequencies(
+                    list(counts) + [other for neighbors in counts.values() for other in neighbors]
+                )
 
+                new_edges = []
+                for source, neighbors in counts.items():
+                    for target, co_count in neighbors.items():
+                        pair = frozenset((source, target))
+                        if target == source or pair in seen_pairs:
+                            continue
+                        seen_pairs.add(pair)
+                        smaller = min(frequencies.get(source, 0), frequencies.get(target, 0))
+                        new_edges.append({
+                            "source": source,
+                            "target": target,
+                            "co_occurrence": co_count,
+                            "strength": min(co_count / smaller, 1.0) if smaller > 0 else 0.0,
+                            "hop": hop
+                        })
+                edges.extend(new_edges)
+
+                # Expand the strongest new entities next; the frontier is capped
+                # so the next aggregation stays within the bucket limit
+                frontier = []
+                for edge in sorted(new_edges, key=lambda e: -e["strength"]):
+                    if edge["target"] not in hops:
+                        hops[edge["target"]] = hop
+                        if len(frontier) < max_neighbors:
+                            frontier.append(edge["target"])
+                if not frontier:
+                    break
+
+            co_occurrences = {edge["target"]: edge["strength"] for edge in edges if edge["source"] == entity_value}
+            connected = [entity for entity in hops if entity != entity_value]
             return {
                 "entity": entity_value,
-                "connected_entities": list(all_entities),
+                "connected_entities": connected,
                 "co_occurrences": co_occurrences,
-                "network_size": len(all_entities)
+                "network_size": len(connected),
+                "nodes": hops,
+                "edges": edges
             }
 
         except Exception as e:
             logger.error(f"Failed to get entity network: {e}")
             return {}
 
+    def _matrix_ready(self) -> bool:
+        return bool(self.cooccurrence and self.cooccurrence.ready)
+
+    def _co_occurrence_counts(self, entities: List[str], max_neighbors: int) -> Dict[str, Dict[str, int]]:
+        """Documents shared by each entity and its co-occurring entities, in one query"""
+        if self._matrix_ready():
+            return {
+                entity: {n["entity"]: n["co_occurrence"] for n in self.cooccurrence.neighbors(entity, max_neighbors)}
+                for entity in entities if self.cooccurrence.get_frequency(entity)
+            }
+
+        query = {
+            "query": {
+                "nested": {
+                    "path": "entities",
+                    "query": {"terms": {"entities.value.keyword": entities}}
+                }
+            },
+            "size": 0,
+            "aggs": {
+                "entities": {
+                    "nested": {"path": "entities"},
+                    "aggs": {
+                        "seeds": {
+                            "terms": {"field": "entities.value.keyword", "include": entities, "size": len(entities)},
+                            "aggs": {
+                                "docs": {
+                                    "reverse_nested": {},
+                                    "aggs": {
+                                        "entities": {
+                                            "nested": {"path": "entities"},
+                                            "aggs": {
+                                                "neighbors": {
+                                                    "terms": {"field": "entities.value.keyword", "size": max_neighbors + 1},
+                                                    "aggs": {"docs": {"reverse_nested": {}}}
+                                                }
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+        response = self.bulk_indexer.es.search(index=Config.ELASTIC_INDEX, body=query)
+
+        counts = {}
+        for seed in response["aggregations"]["entities"]["seeds"]["buckets"]:
+            neighbors = seed["docs"]["entities"]["neighbors"]["buckets"]
+            # Per-document counts, not per nested entity occurrence
+            counts[seed["key"]] = {bucket["key"]: bucket["docs"]["doc_count"] for bucket in neighbors}
+        return counts
+
+    def _get_entity_frequencies(self, entities: List[str]) -> Dict[str, int]:
+        """Documents containing each entity; uncached ones are fetched in one query"""
+        if self._matrix_ready():
+            return {entity: self.cooccurrence.get_frequency(entity) for entity in entities}
+        missing = [entity for entity in dict.fromkeys(entities) if entity not in self._entity_frequencies]
+        if missing:
+            query = {
+                "size": 0,
+                "aggs": {
+                    "entities": {
+                        "nested": {"path": "entities"},
+                        "aggs": {
+                            "values": {
+                                "terms": {"field": "entities.value.keyword", "include": missing, "size": len(missing)},
+                                "aggs": {"docs": {"reverse_nested": {}}}
+                            }
+                        }
+                    }
+                }
+            }
+            response = self.bulk_indexer.es.search(index=Config.ELASTIC_INDEX, body=query)
+            for entity in missing:
+                self._entity_frequencies[entity] = 0
+            for bucket in response["aggregations"]["entities"]["values"]["buckets"]:
+                self._entity_frequencies[bucket["key"]] = bucket["docs"]["doc_count"]
+
+        return {entity: self._entity_frequencies[entity] for entity in entities}
+
     def _calculate_entity_co_occurrence(self, entity1: str, entity2: str) -> float:
         """Calculate co-occurrence strength between two entities"""
+        if self._matrix_ready():
+            return self.cooccurrence.co_occurrence(entity1, entity2)
         try:
             # Find documents containing both entities
             query = {
@@ -254,13 +388,13 @@ class ElasticsearchGraphBuilder:
                             {
                                 "nested": {
                                     "path": "entities",
-                                    "query": {"term": {"entities.value": entity1}}
+                                    "query": {"term": {"entities.value.keyword": entity1}}
                                 }
                             },
                             {
                                 "nested": {
                                     "path": "entities",
-                                    "query": {"term": {"entities.value": entity2}}
+                                    "query": {"term": {"entities.value.keyword": entity2}}
                                 }
                             }
                         ]
@@ -293,12 +427,16 @@ class ElasticsearchGraphBuilder:
 
     def _get_entity_frequency(self, entity_value: str) -> int:
         """Get frequency of an entity across all documents"""
+        if self._matrix_ready():
+            return self.cooccurrence.get_frequency(entity_value)
+        if entity_value in self._entity_frequencies:
+            return self._entity_frequencies[entity_value]
         try:
             query = {
                 "query": {
                     "nested": {
                         "path": "entities",
-                        "query": {"term": {"entities.value": entity_value}}
+                        "query": {"term": {"entities.value.keyword": entity_value}}
                     }
                 },
                 "size": 0
@@ -309,7 +447,8 @@ class ElasticsearchGraphBuilder:
                 body=query
             )
 
-            return response["hits"]["total"]["value"]
+            self._entity_frequencies[entity_value] = response["hits"]["total"]["value"]
+            return self._entity_frequencies[entity_value]
 
         except Exception as e:
             logger.error(f"Failed to get entity frequency: {e}")
@@ -0,0 +1,142 @@
+"""
+Batched, multi-process RAG-Anything enrichment
+"""
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from .raganything_processor import RAGAnythingProcessor
+
+logger = logging.getLogger(__name__)
+
+# One processor per worker process, created by the pool initializer
+_worker_processor: Optional[RAGAnythingProcessor] = None
+
+
+def _init_worker():
+    global _worker_processor
+    _worker_processor = RAGAnythingProcessor()
+
+
+def _enrich_batch(documents: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Enrich a batch in a worker; returns the documents and the batch's stat counts"""
+    processor = _worker_processor or RAGAnythingProcessor()
+    enhanced = [processor.process_document(document) for document in documents]
+    return enhanced, processor.take_stats()
+
+
+class EnrichmentExecutor:
+    """
+    Enrich documents in a process pool and hand them on in submission order
+
+    The enrichment is pure-Python and CPU-bound, so batches go to worker
+    processes while the crawler keeps fetching. Results are passed to `sink`
+    in the order documents were submitted; statistics from the workers are
+    merged into `processor`, so its get_processing_stats() covers every
+    process. With workers <= 1 documents are enriched inline, and so is
+    everything after a worker dies abruptly (BrokenProcessPool).
+
+    Example:
+        executor = EnrichmentExecutor(processor, indexer_callback)
+        for document in crawl():
+            executor.submit(document)
+        executor.flush()
+    """
+
+    def __init__(self, processor: RAGAnythingProcessor, sink: Callable[[Dict[str, Any]], None],
+                 workers: Optional[int] = None, batch_size: Optional[int] = None,
+                 max_pending: Optional[int] = None):
+        from config_elasticsearch import Config
+
+        self.processor = processor
+        self.sink = sink
+        self.workers = Config.ENRICHMENT_WORKERS if workers is None else workers
+        self.batch_size = batch_size or Config.ENRICHMENT_BATCH_SIZE
+        # Batches in flight before submit() waits for the oldest one
+        self.max_pending = max_pending or max(2, self.workers * 2)
+        self.batch: List[Dict[str, Any]] = []
+        self.pending: deque = deque()
+        self.sink_errors = 0
+
+        self.pool = None
+        if self.workers > 1 and processor.enabled:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    def submit(self, document: Dict[str, Any]):
+        """Queue a document for enrichment"""
+        if not self.pool:
+            self._deliver([self.processor.process_document(document)])
+            return
+
+        self.batch.append(document)
+        if len(self.batch) >= self.batch_size:
+            self._dispatch()
+
+    def _dispatch(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        try:
+            future = self.pool.submit(_enrich_batch, batch)
+        except BrokenProcessPool as e:
+            self._pool_broken(e)
+            # Batches already in flight go first, so the order is kept
+            while self.pending:
+                self._collect()
+            self._deliver([self.processor.process_document(document) for document in batch])
+            return
+        self.pending.append((batch, future))
+
+        # Hand on finished batches; wait for the oldest when too many are in flight
+        while self.pending and (self.pending[0][1].done() or len(self.pending) > self.max_pending):
+            self._collect()
+
+    def _collect(self):
+        batch, future = self.pending.popleft()
+        try:
+            enhanced, counts = future.result()
+            self.processor.merge_stats(counts)
+        except BrokenProcessPool as e:
+            self._pool_broken(e)
+            enhanced = [self.processor.process_document(document) for document in batch]
+        except Exception as e:
+            # A crashed worker must not lose documents: enrich this batch here
+            logger.error(f"Enrichment worker failed, enriching {len(batch)} documents inline: {e}")
+            enhanced = [self.processor.process_document(document) for document in batch]
+        self._deliver(enhanced)
+
+    def _pool_broken(self, error: Exception):
+        """A worker died (OOM kill, segfault): the pool is unusable, continue inline"""
+        if not self.pool:
+            return
+        logger.error(f"Enrichment pool broken, enriching inline from now on: {error}")
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = None
+
+    def _deliver(self, documents: List[Dict[str, Any]]):
+        for document in documents:
+            try:
+                self.sink(document)
+            except Exception as e:
+                logger.error(f"Error handling enriched document {document.get('id')}: {e}")
+                self.sink_errors += 1
+
+    def flush(self):
+        """Enrich everything submitted so far and hand it to the sink"""
+        if self.pool:
+            self._dispatch()
+        while self.pending:
+            self._collect()
+        if self.batch:
+            # Left over when the pool broke while this batch was filling
+            batch, self.batch = self.batch, []
+            self._deliver([self.processor.process_document(document) for document in batch])
+
+    def close(self):
+        """Flush and stop the worker processes"""
+        self.flush()
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
@@ -5,9 +5,29 @@ import json
 import logging
 from typing import Dict, List, Any, Optional
 from config_elasticsearch import Config
+from .similarity_engine import SimilarityEngine
+from .text_scanner import KeywordScanner
 
 logger = logging.getLogger(__name__)
 
+# Keyword lists of the simulated enrichment steps
+ENTITY_KEYWORDS = ["project", "budget", "meeting", "report", "analysis", "strategy"]
+TOPIC_KEYWORDS = {
+    "business": ["strategy", "revenue", "profit", "market"],
+    "technology": ["software", "system", "digital", "platform"],
+    "finance": ["budget", "cost", "investment", "financial"],
+    "project": ["plan", "timeline", "milestone", "deliverable"]
+}
+ENGLISH_WORDS = ["the", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by"]
+POSITIVE_WORDS = ["good", "great", "excellent", "positive", "success", "improve"]
+NEGATIVE_WORDS = ["bad", "poor", "negative", "problem", "issue", "fail"]
+
+# One automaton for every list: a document is scanned once for all signals
+_SCANNER = KeywordScanner(
+    ENTITY_KEYWORDS + [word for words in TOPIC_KEYWORDS.values() for word in words]
+    + ENGLISH_WORDS + POSITIVE_WORDS + NEGATIVE_WORDS
+)
+
 class RAGAnythingProcessor:
     """Process documents with RAG-Anything for multimodal content and relationships"""
 
@@ -32,24 +52,29 @@ class RAGAnythingProcessor:
             return document
 
         try:
+            content = document.get("content", "")
+            # One lowercase copy, one split and one keyword scan, shared by every step
+            found = self._scan(content)
+            words = content.split()
+
             # Extract entities from content
-            entities = self._extract_entities(document.get("content", ""))
+            entities = self._extract_entities(content, found)
 
             # Extract key phrases and topics
-            key_phrases = self._extract_key_phrases(document.get("content", ""))
-            topics = self._extract_topics(document.get("content", ""))
+            key_phrases = self._extract_key_phrases(content, words)
+            topics = self._extract_topics(content, found)
 
             # Analyze document complexity
-            complexity_score = self._analyze_complexity(document.get("content", ""))
+            complexity_score = self._analyze_complexity(content, words)
 
             # Detect language and sentiment
-            language = self._detect_language(document.get("content", ""))
-            sentiment = self._analyze_sentiment(document.get("content", ""))
+            language = self._detect_language(content, found)
+            sentiment = self._analyze_sentiment(content, found)
 
             # Build relationships if graph is enabled
             relationships = []
             if self.graph_enabled:
-                relationships = self._extract_relationships(document, entities)
+                relationships = self._extract_relationships(document, entities, found)
 
             # Enhance document with RAG-Anything features
             enhanced_document = document.copy()
@@ -75,71 +100,71 @@ class RAGAnythingProcessor:
             logger.error(f"RAG-Anything processing failed: {e}")
             return document
 
-    def _extract_entities(self, content: str) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _scan(content: str) -> Dict[str, int]:
+        """First position (in the lowercased content) of every keyword present"""
+        return _SCANNER.first_positions(content.lower())
+
+    def _extract_entities(self, content: str, found: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
         """Extract entities from document content"""
         # Simulate entity extraction
         # In real implementation, this would use NER models or APIs
+        if found is None:
+            found = self._scan(content)
 
         entities = []
 
         # Simple keyword-based entity extraction
-        keywords = ["project", "budget", "meeting", "report", "analysis", "strategy"]
-
-        for i, keyword in enumerate(keywords):
-            if keyword.lower() in content.lower():
+        for keyword in ENTITY_KEYWORDS:
+            if keyword in found:
                 entities.append({
                     "type": "keyword",
                     "value": keyword,
                     "confidence": 0.8,
-                    "position": content.lower().find(keyword.lower()),
-                    "context": self._get_context(content, keyword)
+                    "position": found[keyword],
+                    "context": self._get_context(content, keyword, position=found[keyword])
                 })
 
         return entities
 
-    def _extract_key_phrases(self, content: str) -> List[str]:
+    def _extract_key_phrases(self, content: str, words: Optional[List[str]] = None) -> List[str]:
         """Extract key phrases from content"""
         # Simulate key phrase extraction
         # In real implementation, this would use NLP libraries like spaCy or transformers
 
         phrases = []
-        words = content.split()
+        seen = set()
+        if words is None:
+            words = content.split()
 
         # Simple bigram extraction
         for i in range(len(words) - 1):
             phrase = f"{words[i]} {words[i+1]}"
-            if len(phrase) > 10 and phrase not in phrases:
+            if len(phrase) > 10 and phrase not in seen:
+                seen.add(phrase)
                 phrases.append(phrase)
+                if len(phrases) == 10:  # Return top 10 phrases
+                    break
 
-        return phrases[:10]  # Return top 10 phrases
+        return phrases
 
-    def _extract_topics(self, content: str) -> List[str]:
+    def _extract_topics(self, content: str, found: Optional[Dict[str, int]] = None) -> List[str]:
         """Extract topics from content"""
         # Simulate topic extraction
         # In real implementation, this would use topic modeling or classification
-
-        topics = []
+        if found is None:
+            found = self._scan(content)
 
         # Simple topic detection based on keywords
-        topic_keywords = {
-            "business": ["strategy", "revenue", "profit", "market"],
-            "technology": ["software", "system", "digital", "platform"],
-            "finance": ["budget", "cost", "investment", "financial"],
-            "project": ["plan", "timeline", "milestone", "deliverable"]
-        }
-
-        content_lower = content.lower()
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in content_lower for keyword in keywords):
-                topics.append(topic)
-
-        return topics
+        return [topic for topic, keywords in TOPIC_KEYWORDS.items()
+                if any(keyword in found for keyword in keywords)]
 
-    def _analyze_complexity(self, content: str) -> float:
+    def _analyze_complexity(self, content: str, words: Optional[List[str]] = None) -> float:
         """Analyze document complexity score"""
         # Simple complexity analysis based on content length and vocabulary
 
-        words = content.split()
+        if words is None:
+            words = content.split()
         sentences = content.split('.')
 
         # Basic complexity metrics
@@ -152,33 +177,30 @@ class RAGAnythingProcessor:
 
         return round(complexity, 3)
 
-    def _detect_language(self, content: str) -> str:
+    def _detect_language(self, content: str, found: Optional[Dict[str, int]] = None) -> str:
         """Detect document language"""
         # Simple language detection
         # In real implementation, this would use langdetect or similar
+        if found is None:
+            found = self._scan(content)
 
         # Basic English detection
-        english_words = ["the", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by"]
-        content_lower = content.lower()
-
-        english_count = sum(1 for word in english_words if word in content_lower)
+        english_count = sum(1 for word in ENGLISH_WORDS if word in found)
 
         if english_count > 5:
             return "en"
         else:
             return "unknown"
 
-    def _analyze_sentiment(self, content: str) -> str:
+    def _analyze_sentiment(self, content: str, found: Optional[Dict[str, int]] = None) -> str:
         """Analyze document sentiment"""
         # Simple sentiment analysis
         # In real implementation, this would use VADER, TextBlob, or transformers
+        if found is None:
+            found = self._scan(content)
 
-        positive_words = ["good", "great", "excellent", "positive", "success", "improve"]
-        negative_words = ["bad", "poor", "negative", "problem", "issue", "fail"]
-
-        content_lower = content.lower()
-        positive_count = sum(1 for word in positive_words if word in content_lower)
-        negative_count = sum(1 for word in negative_words if word in content_lower)
+        positive_count = sum(1 for word in POSITIVE_WORDS if word in found)
+        negative_count = sum(1 for word in NEGATIVE_WORDS if word in found)
 
         if positive_count > negative_count:
             return "positive"
@@ -187,7 +209,8 @@ class RAGAnythingProcessor:
         else:
             return "neutral"
 
-    def _extract_relationships(self, document: Dict[str, Any], entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _extract_relationships(self, document: Dict[str, Any], entities: List[Dict[str, Any]],
+                               found: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
         """Extract relationships between entities"""
         relationships = []
 
@@ -195,11 +218,18 @@ class RAGAnythingProcessor:
         # In real implementation, this would use more sophisticated NLP
 
         entity_values = [entity["value"] for entity in entities]
+        content = document.get("content", "")
+        if found is None and entity_values:
+            found = self._scan(content)
+        # Keywords come from the scan; other values are looked up once each
+        present = {value for value in entity_values
+                   if (value.lower() in found if value.lower() in _SCANNER.patterns
+                       else value.lower() in content.lower())}
 
         for i, entity1 in enumerate(entity_values):
             for j, entity2 in enumerate(entity_values[i+1:], i+1):
                 # Check if entities appear together in content
-                if self._entities_co_occur(document.get("content", ""), entity1, entity2):
+                if entity1 in present and entity2 in present:
                     relationships.append({
                         "source_entity": entity1,
                         "target_entity": entity2,
@@ -215,12 +245,9 @@ class RAGAnythingProcessor:
         content_lower = content.lower()
         return entity1.lower() in content_lower and entity2.lower() in content_lower
 
-    def _get_context(self, content: str, keyword: str, window: int = 50) -> str:
-        """Get context around a keyword"""
-        content_lower = content.lower()
-        keyword_lower = keyword.lower()
-
-        pos = content_lower.find(keyword_lower)
+    def _get_context(self, content: str, keyword: str, window: int = 50, position: Optional[int] = None) -> str:
+        """Get context around a keyword (at position, if already known)"""
+        pos = content.lower().find(keyword.lower()) if position is None else position
         if pos == -1:
             return ""
 
@@ -230,25 +257,13 @@ class RAGAnythingProcessor:
         return content[start:end].strip()
 
     def find_document_relationships(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Find relationships between documents"""
-        relationships = []
-
-        for i, doc1 in enumerate(documents):
-            for j, doc2 in enumerate(documents[i+1:], i+1):
-                # Calculate similarity based on shared entities and topics
-                similarity = self._calculate_document_similarity(doc1, doc2)
-
-                if similarity > 0.3:  # Threshold for relationship
-                    relationships.append({
-                        "source_doc_id": doc1.get("id"),
-                        "target_doc_id": doc2.get("id"),
-                        "relationship_type": "similarity",
-                        "strength": similarity,
-                        "shared_entities": self._get_shared_entities(doc1, doc2),
-                        "shared_topics": self._get_shared_topics(doc1, doc2)
-                    })
+        """
+        Find relationships between documents
 
-        return relationships
+        Only pairs sharing enough entities or topics are scored (see
+        SimilarityEngine), instead of every pair of documents.
+        """
+        return SimilarityEngine(threshold=0.3).find_relationships(documents)
 
     def _calculate_document_similarity(self, doc1: Dict[str, Any], doc2: Dict[str, Any]) -> float:
         """Calculate similarity between two documents"""
@@ -282,6 +297,22 @@ class RAGAnythingProcessor:
         topics2 = set(doc2.get("topics", []))
         return list(topics1 & topics2)
 
+    def take_stats(self) -> Dict[str, int]:
+        """Return the counters and reset them (used by enrichment worker processes)"""
+        counts = {
+            "processed_docs": self.processed_docs,
+            "entities_extracted": self.entities_extracted,
+            "relationships_created": self.relationships_created
+        }
+        self.processed_docs = self.entities_extracted = self.relationships_created = 0
+        return counts
+
+    def merge_stats(self, counts: Dict[str, int]):
+        """Add counters taken from another process"""
+        self.processed_docs += counts.get("processed_docs", 0)
+        self.entities_extracted += counts.get("entities_extracted", 0)
+        self.relationships_created += counts.get("relationships_created", 0)
+
     def get_processing_stats(self) -> Dict[str, Any]:
         """Get RAG-Anything processing statistics"""
         return {
@@ -0,0 +1,111 @@
+"""
+Candidate-based document similarity for relationship building
+"""
+import math
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, List, Any, Set, Tuple, FrozenSet
+
+logger = logging.getLogger(__name__)
+
+# Guards ceil() against float noise such as 0.3 * 10 = 3.0000000000000004
+_EPSILON = 1e-9
+
+
+class SimilarityEngine:
+    """
+    Find related documents without comparing every pair
+
+    Similarity is the mean of the entity and topic Jaccard similarities, as
+    in RAGAnythingProcessor. A pair above the threshold must have at least
+    one of the two Jaccards above it too (the larger of two values is at
+    least their mean), so candidates are generated per feature family with
+    an inverted index and prefix filtering: with features ordered rarest
+    first, two sets with Jaccard >= t always share one of their first few
+    features (the prefix; see _candidates for its length). Common features
+    (a topic every document has) fall outside most prefixes and never
+    produce candidates on their own. Only candidates are scored, exactly, so the
+    result equals the all-pairs comparison.
+    """
+
+    def __init__(self, threshold: float = 0.3):
+        self.threshold = threshold
+        self.stats = {"documents": 0, "candidates": 0, "relationships": 0}
+
+    @staticmethod
+    def features(document: Dict[str, Any]) -> Tuple[FrozenSet[Any], FrozenSet[Any]]:
+        """Entity values and topics of a document"""
+        entities = frozenset(entity["value"] for entity in document.get("entities", []))
+        topics = frozenset(document.get("topics", []))
+        return entities, topics
+
+    @staticmethod
+    def jaccard(a: FrozenSet[Any], b: FrozenSet[Any]) -> float:
+        union = len(a | b)
+        return len(a & b) / union if union else 0
+
+    def similarity(self, features1: Tuple[FrozenSet[Any], FrozenSet[Any]],
+                   features2: Tuple[FrozenSet[Any], FrozenSet[Any]]) -> float:
+        return (self.jaccard(features1[0], features2[0]) + self.jaccard(features1[1], features2[1])) / 2
+
+    def _candidates(self, sets: List[FrozenSet[Any]]) -> Set[Tuple[int, int]]:
+        """Pairs (i < j) that may have Jaccard >= threshold"""
+        t = self.threshold
+        frequency = Counter(feature for s in sets for feature in s)
+
+        def rank(feature):
+            return (frequency[feature], str(feature))
+
+        index: Dict[Any, List[int]] = defaultdict(list)
+        candidates: Set[Tuple[int, int]] = set()
+
+        # Smallest sets first, so every indexed set y is no larger than the
+        # probing set x. Jaccard >= t needs an overlap of at least
+        # t / (1 + t) * (|x| + |y|), which is >= t * |x| (probe prefix) and
+        # >= 2t / (1 + t) * |y| (shorter index prefix), and |y| >= t * |x|
+        for x in sorted(range(len(sets)), key=lambda i: len(sets[i])):
+            size = len(sets[x])
+            if not size:
+                continue
+            ordered = sorted(sets[x], key=rank)
+            probe_prefix = size - math.ceil(t * size - _EPSILON) + 1
+            index_prefix = size - math.ceil(2 * t / (1 + t) * size - _EPSILON) + 1
+            min_size = t * size - _EPSILON
+
+            for feature in ordered[:probe_prefix]:
+                for y in index.get(feature, ()):
+                    if len(sets[y]) >= min_size:
+                        candidates.add((x, y) if x < y else (y, x))
+            for feature in ordered[:index_prefix]:
+                index[feature].append(x)
+        return candidates
+
+    def find_relationships(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Relationships between documents above the threshold
+
+        Same output as RAGAnythingProcessor.find_document_relationships:
+        one "similarity" relationship per pair, in document order.
+        """
+        features = [self.features(doc) for doc in documents]
+        candidates = self._candidates([f[0] for f in features]) | self._candidates([f[1] for f in features])
+
+        relationships = []
+        for i, j in sorted(candidates):
+            similarity = self.similarity(features[i], features[j])
+            if similarity > self.threshold:
+                relationships.append({
+                    "source_doc_id": documents[i].get("id"),
+                    "target_doc_id": documents[j].get("id"),
+                    "relationship_type": "similarity",
+                    "strength": similarity,
+                    "shared_entities": list(features[i][0] & features[j][0]),
+                    "shared_topics": list(features[i][1] & features[j][1])
+                })
+
+        self.stats["documents"] += len(documents)
+        self.stats["candidates"] += len(candidates)
+        self.stats["relationships"] += len(relationships)
+        logger.info(f"Scored {len(candidates)} candidate pairs for {len(documents)} documents, "
+                    f"{len(relationships)} relationships")
+        return relationships
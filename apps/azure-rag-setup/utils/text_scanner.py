@@ -0,0 +1,74 @@
+"""
+Aho-Corasick multi-pattern scanner for keyword-based enrichment
+"""
+from collections import deque
+from typing import Dict, Iterable, List
+
+
+class KeywordScanner:
+    """
+    Find many substrings in one pass over a text
+
+    Patterns are matched as plain substrings (like `pattern in text`), so
+    results are the same as checking each pattern separately, but the text
+    is traversed once regardless of the number of patterns.
+
+    Example:
+        scanner = KeywordScanner(["budget", "plan"])
+        scanner.first_positions("the budget plan")  # {"budget": 4, "plan": 11}
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = list(dict.fromkeys(p for p in patterns if p))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # Failure links, breadth first; outputs of the fallback state are
+        # merged in so a match never needs to walk the failure chain
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def first_positions(self, text: str) -> Dict[str, int]:
+        """Start offset of the first occurrence of every pattern found in text"""
+        found: Dict[str, int] = {}
+        remaining = len(self.patterns)
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                pattern = patterns[pattern_id]
+                if pattern not in found:
+                    # Matches are reported by end offset; for one pattern the
+                    # earliest end is also the earliest start
+                    found[pattern] = position - len(pattern) + 1
+                    remaining -= 1
+            if not remaining:
+                break
+        return found
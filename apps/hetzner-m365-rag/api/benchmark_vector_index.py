@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Vector Index Benchmark
+Recall@k, query latency and memory of dense_vector index settings
+(hnsw / int8_hnsw / int4_hnsw / bbq_hnsw, m, ef_construction, truncated dims)
+on a running Elasticsearch
+
+Each setting gets a scratch index loaded with the same vectors and merged to
+one segment. Ground truth is an exact script_score search over the full,
+unquantized vectors, so truncated settings are measured against the
+original embedding space.
+
+Synthetic vectors are clustered but have no Matryoshka structure, so their
+truncation results are pessimistic; use --vectors with real embeddings
+(JSONL with a "vector" field, e.g. exported content_vector values) to decide
+on dimensions.
+
+Usage:
+    python benchmark_vector_index.py
+    python benchmark_vector_index.py --settings hnsw,int8_hnsw,int4_hnsw,int8_hnsw:768
+    python benchmark_vector_index.py --vectors embeddings.jsonl --queries 200 --k 10
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, List, Iterator, Optional, Tuple
+
+from elasticsearch import AsyncElasticsearch  # type: ignore
+from elasticsearch.helpers import async_bulk  # type: ignore
+
+from config_manager import get_config_manager
+from vector_settings import index_options, estimated_vector_memory, truncate_embedding
+
+INDEX_PREFIX = 'vector_bench'
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class VectorSource:
+    """Deterministic vectors: from a JSONL file or synthetic clusters"""
+
+    def __init__(self, dims: int, count: int, path: Optional[str] = None,
+                 clusters: int = 50, noise: float = 0.6, seed: int = 42):
+        self.path = path
+        self.noise = noise
+        self.seed = seed
+        if path:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.dims = len(json.loads(f.readline())['vector'])
+                self.count = min(count, 1 + sum(1 for _ in f))
+        else:
+            self.dims = dims
+            self.count = count
+            rng = random.Random(seed)
+            self.centroids = [_normalize([rng.gauss(0, 1) for _ in range(dims)]) for _ in range(clusters)]
+
+    def _synthetic(self, i: int) -> List[float]:
+        rng = random.Random(self.seed * 1_000_003 + i)
+        centroid = self.centroids[i % len(self.centroids)]
+        return _normalize([c + rng.gauss(0, self.noise / math.sqrt(self.dims)) for c in centroid])
+
+    def documents(self) -> Iterator[Tuple[int, List[float]]]:
+        """(id, vector) for every indexed document, generated lazily"""
+        if self.path:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for i, line in enumerate(f):
+                    if i >= self.count:
+                        return
+                    yield i, json.loads(line)['vector']
+        else:
+            for i in range(self.count):
+                yield i, self._synthetic(i)
+
+    def queries(self, n: int) -> List[List[float]]:
+        """Query vectors: perturbed copies of random documents"""
+        rng = random.Random(self.seed + 1)
+        picks = set(rng.sample(range(self.count), min(n, self.count)))
+        queries = []
+        for i, vector in self.documents():
+            if i in picks:
+                queries.append(_normalize([x + rng.gauss(0, 0.02) for x in vector]))
+        return queries
+
+
+def parse_setting(spec: str, full_dims: int, m: int, ef_construction: int) -> Dict[str, Any]:
+    """'int8_hnsw' or 'int8_hnsw:768' -> setting dict"""
+    index_type, _, dims = spec.partition(':')
+    return {
+        'name': spec,
+        'index_type': index_type,
+        'dims': int(dims) if dims else full_dims,
+        'm': m,
+        'ef_construction': ef_construction
+    }
+
+
+async def create_index(es: AsyncElasticsearch, name: str, dims: int, options: Optional[Dict[str, Any]]):
+    await es.options(ignore_status=404).indices.delete(index=name)
+    vector_mapping: Dict[str, Any] = {'type': 'dense_vector', 'dims': dims, 'similarity': 'cosine'}
+    if options:
+        vector_mapping.update({'index': True, 'index_options': options})
+    else:
+        vector_mapping['index'] = False
+    await es.indices.create(index=name, body={
+        'settings': {'number_of_shards': 1, 'number_of_replicas': 0, 'refresh_interval': '-1'},
+        'mappings': {'properties': {'v': vector_mapping}}
+    })
+
+
+async def load_index(es: AsyncElasticsearch, name: str, source: VectorSource, dims: int) -> float:
+    """Bulk load, refresh and merge to one segment; returns seconds taken"""
+    def actions():
+        for i, vector in source.documents():
+            yield {'_index': name, '_id': str(i), '_source': {'v': truncate_embedding(vector, dims)}}
+
+    started = time.perf_counter()
+    await async_bulk(es, actions(), chunk_size=500, request_timeout=300)
+    await es.indices.refresh(index=name)
+    await es.options(request_timeout=3600).indices.forcemerge(index=name, max_num_segments=1)
+    return time.perf_counter() - started
+
+
+async def exact_neighbours(es: AsyncElasticsearch, index: str, query: List[float], k: int) -> List[str]:
+    response = await es.search(index=index, size=k, source=False, query={
+        'script_score': {
+            'query': {'match_all': {}},
+            'script': {'source': "cosineSimilarity(params.q, 'v') + 1.0", 'params': {'q': query}}
+        }
+    })
+    return [hit['_id'] for hit in response['hits']['hits']]
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def benchmark_setting(es: AsyncElasticsearch, setting: Dict[str, Any], source: VectorSource,
+                            queries: List[List[float]], truth: List[List[str]],
+                            k: int, num_candidates: int) -> Dict[str, Any]:
+    name = f"{INDEX_PREFIX}_{setting['name'].replace(':', '_')}"
+    options = index_options(setting['index_type'], setting['m'], setting['ef_construction'])
+    await create_index(es, name, setting['dims'], options)
+    load_seconds = await load_index(es, name, source, setting['dims'])
+
+    # Warm-up so the first queries don't pay for loading the graph
+    for query in queries[:10]:
+        await es.search(index=name, knn={'field': 'v', 'query_vector': truncate_embedding(query, setting['dims']),
+                                         'k': k, 'num_candidates': num_candidates}, source=False)
+
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        response = await es.search(index=name, size=k, source=False, knn={
+            'field': 'v',
+            'query_vector': truncate_embedding(query, setting['dims']),
+            'k': k,
+            'num_candidates': num_candidates
+        })
+        latencies.append((time.perf_counter() - started) * 1000)
+        found = {hit['_id'] for hit in response['hits']['hits']}
+        recalls.append(len(found & set(expected)) / len(expected))
+
+    stats = await es.indices.stats(index=name, metric='store')
+    return {
+        'setting': setting['name'],
+        'dims': setting['dims'],
+        'recall': sum(recalls) / len(recalls),
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'memory_bytes': estimated_vector_memory(source.count, setting['dims'], setting['index_type'], setting['m']),
+        'disk_bytes': stats['_all']['primaries']['store']['size_in_bytes'],
+        'load_seconds': load_seconds,
+        'index': name
+    }
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark dense_vector index settings')
+    parser.add_argument('--settings', default='hnsw,int8_hnsw,int4_hnsw,int8_hnsw:768,int4_hnsw:768',
+                        help='Comma-separated index_type[:dims] (bbq_hnsw needs Elasticsearch 8.16+)')
+    parser.add_argument('--vectors', help='JSONL file of {"vector": [...]} embeddings')
+    parser.add_argument('--docs', type=int, default=20000, help='Documents to index')
+    parser.add_argument('--dims', type=int, default=1536, help='Synthetic vector dimensions')
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--num-candidates', type=int, default=100)
+    parser.add_argument('--m', type=int, default=16)
+    parser.add_argument('--ef-construction', type=int, default=100)
+    parser.add_argument('--total-docs', type=int,
+                        help='Extrapolate memory to this many vectors (e.g. the production chunk count)')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark indices')
+    args = parser.parse_args()
+
+    es_config = get_config_manager().get_elasticsearch_config()
+    es = AsyncElasticsearch(
+        hosts=[f"http://{es_config['host']}:{es_config['port']}"],
+        basic_auth=(es_config['user'], es_config['password']),
+        verify_certs=False,
+        request_timeout=120
+    )
+
+    try:
+        source = VectorSource(args.dims, args.docs, args.vectors)
+        settings = [parse_setting(spec.strip(), source.dims, args.m, args.ef_construction)
+                    for spec in args.settings.split(',') if spec.strip()]
+        print(f"📐 {source.count} vectors x {source.dims} dims, {args.queries} queries, "
+              f"k={args.k}, num_candidates={args.num_candidates}")
+
+        # Ground truth: exact search over the full float vectors
+        truth_index = f"{INDEX_PREFIX}_exact"
+        await create_index(es, truth_index, source.dims, None)
+        await load_index(es, truth_index, source, source.dims)
+        queries = source.queries(args.queries)
+        truth = [await exact_neighbours(es, truth_index, query, args.k) for query in queries]
+
+        results = []
+        for setting in settings:
+            print(f"⏳ {setting['name']}...")
+            try:
+                results.append(await benchmark_setting(es, setting, source, queries, truth,
+                                                       args.k, args.num_candidates))
+            except Exception as e:
+                print(f"❌ {setting['name']}: {e}")
+
+        scale = (args.total_docs / source.count) if args.total_docs else 1
+        memory_label = f"mem@{args.total_docs}" if args.total_docs else "vector mem"
+        print(f"\n{'setting':18} {'dims':>5} {'recall@' + str(args.k):>9} {'p50 ms':>7} {'p95 ms':>7} "
+              f"{memory_label:>14} {'disk':>10} {'load s':>7}")
+        for r in results:
+            print(f"{r['setting']:18} {r['dims']:5d} {r['recall']:9.3f} {r['p50_ms']:7.1f} {r['p95_ms']:7.1f} "
+                  f"{r['memory_bytes'] * scale / 2**20:11.0f} MB {r['disk_bytes'] / 2**20:7.0f} MB "
+                  f"{r['load_seconds']:7.0f}")
+
+        if not args.keep:
+            # Wildcard deletes are refused by default (action.destructive_requires_name)
+            for name in [truth_index] + [r['index'] for r in results]:
+                await es.options(ignore_status=404).indices.delete(index=name)
+        return 0
+    finally:
+        await es.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Bulk-Load Mode for Elasticsearch Indices
+Switches an index to ingest-optimized settings for the duration of a full
+sync or reindex, then restores it
+
+While loading:
+- refresh_interval -1 (no segment per bulk batch, no refresh merge pressure)
+- number_of_replicas reduced (replicas are rebuilt once at the end)
+- translog durability async (fsync every 5s instead of per request)
+
+At the end: original refresh/durability restored, a controlled refresh, a
+forcemerge, then replicas restored, so they copy merged segments.
+
+The original settings and the active loaders are kept in a state document
+(bulk_load_state index) updated with optimistic concurrency, so concurrent
+syncs share one bulk-load period. Loaders renew a lease while running; if a
+process dies, the next loader or API startup finds the expired lease and
+restores the index. The loader that restores first claims the state document
+('finishing', also a renewed lease); new loaders wait until it is done rather
+than having their settings reset underneath them.
+
+Usage:
+    python bulk_load.py status [--index documents]
+    python bulk_load.py restore [--index documents]
+"""
+
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import logging
+from typing import Dict, Any, Optional
+
+from elasticsearch import NotFoundError, ConflictError, BadRequestError  # type: ignore
+
+from config_manager import get_config_manager
+from index_versions import write_alias
+
+logger = logging.getLogger(__name__)
+
+# Settings managed by bulk-load mode (flat index.* names)
+MANAGED_SETTINGS = ('refresh_interval', 'number_of_replicas', 'translog.durability')
+
+# How often enter() re-checks a state document that is being finished
+FINISH_POLL_SECONDS = 2
+
+
+def _flatten(settings: Dict[str, Any], prefix: str = '') -> Dict[str, Any]:
+    flat = {}
+    for key, value in settings.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+class BulkLoadMode:
+    """
+    Enter/leave ingest-optimized settings for an index
+
+    Example:
+        async with BulkLoadMode(es_client, "documents"):
+            ...  # bulk writes; flush the writer before leaving
+    """
+
+    def __init__(self, es_client, index_name: Optional[str] = None, holder: Optional[str] = None):
+        config = get_config_manager()
+        load_config = config.get('elasticsearch.bulk_load', {})
+
+        self.es_client = es_client
+        self.index_name = index_name or write_alias(config.get('elasticsearch.index_prefix', 'documents'))
+        self.holder = holder or f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+        self.state_index = load_config.get('state_index', 'bulk_load_state')
+        self.lease_seconds = load_config.get('lease_seconds', 300)
+        self.load_settings = {
+            'refresh_interval': load_config.get('refresh_interval', '-1'),
+            'number_of_replicas': load_config.get('replicas', 0),
+            'translog.durability': load_config.get('translog_durability', 'async')
+        }
+        self.forcemerge = load_config.get('forcemerge', True)
+        self.forcemerge_max_segments = load_config.get('forcemerge_max_segments')
+        self.finish_timeout = load_config.get('finish_timeout_seconds', 3600)
+
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._finish_heartbeat: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> 'BulkLoadMode':
+        await self.enter()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.exit()
+
+    # ------------------------------------------------------------------
+    # State document
+    # ------------------------------------------------------------------
+    async def _get_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            response = await self.es_client.get(index=self.state_index, id=self.index_name)
+        except NotFoundError:
+            return None
+        return {
+            'doc': response['_source'],
+            'seq_no': response['_seq_no'],
+            'primary_term': response['_primary_term']
+        }
+
+    async def _write_state(self, state: Optional[Dict[str, Any]], doc: Dict[str, Any]):
+        """Create or update the state document; raises ConflictError if it changed meanwhile"""
+        if state is None:
+            await self.es_client.index(
+                index=self.state_index, id=self.index_name, document=doc,
+                op_type='create', refresh='wait_for'
+            )
+        else:
+            await self.es_client.index(
+                index=self.state_index, id=self.index_name, document=doc,
+                if_seq_no=state['seq_no'], if_primary_term=state['primary_term'],
+                refresh='wait_for'
+            )
+
+    async def _ensure_state_index(self):
+        if await self.es_client.indices.exists(index=self.state_index):
+            return
+        try:
+            await self.es_client.indices.create(index=self.state_index, body={
+                'settings': {'number_of_shards': 1, 'auto_expand_replicas': '0-1'},
+                'mappings': {'dynamic': False}
+            })
+        except BadRequestError as e:
+            # Created concurrently by another loader
+            if 'resource_already_exists_exception' not in str(e):
+                raise
+
+    async def _current_settings(self) -> Dict[str, Any]:
+        response = await self.es_client.indices.get_settings(index=self.index_name)
+        # The index name may be an alias; take the concrete index
+        index_settings = _flatten(next(iter(response.values()))['settings']['index'])
+        # Unset values are stored as None, which resets them to the default
+        return {name: index_settings.get(name) for name in MANAGED_SETTINGS}
+
+    async def _put_settings(self, settings: Dict[str, Any]):
+        await self.es_client.indices.put_settings(
+            index=self.index_name, settings={f"index.{k}": v for k, v in settings.items()}
+        )
+
+    @staticmethod
+    def _live_holders(doc: Dict[str, Any]) -> Dict[str, float]:
+        now = time.time()
+        return {holder: until for holder, until in doc.get('holders', {}).items() if until > now}
+
+    @staticmethod
+    def _live_finisher(doc: Dict[str, Any]) -> Optional[str]:
+        """Holder currently restoring the index, if its claim has not expired"""
+        finishing = doc.get('finishing')
+        if finishing and finishing.get('until', 0) > time.time():
+            return finishing.get('holder')
+        return None
+
+    def _finishing_claim(self) -> Dict[str, Any]:
+        return {'holder': self.holder, 'until': time.time() + self.lease_seconds}
+
+    # ------------------------------------------------------------------
+    # Enter / exit
+    # ------------------------------------------------------------------
+    async def enter(self):
+        """Register as a loader and switch the index to bulk-load settings"""
+        await self._ensure_state_index()
+
+        waiting = False
+        while True:
+            state = await self._get_state()
+            if state is not None and self._live_finisher(state['doc']):
+                # Another loader is restoring the index; join a fresh period
+                # once it has finished instead of racing its restore
+                if not waiting:
+                    logger.info(f"Waiting for bulk load of '{self.index_name}' to finish")
+                    waiting = True
+                await asyncio.sleep(FINISH_POLL_SECONDS)
+                continue
+            if state is None:
+                # First loader: remember the settings to restore
+                doc = {
+                    'index': self.index_name,
+                    'original': await self._current_settings(),
+                    'holders': {},
+                    'started_at': time.time()
+                }
+            else:
+                # Settings already switched (possibly by a crashed loader):
+                # keep the recorded originals, never the current values.
+                # An expired finishing claim is taken over here.
+                doc = state['doc']
+                doc['holders'] = self._live_holders(doc)
+                doc.pop('finishing', None)
+
+            doc['holders'][self.holder] = time.time() + self.lease_seconds
+            try:
+                await self._write_state(state, doc)
+                break
+            except ConflictError:
+                continue
+
+        await self._put_settings(self.load_settings)
+        self._heartbeat = asyncio.create_task(self._renew_lease())
+        logger.info(
+            f"Bulk-load mode on for '{self.index_name}' ({len(doc['holders'])} loader(s)): "
+            f"{self.load_settings}"
+        )
+
+    async def _renew_lease(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                while True:
+                    state = await self._get_state()
+                    if state is None:
+                        return
+                    doc = state['doc']
+                    doc.setdefault('holders', {})[self.holder] = time.time() + self.lease_seconds
+                    try:
+                        await self._write_state(state, doc)
+                        break
+                    except ConflictError:
+                        continue
+            except Exception as e:
+                logger.warning(f"Could not renew bulk-load lease for '{self.index_name}': {e}")
+
+    async def exit(self):
+        """Deregister; the last loader restores settings, refreshes and forcemerges"""
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+
+        while True:
+            state = await self._get_state()
+            if state is None:
+                return
+            doc = state['doc']
+            doc['holders'] = self._live_holders(doc)
+            doc['holders'].pop(self.holder, None)
+            if not doc['holders']:
+                if self._live_finisher(doc) not in (None, self.holder):
+                    # Our lease expired and recovery is already restoring
+                    return
+                # Last loader: claim the restore in the same write
+                doc['finishing'] = self._finishing_claim()
+            try:
+                await self._write_state(state, doc)
+            except ConflictError:
+                continue
+            if doc['holders']:
+                logger.info(
+                    f"Left bulk-load mode for '{self.index_name}'; "
+                    f"{len(doc['holders'])} loader(s) still running"
+                )
+                return
+            break
+
+        await self.finish(doc['original'])
+
+    async def claim_finish(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Claim the restore of an index without live loaders
+
+        Returns the original settings, or None if there is nothing to restore,
+        loaders are still live or another finish holds the claim. With force,
+        live loaders and claims are overridden (manual restore).
+        """
+        while True:
+            state = await self._get_state()
+            if state is None:
+                return None
+            doc = state['doc']
+            if not force and (self._live_holders(doc) or self._live_finisher(doc)):
+                return None
+            doc['holders'] = {} if force else self._live_holders(doc)
+            doc['finishing'] = self._finishing_claim()
+            try:
+                await self._write_state(state, doc)
+                return doc['original']
+            except ConflictError:
+                continue
+
+    async def _renew_finishing(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                while True:
+                    state = await self._get_state()
+                    if state is None or self._live_finisher(state['doc']) != self.holder:
+                        return
+                    doc = state['doc']
+                    doc['finishing'] = self._finishing_claim()
+                    try:
+                        await self._write_state(state, doc)
+                        break
+                    except ConflictError:
+                        continue
+            except Exception as e:
+                logger.warning(f"Could not renew bulk-load finish claim for '{self.index_name}': {e}")
+
+    async def finish(self, original: Dict[str, Any]):
+        """
+        Restore an index after bulk loading; the caller holds the finishing claim
+
+        The state document is deleted only once everything is restored, so an
+        interrupted finish is retried by recovery.
+        """
+        logger.info(f"Restoring '{self.index_name}' after bulk load")
+        self._finish_heartbeat = asyncio.create_task(self._renew_finishing())
+        try:
+            await self._restore(original)
+        finally:
+            self._finish_heartbeat.cancel()
+            await asyncio.gather(self._finish_heartbeat, return_exceptions=True)
+            self._finish_heartbeat = None
+        await self._release()
+
+    async def _restore(self, original: Dict[str, Any]):
+        client = self.es_client.options(request_timeout=self.finish_timeout)
+
+        # Make the loaded documents searchable and durable again first
+        await self._put_settings({
+            'refresh_interval': original.get('refresh_interval'),
+            'translog.durability': original.get('translog.durability')
+        })
+        await client.indices.refresh(index=self.index_name)
+
+        if self.forcemerge:
+            # Reindexed documents leave deletes behind; expunge them unless a
+            # segment count is configured
+            if self.forcemerge_max_segments:
+                await client.indices.forcemerge(
+                    index=self.index_name, max_num_segments=self.forcemerge_max_segments
+                )
+            else:
+                await client.indices.forcemerge(index=self.index_name, only_expunge_deletes=True)
+
+        # Replicas last, so they copy the merged segments once
+        await self._put_settings({'number_of_replicas': original.get('number_of_replicas')})
+
+    async def _release(self):
+        """Delete the state document, unless a loader joined while restoring"""
+        while True:
+            state = await self._get_state()
+            if state is None:
+                return
+            doc = state['doc']
+            holders = self._live_holders(doc)
+            claimed = (doc.get('finishing') or {}).get('holder') == self.holder
+            if holders or not claimed:
+                # A loader renewed or took over an expired claim while we were
+                # restoring: put its settings back and leave the state to it
+                if claimed:
+                    doc.pop('finishing', None)
+                    doc['holders'] = holders
+                    try:
+                        await self._write_state(state, doc)
+                    except ConflictError:
+                        continue
+                if holders:
+                    await self._put_settings(self.load_settings)
+                logger.warning(
+                    f"Bulk load of '{self.index_name}' was rejoined while restoring; "
+                    f"{len(holders)} loader(s) running"
+                )
+                return
+            try:
+                await self.es_client.delete(
+                    index=self.state_index, id=self.index_name, refresh='wait_for',
+                    if_seq_no=state['seq_no'], if_primary_term=state['primary_term']
+                )
+            except ConflictError:
+                continue
+            except NotFoundError:
+                pass
+            break
+        logger.info(f"Bulk-load mode off for '{self.index_name}'")
+
+
+async def recover_bulk_loads(es_client) -> int:
+    """
+    Restore indices left in bulk-load mode by loaders that died
+
+    Called at API startup; returns the number of indices restored.
+    """
+    state_index = get_config_manager().get('elasticsearch.bulk_load.state_index', 'bulk_load_state')
+    try:
+        response = await es_client.search(index=state_index, query={'match_all': {}}, size=100)
+    except NotFoundError:
+        return 0
+
+    restored = 0
+    for hit in response['hits']['hits']:
+        mode = BulkLoadMode(es_client, hit['_id'])
+        try:
+            original = await mode.claim_finish()
+            if original is None:
+                continue
+            await mode.finish(original)
+            restored += 1
+        except Exception as e:
+            logger.error(f"Could not restore '{hit['_id']}' after bulk load: {e}")
+    return restored
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description='Elasticsearch bulk-load mode')
+    parser.add_argument('command', choices=['status', 'restore'])
+    parser.add_argument('--index', default=None, help='Index name (default: documents)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from elasticsearch import AsyncElasticsearch  # type: ignore
+
+    es_config = get_config_manager().get_elasticsearch_config()
+    es_client = AsyncElasticsearch(
+        hosts=[f"http://{es_config['host']}:{es_config['port']}"],
+        basic_auth=(es_config['user'], es_config['password']),
+        verify_certs=False
+    )
+    try:
+        mode = BulkLoadMode(es_client, args.index)
+        state = await mode._get_state()
+        if args.command == 'status':
+            print(json.dumps({
+                'index': mode.index_name,
+                'bulk_load': bool(state),
+                'state': state['doc'] if state else None,
+                'settings': await mode._current_settings()
+            }, indent=2))
+            return 0
+
+        # Manual restore, regardless of live loaders
+        original = await mode.claim_finish(force=True) if state else None
+        if original is None:
+            print(f"ℹ️  '{mode.index_name}' is not in bulk-load mode")
+            return 0
+        await mode.finish(original)
+        print(f"✅ Restored '{mode.index_name}'")
+        return 0
+    finally:
+        await es_client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Shared Elasticsearch Bulk Writer
+Accepts index/delete actions from any producer (indexers, webhooks, uploads)
+and writes them with the bulk API instead of one request per document
+
+- Actions are batched per lane and flushed by count, size or time
+- Lanes write in parallel; an id always maps to the same lane, so updates and
+  deletes of one document are applied in order
+- Bounded queues give producers backpressure when Elasticsearch falls behind
+- 429 rejections are retried with exponential backoff
+- Documents that still fail are written to a dead-letter file for replay
+
+Usage:
+    python bulk_writer.py replay [--limit N]
+    python bulk_writer.py stats
+"""
+
+import os
+import sys
+import json
+import zlib
+import asyncio
+import argparse
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from elasticsearch.helpers import async_streaming_bulk  # type: ignore
+
+from config_manager import get_config_manager
+from index_versions import write_alias
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class DeadLetterStore:
+    """
+    Append-only JSONL file of bulk actions that failed permanently
+
+    Each line holds the original action, the error and the failure time.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = asyncio.Lock()
+
+    def _append(self, lines: List[str]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+    async def add(self, failures: List[Tuple[Dict[str, Any], Any]]):
+        """Store (action, error) pairs"""
+        if not failures:
+            return
+        failed_at = datetime.utcnow().isoformat()
+        lines = [
+            json.dumps({'action': action, 'error': error, 'failed_at': failed_at}, default=str) + '\n'
+            for action, error in failures
+        ]
+        async with self._lock:
+            await asyncio.to_thread(self._append, lines)
+
+    def _take(self, limit: Optional[int]) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+        taken, kept = (entries, []) if limit is None else (entries[:limit], entries[limit:])
+        # Write the remainder to a temp file first so a crash never loses entries
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry, default=str) + '\n' for entry in kept)
+        os.replace(tmp_path, self.path)
+        return taken
+
+    async def take(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Remove and return up to `limit` entries, oldest first"""
+        async with self._lock:
+            return await asyncio.to_thread(self._take, limit)
+
+    def count(self) -> int:
+        if not self.path.exists():
+            return 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return sum(1 for line in f if line.strip())
+
+
+class BulkWriter:
+    """
+    Queue-fed Elasticsearch bulk writer
+
+    Example:
+        writer = BulkWriter(es_client)
+        await writer.start()
+        await writer.index(doc_id, document)   # returns once queued
+        await writer.flush()                   # wait until written
+        await writer.close()
+    """
+
+    def __init__(
+        self,
+        es_client,
+        index_name: Optional[str] = None,
+        lanes: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        dead_letter: Optional[DeadLetterStore] = None
+    ):
+        config = get_config_manager()
+        bulk_config = config.get('elasticsearch.bulk', {})
+
+        self.es_client = es_client
+        self.index_name = index_name or write_alias(config.get('elasticsearch.index_prefix', 'documents'))
+        self.lanes = lanes or bulk_config.get('lanes', 4)
+        self.chunk_size = chunk_size or bulk_config.get('chunk_size', 500)
+        self.max_chunk_bytes = bulk_config.get('max_chunk_mb', 10) * 1024 * 1024
+        self.flush_interval = flush_interval or bulk_config.get('flush_interval', 1.0)
+        self.max_retries = bulk_config.get('max_retries', 5)
+        self.initial_backoff = bulk_config.get('initial_backoff', 1)
+        self.max_backoff = bulk_config.get('max_backoff', 60)
+        self.dead_letter = dead_letter or DeadLetterStore(
+            bulk_config.get('dead_letter_file', 'logs/es_dead_letters.jsonl')
+        )
+
+        queue_size = bulk_config.get('queue_size', 2000)
+        self._queue_size = max(1, queue_size // self.lanes)
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+
+        self.stats = {
+            'queued': 0,
+            'indexed': 0,
+            'deleted': 0,
+            'failed': 0,
+            'requests': 0
+        }
+
+    async def __aenter__(self) -> 'BulkWriter':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        """Start the lane workers (idempotent)"""
+        if self._workers:
+            return
+        self._queues = [asyncio.Queue(maxsize=self._queue_size) for _ in range(self.lanes)]
+        self._workers = [
+            asyncio.create_task(self._run_lane(queue)) for queue in self._queues
+        ]
+        logger.info(
+            f"Bulk writer started - lanes: {self.lanes}, chunk: {self.chunk_size}, "
+            f"flush interval: {self.flush_interval}s"
+        )
+
+    # ------------------------------------------------------------------
+    # Producers
+    # ------------------------------------------------------------------
+    async def submit(self, action: Dict[str, Any]):
+        """
+        Queue a bulk action (blocks while the lane is full)
+
+        Args:
+            action: Bulk helper action with _id (and _source for index/update)
+        """
+        if not self._workers:
+            await self.start()
+        action.setdefault('_index', self.index_name)
+        lane = zlib.crc32(str(action.get('_id')).encode()) % self.lanes
+        await self._queues[lane].put(action)
+        self.stats['queued'] += 1
+
+    async def index(self, doc_id: str, document: Dict[str, Any], index: Optional[str] = None):
+        """Queue a document to be indexed (created or replaced)"""
+        await self.submit({
+            '_op_type': 'index',
+            '_index': index or self.index_name,
+            '_id': doc_id,
+            '_source': document
+        })
+
+    async def delete(self, doc_id: str, index: Optional[str] = None):
+        """Queue a document deletion"""
+        await self.submit({
+            '_op_type': 'delete',
+            '_index': index or self.index_name,
+            '_id': doc_id
+        })
+
+    async def flush(self):
+        """Wait until every action queued so far has been written or dead-lettered"""
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def close(self):
+        """Flush and stop the lane workers"""
+        if not self._workers:
+            return
+        for queue in self._queues:
+            await queue.put(_STOP)
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info(
+            f"Bulk writer closed - indexed: {self.stats['indexed']}, deleted: "
+            f"{self.stats['deleted']}, failed: {self.stats['failed']}, requests: {self.stats['requests']}"
+        )
+
+    # ------------------------------------------------------------------
+    # Lanes
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _action_size(action: Dict[str, Any]) -> int:
+        source = action.get('_source')
+        return len(json.dumps(source, default=str)) if source else 100
+
+    async def _run_lane(self, queue: asyncio.Queue):
+        """Collect a batch until it is full or the flush interval passes, then send it"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            action = await queue.get()
+            if action is _STOP:
+                queue.task_done()
+                return
+
+            batch = [action]
+            size = self._action_size(action)
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.chunk_size and size < self.max_chunk_bytes:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    action = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if action is _STOP:
+                    queue.task_done()
+                    stopping = True
+                    break
+                batch.append(action)
+                size += self._action_size(action)
+
+            try:
+                await self._send(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _send(self, batch: List[Dict[str, Any]]):
+        """Write one batch; 429s are retried, other failures are dead-lettered"""
+        # Results name the concrete index (not an alias), so match on op and id
+        pending: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for action in batch:
+            key = (action.get('_op_type', 'index'), str(action.get('_id')))
+            pending.setdefault(key, []).append(action)
+
+        failures: List[Tuple[Dict[str, Any], Any]] = []
+        self.stats['requests'] += 1
+        try:
+            async for ok, info in async_streaming_bulk(
+                self.es_client,
+                batch,
+                chunk_size=len(batch),
+                max_chunk_bytes=self.max_chunk_bytes,
+                raise_on_error=False,
+                raise_on_exception=False,
+                max_retries=self.max_retries,
+                initial_backoff=self.initial_backoff,
+                max_backoff=self.max_backoff,
+                yield_ok=False
+            ):
+                op_type, result = next(iter(info.items()))
+                # Deleting a document that is already gone is not a failure
+                if op_type == 'delete' and result.get('status') == 404:
+                    continue
+                actions = pending.get((op_type, str(result.get('_id'))))
+                action = actions.pop(0) if actions else {'_op_type': op_type, '_id': result.get('_id')}
+                failures.append((action, result.get('error') or result.get('exception') or result))
+        except Exception as e:
+            logger.error(f"Bulk request of {len(batch)} actions failed: {e}")
+            failures = [(action, str(e)) for action in batch]
+
+        deletes = sum(1 for action in batch if action.get('_op_type') == 'delete')
+        failed_deletes = sum(1 for action, _ in failures if action.get('_op_type') == 'delete')
+        self.stats['deleted'] += deletes - failed_deletes
+        self.stats['indexed'] += len(batch) - deletes - (len(failures) - failed_deletes)
+        self.stats['failed'] += len(failures)
+
+        if failures:
+            logger.warning(f"{len(failures)} of {len(batch)} bulk actions failed, sent to dead-letter store")
+            try:
+                await self.dead_letter.add(failures)
+            except Exception as e:
+                logger.error(f"Could not write dead letters: {e}")
+
+    # ------------------------------------------------------------------
+    # Dead letters
+    # ------------------------------------------------------------------
+    async def replay_dead_letters(self, limit: Optional[int] = None) -> Dict[str, int]:
+        """
+        Re-queue dead-lettered actions; ones that fail again go back to the store
+
+        Returns:
+            dict: Replayed, remaining and failed counts
+        """
+        entries = await self.dead_letter.take(limit)
+        failed_before = self.stats['failed']
+        for entry in entries:
+            await self.submit(entry['action'])
+        await self.flush()
+
+        return {
+            'replayed': len(entries),
+            'failed': self.stats['failed'] - failed_before,
+            'remaining': self.dead_letter.count()
+        }
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'queue_depth': sum(queue.qsize() for queue in self._queues),
+            'dead_letters': self.dead_letter.count()
+        }
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description='Elasticsearch bulk writer dead letters')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = subparsers.add_parser('replay', help='Re-send dead-lettered actions')
+    replay_parser.add_argument('--limit', type=int, help='Replay at most this many actions')
+    subparsers.add_parser('stats', help='Show the number of dead-lettered actions')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == 'stats':
+        store = DeadLetterStore(
+            get_config_manager().get('elasticsearch.bulk.dead_letter_file', 'logs/es_dead_letters.jsonl')
+        )
+        print(json.dumps({'dead_letters': store.count()}, indent=2))
+        return 0
+
+    from elasticsearch import AsyncElasticsearch  # type: ignore
+
+    es_config = get_config_manager().get_elasticsearch_config()
+    es_client = AsyncElasticsearch(
+        hosts=[f"http://{es_config['host']}:{es_config['port']}"],
+        basic_auth=(es_config['user'], es_config['password']),
+        verify_certs=False
+    )
+    writer = BulkWriter(es_client)
+    try:
+        await writer.start()
+        result = await writer.replay_dead_letters(args.limit)
+        await writer.close()
+        print(json.dumps(result, indent=2))
+        return 0 if not result['failed'] else 1
+    finally:
+        await es_client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -41,7 +41,63 @@ class ConfigManager:
                 'port': int(os.getenv('ES_PORT', 9200)),
                 'user': os.getenv('ES_USER', 'elastic'),
                 'password': os.getenv('ES_PASSWORD', 'changeme'),
-                'index_prefix': 'documents'
+                'index_prefix': 'documents',
+                # Shared bulk writer (bulk_writer.py): parallel lanes, batch
+                # flush by count/size/time, 429 retries, dead-letter file
+                'bulk': {
+                    'lanes': int(os.getenv('ES_BULK_LANES', 4)),
+                    'chunk_size': 500,
+                    'max_chunk_mb': 10,
+                    'flush_interval': 1.0,
+                    'queue_size': 2000,
+                    'max_retries': 5,
+                    'initial_backoff': 1,
+                    'max_backoff': 60,
+                    'dead_letter_file': os.getenv('ES_DEAD_LETTER_FILE', 'logs/es_dead_letters.jsonl')
+                },
+                # Index settings while full syncs run (bulk_load.py); restored,
+                # refreshed and force-merged when the last loader finishes
+                'bulk_load': {
+                    'enabled': os.getenv('ES_BULK_LOAD_MODE', 'true').lower() == 'true',
+                    'refresh_interval': '-1',
+                    'replicas': 0,
+                    'translog_durability': 'async',
+                    'lease_seconds': 300,
+                    'forcemerge': True,
+                    # None expunges deletes only; a number merges down to it
+                    'forcemerge_max_segments': None,
+                    'finish_timeout_seconds': 3600,
+                    'state_index': 'bulk_load_state'
+                },
+                # Versioned indices (index_versions.py): reindex throttle and
+                # validation before the alias swap
+                'migration': {
+                    'requests_per_second': 1000,
+                    'batch_size': 1000,
+                    'count_tolerance': 0.001,
+                    'sample_size': 200,
+                    'poll_interval': 10
+                },
+                # Monthly indices for time-ordered sources (time_partitions.py),
+                # aged through ILM tiers by the month they cover
+                'partitions': {
+                    'enabled': os.getenv('ES_TIME_PARTITIONS', 'true').lower() == 'true',
+                    'prefix': 'm365',
+                    # source -> metadata field holding the item's date
+                    'sources': {
+                        'exchange': 'received',
+                        'calendar': 'start',
+                        'teams': 'created'
+                    },
+                    # Hot shards; ILM shrinks each partition to one in the warm tier
+                    'number_of_shards': 2,
+                    'policy': 'm365-partitions',
+                    'warm_after': '30d',
+                    'cold_after': '180d',
+                    # None keeps old partitions forever
+                    'delete_after': None,
+                    'cache_seconds': 300
+                }
             },
             'minio': {
                 'endpoint': os.getenv('MINIO_ENDPOINT', 'minio:9000'),
@@ -49,7 +105,28 @@ class ConfigManager:
                 'secret_key': os.getenv(
                     'MINIO_SECRET_KEY', 'changeme123'
                 ),
-                'bucket': 'm365-documents'
+                'bucket': 'm365-documents',
+                'secure': os.getenv('MINIO_SECURE', 'false').lower() == 'true',
+                'region': os.getenv('MINIO_REGION', 'us-east-1'),
+                # AsyncMinIOAdapter tuning: operations in flight, HTTP
+                # connections, multipart part size/parallelism, listing shards
+                'max_concurrency': int(os.getenv('MINIO_MAX_CONCURRENCY', 16)),
+                'pool_size': int(os.getenv('MINIO_POOL_SIZE', 64)),
+                'part_size_mb': int(os.getenv('MINIO_PART_SIZE_MB', 16)),
+                'parallel_uploads': int(os.getenv('MINIO_PARALLEL_UPLOADS', 4)),
+                'list_shards': 8,
+                # Store files once per SHA-256 under object_prefix, with the
+                # reference index in PostgreSQL (content_store.py)
+                'content_addressed': os.getenv('MINIO_CONTENT_ADDRESSED', 'true').lower() == 'true',
+                'object_prefix': 'objects',
+                # gc leaves unreferenced objects younger than this alone: a put
+                # uploads its object before the reference row is inserted
+                'gc_grace_seconds': int(os.getenv('MINIO_GC_GRACE_SECONDS', 3600)),
+                # Presigned download links: lifetime, and how long before
+                # expiry a cached link is re-signed
+                'url_expiry_seconds': int(os.getenv('MINIO_URL_EXPIRY_SECONDS', 3600)),
+                'url_refresh_margin_seconds': 600,
+                'url_cache_size': 10000
             },
             'postgres': {
                 'url': os.getenv('DATABASE_URL'),
@@ -79,10 +156,46 @@ class ConfigManager:
             'rag': {
                 'embedding_model': 'text-embedding-3-large',
                 'embedding_dimensions': 1536,
+                # dense_vector index settings (vector_settings.py). Quantized
+                # HNSW cuts vector memory 4x (int8), 8x (int4) or ~30x (bbq,
+                # ES 8.16+); dims below the model's size truncate Matryoshka
+                # embeddings. Changing these needs a new index version
+                # (index_versions.py migrate); benchmark_vector_index.py
+                # measures recall and latency per setting.
+                'vectors': {
+                    'content': {
+                        # dims default to embedding_dimensions
+                        'index_type': os.getenv('CONTENT_VECTOR_INDEX_TYPE', 'int8_hnsw'),
+                        'm': 16,
+                        'ef_construction': 100,
+                        'confidence_interval': None
+                    },
+                    'image': {
+                        'dims': 512,
+                        'index_type': os.getenv('IMAGE_VECTOR_INDEX_TYPE', 'int8_hnsw'),
+                        'm': 16,
+                        'ef_construction': 100,
+                        'confidence_interval': None
+                    }
+                },
                 'llm_model': 'gpt-4o-mini',
                 'chunk_size': 512,
                 'chunk_overlap': 50
             },
+            'webhooks': {
+                # Public HTTPS URL Graph posts change notifications to
+                'notification_url': os.getenv('M365_WEBHOOK_URL'),
+                'client_state': os.getenv('M365_WEBHOOK_CLIENT_STATE'),
+                # Outlook resources allow at most 10080 minutes
+                'subscription_minutes': 4200,
+                'renew_before_minutes': 720,
+                'renew_check_interval': 600,
+                # Notifications for the same drive within this window share one delta fetch
+                'coalesce_seconds': 5,
+                # A 'missed' lifecycle event re-reads mail/events modified this far back
+                'missed_lookback_hours': 24,
+                'max_attempts': 3
+            },
             'sync': {
                 'batch_size': 100,
                 'max_retries': 3,
@@ -148,6 +261,10 @@ class ConfigManager:
         """Get RAG configuration"""
         return self.get('rag', {})
 
+    def get_webhook_config(self) -> Dict:
+        """Get Graph change notification configuration"""
+        return self.get('webhooks', {})
+
     def get_sync_config(self) -> Dict:
         """Get sync configuration"""
         return self.get('sync', {})
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Storage for M365 Files
+Stores each distinct file once in MinIO under its SHA-256
+(objects/<2 hex>/<sha256>) and keeps a reference index in PostgreSQL that
+maps M365 ids and display paths to content hashes
+
+- Identical files in different locations share one object
+- Files with the same name in different folders no longer overwrite each other
+- Unchanged files (same Graph quickXorHash or SHA-256) are never re-uploaded
+- Objects are deleted when their last reference goes away
+
+Usage:
+    python content_store.py migrate --prefix sharepoint/ [--delete-old] [--dry-run]
+    python content_store.py gc
+    python content_store.py stats
+"""
+
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import argparse
+import logging
+import mimetypes
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
+
+import asyncpg  # type: ignore
+
+from config_manager import get_config_manager
+from storage_adapter import AsyncMinIOAdapter
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS blob_objects (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    content_type VARCHAR(255),
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS blob_refs (
+    source VARCHAR(50) NOT NULL,
+    m365_id VARCHAR(255) NOT NULL,
+    path TEXT,
+    sha256 CHAR(64) NOT NULL REFERENCES blob_objects(sha256),
+    source_hash VARCHAR(255),
+    metadata JSONB,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, m365_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_blob_refs_sha256 ON blob_refs(sha256);
+CREATE INDEX IF NOT EXISTS idx_blob_refs_path ON blob_refs(path);
+"""
+
+
+def hash_file(file_path: str) -> tuple:
+    """SHA-256 hex digest and size of a file"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def graph_source_hash(item: Dict[str, Any]) -> Optional[str]:
+    """Content hash Graph reports for a driveItem (no download needed)"""
+    hashes = item.get('file', {}).get('hashes', {})
+    return hashes.get('quickXorHash') or hashes.get('sha256Hash') or hashes.get('sha1Hash')
+
+
+def drive_item_folder(item: Dict[str, Any]) -> str:
+    """Folder of a driveItem below the drive root ('' or '/A/B')"""
+    parent_path = item.get('parentReference', {}).get('path', '')
+    return parent_path.split('root:', 1)[1] if 'root:' in parent_path else ''
+
+
+class ContentStore:
+    """
+    Content-addressed object layer over AsyncMinIOAdapter
+
+    blob_objects holds one row per stored object with its reference count;
+    blob_refs maps (source, m365_id) to an object. Reference counts change
+    in the same transaction as the references, and an object is removed
+    from MinIO while its row is locked, so a concurrent put of the same
+    content either sees the row gone (and uploads again) or keeps it alive.
+    """
+
+    def __init__(self, storage: AsyncMinIOAdapter, pool, prefix: Optional[str] = None):
+        self.storage = storage
+        self.pool = pool
+        self.prefix = prefix or get_config_manager().get('minio.object_prefix', 'objects')
+
+        self.stats = {
+            'uploaded': 0,
+            'deduplicated': 0,
+            'unchanged': 0,
+            'objects_deleted': 0
+        }
+
+    @classmethod
+    async def connect(cls, storage: Optional[AsyncMinIOAdapter] = None,
+                      dsn: Optional[str] = None) -> 'ContentStore':
+        """Create a store with its own connection pool and make sure the tables exist"""
+        dsn = dsn or get_config_manager().get_postgres_config().get('url')
+        if not dsn:
+            raise ValueError("DATABASE_URL is required for the content store")
+
+        pool = await asyncpg.create_pool(dsn, min_size=1, max_size=10)
+        store = cls(storage or AsyncMinIOAdapter(), pool)
+        await store.ensure_schema()
+        return store
+
+    async def close(self):
+        await self.pool.close()
+
+    async def ensure_schema(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute(SCHEMA_SQL)
+
+    def object_name(self, sha256: str) -> str:
+        return f"{self.prefix}/{sha256[:2]}/{sha256}"
+
+    async def get_ref(self, source: str, m365_id: str) -> Optional[Dict[str, Any]]:
+        """Reference of an M365 item, or None"""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT source, m365_id, path, sha256, source_hash, metadata "
+                "FROM blob_refs WHERE source = $1 AND m365_id = $2",
+                source, m365_id
+            )
+        if not row:
+            return None
+
+        ref = dict(row)
+        ref['metadata'] = json.loads(ref['metadata']) if ref['metadata'] else {}
+        ref['object_name'] = self.object_name(ref['sha256'])
+        return ref
+
+    async def touch_if_unchanged(self, source: str, m365_id: str, path: str,
+                                 source_hash: Optional[str],
+                                 metadata: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Update path and metadata of a reference whose content is unchanged
+
+        Returns the reference when Graph's content hash matches the stored
+        one (the caller can skip the download), otherwise None.
+        """
+        if not source_hash:
+            return None
+
+        async with self.pool.acquire() as conn:
+            sha256 = await conn.fetchval(
+                "UPDATE blob_refs SET path = $3, metadata = $4, updated_at = CURRENT_TIMESTAMP "
+                "WHERE source = $1 AND m365_id = $2 AND source_hash = $5 RETURNING sha256",
+                source, m365_id, path, json.dumps(metadata or {}), source_hash
+            )
+        if not sha256:
+            return None
+
+        self.stats['unchanged'] += 1
+        return {'sha256': sha256, 'object_name': self.object_name(sha256), 'uploaded': False}
+
+    async def put_file(self, source: str, m365_id: str, path: str, file_path: str,
+                       metadata: Optional[Dict[str, Any]] = None,
+                       source_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Store a file for an M365 item and point its reference at it
+
+        Returns the sha256, object name and whether it was uploaded, or None
+        if the upload failed.
+        """
+        sha256, size = await asyncio.to_thread(hash_file, file_path)
+        object_name = self.object_name(sha256)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        object_metadata = {'sha256': sha256, 'source': source}
+
+        async with self.pool.acquire() as conn:
+            ref_count = await conn.fetchval(
+                "SELECT ref_count FROM blob_objects WHERE sha256 = $1", sha256
+            )
+
+        uploaded = False
+        if not ref_count:
+            if not await self.storage.upload_file(file_path, object_name, object_metadata, content_type):
+                return None
+            uploaded = True
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                inserted = await conn.fetchval(
+                    "INSERT INTO blob_objects (sha256, size, content_type, ref_count) "
+                    "VALUES ($1, $2, $3, 1) "
+                    "ON CONFLICT (sha256) DO UPDATE SET ref_count = blob_objects.ref_count + 1 "
+                    "RETURNING (xmax = 0)",
+                    sha256, size, content_type
+                )
+                old_sha256 = await conn.fetchval(
+                    "SELECT sha256 FROM blob_refs WHERE source = $1 AND m365_id = $2 FOR UPDATE",
+                    source, m365_id
+                )
+                await conn.execute(
+                    "INSERT INTO blob_refs (source, m365_id, path, sha256, source_hash, metadata) "
+                    "VALUES ($1, $2, $3, $4, $5, $6) "
+                    "ON CONFLICT (source, m365_id) DO UPDATE SET path = $3, sha256 = $4, "
+                    "source_hash = $5, metadata = $6, updated_at = CURRENT_TIMESTAMP",
+                    source, m365_id, path, sha256, source_hash, json.dumps(metadata or {})
+                )
+                # Re-putting the same content only refreshes the reference
+                old_count = await self._decrement(conn, old_sha256) if old_sha256 else None
+
+        if inserted and not uploaded:
+            # The object was released between our check and our insert
+            if not await self.storage.upload_file(file_path, object_name, object_metadata, content_type):
+                await self.delete(source, m365_id)
+                return None
+            uploaded = True
+
+        if old_count == 0:
+            await self._release_object(old_sha256)
+
+        self.stats['uploaded' if uploaded else 'deduplicated'] += 1
+        return {'sha256': sha256, 'object_name': object_name, 'uploaded': uploaded}
+
+    async def delete(self, source: Optional[str], m365_id: str) -> bool:
+        """
+        Drop an M365 item's reference; the object goes with its last reference
+
+        With source=None the item's references of every source are dropped
+        (change notifications for deleted items do not say which one).
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    "DELETE FROM blob_refs WHERE ($1::varchar IS NULL OR source = $1) "
+                    "AND m365_id = $2 RETURNING sha256",
+                    source, m365_id
+                )
+                released = [
+                    row['sha256'] for row in rows
+                    if await self._decrement(conn, row['sha256']) == 0
+                ]
+
+        for sha256 in released:
+            await self._release_object(sha256)
+        return bool(rows)
+
+    @staticmethod
+    async def _decrement(conn, sha256: str) -> int:
+        return await conn.fetchval(
+            "UPDATE blob_objects SET ref_count = ref_count - 1 WHERE sha256 = $1 RETURNING ref_count",
+            sha256
+        )
+
+    async def _release_object(self, sha256: str):
+        """Remove an unreferenced object (row lock held while MinIO deletes it)"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                ref_count = await conn.fetchval(
+                    "SELECT ref_count FROM blob_objects WHERE sha256 = $1 FOR UPDATE", sha256
+                )
+                if ref_count != 0:
+                    return
+                if not await self.storage.delete_file(self.object_name(sha256)):
+                    # Row stays at zero references; gc retries
+                    return
+                await conn.execute("DELETE FROM blob_objects WHERE sha256 = $1", sha256)
+
+        self.stats['objects_deleted'] += 1
+
+    async def collect_garbage(self) -> Dict[str, int]:
+        """
+        Remove objects without references
+
+        Covers rows left at zero references and objects uploaded by a put
+        whose transaction never committed. Objects modified within
+        gc_grace_seconds are kept: put_file uploads before it inserts the
+        object's row, so a young object may be about to get its reference.
+        """
+        async with self.pool.acquire() as conn:
+            zero = await conn.fetch("SELECT sha256 FROM blob_objects WHERE ref_count <= 0")
+        for row in zero:
+            await self._release_object(row['sha256'])
+
+        grace = get_config_manager().get('minio.gc_grace_seconds', 3600)
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace)
+        orphans = []
+        recent = 0
+        async for name in self.storage.iter_files(f"{self.prefix}/"):
+            sha256 = name.rsplit('/', 1)[-1]
+            async with self.pool.acquire() as conn:
+                known = await conn.fetchval("SELECT 1 FROM blob_objects WHERE sha256 = $1", sha256)
+            if known:
+                continue
+            info = await self.storage.stat_file(name)
+            if not info:
+                continue
+            if not info.get('last_modified') or info['last_modified'] > cutoff:
+                recent += 1
+                continue
+            orphans.append(name)
+
+        result = await self.storage.delete_files(orphans) if orphans else {'deleted': 0, 'failed': 0}
+        return {'released': len(zero), 'orphans_deleted': result['deleted'], 'orphans_in_grace': recent}
+
+    async def get_statistics(self) -> Dict[str, Any]:
+        """Reference and storage totals (logical vs stored bytes)"""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT "
+                "(SELECT COUNT(*) FROM blob_refs) AS refs, "
+                "(SELECT COUNT(*) FROM blob_objects) AS objects, "
+                "(SELECT COALESCE(SUM(size), 0) FROM blob_objects) AS stored_bytes, "
+                "(SELECT COALESCE(SUM(o.size), 0) FROM blob_refs r "
+                " JOIN blob_objects o ON o.sha256 = r.sha256) AS logical_bytes"
+            )
+        stats = dict(row)
+        stats['dedupe_ratio'] = (
+            round(stats['logical_bytes'] / stats['stored_bytes'], 2) if stats['stored_bytes'] else 0
+        )
+        return stats
+
+
+async def migrate(store: ContentStore, prefix: str, delete_old: bool, dry_run: bool) -> Dict[str, int]:
+    """
+    Move path-keyed objects (sharepoint/<site>/<name>, ...) into the content store
+
+    The M365 id and source come from the object's metadata written by the
+    indexers; objects without them are referenced by their path. A fixed
+    set of workers takes names from a bounded queue, so memory stays flat on
+    large buckets, and an object that fails is counted, not fatal.
+    """
+    storage = store.storage
+    result = {'migrated': 0, 'deduplicated': 0, 'skipped': 0, 'failed': 0}
+    old_names = []
+    queue: asyncio.Queue = asyncio.Queue(maxsize=storage.max_concurrency * 2)
+
+    async def migrate_one(name: str):
+        info = await storage.stat_file(name)
+        if info is None:
+            result['failed'] += 1
+            return
+
+        metadata = info['metadata']
+        source = metadata.get('source') or name.split('/', 1)[0]
+        m365_id = metadata.get('m365_id') or name
+
+        if dry_run:
+            print(f"   would migrate {name} -> {source}/{m365_id}")
+            result['migrated'] += 1
+            return
+
+        fd, temp_path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            if not await storage.download_file(name, temp_path):
+                result['failed'] += 1
+                return
+            stored = await store.put_file(source, m365_id, name, temp_path, metadata)
+        finally:
+            os.remove(temp_path)
+
+        if not stored:
+            result['failed'] += 1
+            return
+
+        result['migrated' if stored['uploaded'] else 'deduplicated'] += 1
+        old_names.append(name)
+
+    async def worker():
+        while True:
+            name = await queue.get()
+            if name is None:
+                return
+            try:
+                await migrate_one(name)
+            except Exception as e:
+                logger.error(f"Error migrating {name}: {e}")
+                result['failed'] += 1
+
+    workers = [asyncio.create_task(worker()) for _ in range(storage.max_concurrency)]
+    try:
+        async for name in storage.iter_files(prefix):
+            if name.startswith(f"{store.prefix}/"):
+                result['skipped'] += 1
+                continue
+            await queue.put(name)
+    finally:
+        # Let the workers finish what is queued, then stop
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    if delete_old and old_names:
+        deleted = await storage.delete_files(old_names)
+        result['old_deleted'] = deleted['deleted']
+
+    return result
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description='Content-addressed MinIO storage')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help='Move path-keyed objects into the content store')
+    migrate_parser.add_argument('--prefix', default='', help='Only migrate objects under this prefix')
+    migrate_parser.add_argument('--delete-old', action='store_true', help='Delete migrated path-keyed objects')
+    migrate_parser.add_argument('--dry-run', action='store_true', help='Only show what would be migrated')
+
+    subparsers.add_parser('gc', help='Delete unreferenced objects')
+    subparsers.add_parser('stats', help='Show reference and dedupe statistics')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    store = await ContentStore.connect()
+    try:
+        if args.command == 'migrate':
+            print(f"🚚 Migrating objects under '{args.prefix or '/'}' to {store.prefix}/...")
+            result = await migrate(store, args.prefix, args.delete_old, args.dry_run)
+        elif args.command == 'gc':
+            result = await store.collect_garbage()
+        else:
+            result = await store.get_statistics()
+
+        print(json.dumps(result, indent=2, default=str))
+        return 0 if not result.get('failed') else 1
+    finally:
+        await store.close()
+        store.storage.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
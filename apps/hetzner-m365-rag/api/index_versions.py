@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+"""
+Versioned Elasticsearch Indices behind Aliases
+Each logical index (documents, images, knowledge_graph) lives in versioned
+physical indices (documents_v1, documents_v2, ...) behind two aliases:
+
+- read alias  = the logical name ("documents"), used by search
+- write alias = "<logical>_write", used by every writer
+
+Changing a mapping means bumping its version in index_definitions() and
+running a migration: the new version is created and filled by a throttled
+_reindex (optionally through an ingest pipeline), validated, and both
+aliases are swapped atomically. Search never sees a missing or half-filled
+index, and the previous version is kept for rollback.
+
+Writes made while a migration runs go to the old version and are copied by
+a catch-up pass before and after the swap. A legacy index is deleted by the
+swap, so it is write-blocked for the last catch-up instead; writes rejected
+in that window land in the bulk writer's dead-letter store and must be
+replayed (python bulk_writer.py replay). Rollback copies documents written
+since the swap back into the previous version. Deletes made during the
+reindex itself can reappear in the new version; run migrations outside
+heavy delete activity or follow them with a delta sync.
+
+Usage:
+    python index_versions.py status
+    python index_versions.py migrate documents [--version N] [--rps 1000] [--pipeline NAME]
+    python index_versions.py rollback documents
+    python index_versions.py cleanup documents [--keep 1]
+"""
+
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from elasticsearch import NotFoundError  # type: ignore
+
+from config_manager import get_config_manager
+from vector_settings import dense_vector_mapping
+
+logger = logging.getLogger(__name__)
+
+
+def write_alias(logical: str) -> str:
+    return f"{logical}_write"
+
+
+def physical_name(logical: str, version: int) -> str:
+    return f"{logical}_v{version}"
+
+
+def index_definitions() -> Dict[str, Dict[str, Any]]:
+    """
+    Current version and create body of every logical index
+
+    Bump `version` whenever the body changes (including the rag.vectors
+    config); `updated_field` (if any) is used to copy documents written
+    while a migration runs.
+    """
+    return {
+        'documents': {
+            'version': 1,
+            'updated_field': 'indexed_at',
+            'body': {
+                "mappings": {
+                    "properties": {
+                        "doc_id": {"type": "keyword"},
+                        "title": {"type": "text", "analyzer": "standard"},
+                        "content": {"type": "text", "analyzer": "standard"},
+                        "content_vector": dense_vector_mapping('content'),
+                        "metadata": {
+                            "properties": {
+                                "source": {"type": "keyword"},
+                                "author": {"type": "keyword"},
+                                "created_at": {"type": "date"},
+                                "modified_at": {"type": "date"},
+                                "file_type": {"type": "keyword"},
+                                "file_size": {"type": "long"},
+                                "m365_id": {"type": "keyword"},
+                                "path": {"type": "keyword"}
+                            }
+                        },
+                        "entities": {"type": "keyword"},
+                        "has_images": {"type": "boolean"},
+                        "has_tables": {"type": "boolean"},
+                        "indexed_at": {"type": "date"}
+                    }
+                },
+                "settings": {
+                    "number_of_shards": 2,
+                    "number_of_replicas": 0,
+                    "analysis": {
+                        "analyzer": {
+                            "standard": {
+                                "type": "standard"
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        'images': {
+            'version': 1,
+            'body': {
+                "mappings": {
+                    "properties": {
+                        "image_id": {"type": "keyword"},
+                        "doc_id": {"type": "keyword"},
+                        "image_vector": dense_vector_mapping('image'),  # CLIP embeddings
+                        "ocr_text": {"type": "text"},
+                        "caption": {"type": "text"},
+                        "image_url": {"type": "keyword"},
+                        "page_number": {"type": "integer"}
+                    }
+                }
+            }
+        },
+        'knowledge_graph': {
+            'version': 1,
+            'body': {
+                "mappings": {
+                    "properties": {
+                        "entity_id": {"type": "keyword"},
+                        "entity_text": {"type": "text"},
+                        "entity_type": {"type": "keyword"},
+                        "doc_ids": {"type": "keyword"},
+                        "relationships": {
+                            "type": "nested",
+                            "properties": {
+                                "target_entity": {"type": "keyword"},
+                                "relation_type": {"type": "keyword"},
+                                "weight": {"type": "float"}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+
+class MigrationError(Exception):
+    """A migration step failed; aliases still point at the old version"""
+
+
+class IndexVersionManager:
+    """Create, migrate and roll back versioned indices"""
+
+    def __init__(self, es_client, definitions: Optional[Dict[str, Dict[str, Any]]] = None):
+        config = get_config_manager()
+        migration_config = config.get('elasticsearch.migration', {})
+
+        self.es_client = es_client
+        self.definitions = definitions or index_definitions()
+        self.requests_per_second = migration_config.get('requests_per_second', 1000)
+        self.batch_size = migration_config.get('batch_size', 1000)
+        self.count_tolerance = migration_config.get('count_tolerance', 0.001)
+        self.sample_size = migration_config.get('sample_size', 200)
+        self.poll_interval = migration_config.get('poll_interval', 10)
+
+    # ------------------------------------------------------------------
+    # Resolution
+    # ------------------------------------------------------------------
+    async def _alias_targets(self, alias: str) -> List[str]:
+        try:
+            response = await self.es_client.indices.get_alias(name=alias)
+        except NotFoundError:
+            return []
+        return sorted(response.keys())
+
+    async def resolve(self, logical: str) -> Dict[str, Any]:
+        """
+        Where a logical index currently lives
+
+        Returns:
+            dict: read/write physical index names and whether the read name
+            is a pre-versioning concrete index ("legacy")
+        """
+        read = await self._alias_targets(logical)
+        legacy = False
+        if not read and await self.es_client.indices.exists(index=logical):
+            read, legacy = [logical], True
+
+        write = await self._alias_targets(write_alias(logical))
+        return {
+            'read': read[0] if read else None,
+            'write': write[0] if write else None,
+            'legacy': legacy
+        }
+
+    @staticmethod
+    def version_of(logical: str, index_name: Optional[str]) -> int:
+        """Version number of a physical index (0 for a legacy index)"""
+        match = re.fullmatch(rf"{re.escape(logical)}_v(\d+)", index_name or '')
+        return int(match.group(1)) if match else 0
+
+    async def _versions(self, logical: str) -> List[str]:
+        try:
+            response = await self.es_client.indices.get(index=f"{logical}_v*")
+        except NotFoundError:
+            return []
+        return sorted(response.keys(), key=lambda name: self.version_of(logical, name))
+
+    # ------------------------------------------------------------------
+    # Startup
+    # ------------------------------------------------------------------
+    async def ensure(self, logical: str):
+        """Create the current version with both aliases if the index is missing"""
+        definition = self.definitions[logical]
+        location = await self.resolve(logical)
+
+        if location['read'] is None:
+            name = physical_name(logical, definition['version'])
+            await self.es_client.indices.create(
+                index=name,
+                body={
+                    **definition['body'],
+                    'aliases': {logical: {}, write_alias(logical): {'is_write_index': True}}
+                }
+            )
+            logger.info(f"Created '{name}' behind aliases '{logical}' / '{write_alias(logical)}'")
+            return
+
+        if location['write'] is None:
+            # Pre-versioning index: give writers their alias, data stays put
+            await self.es_client.indices.update_aliases(actions=[
+                {'add': {'index': location['read'], 'alias': write_alias(logical), 'is_write_index': True}}
+            ])
+            logger.info(f"Added write alias '{write_alias(logical)}' to '{location['read']}'")
+
+        current = self.version_of(logical, location['read'])
+        if current < definition['version']:
+            logger.warning(
+                f"'{logical}' is at version {current}, definition is version {definition['version']}: "
+                f"run 'python index_versions.py migrate {logical}'"
+            )
+        else:
+            for field in await self.vector_drift(logical, location['read']):
+                logger.warning(
+                    f"'{location['read']}.{field}' differs from the configured vector settings; "
+                    f"bump the '{logical}' version and migrate to apply them"
+                )
+
+    async def vector_drift(self, logical: str, index_name: str) -> List[str]:
+        """dense_vector fields whose live dims/index_options differ from the definition"""
+        wanted = self.definitions[logical]['body']['mappings']['properties']
+        response = await self.es_client.indices.get_mapping(index=index_name)
+        live = next(iter(response.values()))['mappings'].get('properties', {})
+
+        drifted = []
+        for field, mapping in wanted.items():
+            if mapping.get('type') != 'dense_vector' or field not in live:
+                continue
+            live_options = live[field].get('index_options', {})
+            if live[field].get('dims') != mapping['dims'] or any(
+                live_options.get(key) != value for key, value in mapping.get('index_options', {}).items()
+            ):
+                drifted.append(field)
+        return drifted
+
+    async def ensure_all(self):
+        for logical in self.definitions:
+            await self.ensure(logical)
+
+    # ------------------------------------------------------------------
+    # Migration
+    # ------------------------------------------------------------------
+    async def _reindex(self, source: str, dest: str, query: Optional[Dict] = None,
+                       op_type: str = 'index', pipeline: Optional[str] = None,
+                       requests_per_second: Optional[float] = None) -> Dict[str, Any]:
+        """Run a throttled _reindex as a task and wait for it"""
+        source_spec: Dict[str, Any] = {'index': source, 'size': self.batch_size}
+        if query:
+            source_spec['query'] = query
+        dest_spec: Dict[str, Any] = {'index': dest, 'op_type': op_type}
+        if pipeline:
+            dest_spec['pipeline'] = pipeline
+
+        response = await self.es_client.reindex(
+            source=source_spec,
+            dest=dest_spec,
+            conflicts='proceed',
+            slices='auto',
+            requests_per_second=requests_per_second or self.requests_per_second,
+            wait_for_completion=False
+        )
+        task_id = response['task']
+        logger.info(f"Reindex {source} -> {dest} started (task {task_id})")
+
+        while True:
+            task = await self.es_client.tasks.get(task_id=task_id)
+            status = task['task'].get('status', {})
+            if task.get('completed'):
+                break
+            logger.info(
+                f"Reindex {source} -> {dest}: {status.get('created', 0) + status.get('updated', 0)}"
+                f"/{status.get('total', '?')} documents"
+            )
+            await asyncio.sleep(self.poll_interval)
+
+        if task.get('error'):
+            raise MigrationError(f"Reindex failed: {task['error']}")
+        result = task.get('response', {})
+        if result.get('failures'):
+            raise MigrationError(f"Reindex had {len(result['failures'])} failures: {result['failures'][:3]}")
+        return result
+
+    async def validate(self, source: str, dest: str) -> Dict[str, Any]:
+        """
+        Check a new version against the live one before swapping
+
+        Document counts must match within count_tolerance, and a random
+        sample of live documents must all exist in the new version.
+        """
+        await self.es_client.indices.refresh(index=dest)
+        source_count = (await self.es_client.count(index=source))['count']
+        dest_count = (await self.es_client.count(index=dest))['count']
+
+        sample = await self.es_client.search(
+            index=source,
+            size=self.sample_size,
+            query={'function_score': {'query': {'match_all': {}}, 'random_score': {}}},
+            source=False
+        )
+        sample_ids = [hit['_id'] for hit in sample['hits']['hits']]
+        missing = []
+        if sample_ids:
+            found = await self.es_client.mget(index=dest, ids=sample_ids, source=False)
+            missing = [doc['_id'] for doc in found['docs'] if not doc.get('found')]
+
+        allowed = max(1, int(source_count * self.count_tolerance))
+        result = {
+            'source_count': source_count,
+            'dest_count': dest_count,
+            'sampled': len(sample_ids),
+            'missing_sampled': missing[:10],
+            'valid': abs(source_count - dest_count) <= allowed and not missing
+        }
+        return result
+
+    async def migrate(self, logical: str, version: Optional[int] = None,
+                      pipeline: Optional[str] = None, requests_per_second: Optional[float] = None,
+                      replace_legacy: bool = False) -> Dict[str, Any]:
+        """
+        Fill a new version from the live one and swap the aliases to it
+
+        Args:
+            logical: Logical index name
+            version: Target version (default: the definition's version)
+            pipeline: Ingest pipeline to run documents through (re-ingest)
+            requests_per_second: Reindex throttle
+            replace_legacy: Allow deleting a pre-versioning concrete index,
+                whose name must become the read alias
+
+        Returns:
+            dict: Migration summary
+        """
+        definition = self.definitions[logical]
+        target_version = version or definition['version']
+        location = await self.resolve(logical)
+        source = location['read']
+        if source is None:
+            raise MigrationError(f"'{logical}' does not exist; start the API to create it")
+
+        dest = physical_name(logical, target_version)
+        if source == dest:
+            return {'logical': logical, 'index': dest, 'migrated': False}
+        if location['legacy'] and not replace_legacy:
+            raise MigrationError(
+                f"'{logical}' is a pre-versioning index; the swap deletes it to free the name. "
+                f"Re-run with --replace-legacy"
+            )
+
+        # Leftover from an interrupted attempt: never aliased, safe to drop
+        if await self.es_client.indices.exists(index=dest):
+            if await self._alias_targets(logical) == [dest]:
+                raise MigrationError(f"'{dest}' is already live")
+            await self.es_client.indices.delete(index=dest)
+        await self.es_client.indices.create(index=dest, body=definition['body'])
+
+        # Imported here: bulk_load uses this module's alias naming
+        from bulk_load import BulkLoadMode
+
+        started = datetime.utcnow().isoformat()
+        bulk_load = BulkLoadMode(self.es_client, dest)
+        await bulk_load.enter()
+        try:
+            result = await self._reindex(source, dest, pipeline=pipeline,
+                                         requests_per_second=requests_per_second)
+            # Documents written to the live index while the bulk copy ran
+            updated_field = definition.get('updated_field')
+            catch_up_from = datetime.utcnow().isoformat()
+            if updated_field:
+                await self._reindex(source, dest, query={'range': {updated_field: {'gte': started}}},
+                                    pipeline=pipeline, requests_per_second=-1)
+        finally:
+            await bulk_load.exit()
+
+        validation = await self.validate(source, dest)
+        if not validation['valid']:
+            raise MigrationError(f"Validation of '{dest}' failed, aliases unchanged: {validation}")
+
+        if location['legacy']:
+            await self._swap_legacy(logical, source, dest, updated_field, catch_up_from, pipeline)
+        else:
+            await self.swap(logical, source, dest)
+            # Writes between the catch-up and the swap: only fill in missing documents
+            # (the old index must not overwrite anything written to the new one)
+            if updated_field:
+                await self._reindex(source, dest, query={'range': {updated_field: {'gte': catch_up_from}}},
+                                    op_type='create', pipeline=pipeline, requests_per_second=-1)
+
+        return {
+            'logical': logical,
+            'from': source,
+            'to': dest,
+            'migrated': True,
+            'reindexed': result.get('created', 0) + result.get('updated', 0),
+            'validation': validation
+        }
+
+    async def _swap_legacy(self, logical: str, source: str, dest: str, updated_field: Optional[str],
+                           catch_up_from: str, pipeline: Optional[str]):
+        """
+        Swap away from a legacy index, which the swap deletes
+
+        There is no old index left for a post-swap catch-up, so the legacy
+        index is write-blocked for the final catch-up and the swap. Writes
+        rejected meanwhile are dead-lettered by the bulk writer.
+        """
+        await self.es_client.indices.put_settings(index=source, settings={'index.blocks.write': True})
+        logger.warning(
+            f"'{source}' is write-blocked until the swap; writes rejected meanwhile are "
+            f"dead-lettered, replay them with 'python bulk_writer.py replay'"
+        )
+        try:
+            if updated_field:
+                await self._reindex(source, dest, query={'range': {updated_field: {'gte': catch_up_from}}},
+                                    pipeline=pipeline, requests_per_second=-1)
+            await self.swap(logical, source, dest, delete_source=True)
+        except Exception:
+            await self.es_client.indices.put_settings(index=source, settings={'index.blocks.write': None})
+            raise
+
+    async def swap(self, logical: str, old: str, new: str, delete_source: bool = False):
+        """Point the read and write aliases at another version in one atomic update"""
+        # Recorded before the swap, so a rollback's catch-up starts no later
+        # than the first write to the new version
+        await self.es_client.indices.put_mapping(
+            index=new, meta={'swapped_at': datetime.utcnow().isoformat(), 'swapped_from': old}
+        )
+        if delete_source:
+            # A legacy index holds the alias name; deleting it is part of the swap
+            actions: List[Dict[str, Any]] = [{'remove_index': {'index': old}}]
+        else:
+            actions = [
+                {'remove': {'index': old, 'alias': logical}},
+                {'remove': {'index': old, 'alias': write_alias(logical)}}
+            ]
+        actions += [
+            {'add': {'index': new, 'alias': write_alias(logical), 'is_write_index': True}},
+            {'add': {'index': new, 'alias': logical}}
+        ]
+
+        await self.es_client.indices.update_aliases(actions=actions)
+        logger.info(f"Aliases '{logical}' / '{write_alias(logical)}' now point at '{new}'")
+
+    async def _swapped_at(self, index_name: str) -> Optional[str]:
+        """When the aliases were last swapped to an index (its creation time if unrecorded)"""
+        response = await self.es_client.indices.get_mapping(index=index_name)
+        swapped_at = next(iter(response.values()))['mappings'].get('_meta', {}).get('swapped_at')
+        if swapped_at:
+            return swapped_at
+        response = await self.es_client.indices.get_settings(index=index_name, name='index.creation_date')
+        created_ms = next(iter(response.values()))['settings']['index']['creation_date']
+        return datetime.utcfromtimestamp(int(created_ms) / 1000).isoformat()
+
+    async def rollback(self, logical: str) -> Dict[str, Any]:
+        """
+        Swap the aliases back to the newest version older than the live one
+
+        Documents written to the live version since it was swapped in are
+        copied back first, and the writes between that copy and the swap
+        back are filled in afterwards. Deletes made since the swap are not
+        carried back.
+        """
+        location = await self.resolve(logical)
+        current = location['read']
+        previous = [
+            name for name in await self._versions(logical)
+            if self.version_of(logical, name) < self.version_of(logical, current)
+        ]
+        if not previous:
+            raise MigrationError(f"No version of '{logical}' older than '{current}' to roll back to")
+        target = previous[-1]
+
+        updated_field = self.definitions[logical].get('updated_field')
+        copied = 0
+        if updated_field:
+            swapped_at = await self._swapped_at(current)
+            catch_up_from = datetime.utcnow().isoformat()
+            result = await self._reindex(current, target, query={'range': {updated_field: {'gte': swapped_at}}},
+                                         requests_per_second=-1)
+            copied = result.get('created', 0) + result.get('updated', 0)
+
+        await self.swap(logical, current, target)
+
+        if updated_field:
+            await self._reindex(current, target, query={'range': {updated_field: {'gte': catch_up_from}}},
+                                op_type='create', requests_per_second=-1)
+
+        return {'logical': logical, 'from': current, 'to': target, 'caught_up': copied}
+
+    async def cleanup(self, logical: str, keep: int = 1) -> List[str]:
+        """Delete old versions, keeping the live one and `keep` older ones for rollback"""
+        location = await self.resolve(logical)
+        current = self.version_of(logical, location['read'])
+        older = [name for name in await self._versions(logical)
+                 if self.version_of(logical, name) < current]
+        to_delete = older[:-keep] if keep else older
+        for name in to_delete:
+            await self.es_client.indices.delete(index=name)
+            logger.info(f"Deleted old version '{name}'")
+        return to_delete
+
+    async def status(self) -> Dict[str, Any]:
+        result = {}
+        for logical, definition in self.definitions.items():
+            location = await self.resolve(logical)
+            result[logical] = {
+                **location,
+                'live_version': self.version_of(logical, location['read']),
+                'defined_version': definition['version'],
+                'versions': await self._versions(logical)
+            }
+        return result
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description='Versioned Elasticsearch indices')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('status', help='Show live and defined versions')
+
+    migrate_parser = subparsers.add_parser('migrate', help='Reindex into a new version and swap aliases')
+    migrate_parser.add_argument('index', help='Logical index (documents, images, knowledge_graph)')
+    migrate_parser.add_argument('--version', type=int, help='Target version (default: defined version)')
+    migrate_parser.add_argument('--rps', type=float, help='Reindex throttle in documents per second')
+    migrate_parser.add_argument('--pipeline', help='Ingest pipeline for re-ingesting documents')
+    migrate_parser.add_argument('--replace-legacy', action='store_true',
+                                help='Delete a pre-versioning index during the swap')
+
+    rollback_parser = subparsers.add_parser('rollback', help='Swap aliases back to the previous version')
+    rollback_parser.add_argument('index')
+
+    cleanup_parser = subparsers.add_parser('cleanup', help='Delete old versions')
+    cleanup_parser.add_argument('index')
+    cleanup_parser.add_argument('--keep', type=int, default=1, help='Older versions to keep for rollback')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from elasticsearch import AsyncElasticsearch  # type: ignore
+
+    es_config = get_config_manager().get_elasticsearch_config()
+    es_client = AsyncElasticsearch(
+        hosts=[f"http://{es_config['host']}:{es_config['port']}"],
+        basic_auth=(es_config['user'], es_config['password']),
+        verify_certs=False
+    )
+    manager = IndexVersionManager(es_client)
+    try:
+        started = time.time()
+        if args.command == 'status':
+            result: Any = await manager.status()
+        elif args.command == 'migrate':
+            print(f"🚚 Migrating '{args.index}'...")
+            result = await manager.migrate(args.index, args.version, args.pipeline,
+                                           args.rps, args.replace_legacy)
+            result['duration_seconds'] = round(time.time() - started)
+        elif args.command == 'rollback':
+            result = await manager.rollback(args.index)
+        else:
+            result = {'deleted': await manager.cleanup(args.index, args.keep)}
+
+        print(json.dumps(result, indent=2, default=str))
+        return 0
+    except MigrationError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        await es_client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
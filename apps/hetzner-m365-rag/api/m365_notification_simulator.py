@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Microsoft Graph Change Notification Simulator
+Stands in for Graph when testing the /webhooks/m365 endpoint locally:
+performs the validation handshake, posts notifications in Graph's format and
+measures how long the API takes to process them
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any
+
+import httpx  # type: ignore
+from dotenv import load_dotenv
+
+
+def build_notification(kind: str, args: argparse.Namespace, client_state: str) -> Dict[str, Any]:
+    """Build one notification as Graph would send it"""
+    item_id = args.item_id or f"AAMk{uuid.uuid4().hex}"
+    expiration = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+
+    if kind == 'drive':
+        resource = f"drives/{args.drive_id}/root"
+        resource_data = {'@odata.type': '#Microsoft.Graph.DriveItem'}
+    elif kind == 'message':
+        resource = f"Users/{args.user_id}/Messages/{item_id}"
+        resource_data = {'@odata.type': '#Microsoft.Graph.Message', 'id': item_id}
+    else:
+        resource = f"Users/{args.user_id}/Events/{item_id}"
+        resource_data = {'@odata.type': '#Microsoft.Graph.Event', 'id': item_id}
+
+    return {
+        'subscriptionId': args.subscription_id,
+        'subscriptionExpirationDateTime': expiration,
+        'changeType': args.change_type,
+        'resource': resource,
+        'resourceData': resource_data,
+        'clientState': client_state,
+        'tenantId': os.getenv('M365_TENANT_ID', os.getenv('AZURE_TENANT_ID', ''))
+    }
+
+
+def handshake(client: httpx.Client, url: str) -> bool:
+    """Send the subscription validation request Graph sends on create"""
+    token = f"Validation: Testing client application reachability {uuid.uuid4()}"
+    response = client.post(url, params={'validationToken': token})
+
+    ok = response.status_code == 200 and response.text == token
+    print(f"{'✅' if ok else '❌'} Validation handshake: HTTP {response.status_code}")
+    return ok
+
+
+def get_status(client: httpx.Client, base_url: str) -> Dict[str, Any]:
+    response = client.get(f"{base_url}/webhooks/m365/status")
+    response.raise_for_status()
+    return response.json()
+
+
+def send(client: httpx.Client, url: str, notifications: List[Dict[str, Any]]) -> int:
+    """Post one notification batch and return the HTTP status"""
+    response = client.post(url, json={'value': notifications})
+    print(f"📨 Sent {len(notifications)} notification(s): HTTP {response.status_code}")
+    return response.status_code
+
+
+def wait_for_processing(client: httpx.Client, base_url: str, processed_before: int,
+                        expected: int, timeout: float, started: float) -> bool:
+    """Poll the status endpoint until the queued jobs are processed"""
+    while time.time() - started < timeout:
+        status = get_status(client, base_url)
+        stats = status.get('stats', {})
+        processed = int(stats.get('processed', 0))
+        failed = int(stats.get('failed', 0))
+
+        if processed - processed_before >= expected:
+            elapsed = time.time() - started
+            print(f"✅ Processed {processed - processed_before} job(s) in {elapsed:.2f}s "
+                  f"(queue latency {stats.get('last_latency_ms', '?')} ms)")
+            return True
+
+        print(f"   ⏳ queue={status.get('queue_length')} processed={processed - processed_before} failed={failed}")
+        time.sleep(1)
+
+    print(f"❌ Timed out after {timeout}s waiting for processing")
+    return False
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description='Simulate Microsoft Graph change notifications against a local API',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Validation handshake only
+  python3 m365_notification_simulator.py --handshake-only
+
+  # A burst of 20 drive notifications (should coalesce into one delta fetch)
+  python3 m365_notification_simulator.py --kind drive --drive-id b!abc --count 20 --wait
+
+  # A new mail in a mailbox
+  python3 m365_notification_simulator.py --kind message --user-id <user-id> --item-id <message-id> --change-type created --wait
+
+  # Wrong clientState must be rejected
+  python3 m365_notification_simulator.py --kind drive --drive-id b!abc --bad-client-state
+        """
+    )
+    parser.add_argument('--api-url', default=os.getenv('API_URL', 'http://localhost:8000'), help='API base URL')
+    parser.add_argument('--kind', choices=['drive', 'message', 'event'], default='drive', help='Resource kind')
+    parser.add_argument('--drive-id', default='b!simulated-drive', help='Drive id for drive notifications')
+    parser.add_argument('--user-id', default='00000000-0000-0000-0000-000000000000', help='User id for mail/events')
+    parser.add_argument('--item-id', help='Message/event id (random if omitted)')
+    parser.add_argument('--change-type', choices=['created', 'updated', 'deleted'], default='updated')
+    parser.add_argument('--subscription-id', default=str(uuid.uuid4()), help='Subscription id to report')
+    parser.add_argument('--client-state', default=os.getenv('M365_WEBHOOK_CLIENT_STATE'), help='clientState secret')
+    parser.add_argument('--bad-client-state', action='store_true', help='Send a wrong clientState')
+    parser.add_argument('--count', type=int, default=1, help='Notifications to send in one batch')
+    parser.add_argument('--handshake-only', action='store_true', help='Only test the validation handshake')
+    parser.add_argument('--wait', action='store_true', help='Wait until the queued fetch jobs are processed')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait with --wait')
+
+    args = parser.parse_args()
+    base_url = args.api_url.rstrip('/')
+    url = f"{base_url}/webhooks/m365"
+
+    with httpx.Client(timeout=30) as client:
+        if not handshake(client, url):
+            return 1
+        if args.handshake_only:
+            return 0
+
+        if not args.client_state and not args.bad_client_state:
+            print("❌ Set M365_WEBHOOK_CLIENT_STATE or pass --client-state")
+            return 1
+
+        client_state = 'not-the-secret' if args.bad_client_state else args.client_state
+        notifications = [build_notification(args.kind, args, client_state) for _ in range(args.count)]
+
+        processed_before = int(get_status(client, base_url).get('stats', {}).get('processed', 0)) if args.wait else 0
+        started = time.time()
+        status_code = send(client, url, notifications)
+
+        if args.bad_client_state:
+            ok = status_code == 403
+            print(f"{'✅' if ok else '❌'} Bad clientState {'rejected' if ok else 'was accepted'}")
+            return 0 if ok else 1
+
+        if status_code != 202:
+            return 1
+
+        if args.wait:
+            # Drive bursts coalesce into one job; each mail/event is its own job
+            expected = 1 if args.kind == 'drive' else len({n['resource'] for n in notifications})
+            return 0 if wait_for_processing(client, base_url, processed_before, expected,
+                                            args.timeout, started) else 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
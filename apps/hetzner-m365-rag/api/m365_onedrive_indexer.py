@@ -6,6 +6,7 @@ Downloads and indexes OneDrive files to MinIO + Elasticsearch
 
 import os
 import json
+import tempfile
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional
@@ -19,7 +20,10 @@ from elasticsearch import AsyncElasticsearch  # type: ignore
 from config_manager import get_config_manager
 from logger import setup_logging
 from m365_auth import M365Auth
-from storage_adapter import MinIOAdapter, ElasticsearchAdapter
+from storage_adapter import AsyncMinIOAdapter
+from bulk_writer import BulkWriter
+from bulk_load import BulkLoadMode
+from content_store import ContentStore, drive_item_folder, graph_source_hash
 
 
 class OneDriveIndexer:
@@ -38,9 +42,10 @@ class OneDriveIndexer:
         self.progress = self._load_progress()
 
         # Storage
-        self.storage = MinIOAdapter()
+        self.storage = AsyncMinIOAdapter()
+        self.content_store: Optional[ContentStore] = None
         self.es_client: Optional[AsyncElasticsearch] = None
-        self.es_adapter: Optional[ElasticsearchAdapter] = None
+        self.bulk_writer: Optional[BulkWriter] = None
 
         # Supported file types
         extensions = self.config.get_supported_file_extensions('onedrive')
@@ -74,15 +79,25 @@ class OneDriveIndexer:
         except Exception as e:
             self.logger.error(f"Could not save progress: {e}")
 
+    async def initialize_content_store(self):
+        """Connect the content-addressed store (falls back to path-keyed objects)"""
+        if not self.config.get('minio.content_addressed', True):
+            return
+        try:
+            self.content_store = await ContentStore.connect(self.storage)
+        except Exception as e:
+            self.logger.warning(f"Content store unavailable, storing by path: {e}")
+
     async def initialize_elasticsearch(self):
-        """Initialize Elasticsearch client"""
+        """Initialize Elasticsearch client and bulk writer"""
         es_config = self.config.get_elasticsearch_config()
         self.es_client = AsyncElasticsearch(
             hosts=[f"http://{es_config['host']}:{es_config['port']}"],
             basic_auth=(es_config['user'], es_config['password']),
             verify_certs=False
         )
-        self.es_adapter = ElasticsearchAdapter(self.es_client)
+        self.bulk_writer = BulkWriter(self.es_client)
+        await self.bulk_writer.start()
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
     def _make_graph_request(
@@ -158,6 +173,19 @@ class OneDriveIndexer:
 
         return items
 
+    async def _store_file(
+        self, temp_path: str, blob_name: str, file_id: str, metadata: Dict,
+        source_hash: Optional[str]
+    ) -> Optional[Dict]:
+        """Store a downloaded file by content hash (or at its path without a content store)"""
+        if self.content_store:
+            return await self.content_store.put_file(
+                'onedrive', file_id, blob_name, temp_path, metadata, source_hash
+            )
+        if await self.storage.upload_file(temp_path, blob_name, metadata):
+            return {'object_name': blob_name, 'uploaded': True}
+        return None
+
     async def process_file(self, file: Dict, user_email: str) -> bool:
         """Download and index a single file"""
         file_id = file['id']
@@ -175,23 +203,8 @@ class OneDriveIndexer:
                 return True
 
         try:
-            # Download file
-            download_url = file.get('@microsoft.graph.downloadUrl')
-            if not download_url:
-                self.logger.warning(f"No download URL for {file_name}")
-                return False
-
-            self.logger.info(f"Processing: {file_name}")
-
-            temp_path = f"/tmp/{file_id}_{file_name}"
-            response = requests.get(download_url)
-            response.raise_for_status()
-
-            with open(temp_path, 'wb') as f:
-                f.write(response.content)
-
-            # Upload to MinIO
-            blob_name = f"onedrive/{user_email}/{file_name}"
+            # Folder path keeps same-named files in different folders apart
+            blob_name = f"onedrive/{user_email}{drive_item_folder(file)}/{file_name}"
             metadata = {
                 'm365_id': file_id,
                 'source': 'onedrive',
@@ -202,8 +215,44 @@ class OneDriveIndexer:
                 'modified': file.get('lastModifiedDateTime')
             }
 
-            if self.storage.upload_file(temp_path, blob_name, metadata):
-                self.logger.info(f"✅ Uploaded to MinIO: {blob_name}")
+            source_hash = graph_source_hash(file)
+            stored = None
+            if self.content_store:
+                # Content unchanged (e.g. renamed or moved): no download
+                stored = await self.content_store.touch_if_unchanged(
+                    'onedrive', file_id, blob_name, source_hash, metadata
+                )
+
+            if stored is None:
+                download_url = file.get('@microsoft.graph.downloadUrl')
+                if not download_url:
+                    self.logger.warning(f"No download URL for {file_name}")
+                    return False
+
+                self.logger.info(f"Processing: {file_name}")
+
+                fd, temp_path = tempfile.mkstemp(suffix=Path(file_name).suffix)
+                try:
+                    # Blocking download kept off the event loop
+                    response = await asyncio.to_thread(
+                        requests.get, download_url, timeout=300
+                    )
+                    response.raise_for_status()
+
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(response.content)
+
+                    stored = await self._store_file(
+                        temp_path, blob_name, file_id, metadata, source_hash
+                    )
+                finally:
+                    os.remove(temp_path)
+
+            if stored:
+                self.logger.info(f"✅ Stored in MinIO: {stored['object_name']}")
+                metadata['object_name'] = stored['object_name']
+                if stored.get('sha256'):
+                    metadata['sha256'] = stored['sha256']
 
                 # Index to Elasticsearch
                 es_doc = {
@@ -216,11 +265,10 @@ class OneDriveIndexer:
                     'indexed_at': datetime.utcnow().isoformat()
                 }
 
-                if self.es_adapter and await self.es_adapter.index_document(
-                    file_id, es_doc
-                ):
-                    log_msg = f"✅ Indexed to Elasticsearch: {file_name}"
-                    self.logger.info(log_msg)
+                # Queued for the bulk writer; failures go to its dead-letter file
+                if self.bulk_writer:
+                    await self.bulk_writer.index(file_id, es_doc)
+                    self.logger.info(f"✅ Queued for Elasticsearch: {file_name}")
 
                     self.progress['indexed_documents'][file_id] = {
                         'name': file_name,
@@ -230,7 +278,6 @@ class OneDriveIndexer:
                     self._save_progress()
 
                     self.stats['documents_uploaded'] += 1
-                    os.remove(temp_path)
                     return True
 
             return False
@@ -250,9 +297,18 @@ class OneDriveIndexer:
 
         self.logger.info(f"Found {len(files)} files to process")
 
-        # Process each file
-        for file in tqdm(files, desc=f"Indexing {user_email}"):
-            await self.process_file(file, user_email)
+        # Process files concurrently; the storage adapter bounds the
+        # uploads in flight, this bounds downloads and temp files
+        semaphore = asyncio.Semaphore(self.storage.max_concurrency)
+        progress_bar = tqdm(total=len(files), desc=f"Indexing {user_email}")
+
+        async def process(file: Dict):
+            async with semaphore:
+                await self.process_file(file, user_email)
+            progress_bar.update(1)
+
+        await asyncio.gather(*(process(file) for file in files))
+        progress_bar.close()
 
         self.stats['users_processed'] += 1
 
@@ -269,6 +325,7 @@ class OneDriveIndexer:
 
         # Initialize Elasticsearch
         await self.initialize_elasticsearch()
+        await self.initialize_content_store()
 
         # Get all users
         users = self.get_all_users()
@@ -276,26 +333,43 @@ class OneDriveIndexer:
         if limit:
             users = users[:limit]
 
-        # Process each user
-        for user in users:
-            user_id = user['id']
-            user_email = user.get('userPrincipalName', 'Unknown')
+        # Full sync: ingest-optimized index settings until all writes are flushed
+        bulk_load = None
+        if self.config.get('elasticsearch.bulk_load.enabled', True):
+            bulk_load = BulkLoadMode(self.es_client)
+            await bulk_load.enter()
 
-            try:
-                await self.index_user(user_id, user_email)
-            except Exception as e:
-                self.logger.error(
-                    f"Error indexing user {user_email}: {e}"
-                )
-                self.stats['errors'] += 1
-                continue
+        try:
+            # Process each user
+            for user in users:
+                user_id = user['id']
+                user_email = user.get('userPrincipalName', 'Unknown')
+
+                try:
+                    await self.index_user(user_id, user_email)
+                except Exception as e:
+                    self.logger.error(
+                        f"Error indexing user {user_email}: {e}"
+                    )
+                    self.stats['errors'] += 1
+                    continue
+        finally:
+            if self.bulk_writer:
+                await self.bulk_writer.flush()
+            if bulk_load:
+                await bulk_load.exit()
 
         end_time = datetime.utcnow()
         duration = end_time - start_time
 
-        # Close Elasticsearch
+        # Stop the bulk writer, then close Elasticsearch
+        if self.bulk_writer:
+            await self.bulk_writer.close()
         if self.es_client:
             await self.es_client.close()
+        if self.content_store:
+            await self.content_store.close()
+        self.storage.close()
 
         return {
             'success': True,
@@ -304,6 +378,7 @@ class OneDriveIndexer:
             'documents_uploaded': self.stats['documents_uploaded'],
             'documents_skipped': self.stats['documents_skipped'],
             'errors': self.stats['errors'],
+            'index_failures': self.bulk_writer.stats['failed'] if self.bulk_writer else 0,
             'duration': str(duration)
         }
 
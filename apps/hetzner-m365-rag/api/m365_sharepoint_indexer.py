@@ -6,6 +6,7 @@ Downloads and indexes SharePoint documents to MinIO + Elasticsearch
 
 import os
 import json
+import tempfile
 import asyncio
 from pathlib import Path
 from datetime import datetime
@@ -19,7 +20,10 @@ from elasticsearch import AsyncElasticsearch  # type: ignore
 from config_manager import get_config_manager
 from logger import setup_logging
 from m365_auth import M365Auth
-from storage_adapter import MinIOAdapter, ElasticsearchAdapter
+from storage_adapter import AsyncMinIOAdapter
+from bulk_writer import BulkWriter
+from bulk_load import BulkLoadMode
+from content_store import ContentStore, drive_item_folder, graph_source_hash
 
 
 class SharePointIndexer:
@@ -38,11 +42,12 @@ class SharePointIndexer:
         self.progress = self._load_progress()
 
         # MinIO storage setup
-        self.storage = MinIOAdapter()
+        self.storage = AsyncMinIOAdapter()
+        self.content_store: Optional[ContentStore] = None
 
         # Elasticsearch setup (will be initialized async)
         self.es_client: Optional[AsyncElasticsearch] = None
-        self.es_adapter: Optional[ElasticsearchAdapter] = None
+        self.bulk_writer: Optional[BulkWriter] = None
 
         # Supported file types
         extensions = self.config.get_supported_file_extensions('sharepoint')
@@ -59,15 +64,25 @@ class SharePointIndexer:
             'end_time': None
         }
 
+    async def initialize_content_store(self):
+        """Connect the content-addressed store (falls back to path-keyed objects)"""
+        if not self.config.get('minio.content_addressed', True):
+            return
+        try:
+            self.content_store = await ContentStore.connect(self.storage)
+        except Exception as e:
+            self.logger.warning(f"Content store unavailable, storing by path: {e}")
+
     async def initialize_elasticsearch(self):
-        """Initialize Elasticsearch client and adapter"""
+        """Initialize Elasticsearch client and bulk writer"""
         es_config = self.config.get_elasticsearch_config()
         self.es_client = AsyncElasticsearch(
             hosts=[f"http://{es_config['host']}:{es_config['port']}"],
             basic_auth=(es_config['user'], es_config['password']),
             verify_certs=False
         )
-        self.es_adapter = ElasticsearchAdapter(self.es_client)
+        self.bulk_writer = BulkWriter(self.es_client)
+        await self.bulk_writer.start()
 
     def _load_progress(self) -> Dict:
         """Load progress from file"""
@@ -207,6 +222,19 @@ class SharePointIndexer:
 
         return items
 
+    async def _store_file(
+        self, temp_path: str, blob_name: str, doc_id: str, metadata: Dict,
+        source_hash: Optional[str]
+    ) -> Optional[Dict]:
+        """Store a downloaded file by content hash (or at its path without a content store)"""
+        if self.content_store:
+            return await self.content_store.put_file(
+                'sharepoint', doc_id, blob_name, temp_path, metadata, source_hash
+            )
+        if await self.storage.upload_file(temp_path, blob_name, metadata):
+            return {'object_name': blob_name, 'uploaded': True}
+        return None
+
     async def process_document(
         self, doc: Dict, site_name: str, site_url: str
     ) -> bool:
@@ -236,24 +264,8 @@ class SharePointIndexer:
                 return True
 
         try:
-            # Download document
-            download_url = doc.get('@microsoft.graph.downloadUrl')
-            if not download_url:
-                self.logger.warning(f"No download URL for {doc_name}")
-                return False
-
-            self.logger.info(f"Processing: {doc_name}")
-
-            # Download to temp location
-            temp_path = f"/tmp/{doc_id}_{doc_name}"
-            response = requests.get(download_url)
-            response.raise_for_status()
-
-            with open(temp_path, 'wb') as f:
-                f.write(response.content)
-
-            # Upload to MinIO
-            blob_name = f"sharepoint/{site_name}/{doc_name}"
+            # Folder path keeps same-named files in different folders apart
+            blob_name = f"sharepoint/{site_name}{drive_item_folder(doc)}/{doc_name}"
             created_by = doc.get('createdBy', {}).get('user', {})
             author_name = created_by.get('displayName', 'Unknown')
             metadata = {
@@ -268,8 +280,44 @@ class SharePointIndexer:
                 'author': author_name
             }
 
-            if self.storage.upload_file(temp_path, blob_name, metadata):
-                self.logger.info(f"✅ Uploaded to MinIO: {blob_name}")
+            source_hash = graph_source_hash(doc)
+            stored = None
+            if self.content_store:
+                # Content unchanged (e.g. renamed or moved): no download
+                stored = await self.content_store.touch_if_unchanged(
+                    'sharepoint', doc_id, blob_name, source_hash, metadata
+                )
+
+            if stored is None:
+                download_url = doc.get('@microsoft.graph.downloadUrl')
+                if not download_url:
+                    self.logger.warning(f"No download URL for {doc_name}")
+                    return False
+
+                self.logger.info(f"Processing: {doc_name}")
+
+                fd, temp_path = tempfile.mkstemp(suffix=Path(doc_name).suffix)
+                try:
+                    # Blocking download kept off the event loop
+                    response = await asyncio.to_thread(
+                        requests.get, download_url, timeout=300
+                    )
+                    response.raise_for_status()
+
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(response.content)
+
+                    stored = await self._store_file(
+                        temp_path, blob_name, doc_id, metadata, source_hash
+                    )
+                finally:
+                    os.remove(temp_path)
+
+            if stored:
+                self.logger.info(f"✅ Stored in MinIO: {stored['object_name']}")
+                metadata['object_name'] = stored['object_name']
+                if stored.get('sha256'):
+                    metadata['sha256'] = stored['sha256']
 
                 # Index to Elasticsearch
                 es_doc = {
@@ -282,11 +330,10 @@ class SharePointIndexer:
                     'indexed_at': datetime.utcnow().isoformat()
                 }
 
-                if self.es_adapter and await self.es_adapter.index_document(
-                    doc_id, es_doc
-                ):
-                    log_msg = f"✅ Indexed to Elasticsearch: {doc_name}"
-                    self.logger.info(log_msg)
+                # Queued for the bulk writer; failures go to its dead-letter file
+                if self.bulk_writer:
+                    await self.bulk_writer.index(doc_id, es_doc)
+                    self.logger.info(f"✅ Queued for Elasticsearch: {doc_name}")
 
                     # Update progress
                     self.progress['indexed_documents'][doc_id] = {
@@ -298,8 +345,6 @@ class SharePointIndexer:
 
                     self.stats['documents_uploaded'] += 1
 
-                    # Clean up temp file
-                    os.remove(temp_path)
                     return True
 
             return False
@@ -338,9 +383,18 @@ class SharePointIndexer:
 
         self.logger.info(f"Found {len(documents)} documents to process")
 
-        # Process each document
-        for doc in tqdm(documents, desc=f"Indexing {site_name}"):
-            await self.process_document(doc, site_name, site_web_url)
+        # Process documents concurrently; the storage adapter bounds the
+        # uploads in flight, this bounds downloads and temp files
+        semaphore = asyncio.Semaphore(self.storage.max_concurrency)
+        progress_bar = tqdm(total=len(documents), desc=f"Indexing {site_name}")
+
+        async def process(doc: Dict):
+            async with semaphore:
+                await self.process_document(doc, site_name, site_web_url)
+            progress_bar.update(1)
+
+        await asyncio.gather(*(process(doc) for doc in documents))
+        progress_bar.close()
 
         self.stats['sites_processed'] += 1
 
@@ -365,6 +419,7 @@ class SharePointIndexer:
 
         # Initialize Elasticsearch
         await self.initialize_elasticsearch()
+        await self.initialize_content_store()
 
         # Get all sites
         sites = self.get_all_sites()
@@ -372,17 +427,29 @@ class SharePointIndexer:
         if limit:
             sites = sites[:limit]
 
-        # Process each site
-        for site in sites:
-            site_id = site['id']
-            site_name = site.get('displayName', site.get('name', 'Unknown'))
+        # Full sync: ingest-optimized index settings until all writes are flushed
+        bulk_load = None
+        if self.config.get('elasticsearch.bulk_load.enabled', True):
+            bulk_load = BulkLoadMode(self.es_client)
+            await bulk_load.enter()
 
-            try:
-                await self.index_site(site_id, site_name)
-            except Exception as e:
-                self.logger.error(f"Error indexing site {site_name}: {e}")
-                self.stats['errors'] += 1
-                continue
+        try:
+            # Process each site
+            for site in sites:
+                site_id = site['id']
+                site_name = site.get('displayName', site.get('name', 'Unknown'))
+
+                try:
+                    await self.index_site(site_id, site_name)
+                except Exception as e:
+                    self.logger.error(f"Error indexing site {site_name}: {e}")
+                    self.stats['errors'] += 1
+                    continue
+        finally:
+            if self.bulk_writer:
+                await self.bulk_writer.flush()
+            if bulk_load:
+                await bulk_load.exit()
 
         self.stats['end_time'] = datetime.utcnow().isoformat()
 
@@ -400,9 +467,14 @@ class SharePointIndexer:
         else:
             duration = None
 
-        # Close Elasticsearch
+        # Stop the bulk writer, then close Elasticsearch
+        if self.bulk_writer:
+            await self.bulk_writer.close()
         if self.es_client:
             await self.es_client.close()
+        if self.content_store:
+            await self.content_store.close()
+        self.storage.close()
 
         return {
             'success': True,
@@ -411,6 +483,7 @@ class SharePointIndexer:
             'documents_uploaded': self.stats['documents_uploaded'],
             'documents_skipped': self.stats['documents_skipped'],
             'errors': self.stats['errors'],
+            'index_failures': self.bulk_writer.stats['failed'] if self.bulk_writer else 0,
             'duration': str(duration) if duration else 'N/A',
             'start_time': self.stats['start_time'],
             'end_time': self.stats['end_time']
@@ -0,0 +1,903 @@
+#!/usr/bin/env python3
+"""
+Microsoft Graph Change Notifications - Adapted for Hetzner
+Receives drive, message and event notifications, queues targeted delta
+fetches in Redis and keeps subscriptions renewed
+"""
+
+import os
+import hmac
+import json
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Any
+
+import requests  # type: ignore
+
+from config_manager import get_config_manager
+from logger import setup_logging
+from storage_adapter import ElasticsearchAdapter
+from content_store import drive_item_folder, graph_source_hash
+from time_partitions import MOVABLE_SOURCES, utc_datetime
+
+GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+
+# Redis keys
+QUEUE_KEY = "m365:webhooks:queue"
+DEAD_LETTER_KEY = "m365:webhooks:dead"
+# Jobs waiting for a retry, scored by the time they are due
+DELAYED_KEY = "m365:webhooks:delayed"
+SUBSCRIPTIONS_KEY = "m365:webhooks:subscriptions"
+DRIVES_KEY = "m365:webhooks:drives"
+DELTA_LINKS_KEY = "m365:webhooks:delta"
+STATS_KEY = "m365:webhooks:stats"
+PENDING_PREFIX = "m365:webhooks:pending:"
+# Hash per partitioned source: item id -> partition it was last written to
+PARTITIONS_PREFIX = "m365:webhooks:partitions:"
+RENEW_LOCK_KEY = "m365:webhooks:renew-lock"
+
+# Change types Graph supports per resource kind
+CHANGE_TYPES = {
+    'drive': 'updated',
+    'messages': 'created,updated,deleted',
+    'events': 'created,updated,deleted'
+}
+
+
+def parse_resource(resource: str) -> Dict[str, str]:
+    """
+    Split a notification resource path into its parts
+
+    Graph sends e.g. "drives/{id}/root", "Users/{id}/Messages/{id}" or
+    "users/{id}/events/{id}"; casing varies by workload.
+    """
+    parts = [part for part in resource.strip('/').split('/') if part]
+    lowered = [part.lower() for part in parts]
+    parsed: Dict[str, str] = {}
+
+    if lowered and lowered[0] == 'drives' and len(parts) >= 2:
+        parsed['kind'] = 'drive'
+        parsed['drive_id'] = parts[1]
+    elif lowered and lowered[0] == 'users' and len(parts) >= 3:
+        parsed['user_id'] = parts[1]
+        collection = lowered[2]
+        if collection in ('messages', 'mailfolders'):
+            parsed['kind'] = 'messages'
+        elif collection in ('events', 'calendar'):
+            parsed['kind'] = 'events'
+        if len(parts) >= 4 and collection in ('messages', 'events'):
+            parsed['item_id'] = parts[3]
+
+    return parsed
+
+
+def notification_to_job(notification: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Turn one change notification into a targeted fetch job"""
+    resource = parse_resource(notification.get('resource', ''))
+    kind = resource.get('kind')
+    change_type = notification.get('changeType', 'updated')
+
+    if kind == 'drive':
+        # Drive notifications carry no item; fetch the drive's delta
+        return {'kind': 'drive_delta', 'drive_id': resource['drive_id']}
+
+    if kind in ('messages', 'events'):
+        item_id = resource.get('item_id') or notification.get('resourceData', {}).get('id')
+        if not item_id:
+            return None
+        return {
+            'kind': 'message' if kind == 'messages' else 'event',
+            'user_id': resource['user_id'],
+            'item_id': item_id,
+            'change_type': change_type
+        }
+
+    return None
+
+
+def parse_graph_datetime(value: str) -> datetime:
+    """Parse Graph timestamps such as 2024-01-01T00:00:00.0000000Z"""
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class GraphThrottledError(RuntimeError):
+    """Graph answered 429; retry_after is the wait it asked for, in seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Throttled by Graph, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def job_key(job: Dict[str, Any]) -> str:
+    """Identity used to coalesce duplicate jobs"""
+    if job['kind'] == 'drive_delta':
+        return f"drive:{job['drive_id']}"
+    if job['kind'] in ('message', 'event'):
+        return f"{job['kind']}:{job['user_id']}:{job['item_id']}:{job['change_type']}"
+    if job['kind'] == 'user_resync':
+        return f"resync:{job['collection']}:{job['user_id']}"
+    return f"{job['kind']}:{json.dumps(job, sort_keys=True)}"
+
+
+class WebhookManager:
+    """Validate notifications, queue fetch jobs and manage Graph subscriptions"""
+
+    def __init__(self, redis_client, es_client=None, bulk_writer=None, partitions=None):
+        self.config = get_config_manager()
+        self.webhook_config = self.config.get_webhook_config()
+        self.logger = setup_logging('m365-webhooks', level='INFO')
+        self.redis = redis_client
+        self.es_adapter = ElasticsearchAdapter(es_client) if es_client else None
+        # Shared bulk writer; without one, documents are written one request each
+        self.bulk_writer = bulk_writer
+        # Monthly indices for mail and calendar (time_partitions.py); needs the bulk writer
+        self.partitions = partitions if bulk_writer else None
+        self.supported_extensions = set(self.config.get_supported_file_extensions())
+
+        # Created on first use (both talk to remote services on init)
+        self._auth = None
+        self._storage = None
+        self._content_store = None
+        self._content_store_checked = False
+
+    # ------------------------------------------------------------------
+    # Graph access
+    # ------------------------------------------------------------------
+    @property
+    def auth(self):
+        if self._auth is None:
+            from m365_auth import M365Auth
+            self._auth = M365Auth()
+        return self._auth
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            from storage_adapter import AsyncMinIOAdapter
+            self._storage = AsyncMinIOAdapter()
+        return self._storage
+
+    async def get_content_store(self):
+        """Content-addressed store, or None to store by path (connected once)"""
+        if not self._content_store_checked:
+            self._content_store_checked = True
+            if self.config.get('minio.content_addressed', True):
+                try:
+                    from content_store import ContentStore
+                    self._content_store = await ContentStore.connect(self.storage)
+                except Exception as e:
+                    self.logger.warning(f"Content store unavailable, storing by path: {e}")
+        return self._content_store
+
+    def _graph_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Make an authenticated Graph request (blocking)"""
+        headers = self.auth.get_graph_headers()
+        if not headers:
+            raise ValueError("Failed to get authentication headers")
+        headers.update(kwargs.pop('headers', {}))
+
+        if not url.startswith('http'):
+            url = f"{GRAPH_BASE}/{url.lstrip('/')}"
+
+        response = requests.request(method, url, headers=headers, timeout=60, **kwargs)
+        if response.status_code == 429:
+            raise GraphThrottledError(int(response.headers.get('Retry-After', 10)))
+        return response
+
+    async def _graph(self, method: str, url: str, **kwargs) -> requests.Response:
+        return await asyncio.to_thread(self._graph_request, method, url, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Notifications
+    # ------------------------------------------------------------------
+    async def _get_subscription(self, subscription_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.redis.hget(SUBSCRIPTIONS_KEY, subscription_id)
+        return json.loads(raw) if raw else None
+
+    async def validate_notification(self, notification: Dict[str, Any]) -> bool:
+        """
+        Check that a notification came from one of our subscriptions
+
+        The clientState must match the secret the subscription was created
+        with (or the configured secret for subscriptions made elsewhere).
+        """
+        received = notification.get('clientState') or ''
+        subscription = await self._get_subscription(notification.get('subscriptionId', ''))
+        expected = (subscription or {}).get('clientState') or self.webhook_config.get('client_state')
+
+        if not expected:
+            self.logger.warning("Rejecting notification: no client state configured")
+            return False
+        if not hmac.compare_digest(str(received), str(expected)):
+            self.logger.warning(f"Rejecting notification with bad clientState for {notification.get('resource')}")
+            return False
+
+        tenant_id = self.config.get_m365_config().get('tenant_id')
+        if tenant_id and notification.get('tenantId') and notification['tenantId'] != tenant_id:
+            self.logger.warning(f"Rejecting notification from tenant {notification['tenantId']}")
+            return False
+
+        return True
+
+    async def handle_notifications(self, payload: Dict[str, Any]) -> Dict[str, int]:
+        """Validate a notification batch and queue fetch jobs (must stay fast)"""
+        counts = {'accepted': 0, 'rejected': 0, 'queued': 0, 'coalesced': 0}
+
+        for notification in payload.get('value', []):
+            if not await self.validate_notification(notification):
+                counts['rejected'] += 1
+                continue
+
+            counts['accepted'] += 1
+
+            if notification.get('lifecycleEvent'):
+                await self._handle_lifecycle_event(notification)
+                continue
+
+            job = notification_to_job(notification)
+            if not job:
+                continue
+
+            if await self.enqueue(job):
+                counts['queued'] += 1
+            else:
+                counts['coalesced'] += 1
+
+        await self.redis.hincrby(STATS_KEY, 'notifications', counts['accepted'])
+        await self.redis.hincrby(STATS_KEY, 'rejected', counts['rejected'])
+        return counts
+
+    async def _handle_lifecycle_event(self, notification: Dict[str, Any]):
+        """React to subscriptionRemoved / reauthorizationRequired / missed events"""
+        event = notification['lifecycleEvent']
+        subscription_id = notification.get('subscriptionId', '')
+        self.logger.warning(f"Lifecycle event {event} for subscription {subscription_id}")
+
+        subscription = await self._get_subscription(subscription_id)
+        if not subscription:
+            return
+
+        if event in ('reauthorizationRequired', 'subscriptionRemoved'):
+            # Force the renewal loop to handle it on its next pass
+            subscription['expirationDateTime'] = datetime.now(timezone.utc).isoformat()
+            await self.redis.hset(SUBSCRIPTIONS_KEY, subscription_id, json.dumps(subscription))
+        elif event == 'missed':
+            # Notifications were dropped; fall back to a delta fetch of the resource
+            job = notification_to_job({'resource': subscription['resource'], 'changeType': 'updated'})
+            resource = parse_resource(subscription['resource'])
+            if job and job['kind'] == 'drive_delta':
+                await self.enqueue(job)
+            elif resource.get('kind') in ('messages', 'events') and 'item_id' not in resource:
+                # Mail and calendar have no stored delta link: re-read what changed lately
+                lookback = timedelta(hours=self.webhook_config.get('missed_lookback_hours', 24))
+                await self.enqueue({
+                    'kind': 'user_resync',
+                    'collection': resource['kind'],
+                    'user_id': resource['user_id'],
+                    'since': (datetime.now(timezone.utc) - lookback).strftime('%Y-%m-%dT%H:%M:%SZ')
+                })
+            else:
+                self.logger.warning(
+                    f"Missed notifications for {subscription['resource']} cannot be fetched "
+                    f"automatically; resync it with a full sync"
+                )
+
+    async def enqueue(self, job: Dict[str, Any], coalesce: bool = True) -> bool:
+        """
+        Queue a fetch job
+
+        Bursts of notifications for the same drive (a folder upload fires one
+        per file) share one delta fetch: only the first within coalesce_seconds
+        is queued.
+        """
+        if coalesce:
+            window = max(int(self.webhook_config.get('coalesce_seconds', 5)), 1)
+            if not await self.redis.set(PENDING_PREFIX + job_key(job), 1, nx=True, ex=window):
+                return False
+
+        job.setdefault('attempts', 0)
+        job.setdefault('queued_at', time.time())
+        await self.redis.rpush(QUEUE_KEY, json.dumps(job))
+        return True
+
+    async def get_status(self) -> Dict[str, Any]:
+        """Queue depth, counters and subscriptions"""
+        stats = await self.redis.hgetall(STATS_KEY)
+        subscriptions = await self.redis.hgetall(SUBSCRIPTIONS_KEY)
+
+        return {
+            'queue_length': await self.redis.llen(QUEUE_KEY),
+            'delayed': await self.redis.zcard(DELAYED_KEY),
+            'dead_letters': await self.redis.llen(DEAD_LETTER_KEY),
+            'stats': {self._decode(k): self._decode(v) for k, v in stats.items()},
+            'subscriptions': [json.loads(value) for value in subscriptions.values()]
+        }
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    # ------------------------------------------------------------------
+    # Subscriptions
+    # ------------------------------------------------------------------
+    def _expiration(self) -> str:
+        minutes = self.webhook_config.get('subscription_minutes', 4200)
+        return (datetime.now(timezone.utc) + timedelta(minutes=minutes)).strftime('%Y-%m-%dT%H:%M:%S.0000000Z')
+
+    async def subscribe(self, resource: str, context: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Create a Graph subscription for a resource
+
+        Args:
+            resource: e.g. "drives/{id}/root", "users/{id}/messages", "users/{id}/events"
+            context: Drive context (source, site_name or user_email) for blob naming
+        """
+        notification_url = self.webhook_config.get('notification_url')
+        client_state = self.webhook_config.get('client_state')
+        if not notification_url or not client_state:
+            raise ValueError("M365_WEBHOOK_URL and M365_WEBHOOK_CLIENT_STATE must be set to subscribe")
+
+        kind = parse_resource(resource).get('kind')
+        if kind not in CHANGE_TYPES:
+            raise ValueError(f"Unsupported resource: {resource}")
+
+        if kind == 'drive':
+            drive_id = parse_resource(resource)['drive_id']
+            if context:
+                await self.redis.hset(DRIVES_KEY, drive_id, json.dumps(context))
+            # Start the delta cursor now so the first notification fetches only new changes
+            await self._prime_delta_link(drive_id)
+
+        response = await self._graph('POST', 'subscriptions', json={
+            'changeType': CHANGE_TYPES[kind],
+            'notificationUrl': notification_url,
+            'lifecycleNotificationUrl': notification_url,
+            'resource': resource,
+            'expirationDateTime': self._expiration(),
+            'clientState': client_state
+        })
+        response.raise_for_status()
+        subscription = response.json()
+
+        record = {
+            'id': subscription['id'],
+            'resource': resource,
+            'changeType': CHANGE_TYPES[kind],
+            'expirationDateTime': subscription['expirationDateTime'],
+            'clientState': client_state
+        }
+        await self.redis.hset(SUBSCRIPTIONS_KEY, subscription['id'], json.dumps(record))
+        self.logger.info(f"Subscribed to {resource} until {record['expirationDateTime']}")
+        return record
+
+    async def unsubscribe(self, subscription_id: str) -> bool:
+        """Delete a Graph subscription"""
+        response = await self._graph('DELETE', f"subscriptions/{subscription_id}")
+        await self.redis.hdel(SUBSCRIPTIONS_KEY, subscription_id)
+        return response.status_code in (204, 404)
+
+    async def renew_due_subscriptions(self) -> Dict[str, int]:
+        """Extend subscriptions that expire within renew_before_minutes"""
+        renew_before = timedelta(minutes=self.webhook_config.get('renew_before_minutes', 720))
+        now = datetime.now(timezone.utc)
+        counts = {'renewed': 0, 'recreated': 0, 'failed': 0}
+
+        for raw in (await self.redis.hgetall(SUBSCRIPTIONS_KEY)).values():
+            subscription = json.loads(raw)
+            expires = parse_graph_datetime(subscription['expirationDateTime'])
+            if expires - now > renew_before:
+                continue
+
+            try:
+                response = await self._graph(
+                    'PATCH', f"subscriptions/{subscription['id']}",
+                    json={'expirationDateTime': self._expiration()}
+                )
+                if response.status_code == 404:
+                    # Graph already dropped it; create a replacement
+                    await self.redis.hdel(SUBSCRIPTIONS_KEY, subscription['id'])
+                    await self.subscribe(subscription['resource'])
+                    counts['recreated'] += 1
+                    continue
+
+                response.raise_for_status()
+                subscription['expirationDateTime'] = response.json()['expirationDateTime']
+                await self.redis.hset(SUBSCRIPTIONS_KEY, subscription['id'], json.dumps(subscription))
+                counts['renewed'] += 1
+            except Exception as e:
+                self.logger.error(f"Failed to renew subscription {subscription['id']}: {e}")
+                counts['failed'] += 1
+
+        if any(counts.values()):
+            self.logger.info(f"Subscription renewal: {counts}")
+        return counts
+
+    async def renewal_loop(self):
+        """Renew subscriptions periodically (runs for the API's lifetime)"""
+        interval = self.webhook_config.get('renew_check_interval', 600)
+        while True:
+            try:
+                # Only one API worker process renews per interval
+                if await self.redis.set(RENEW_LOCK_KEY, 1, nx=True, ex=max(interval - 1, 1)):
+                    await self.renew_due_subscriptions()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Subscription renewal pass failed: {e}")
+            await asyncio.sleep(interval)
+
+    # ------------------------------------------------------------------
+    # Fetch jobs
+    # ------------------------------------------------------------------
+    async def schedule_retry(self, job: Dict[str, Any], delay: float):
+        """Re-queue a job after delay seconds without holding up the consumer"""
+        await self.redis.zadd(DELAYED_KEY, {json.dumps(job): time.time() + delay})
+
+    async def promote_due_retries(self) -> int:
+        """Move delayed jobs whose time has come back onto the queue"""
+        promoted = 0
+        for raw in await self.redis.zrangebyscore(DELAYED_KEY, 0, time.time(), start=0, num=100):
+            # zrem decides which consumer moves the job when several API workers run
+            if await self.redis.zrem(DELAYED_KEY, raw):
+                await self.redis.rpush(QUEUE_KEY, raw)
+                promoted += 1
+        return promoted
+
+    async def replay_dead_letters(self, limit: Optional[int] = None) -> int:
+        """Queue dead-lettered jobs again with a fresh attempt count"""
+        replayed = 0
+        while limit is None or replayed < limit:
+            raw = await self.redis.lpop(DEAD_LETTER_KEY)
+            if not raw:
+                break
+            job = json.loads(raw)
+            job['attempts'] = 0
+            job.pop('error', None)
+            job['queued_at'] = time.time()
+            await self.enqueue(job, coalesce=False)
+            replayed += 1
+
+        if replayed:
+            self.logger.info(f"Replayed {replayed} dead-lettered fetch jobs")
+        return replayed
+
+    async def consume_loop(self):
+        """Process queued fetch jobs (runs for the API's lifetime)"""
+        max_attempts = self.webhook_config.get('max_attempts', 3)
+
+        while True:
+            try:
+                await self.promote_due_retries()
+                item = await self.redis.blpop(QUEUE_KEY, timeout=5)
+                if not item:
+                    continue
+                job = json.loads(item[1])
+                # Notifications arriving from now on need a new fetch: this one
+                # may already be past the change they report
+                await self.redis.delete(PENDING_PREFIX + job_key(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Failed to read fetch queue: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            try:
+                await self.process_job(job)
+                latency_ms = int((time.time() - job['queued_at']) * 1000)
+                await self.redis.hincrby(STATS_KEY, 'processed', 1)
+                await self.redis.hset(STATS_KEY, 'last_latency_ms', latency_ms)
+                await self.redis.hset(STATS_KEY, 'last_processed_at', datetime.utcnow().isoformat())
+            except asyncio.CancelledError:
+                raise
+            except GraphThrottledError as e:
+                # Not the job's fault: wait as long as Graph asks, without using an attempt
+                job['error'] = str(e)
+                await self.redis.hincrby(STATS_KEY, 'throttled', 1)
+                await self.schedule_retry(job, e.retry_after)
+            except Exception as e:
+                job['attempts'] += 1
+                job['error'] = str(e)
+                self.logger.error(f"Fetch job {job['kind']} failed (attempt {job['attempts']}): {e}")
+                await self.redis.hincrby(STATS_KEY, 'failed', 1)
+
+                if job['attempts'] >= max_attempts:
+                    await self.redis.rpush(DEAD_LETTER_KEY, json.dumps(job))
+                else:
+                    await self.schedule_retry(job, min(2 ** job['attempts'], 30))
+
+    async def process_job(self, job: Dict[str, Any]):
+        """Run one fetch job"""
+        kind = job['kind']
+
+        if kind == 'drive_delta':
+            await self.fetch_drive_delta(job['drive_id'])
+        elif kind == 'message':
+            await self.fetch_message(job['user_id'], job['item_id'], job['change_type'])
+        elif kind == 'event':
+            await self.fetch_event(job['user_id'], job['item_id'], job['change_type'])
+        elif kind == 'user_resync':
+            await self.resync_user_items(job['user_id'], job['collection'], job['since'])
+        elif kind == 'site_sync':
+            await self.queue_site_drives(job['site_url'])
+        elif kind == 'onedrive_sync':
+            await self.queue_user_drives()
+        else:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+    async def _prime_delta_link(self, drive_id: str):
+        """Store a delta link pointing at 'now' so later fetches see only new changes"""
+        if await self.redis.hexists(DELTA_LINKS_KEY, drive_id):
+            return
+        response = await self._graph('GET', f"drives/{drive_id}/root/delta", params={'token': 'latest'})
+        response.raise_for_status()
+        delta_link = response.json().get('@odata.deltaLink')
+        if delta_link:
+            await self.redis.hset(DELTA_LINKS_KEY, drive_id, delta_link)
+
+    async def fetch_drive_delta(self, drive_id: str) -> Dict[str, int]:
+        """Fetch and apply the changes of one drive since its last delta link"""
+        delta_link = await self.redis.hget(DELTA_LINKS_KEY, drive_id)
+        url = self._decode(delta_link) if delta_link else f"drives/{drive_id}/root/delta"
+        if not delta_link:
+            self.logger.info(f"No delta link for drive {drive_id}, fetching full drive once")
+
+        context_raw = await self.redis.hget(DRIVES_KEY, drive_id)
+        context = json.loads(context_raw) if context_raw else {}
+        counts = {'indexed': 0, 'deleted': 0, 'skipped': 0}
+
+        while url:
+            response = await self._graph('GET', url)
+            if response.status_code == 410:
+                # Delta token expired; restart from a full delta
+                await self.redis.hdel(DELTA_LINKS_KEY, drive_id)
+                url = f"drives/{drive_id}/root/delta"
+                continue
+            response.raise_for_status()
+            data = response.json()
+
+            for item in data.get('value', []):
+                if 'deleted' in item:
+                    await self._delete_drive_item(item, context)
+                    counts['deleted'] += 1
+                elif 'file' in item and Path(item.get('name', '')).suffix.lower() in self.supported_extensions:
+                    if await self._index_drive_item(drive_id, item, context):
+                        counts['indexed'] += 1
+                else:
+                    counts['skipped'] += 1
+
+            if data.get('@odata.deltaLink'):
+                await self.redis.hset(DELTA_LINKS_KEY, drive_id, data['@odata.deltaLink'])
+            url = data.get('@odata.nextLink')
+
+        self.logger.info(f"Drive {drive_id} delta applied: {counts}")
+        return counts
+
+    def _drive_item_metadata(self, item: Dict[str, Any], context: Dict[str, str]) -> Dict[str, Any]:
+        """Blob name and metadata matching the SharePoint/OneDrive indexers"""
+        drive_type = item.get('parentReference', {}).get('driveType')
+        source = context.get('source') or ('onedrive' if drive_type in ('business', 'personal') else 'sharepoint')
+        name = item.get('name', '')
+        metadata = {
+            'm365_id': item['id'],
+            'source': source,
+            'file_name': name,
+            'file_size': str(item.get('size', 0)),
+            'created': item.get('createdDateTime'),
+            'modified': item.get('lastModifiedDateTime')
+        }
+
+        if source == 'onedrive':
+            owner = context.get('user_email') or item.get('createdBy', {}).get('user', {}).get('email', 'unknown')
+            metadata['user_email'] = owner
+            blob_name = f"onedrive/{owner}{drive_item_folder(item)}/{name}"
+        else:
+            site_name = context.get('site_name', 'unknown')
+            metadata['site_name'] = site_name
+            metadata['site_url'] = context.get('site_url', '')
+            metadata['author'] = item.get('createdBy', {}).get('user', {}).get('displayName', 'Unknown')
+            blob_name = f"sharepoint/{site_name}{drive_item_folder(item)}/{name}"
+
+        return {'blob_name': blob_name, 'metadata': metadata, 'source': source}
+
+    async def _index_drive_item(self, drive_id: str, item: Dict[str, Any], context: Dict[str, str]) -> bool:
+        """Download one changed file, store it in MinIO and index it"""
+        target = self._drive_item_metadata(item, context)
+        content_store = await self.get_content_store()
+        source_hash = graph_source_hash(item)
+
+        stored = None
+        if content_store:
+            # Renamed or moved without content changes: no download
+            stored = await content_store.touch_if_unchanged(
+                target['source'], item['id'], target['blob_name'], source_hash, target['metadata']
+            )
+
+        if stored is None:
+            response = await self._graph('GET', f"drives/{drive_id}/items/{item['id']}/content")
+            response.raise_for_status()
+
+            fd, temp_path = tempfile.mkstemp(suffix=Path(item['name']).suffix)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(response.content)
+
+                if content_store:
+                    stored = await content_store.put_file(
+                        target['source'], item['id'], target['blob_name'], temp_path,
+                        target['metadata'], source_hash
+                    )
+                elif await self.storage.upload_file(temp_path, target['blob_name'], target['metadata']):
+                    stored = {'object_name': target['blob_name']}
+            finally:
+                os.remove(temp_path)
+
+        if not stored or not self.es_adapter:
+            return bool(stored)
+
+        target['metadata']['object_name'] = stored['object_name']
+        if stored.get('sha256'):
+            target['metadata']['sha256'] = stored['sha256']
+
+        return await self._write_document(item['id'], {
+            'doc_id': item['id'],
+            'title': item['name'],
+            'content': '',  # Will be extracted by RAG-Anything
+            'metadata': target['metadata'],
+            'has_images': False,
+            'has_tables': False,
+            'indexed_at': datetime.utcnow().isoformat()
+        })
+
+    async def _delete_drive_item(self, item: Dict[str, Any], context: Dict[str, str]):
+        """Remove a deleted file from Elasticsearch and MinIO"""
+        await self._delete_document(item['id'])
+
+        content_store = await self.get_content_store()
+        if content_store:
+            # References are keyed by id, so the (often missing) name is not needed
+            await content_store.delete(None, item['id'])
+            return
+
+        # Delta reports deleted items without a reliable name; only delete when known
+        if item.get('name'):
+            target = self._drive_item_metadata(item, context)
+            await self.storage.delete_file(target['blob_name'])
+
+    async def fetch_message(self, user_id: str, message_id: str, change_type: str):
+        """Fetch and index one changed message"""
+        if change_type == 'deleted':
+            await self._delete_document(message_id, 'exchange')
+            return
+
+        response = await self._graph(
+            'GET', f"users/{user_id}/messages/{message_id}",
+            params={'$select': 'id,subject,body,from,toRecipients,receivedDateTime,hasAttachments,webLink'},
+            headers={'Prefer': 'outlook.body-content-type="text"'}
+        )
+        if response.status_code == 404:
+            # Moved or deleted before we got to it
+            return
+        response.raise_for_status()
+        message = response.json()
+
+        sender = message.get('from', {}).get('emailAddress', {})
+        await self._index_item(message_id, message.get('subject') or '(no subject)',
+                               message.get('body', {}).get('content', ''), {
+                                   'm365_id': message_id,
+                                   'source': 'exchange',
+                                   'user_email': await self._user_email(user_id),
+                                   'from': sender.get('address'),
+                                   'received': message.get('receivedDateTime'),
+                                   'has_attachments': message.get('hasAttachments', False),
+                                   'web_url': message.get('webLink')
+                               })
+
+    async def fetch_event(self, user_id: str, event_id: str, change_type: str):
+        """Fetch and index one changed calendar event"""
+        if change_type == 'deleted':
+            await self._delete_document(event_id, 'calendar')
+            return
+
+        response = await self._graph(
+            'GET', f"users/{user_id}/events/{event_id}",
+            params={'$select': 'id,subject,body,start,end,location,organizer,webLink'},
+            # start/end in UTC, so the partition month does not depend on the organizer's zone
+            headers={'Prefer': 'outlook.body-content-type="text", outlook.timezone="UTC"'}
+        )
+        if response.status_code == 404:
+            return
+        response.raise_for_status()
+        event = response.json()
+
+        await self._index_item(event_id, event.get('subject') or '(no subject)',
+                               event.get('body', {}).get('content', ''), {
+                                   'm365_id': event_id,
+                                   'source': 'calendar',
+                                   'user_email': await self._user_email(user_id),
+                                   'start': utc_datetime(event.get('start', {}).get('dateTime'),
+                                                         event.get('start', {}).get('timeZone')),
+                                   'end': utc_datetime(event.get('end', {}).get('dateTime'),
+                                                       event.get('end', {}).get('timeZone')),
+                                   'location': event.get('location', {}).get('displayName'),
+                                   'organizer': event.get('organizer', {}).get('emailAddress', {}).get('address'),
+                                   'web_url': event.get('webLink')
+                               })
+
+    async def resync_user_items(self, user_id: str, collection: str, since: str) -> int:
+        """
+        Re-read a user's messages or events modified since `since`
+
+        Runs after a 'missed' lifecycle event. A listing does not show
+        deletions; those are removed by the next full sync.
+        """
+        fetch = self.fetch_message if collection == 'messages' else self.fetch_event
+        url: Optional[str] = f"users/{user_id}/{collection}"
+        params: Optional[Dict[str, Any]] = {
+            '$filter': f"lastModifiedDateTime ge {since}",
+            '$select': 'id',
+            '$top': 100
+        }
+        fetched = 0
+
+        while url:
+            response = await self._graph('GET', url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            for item in data.get('value', []):
+                await fetch(user_id, item['id'], 'updated')
+                fetched += 1
+            # The next link already carries the query
+            url, params = data.get('@odata.nextLink'), None
+
+        self.logger.info(f"Resynced {fetched} {collection} of {user_id} modified since {since}")
+        return fetched
+
+    async def _index_item(self, item_id: str, title: str, content: str, metadata: Dict[str, Any]):
+        if not self.es_adapter:
+            return
+        await self._write_document(item_id, {
+            'doc_id': item_id,
+            'title': title,
+            'content': content,
+            'metadata': metadata,
+            'has_images': False,
+            'has_tables': False,
+            'indexed_at': datetime.utcnow().isoformat()
+        })
+
+    async def _write_document(self, doc_id: str, document: Dict[str, Any]) -> bool:
+        if self.bulk_writer:
+            index = await self.partitions.index_for(document) if self.partitions else None
+            if index:
+                source = document['metadata']['source']
+                if source in MOVABLE_SOURCES:
+                    # A rescheduled event moves to another month's partition
+                    for stale in await self._item_partitions(source, doc_id):
+                        if stale != index:
+                            await self.bulk_writer.delete(doc_id, index=stale)
+                await self.redis.hset(PARTITIONS_PREFIX + source, doc_id, index)
+            await self.bulk_writer.index(doc_id, document, index=index)
+            return True
+        return await self.es_adapter.index_document(doc_id, document)
+
+    async def _item_partitions(self, source: str, doc_id: str) -> List[str]:
+        """
+        Partitions an item may be in
+
+        The recorded partition covers writes still queued or unrefreshed,
+        which a search cannot see; the search covers items written before
+        partitions were recorded.
+        """
+        recorded = await self.redis.hget(PARTITIONS_PREFIX + source, doc_id)
+        indices = [self._decode(recorded)] if recorded else []
+        for index in await self.partitions.locate(source, doc_id):
+            if index not in indices:
+                indices.append(index)
+        return indices
+
+    async def _delete_document(self, doc_id: str, source: Optional[str] = None):
+        if self.bulk_writer:
+            # Same lane as the document's index actions, so ordering is kept
+            if self.partitions and self.partitions.is_partitioned(source):
+                for index in await self._item_partitions(source, doc_id):
+                    await self.bulk_writer.delete(doc_id, index=index)
+                await self.redis.hdel(PARTITIONS_PREFIX + source, doc_id)
+            # Items written before partitioning live in the documents index
+            await self.bulk_writer.delete(doc_id)
+        elif self.es_adapter and await self.es_adapter.document_exists(doc_id):
+            await self.es_adapter.delete_document(doc_id)
+
+    async def _user_email(self, user_id: str) -> str:
+        """Resolve a user id to its UPN (cached in Redis)"""
+        cache_key = f"m365:users:{user_id}"
+        cached = await self.redis.get(cache_key)
+        if cached:
+            return self._decode(cached)
+
+        response = await self._graph('GET', f"users/{user_id}", params={'$select': 'userPrincipalName'})
+        email = response.json().get('userPrincipalName', user_id) if response.ok else user_id
+        await self.redis.setex(cache_key, 86400, email)
+        return email
+
+    async def queue_site_drives(self, site_url: str) -> int:
+        """Queue delta fetches for every document library of a site"""
+        from urllib.parse import urlparse
+
+        parsed = urlparse(site_url)
+        response = await self._graph('GET', f"sites/{parsed.hostname}:{parsed.path or '/'}")
+        response.raise_for_status()
+        site = response.json()
+
+        response = await self._graph('GET', f"sites/{site['id']}/drives")
+        response.raise_for_status()
+
+        drives = response.json().get('value', [])
+        for drive in drives:
+            await self.redis.hset(DRIVES_KEY, drive['id'], json.dumps({
+                'source': 'sharepoint',
+                'site_name': site.get('displayName', 'unknown'),
+                'site_url': site.get('webUrl', site_url)
+            }))
+            await self.enqueue({'kind': 'drive_delta', 'drive_id': drive['id']})
+
+        return len(drives)
+
+    async def queue_user_drives(self) -> int:
+        """Queue delta fetches for every user's OneDrive"""
+        queued = 0
+        url: Optional[str] = "users?$select=id,userPrincipalName"
+
+        while url:
+            response = await self._graph('GET', url)
+            response.raise_for_status()
+            data = response.json()
+
+            for user in data.get('value', []):
+                drive_response = await self._graph('GET', f"users/{user['id']}/drive", params={'$select': 'id'})
+                if not drive_response.ok:
+                    continue  # No OneDrive provisioned
+                drive_id = drive_response.json()['id']
+                await self.redis.hset(DRIVES_KEY, drive_id, json.dumps({
+                    'source': 'onedrive',
+                    'user_email': user.get('userPrincipalName', user['id'])
+                }))
+                await self.enqueue({'kind': 'drive_delta', 'drive_id': drive_id})
+                queued += 1
+
+            url = data.get('@odata.nextLink')
+
+        return queued
+
+    async def subscribe_all(self, sources: List[str]) -> Dict[str, int]:
+        """Subscribe to every known drive, and to mailboxes/calendars of all users"""
+        counts = {}
+
+        if 'drives' in sources:
+            counts['drives'] = 0
+            for drive_id, context in (await self.redis.hgetall(DRIVES_KEY)).items():
+                await self.subscribe(f"drives/{self._decode(drive_id)}/root", json.loads(context))
+                counts['drives'] += 1
+
+        user_kinds = [kind for kind in ('messages', 'events') if kind in sources]
+        if user_kinds:
+            url: Optional[str] = "users?$select=id"
+            while url:
+                response = await self._graph('GET', url)
+                response.raise_for_status()
+                data = response.json()
+                for user in data.get('value', []):
+                    for kind in user_kinds:
+                        try:
+                            await self.subscribe(f"users/{user['id']}/{kind}")
+                            counts[kind] = counts.get(kind, 0) + 1
+                        except Exception as e:
+                            # Users without a mailbox cannot be subscribed
+                            self.logger.warning(f"Could not subscribe to {kind} of {user['id']}: {e}")
+                url = data.get('@odata.nextLink')
+
+        return counts
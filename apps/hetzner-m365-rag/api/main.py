@@ -2,7 +2,8 @@
 # Custom API Layer - Integrating RAG-Anything + Elasticsearch + RAGFlow
 # M365 RAG System on Hetzner
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile
+from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from typing import List, Optional, Dict, Any, Union
@@ -49,7 +50,6 @@ class RAGEngineUnavailable:
 
 # Elasticsearch imports
 from elasticsearch import AsyncElasticsearch  # type: ignore
-from elasticsearch.helpers import async_bulk  # type: ignore
 
 # Database and cache
 import asyncpg  # type: ignore
@@ -59,6 +59,18 @@ import redis.asyncio as redis
 import json
 import uuid
 
+# M365 change notifications
+from m365_webhooks import WebhookManager
+
+# Shared Elasticsearch bulk writer
+from bulk_writer import BulkWriter
+from bulk_load import recover_bulk_loads
+from index_versions import IndexVersionManager
+from time_partitions import TimePartitions
+
+# Object storage (download links in search results)
+from storage_adapter import AsyncMinIOAdapter
+
 
 # ============================================
 # LOGGING CONFIGURATION
@@ -121,6 +133,10 @@ settings = Settings()
 es_client: Optional[AsyncElasticsearch] = None
 pg_pool: Optional[asyncpg.Pool] = None  # type: ignore
 redis_client: Optional[redis.Redis] = None
+webhook_manager: Optional[WebhookManager] = None
+storage: Optional[AsyncMinIOAdapter] = None
+bulk_writer: Optional[BulkWriter] = None
+partitions: Optional[TimePartitions] = None
 # rag_engine is always initialized in lifespan - either RAGAnything or RAGEngineUnavailable stub
 rag_engine: Union[Any, "RAGEngineUnavailable"]  # type: ignore
 
@@ -150,6 +166,7 @@ class SearchResult(BaseModel):
     images: Optional[List[Dict[str, Any]]] = None
     tables: Optional[List[Dict[str, Any]]] = None
     citations: Optional[List[str]] = None
+    download_url: Optional[str] = None
 
 
 class SearchResponse(BaseModel):
@@ -184,13 +201,23 @@ class M365SyncRequest(BaseModel):
     delta_sync: bool = True
 
 
+class M365SubscriptionRequest(BaseModel):
+    resource: Optional[str] = Field(
+        None, description="Graph resource, e.g. drives/{id}/root or users/{id}/messages"
+    )
+    sources: Optional[List[str]] = Field(
+        None, description="Subscribe to all known drives/messages/events instead"
+    )
+    context: Optional[Dict[str, str]] = None
+
+
 # ============================================
 # LIFESPAN MANAGEMENT
 # ============================================
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application startup and shutdown"""
-    global es_client, pg_pool, redis_client, rag_engine
+    global es_client, pg_pool, redis_client, rag_engine, webhook_manager, storage, bulk_writer, partitions
 
     logger.info("🚀 Starting M365 RAG API...")
 
@@ -205,6 +232,20 @@ async def lifespan(app: FastAPI):
     await ensure_indices()
     logger.info(f"✅ Elasticsearch connected ({es_scheme.upper()})")
 
+    # Mail and calendar go to monthly indices aged by ILM; search skips
+    # months outside a query's date filter
+    partitions = TimePartitions(es_client)
+    await partitions.ensure_policy()
+
+    # Indices left in bulk-load mode by a sync that died are restored here
+    restored = await recover_bulk_loads(es_client)
+    if restored:
+        logger.warning(f"⚠️  Restored {restored} index(es) left in bulk-load mode")
+
+    # All document writes (uploads, change notifications) go through one bulk writer
+    bulk_writer = BulkWriter(es_client)
+    await bulk_writer.start()
+
     # Initialize PostgreSQL
     if not settings.DATABASE_URL:
         raise ValueError(
@@ -220,6 +261,10 @@ async def lifespan(app: FastAPI):
         await redis_client.ping()
     logger.info("✅ Redis connected")
 
+    # MinIO (presigned download links; signing is local, no connection needed)
+    storage = AsyncMinIOAdapter()
+    logger.info("✅ MinIO adapter ready")
+
     # Initialize RAG-Anything (real or stub)
     if RAG_ANYTHING_AVAILABLE:
         rag_engine = RAGAnything(
@@ -239,16 +284,31 @@ async def lifespan(app: FastAPI):
             "Document processing will be limited."
         )
 
+    # M365 change notifications: fetch queue consumer and subscription renewal
+    webhook_manager = WebhookManager(redis_client, es_client, bulk_writer, partitions)
+    webhook_tasks = [
+        asyncio.create_task(webhook_manager.consume_loop()),
+        asyncio.create_task(webhook_manager.renewal_loop())
+    ]
+    logger.info("✅ M365 change notification workers started")
+
     yield
 
     # Cleanup
     logger.info("🔌 Shutting down...")
+    for task in webhook_tasks:
+        task.cancel()
+    await asyncio.gather(*webhook_tasks, return_exceptions=True)
+    if bulk_writer:
+        await bulk_writer.close()
     if es_client:
         await es_client.close()
     if pg_pool:
         await pg_pool.close()
     if redis_client:
         await redis_client.close()
+    if storage:
+        storage.close()
     logger.info("👋 Shutdown complete")
 
 
@@ -276,109 +336,14 @@ app.add_middleware(
 # ELASTICSEARCH INDEX MANAGEMENT
 # ============================================
 async def ensure_indices():
-    """Create Elasticsearch indices if they don't exist"""
-
-    # Documents index
-    documents_mapping = {
-        "mappings": {
-            "properties": {
-                "doc_id": {"type": "keyword"},
-                "title": {"type": "text", "analyzer": "standard"},
-                "content": {"type": "text", "analyzer": "standard"},
-                "content_vector": {
-                    "type": "dense_vector",
-                    "dims": settings.EMBEDDING_DIMENSIONS,
-                    "index": True,
-                    "similarity": "cosine"
-                },
-                "metadata": {
-                    "properties": {
-                        "source": {"type": "keyword"},
-                        "author": {"type": "keyword"},
-                        "created_at": {"type": "date"},
-                        "modified_at": {"type": "date"},
-                        "file_type": {"type": "keyword"},
-                        "file_size": {"type": "long"},
-                        "m365_id": {"type": "keyword"},
-                        "path": {"type": "keyword"}
-                    }
-                },
-                "entities": {"type": "keyword"},
-                "has_images": {"type": "boolean"},
-                "has_tables": {"type": "boolean"},
-                "indexed_at": {"type": "date"}
-            }
-        },
-        "settings": {
-            "number_of_shards": 2,
-            "number_of_replicas": 0,
-            "analysis": {
-                "analyzer": {
-                    "standard": {
-                        "type": "standard"
-                    }
-                }
-            }
-        }
-    }
-
-    if es_client and not await es_client.indices.exists(index="documents"):
-        await es_client.indices.create(
-            index="documents", body=documents_mapping
-        )
-        logger.info("Created 'documents' index")
-
-    # Images index
-    images_mapping = {
-        "mappings": {
-            "properties": {
-                "image_id": {"type": "keyword"},
-                "doc_id": {"type": "keyword"},
-                "image_vector": {
-                    "type": "dense_vector",
-                    "dims": 512,  # CLIP embeddings
-                    "index": True,
-                    "similarity": "cosine"
-                },
-                "ocr_text": {"type": "text"},
-                "caption": {"type": "text"},
-                "image_url": {"type": "keyword"},
-                "page_number": {"type": "integer"}
-            }
-        }
-    }
-
-    if es_client and not await es_client.indices.exists(index="images"):
-        await es_client.indices.create(index="images", body=images_mapping)
-        logger.info("Created 'images' index")
-
-    # Knowledge graph index
-    kg_mapping = {
-        "mappings": {
-            "properties": {
-                "entity_id": {"type": "keyword"},
-                "entity_text": {"type": "text"},
-                "entity_type": {"type": "keyword"},
-                "doc_ids": {"type": "keyword"},
-                "relationships": {
-                    "type": "nested",
-                    "properties": {
-                        "target_entity": {"type": "keyword"},
-                        "relation_type": {"type": "keyword"},
-                        "weight": {"type": "float"}
-                    }
-                }
-            }
-        }
-    }
+    """
+    Create Elasticsearch indices if they don't exist
 
-    if es_client and not await es_client.indices.exists(
-        index="knowledge_graph"
-    ):
-        await es_client.indices.create(
-            index="knowledge_graph", body=kg_mapping
-        )
-        logger.info("Created 'knowledge_graph' index")
+    Indices are versioned behind read/write aliases (index_versions.py);
+    mapping changes are rolled out with its migrate command.
+    """
+    if es_client:
+        await IndexVersionManager(es_client).ensure_all()
 
 
 # ============================================
@@ -438,7 +403,9 @@ async def search_documents(query: SearchQuery):
 
     try:
         # Check cache (use stable hash for cache key)
-        query_hash = hashlib.md5(query.query.encode()).hexdigest()
+        query_hash = hashlib.md5(
+            (query.query + json.dumps(query.filters or {}, sort_keys=True, default=str)).encode()
+        ).hexdigest()
         cache_key = f"search:{query_hash}:{query.search_mode}"
         if redis_client:
             cached = await redis_client.get(cache_key)
@@ -447,7 +414,10 @@ async def search_documents(query: SearchQuery):
                     logger.info(f"Cache hit for query: {query.query}")
                     # Decode bytes and reconstruct SearchResponse model
                     cached_dict = json.loads(cached.decode('utf-8'))
-                    return SearchResponse(**cached_dict)
+                    search_response = SearchResponse(**cached_dict)
+                    await attach_download_urls(search_response.results)
+                    await log_search_query(query, search_response)
+                    return search_response
                 except (json.JSONDecodeError, ValueError, TypeError) as e:
                     # Cache data is invalid/corrupt, log and continue with fresh search
                     logger.warning(f"Invalid cache data: {e}, performing fresh search")
@@ -459,10 +429,15 @@ async def search_documents(query: SearchQuery):
         # Build Elasticsearch query
         es_query = {
             "query": {
-                "multi_match": {
-                    "query": query.query,
-                    "fields": ["title^2", "content"],
-                    "type": "best_fields"
+                "bool": {
+                    "must": {
+                        "multi_match": {
+                            "query": query.query,
+                            "fields": ["title^2", "content"],
+                            "type": "best_fields"
+                        }
+                    },
+                    "filter": search_filters(query.filters)
                 }
             },
             "size": query.top_k,
@@ -482,10 +457,16 @@ async def search_documents(query: SearchQuery):
                 status_code=503, detail="Elasticsearch not available"
             )
 
-        response = await es_client.search(
-            index="documents",
-            body=es_query
-        )
+        # Only the partitions overlapping the date filter are searched
+        indices = await partitions.search_indices(query.filters) if partitions else ["documents"]
+        if indices:
+            response = await es_client.search(
+                index=",".join(indices),
+                body=es_query,
+                ignore_unavailable=True
+            )
+        else:
+            response = {"hits": {"hits": [], "total": {"value": 0}}}
 
         # Process results
         results = []
@@ -511,7 +492,7 @@ async def search_documents(query: SearchQuery):
             took_ms=took_ms
         )
 
-        # Cache results
+        # Cache results (without download links, which expire on their own clock)
         if redis_client:
             await redis_client.setex(
                 cache_key,
@@ -519,6 +500,9 @@ async def search_documents(query: SearchQuery):
                 json.dumps(search_response.dict())
             )
 
+        await attach_download_urls(search_response.results)
+        await log_search_query(query, search_response)
+
         return search_response
 
     except Exception as e:
@@ -526,6 +510,94 @@ async def search_documents(query: SearchQuery):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def search_filters(filters: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filter clauses for the source and date_from/date_to search filters"""
+    clauses: List[Dict[str, Any]] = []
+    if not filters:
+        return clauses
+    source = filters.get("source")
+    if source:
+        clauses.append({"terms": {"metadata.source": [source] if isinstance(source, str) else source}})
+    date_range = {
+        op: filters[key] for op, key in (("gte", "date_from"), ("lte", "date_to")) if filters.get(key)
+    }
+    if date_range:
+        clauses.append({"range": {"event_date": date_range}})
+    return clauses
+
+
+async def attach_download_urls(results: List[SearchResult]):
+    """
+    Set presigned download links on results that have a stored object
+
+    All links are issued in one batch; cached URLs are reused, so this adds
+    no signing work for objects that appeared in recent results.
+    """
+    if not storage:
+        return
+
+    object_names = [r.metadata.get("object_name") for r in results]
+    wanted = [name for name in object_names if name]
+    if not wanted:
+        return
+
+    try:
+        urls = await storage.get_file_urls(wanted)
+    except Exception as e:
+        logger.warning(f"Failed to sign download links: {e}")
+        return
+
+    for result, name in zip(results, object_names):
+        if name:
+            result.download_url = urls.get(name)
+
+
+def count_result_sources(results: List[SearchResult]) -> Dict[str, int]:
+    """
+    Count search hits per source and per site/mailbox
+
+    Keys are "<source>" and "<source>:<site or user>", matching the work
+    units of the M365 sync scheduler.
+    """
+    counts: Dict[str, int] = {}
+    for result in results:
+        source = result.metadata.get("source")
+        if not source:
+            continue
+        counts[source] = counts.get(source, 0) + 1
+
+        unit = result.metadata.get("site_name") or result.metadata.get("user_email")
+        if unit:
+            key = f"{source}:{unit}"
+            counts[key] = counts.get(key, 0) + 1
+
+    return counts
+
+
+async def log_search_query(query: SearchQuery, search_response: SearchResponse):
+    """Record a search in search_queries (best effort, never fails the search)"""
+    if not pg_pool:
+        return
+
+    try:
+        async with pg_pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO search_queries
+                    (query, search_mode, num_results, took_ms, filters, result_sources)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                """,
+                query.query,
+                query.search_mode,
+                len(search_response.results),
+                search_response.took_ms,
+                json.dumps(query.filters) if query.filters else None,
+                json.dumps(count_result_sources(search_response.results))
+            )
+    except Exception as e:
+        logger.warning(f"Failed to log search query: {e}")
+
+
 # ============================================
 # DOCUMENT INGESTION
 # ============================================
@@ -606,12 +678,9 @@ async def process_document(
         )
 
         # Index to Elasticsearch (simplified - add embedding generation)
-        actions = []
-        for i, chunk in enumerate(chunks):
-            action = {
-                "_index": "documents",
-                "_id": f"{doc_id}_{i}",
-                "_source": {
+        if bulk_writer:
+            for i, chunk in enumerate(chunks):
+                await bulk_writer.index(f"{doc_id}_{i}", {
                     "doc_id": doc_id,
                     "title": metadata.get("file_name", "Untitled"),
                     "content": chunk.text,
@@ -619,12 +688,7 @@ async def process_document(
                     "has_images": False,  # Update based on parsed_doc
                     "has_tables": False,  # Update based on parsed_doc
                     "indexed_at": datetime.utcnow().isoformat()
-                }
-            }
-            actions.append(action)
-
-        if es_client:
-            await async_bulk(es_client, actions)
+                })
         logger.info(f"✅ Document processed: {doc_id}")
 
     except Exception as e:
@@ -644,17 +708,106 @@ async def sync_m365(
     sync_request: M365SyncRequest,
     background_tasks: BackgroundTasks
 ):
-    """Sync documents from Microsoft 365"""
+    """Queue a delta sync of SharePoint sites or OneDrive drives"""
+    if not webhook_manager:
+        raise HTTPException(status_code=503, detail="Redis not available")
+
     job_id = str(uuid.uuid4())
 
-    # This will be implemented with the migrated M365 indexers
+    if sync_request.source_type == "sharepoint":
+        if not sync_request.site_url:
+            raise HTTPException(
+                status_code=400, detail="site_url is required for SharePoint sync"
+            )
+        job = {"kind": "site_sync", "site_url": sync_request.site_url}
+    elif sync_request.source_type == "onedrive":
+        job = {"kind": "onedrive_sync"}
+    else:
+        # Mail and calendar changes arrive through change notifications
+        return {
+            "job_id": job_id,
+            "status": "not_supported",
+            "message": (
+                f"{sync_request.source_type} is synced through change "
+                "notifications (POST /webhooks/m365/subscriptions)"
+            )
+        }
+
+    job["job_id"] = job_id
+    await webhook_manager.enqueue(job, coalesce=False)
+
     return {
         "job_id": job_id,
-        "status": "not_implemented",
-        "message": "M365 sync will be implemented in Phase 4"
+        "status": "queued",
+        "message": "Delta fetch queued; only changed items are downloaded"
     }
 
 
+@app.post("/webhooks/m365")
+async def m365_notifications(request: Request):
+    """
+    Receive Microsoft Graph change notifications
+
+    Answers the subscription validation handshake, then validates each
+    notification and queues a targeted fetch. Graph expects a response
+    within a few seconds, so no fetching happens here.
+    """
+    validation_token = request.query_params.get("validationToken")
+    if validation_token:
+        return PlainTextResponse(validation_token, status_code=200)
+
+    if not webhook_manager:
+        raise HTTPException(status_code=503, detail="Redis not available")
+
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid notification payload")
+
+    counts = await webhook_manager.handle_notifications(payload)
+    if counts["rejected"] and not counts["accepted"]:
+        raise HTTPException(status_code=403, detail="Invalid clientState")
+
+    return PlainTextResponse("", status_code=202)
+
+
+@app.post("/webhooks/m365/subscriptions")
+async def create_m365_subscriptions(subscription_request: M365SubscriptionRequest):
+    """Create Graph subscriptions for one resource or for whole sources"""
+    if not webhook_manager:
+        raise HTTPException(status_code=503, detail="Redis not available")
+
+    try:
+        if subscription_request.resource:
+            return await webhook_manager.subscribe(
+                subscription_request.resource, subscription_request.context
+            )
+        return await webhook_manager.subscribe_all(
+            subscription_request.sources or ["drives", "messages", "events"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Subscription error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+@app.post("/webhooks/m365/dead-letters/replay")
+async def replay_m365_dead_letters(limit: Optional[int] = None):
+    """Queue failed fetch jobs again"""
+    if not webhook_manager:
+        raise HTTPException(status_code=503, detail="Redis not available")
+    return {"replayed": await webhook_manager.replay_dead_letters(limit)}
+
+
+@app.get("/webhooks/m365/status")
+async def m365_webhook_status():
+    """Notification queue depth, counters and active subscriptions"""
+    if not webhook_manager:
+        raise HTTPException(status_code=503, detail="Redis not available")
+    return await webhook_manager.get_status()
+
+
 # ============================================
 # MAIN
 # ============================================
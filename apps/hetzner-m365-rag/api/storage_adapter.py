@@ -5,14 +5,121 @@ Replaces Azure Blob Storage in the original implementation
 
 from minio import Minio
 from minio.error import S3Error
-from typing import Optional, BinaryIO
+from minio.deleteobjects import DeleteObject
+from typing import Optional, BinaryIO, Iterable, Iterator, AsyncIterator, Tuple, Dict, List
 import os
+import io
+import time
+import asyncio
 import logging
+import threading
+import functools
 from pathlib import Path
 from datetime import timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
 
 logger = logging.getLogger(__name__)
 
+# S3 DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+
+# Object names per batch handed from a listing thread to the event loop
+LIST_BATCH_SIZE = 1000
+
+
+class PresignedURLCache:
+    """
+    Cache of presigned GET URLs, reused until shortly before they expire
+
+    A URL signed for `expires` seconds is handed out again until
+    `refresh_margin` seconds before its expiry, so every link returned still
+    has at least that long to live. Entries are evicted least recently used.
+    Thread-safe: signing runs on executor threads.
+    """
+
+    def __init__(self, max_entries: int = 10000, refresh_margin: int = 600):
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bucket: str, blob_name: str, expires: int) -> Optional[str]:
+        key = (bucket, blob_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == expires and entry[2] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, bucket: str, blob_name: str, expires: int, url: str, signed_at: float):
+        # URLs that would not outlive the margin are never worth caching
+        reuse_until = signed_at + expires - self.refresh_margin
+        if reuse_until <= time.monotonic():
+            return
+        key = (bucket, blob_name)
+        with self._lock:
+            self._entries[key] = (expires, url, reuse_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, bucket: str, blob_name: str):
+        """Drop the cached URL of an object (e.g. after it was deleted)"""
+        with self._lock:
+            self._entries.pop((bucket, blob_name), None)
+
+    def get_statistics(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def sign_urls(client: Minio, bucket: str, blob_names: Iterable[str], expires: int,
+              cache: PresignedURLCache) -> Dict[str, Optional[str]]:
+    """
+    Presigned GET URLs for many objects, from the cache where possible
+
+    Signing is a local HMAC computation once the bucket region is known, so
+    misses are signed in one pass without network round trips.
+    """
+    urls: Dict[str, Optional[str]] = {}
+    for blob_name in blob_names:
+        if blob_name not in urls:
+            urls[blob_name] = cache.get(bucket, blob_name, expires)
+
+    missing = [name for name, url in urls.items() if url is None]
+    if missing:
+        urls.update(presign_urls(client, bucket, missing, expires, cache))
+    return urls
+
+
+def presign_urls(client: Minio, bucket: str, blob_names: List[str], expires: int,
+                 cache: PresignedURLCache) -> Dict[str, Optional[str]]:
+    """Sign URLs for objects that missed the cache and cache them"""
+    urls: Dict[str, Optional[str]] = {}
+    for blob_name in blob_names:
+        signed_at = time.monotonic()
+        try:
+            urls[blob_name] = client.presigned_get_object(
+                bucket, blob_name, expires=timedelta(seconds=expires)
+            )
+            cache.put(bucket, blob_name, expires, urls[blob_name], signed_at)
+        except S3Error as e:
+            logger.error(f"Error generating presigned URL for {blob_name}: {e}")
+            urls[blob_name] = None
+    return urls
+
+
 class MinIOAdapter:
     """Adapter class to replace Azure Blob Storage with MinIO"""
     
@@ -21,17 +128,20 @@ class MinIOAdapter:
         self.access_key = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
         self.secret_key = os.getenv("MINIO_SECRET_KEY", "changeme123")
         
-        # Initialize MinIO client
+        # Initialize MinIO client; a known region lets presigned URLs be
+        # signed locally instead of looking up the bucket location first
         self.client = Minio(
             self.endpoint,
             access_key=self.access_key,
             secret_key=self.secret_key,
-            secure=False  # Set to True if using HTTPS
+            secure=False,  # Set to True if using HTTPS
+            region=os.getenv("MINIO_REGION", "us-east-1")
         )
         
         # Default bucket
         self.bucket_name = "m365-documents"
         self._ensure_bucket_exists()
+        self.url_cache = PresignedURLCache()
         
         logger.info(f"MinIO adapter initialized - endpoint: {self.endpoint}")
     
@@ -137,18 +247,22 @@ class MinIOAdapter:
             expires: URL expiration time in seconds (default 1 hour)
             
         Returns:
-            str: Presigned URL
+            str: Presigned URL (cached until shortly before it expires)
         """
-        try:
-            url = self.client.presigned_get_object(
-                self.bucket_name,
-                blob_name,
-                expires=timedelta(seconds=expires)
-            )
-            return url
-        except S3Error as e:
-            logger.error(f"Error generating presigned URL: {e}")
-            return None
+        return self.get_file_urls([blob_name], expires)[blob_name]
+
+    def get_file_urls(self, blob_names: Iterable[str], expires: int = 3600) -> Dict[str, Optional[str]]:
+        """
+        Get presigned URLs for many files at once
+        
+        Args:
+            blob_names: Object names
+            expires: URL expiration time in seconds (default 1 hour)
+            
+        Returns:
+            dict: Object name -> presigned URL (None if signing failed)
+        """
+        return sign_urls(self.client, self.bucket_name, blob_names, expires, self.url_cache)
     
     def delete_file(self, blob_name: str) -> bool:
         """
@@ -162,12 +276,36 @@ class MinIOAdapter:
         """
         try:
             self.client.remove_object(self.bucket_name, blob_name)
+            self.url_cache.invalidate(self.bucket_name, blob_name)
             logger.info(f"Deleted {blob_name} from MinIO")
             return True
         except S3Error as e:
             logger.error(f"Error deleting {blob_name}: {e}")
             return False
     
+    def iter_files(self, prefix: str = "") -> Iterator[str]:
+        """
+        Iterate over object names in MinIO with optional prefix
+
+        Names are yielded as listing pages arrive instead of being collected
+        into one list first.
+
+        Args:
+            prefix: Optional prefix to filter objects
+
+        Yields:
+            str: Object names
+        """
+        try:
+            for obj in self.client.list_objects(
+                self.bucket_name,
+                prefix=prefix,
+                recursive=True
+            ):
+                yield obj.object_name
+        except S3Error as e:
+            logger.error(f"Error listing files: {e}")
+
     def list_files(self, prefix: str = "") -> list:
         """
         List files in MinIO with optional prefix
@@ -178,16 +316,435 @@ class MinIOAdapter:
         Returns:
             list: List of object names
         """
+        return list(self.iter_files(prefix))
+
+
+class AsyncMinIOAdapter:
+    """
+    Asyncio adapter for MinIO, for use from async indexers
+
+    The MinIO SDK is blocking, so calls run on a dedicated thread pool that
+    is sized together with the HTTP connection pool. A semaphore bounds the
+    operations in flight, so callers can gather() freely. Large files are
+    uploaded as multipart with parts sent in parallel.
+
+    Example:
+        storage = AsyncMinIOAdapter()
+        await storage.upload_file(path, "sharepoint/site/file.pdf", metadata)
+        async for name in storage.iter_files("sharepoint/"):
+            ...
+        storage.close()
+    """
+
+    def __init__(self, bucket_name: Optional[str] = None, max_concurrency: Optional[int] = None):
+        from config_manager import get_config_manager
+
+        minio_config = get_config_manager().get_minio_config()
+
+        self.endpoint = minio_config.get('endpoint', 'minio:9000')
+        self.bucket_name = bucket_name or minio_config.get('bucket', 'm365-documents')
+        self.max_concurrency = max_concurrency or minio_config.get('max_concurrency', 16)
+        self.part_size = minio_config.get('part_size_mb', 16) * 1024 * 1024
+        self.parallel_uploads = minio_config.get('parallel_uploads', 4)
+        self.list_shards = minio_config.get('list_shards', 8)
+
+        # Every operation may run parallel_uploads part uploads; block instead
+        # of opening throwaway connections when the pool is exhausted
+        pool_size = minio_config.get('pool_size', self.max_concurrency * self.parallel_uploads)
+        http_client = urllib3.PoolManager(
+            num_pools=4,
+            maxsize=pool_size,
+            block=True,
+            timeout=urllib3.Timeout(connect=10, read=300),
+            retries=urllib3.Retry(
+                total=5,
+                backoff_factor=0.2,
+                status_forcelist=[500, 502, 503, 504]
+            )
+        )
+
+        self.client = Minio(
+            self.endpoint,
+            access_key=minio_config.get('access_key', 'minioadmin'),
+            secret_key=minio_config.get('secret_key', 'changeme123'),
+            secure=minio_config.get('secure', False),
+            region=minio_config.get('region', 'us-east-1'),
+            http_client=http_client
+        )
+
+        self.url_expiry = minio_config.get('url_expiry_seconds', 3600)
+        self.url_cache = PresignedURLCache(
+            max_entries=minio_config.get('url_cache_size', 10000),
+            refresh_margin=minio_config.get('url_refresh_margin_seconds', 600)
+        )
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix='minio'
+        )
+        # Listing threads block on the consumer; they get their own pool so
+        # they can never starve the operations the consumer is waiting for
+        self._list_executor = ThreadPoolExecutor(
+            max_workers=self.list_shards, thread_name_prefix='minio-list'
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket_ready = False
+
+        logger.info(
+            f"Async MinIO adapter initialized - endpoint: {self.endpoint}, "
+            f"concurrency: {self.max_concurrency}, pool: {pool_size}"
+        )
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking SDK call on the adapter's thread pool"""
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs)
+            )
+
+    async def _ensure_bucket_exists(self):
+        """Ensure the bucket exists (checked once per adapter)"""
+        if self._bucket_ready:
+            return
+
+        try:
+            if not await self._run(self.client.bucket_exists, self.bucket_name):
+                await self._run(self.client.make_bucket, self.bucket_name)
+                logger.info(f"Created bucket: {self.bucket_name}")
+        except S3Error as e:
+            # Another worker may have created it concurrently
+            if e.code != 'BucketAlreadyOwnedByYou':
+                logger.error(f"Error ensuring bucket exists: {e}")
+                raise
+
+        self._bucket_ready = True
+
+    @staticmethod
+    def _metadata(metadata: Optional[dict]) -> Optional[dict]:
+        if not metadata:
+            return None
+        return {k: str(v) for k, v in metadata.items() if v is not None}
+
+    async def upload_file(
+        self,
+        file_path: str,
+        blob_name: str,
+        metadata: Optional[dict] = None,
+        content_type: str = 'application/octet-stream'
+    ) -> bool:
+        """
+        Upload a file to MinIO (multipart with parallel parts when large)
+
+        Returns:
+            bool: True if successful
+        """
+        await self._ensure_bucket_exists()
+
         try:
-            objects = self.client.list_objects(
+            await self._run(
+                self.client.fput_object,
                 self.bucket_name,
-                prefix=prefix,
-                recursive=True
+                blob_name,
+                file_path,
+                content_type=content_type,
+                metadata=self._metadata(metadata),
+                part_size=self.part_size,
+                num_parallel_uploads=self.parallel_uploads
             )
-            return [obj.object_name for obj in objects]
+            logger.info(f"Uploaded {blob_name} to MinIO")
+            return True
         except S3Error as e:
-            logger.error(f"Error listing files: {e}")
-            return []
+            logger.error(f"Error uploading {blob_name}: {e}")
+            return False
+
+    async def upload_bytes(
+        self,
+        data: bytes,
+        blob_name: str,
+        metadata: Optional[dict] = None,
+        content_type: str = 'application/octet-stream'
+    ) -> bool:
+        """
+        Upload an in-memory object to MinIO
+
+        Returns:
+            bool: True if successful
+        """
+        await self._ensure_bucket_exists()
+
+        try:
+            await self._run(
+                self.client.put_object,
+                self.bucket_name,
+                blob_name,
+                io.BytesIO(data),
+                len(data),
+                content_type=content_type,
+                metadata=self._metadata(metadata),
+                part_size=self.part_size,
+                num_parallel_uploads=self.parallel_uploads
+            )
+            return True
+        except S3Error as e:
+            logger.error(f"Error uploading {blob_name}: {e}")
+            return False
+
+    async def upload_files(
+        self, uploads: Iterable[Tuple[str, str, Optional[dict]]]
+    ) -> dict:
+        """
+        Upload many files concurrently
+
+        Args:
+            uploads: (file_path, blob_name, metadata) tuples
+
+        Returns:
+            dict: Counts of uploaded and failed files
+        """
+        results = await asyncio.gather(*(
+            self.upload_file(file_path, blob_name, metadata)
+            for file_path, blob_name, metadata in uploads
+        ))
+        uploaded = sum(1 for ok in results if ok)
+        return {"uploaded": uploaded, "failed": len(results) - uploaded}
+
+    async def download_file(self, blob_name: str, download_path: str) -> bool:
+        """
+        Download a file from MinIO
+
+        Returns:
+            bool: True if successful
+        """
+        try:
+            await self._run(
+                self.client.fget_object, self.bucket_name, blob_name, download_path
+            )
+            logger.info(f"Downloaded {blob_name} from MinIO")
+            return True
+        except S3Error as e:
+            logger.error(f"Error downloading {blob_name}: {e}")
+            return False
+
+    async def file_exists(self, blob_name: str) -> bool:
+        """Check if a file exists in MinIO"""
+        try:
+            await self._run(self.client.stat_object, self.bucket_name, blob_name)
+            return True
+        except S3Error:
+            return False
+
+    async def stat_file(self, blob_name: str) -> Optional[dict]:
+        """
+        Get size, content type and user metadata of a file
+
+        Returns:
+            dict or None if the object does not exist
+        """
+        try:
+            obj = await self._run(self.client.stat_object, self.bucket_name, blob_name)
+        except S3Error:
+            return None
+
+        meta_prefix = 'x-amz-meta-'
+        return {
+            'size': obj.size,
+            'etag': obj.etag,
+            'content_type': obj.content_type,
+            'last_modified': obj.last_modified,
+            'metadata': {
+                key[len(meta_prefix):].lower(): value
+                for key, value in (obj.metadata or {}).items()
+                if key.lower().startswith(meta_prefix)
+            }
+        }
+
+    async def get_file_url(self, blob_name: str, expires: Optional[int] = None) -> Optional[str]:
+        """Get a presigned URL for a file (cached until shortly before it expires)"""
+        return (await self.get_file_urls([blob_name], expires))[blob_name]
+
+    async def get_file_urls(
+        self, blob_names: Iterable[str], expires: Optional[int] = None
+    ) -> Dict[str, Optional[str]]:
+        """
+        Get presigned URLs for many files at once
+
+        Cached URLs are returned without leaving the event loop; the misses
+        are signed together in a single executor call.
+
+        Returns:
+            dict: Object name -> presigned URL (None if signing failed)
+        """
+        expires = expires or self.url_expiry
+        urls: Dict[str, Optional[str]] = {}
+        for blob_name in blob_names:
+            if blob_name not in urls:
+                urls[blob_name] = self.url_cache.get(self.bucket_name, blob_name, expires)
+
+        missing = [name for name, url in urls.items() if url is None]
+        if missing:
+            urls.update(await self._run(
+                presign_urls, self.client, self.bucket_name, missing, expires, self.url_cache
+            ))
+        return urls
+
+    async def delete_file(self, blob_name: str) -> bool:
+        """
+        Delete a file from MinIO
+
+        Returns:
+            bool: True if successful
+        """
+        try:
+            await self._run(self.client.remove_object, self.bucket_name, blob_name)
+            self.url_cache.invalidate(self.bucket_name, blob_name)
+            logger.info(f"Deleted {blob_name} from MinIO")
+            return True
+        except S3Error as e:
+            logger.error(f"Error deleting {blob_name}: {e}")
+            return False
+
+    def _remove_batch(self, names: list) -> list:
+        # remove_objects is lazy: errors only arrive while iterating
+        return list(self.client.remove_objects(
+            self.bucket_name, (DeleteObject(name) for name in names)
+        ))
+
+    async def delete_files(self, blob_names: Iterable[str]) -> dict:
+        """
+        Delete many files with multi-object delete requests
+
+        Args:
+            blob_names: Object names (any iterable, consumed in batches)
+
+        Returns:
+            dict: Counts of deleted and failed objects
+        """
+        batches, batch = [], []
+        for name in blob_names:
+            batch.append(name)
+            if len(batch) >= DELETE_BATCH_SIZE:
+                batches.append(batch)
+                batch = []
+        if batch:
+            batches.append(batch)
+
+        deleted, failed = 0, 0
+        results = await asyncio.gather(
+            *(self._run(self._remove_batch, names) for names in batches),
+            return_exceptions=True
+        )
+        for names, errors in zip(batches, results):
+            for name in names:
+                self.url_cache.invalidate(self.bucket_name, name)
+            if isinstance(errors, Exception):
+                logger.error(f"Error deleting {len(names)} objects: {errors}")
+                failed += len(names)
+                continue
+            for error in errors:
+                logger.error(f"Error deleting {error.name}: {error.message}")
+            failed += len(errors)
+            deleted += len(names) - len(errors)
+
+        logger.info(f"Deleted {deleted} objects from MinIO ({failed} failed)")
+        return {"deleted": deleted, "failed": failed}
+
+    async def _shard_prefixes(self, prefix: str) -> Tuple[list, list]:
+        """Split a prefix into its immediate sub-prefixes and direct objects"""
+        def list_level():
+            shards, objects = [], []
+            for obj in self.client.list_objects(self.bucket_name, prefix=prefix, recursive=False):
+                (shards if obj.is_dir else objects).append(obj.object_name)
+            return shards, objects
+
+        return await self._run(list_level)
+
+    async def iter_files(self, prefix: str = "", shard: bool = True) -> AsyncIterator[str]:
+        """
+        Iterate over object names under a prefix
+
+        With shard=True the prefix is split into its sub-prefixes (sites,
+        users, ...) which are listed concurrently. Names arrive in batches as
+        pages are listed; listing threads pause while the consumer is behind.
+
+        Yields:
+            str: Object names (unordered across shards)
+        """
+        if shard:
+            prefixes, direct = await self._shard_prefixes(prefix)
+            for name in direct:
+                yield name
+        else:
+            prefixes = [prefix]
+
+        if not prefixes:
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        # Batches a listing thread may hand over before the consumer takes them
+        pending = threading.Semaphore(self.list_shards * 2)
+        stop = threading.Event()
+        finished = object()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # Event loop already closed
+                stop.set()
+
+        def hand_over(batch: list) -> bool:
+            while not pending.acquire(timeout=1):
+                if stop.is_set():
+                    return False
+            if stop.is_set():
+                return False
+            put(batch)
+            return True
+
+        def produce(shard_prefix: str):
+            try:
+                batch = []
+                for obj in self.client.list_objects(self.bucket_name, prefix=shard_prefix, recursive=True):
+                    batch.append(obj.object_name)
+                    if len(batch) >= LIST_BATCH_SIZE:
+                        if not hand_over(batch):
+                            return
+                        batch = []
+                if batch:
+                    hand_over(batch)
+            except Exception as e:
+                put(e)
+            finally:
+                put(finished)
+
+        for shard_prefix in prefixes:
+            loop.run_in_executor(self._list_executor, produce, shard_prefix)
+
+        remaining = len(prefixes)
+        try:
+            while remaining:
+                item = await queue.get()
+                if item is finished:
+                    remaining -= 1
+                    continue
+                if isinstance(item, Exception):
+                    # A partial listing must not look complete (callers delete from it)
+                    raise item
+                pending.release()
+                for name in item:
+                    yield name
+        finally:
+            stop.set()
+
+    async def list_files(self, prefix: str = "") -> list:
+        """List files in MinIO with optional prefix"""
+        return [name async for name in self.iter_files(prefix)]
+
+    def close(self):
+        """Shut down the adapter's thread pools"""
+        self._executor.shutdown(wait=False)
+        self._list_executor.shutdown(wait=False)
 
 
 class ElasticsearchAdapter:
@@ -212,7 +769,8 @@ class ElasticsearchAdapter:
         Note: Do NOT await this __init__ - it's synchronous by design.
         """
         self.es_client = es_client
-        self.index_name = "documents"
+        # Writes go through the write alias (see index_versions.py)
+        self.index_name = "documents_write"
         logger.info("Elasticsearch adapter initialized")
     
     async def index_document(
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Time-Partitioned Indices for Mail, Calendar and Teams
+High-volume, time-ordered sources are written to monthly indices
+(m365-exchange-2025.03, m365-calendar-2025.03, ...) instead of the shared
+documents index, so old items stop inflating every query's segment set
+
+A partition is chosen by the item's own date (received / start / created),
+not by ingest time: re-syncs and updates of an item always land in the same
+index, so writes stay idempotent by id. That rules out rollover data
+streams, which only append. Each partition gets
+index.lifecycle.origination_date = the first day of the following month,
+so ILM ages it from when the month is complete:
+
+- hot:  written to, number_of_shards primaries
+- warm: shrink to one shard (writable afterwards for late updates and
+        deletes), forcemerge to one segment
+- cold: moved to data_cold nodes (or left in place on single-node setups)
+- delete (optional)
+
+Every partition joins the "m365-partitions" alias and gets an event_date
+field holding its partition date. The search router picks the partitions
+that overlap a query's date_from/date_to filter and skips the rest.
+
+The index template follows the current documents definition; partitions
+created earlier keep their mapping until they age out.
+
+Usage:
+    python time_partitions.py status
+    python time_partitions.py setup
+"""
+
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from elasticsearch import BadRequestError  # type: ignore
+
+from config_manager import get_config_manager
+from index_versions import index_definitions
+
+logger = logging.getLogger(__name__)
+
+# Sources whose partition date can change (rescheduled meetings); writes
+# remove copies left in other partitions
+MOVABLE_SOURCES = ('calendar',)
+
+_MONTH = re.compile(r'^(\d{4})-(\d{2})')
+
+
+def month_of(value: Any) -> Optional[str]:
+    """'2025-03-14T09:00:00Z' -> '2025.03'; None if the value is not an ISO date"""
+    match = _MONTH.match(str(value or ''))
+    if not match:
+        return None
+    return f"{match.group(1)}.{match.group(2)}"
+
+
+def utc_datetime(date_time: Optional[str], time_zone: Optional[str]) -> Optional[str]:
+    """
+    Graph dateTimeTimeZone -> '2025-03-31T23:30:00Z'
+
+    Event times are local to time_zone; an event at 00:30 on the 1st in a
+    zone ahead of UTC is still in the previous month in UTC, and belongs to
+    that month's partition. Unknown zones (Windows names) are returned
+    unchanged; request UTC with Prefer: outlook.timezone="UTC" to avoid them.
+    """
+    if not date_time:
+        return date_time
+    try:
+        # Graph sends seven fractional digits, fromisoformat takes six
+        local = datetime.fromisoformat(date_time[:26])
+    except ValueError:
+        return date_time
+    if local.tzinfo is None:
+        if not time_zone or time_zone.upper() in ('UTC', 'Z'):
+            zone: Any = timezone.utc
+        else:
+            try:
+                zone = ZoneInfo(time_zone)
+            except (ZoneInfoNotFoundError, ValueError):
+                logger.warning(f"Unknown time zone '{time_zone}', keeping '{date_time}' as is")
+                return date_time
+        local = local.replace(tzinfo=zone)
+    return local.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _next_month_millis(month: str) -> int:
+    year, mon = (int(part) for part in month.split('.'))
+    year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return int(datetime(year, mon, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class TimePartitions:
+    """Monthly indices per source: ILM setup, write routing and search routing"""
+
+    def __init__(self, es_client):
+        config = get_config_manager()
+        partition_config = config.get('elasticsearch.partitions', {})
+
+        self.es_client = es_client
+        self.enabled = partition_config.get('enabled', True)
+        self.prefix = partition_config.get('prefix', 'm365')
+        self.sources: Dict[str, str] = dict(partition_config.get('sources', {}))
+        self.number_of_shards = partition_config.get('number_of_shards', 2)
+        self.policy = partition_config.get('policy', 'm365-partitions')
+        self.warm_after = partition_config.get('warm_after', '30d')
+        self.cold_after = partition_config.get('cold_after', '180d')
+        self.delete_after = partition_config.get('delete_after')
+        self.cache_seconds = partition_config.get('cache_seconds', 300)
+
+        self.read_alias = config.get('elasticsearch.index_prefix', 'documents')
+        self.alias = f"{self.prefix}-partitions"
+        self._name = re.compile(rf'{re.escape(self.prefix)}-(?P<source>[a-z0-9_]+)-(?P<month>\d{{4}}\.\d{{2}})$')
+
+        self._created: set = set()
+        self._known: Optional[Dict[str, Dict[str, str]]] = None
+        self._known_at = 0.0
+
+    def is_partitioned(self, source: Optional[str]) -> bool:
+        return self.enabled and source in self.sources
+
+    def index_name(self, source: str, month: str) -> str:
+        return f"{self.prefix}-{source}-{month}"
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+    def policy_body(self) -> Dict[str, Any]:
+        phases: Dict[str, Any] = {
+            'hot': {'min_age': '0ms', 'actions': {'set_priority': {'priority': 100}}},
+            'warm': {
+                'min_age': self.warm_after,
+                'actions': {
+                    'set_priority': {'priority': 50},
+                    'shrink': {'number_of_shards': 1, 'allow_write_after_shrink': True},
+                    'forcemerge': {'max_num_segments': 1}
+                }
+            },
+            # migrate to data_cold is implicit in the cold phase
+            'cold': {'min_age': self.cold_after, 'actions': {'set_priority': {'priority': 0}}}
+        }
+        if self.delete_after:
+            phases['delete'] = {'min_age': self.delete_after, 'actions': {'delete': {}}}
+        return {'phases': phases}
+
+    def template_body(self) -> Dict[str, Any]:
+        body = json.loads(json.dumps(index_definitions()['documents']['body']))
+        body['mappings']['properties']['event_date'] = {'type': 'date'}
+        body['settings'].update({
+            'number_of_shards': self.number_of_shards,
+            'index.lifecycle.name': self.policy
+        })
+        body['aliases'] = {self.alias: {}}
+        return body
+
+    async def ensure_policy(self):
+        """Create or update the ILM policy and the index template of the partitions"""
+        if not self.enabled:
+            return
+        await self.es_client.ilm.put_lifecycle(name=self.policy, policy=self.policy_body())
+        await self.es_client.indices.put_index_template(
+            name=self.alias,
+            index_patterns=[f"{self.prefix}-{source}-*" for source in self.sources],
+            template=self.template_body(),
+            priority=200
+        )
+        logger.info(f"ILM policy '{self.policy}' and template '{self.alias}' in place")
+
+    async def _ensure_partition(self, name: str, month: str):
+        if name in self._created:
+            return
+        if not await self.es_client.indices.exists(index=name):
+            try:
+                await self.es_client.indices.create(index=name, settings={
+                    'index.lifecycle.origination_date': _next_month_millis(month)
+                })
+                logger.info(f"Created partition '{name}'")
+            except BadRequestError as e:
+                # Created concurrently by another writer
+                if 'resource_already_exists_exception' not in str(e):
+                    raise
+            self._known = None
+        self._created.add(name)
+
+    # ------------------------------------------------------------------
+    # Write routing
+    # ------------------------------------------------------------------
+    async def index_for(self, document: Dict[str, Any]) -> Optional[str]:
+        """
+        Partition a document belongs to, created on first use
+
+        Sets the document's event_date. Returns None for unpartitioned sources
+        and undated items, which go to the documents index.
+        """
+        metadata = document.get('metadata') or {}
+        source = metadata.get('source')
+        if not self.is_partitioned(source):
+            return None
+        date = metadata.get(self.sources[source])
+        month = month_of(date)
+        if not month:
+            return None
+
+        document['event_date'] = date
+        name = self.index_name(source, month)
+        await self._ensure_partition(name, month)
+        return name
+
+    async def locate(self, source: str, doc_id: str) -> List[str]:
+        """
+        Partitions holding a document (by partition name, valid after shrink)
+
+        A search: writes still queued in the bulk writer or not yet refreshed
+        are missed, so writers also record where they put each item.
+        """
+        if not self.is_partitioned(source):
+            return []
+        response = await self.es_client.search(
+            index=f"{self.prefix}-{source}-*",
+            query={'ids': {'values': [doc_id]}},
+            source=False, size=10,
+            ignore_unavailable=True, allow_no_indices=True
+        )
+        names = []
+        for hit in response['hits']['hits']:
+            match = self._name.search(hit['_index'])
+            if match:
+                names.append(self.index_name(match.group('source'), match.group('month')))
+        return names
+
+    # ------------------------------------------------------------------
+    # Search routing
+    # ------------------------------------------------------------------
+    async def partitions(self) -> Dict[str, Dict[str, str]]:
+        """source -> month -> physical index of every partition (cached)"""
+        if self._known is not None and time.time() - self._known_at < self.cache_seconds:
+            return self._known
+
+        known: Dict[str, Dict[str, str]] = {}
+        try:
+            response = await self.es_client.indices.get_alias(name=self.alias)
+        except Exception:
+            response = {}
+        for index in response:
+            # Shrunk partitions are renamed (shrink-xxxx-m365-...); the month is in the suffix
+            match = self._name.search(index)
+            if match:
+                known.setdefault(match.group('source'), {})[match.group('month')] = index
+
+        self._known, self._known_at = known, time.time()
+        return known
+
+    async def search_indices(self, filters: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Indices a search has to cover
+
+        Filters:
+            source: source name or list of names
+            date_from / date_to: ISO dates; partitions outside the range are
+                skipped, and so is the documents index (its items carry no
+                event_date)
+
+        Returns:
+            list: index names; empty if no index can match
+        """
+        filters = filters or {}
+        if not self.enabled:
+            return [self.read_alias]
+
+        sources = filters.get('source')
+        if isinstance(sources, str):
+            sources = [sources]
+        date_from = month_of(filters.get('date_from'))
+        date_to = month_of(filters.get('date_to'))
+        dated = bool(date_from or date_to)
+
+        indices = []
+        if not dated and (not sources or any(s not in self.sources for s in sources)):
+            indices.append(self.read_alias)
+
+        known = await self.partitions()
+        for source in (sources or self.sources):
+            for month, index in sorted(known.get(source, {}).items()):
+                if (date_from and month < date_from) or (date_to and month > date_to):
+                    continue
+                indices.append(index)
+        return indices
+
+    async def status(self) -> List[Dict[str, Any]]:
+        """Partitions with their ILM phase, size and document count"""
+        known = await self.partitions()
+        indices = [index for months in known.values() for index in months.values()]
+        if not indices:
+            return []
+        explain = await self.es_client.ilm.explain_lifecycle(index=','.join(indices))
+        stats = await self.es_client.indices.stats(index=','.join(indices), metric='docs,store')
+
+        rows = []
+        for source, months in sorted(known.items()):
+            for month, index in sorted(months.items()):
+                ilm = explain['indices'].get(index, {})
+                primaries = stats['indices'].get(index, {}).get('primaries', {})
+                rows.append({
+                    'source': source,
+                    'month': month,
+                    'index': index,
+                    'phase': ilm.get('phase'),
+                    'action': ilm.get('action'),
+                    'docs': primaries.get('docs', {}).get('count'),
+                    'size_bytes': primaries.get('store', {}).get('size_in_bytes')
+                })
+        return rows
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description='Time-partitioned indices')
+    parser.add_argument('command', choices=['status', 'setup'])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from elasticsearch import AsyncElasticsearch  # type: ignore
+
+    es_config = get_config_manager().get_elasticsearch_config()
+    es_client = AsyncElasticsearch(
+        hosts=[f"http://{es_config['host']}:{es_config['port']}"],
+        basic_auth=(es_config['user'], es_config['password']),
+        verify_certs=False
+    )
+    try:
+        partitions = TimePartitions(es_client)
+        if not partitions.enabled:
+            print("ℹ️  Time partitions are disabled (ES_TIME_PARTITIONS=false)")
+            return 0
+        if args.command == 'setup':
+            await partitions.ensure_policy()
+            print(f"✅ Policy '{partitions.policy}' and template '{partitions.alias}' updated")
+            return 0
+
+        rows = await partitions.status()
+        if not rows:
+            print("ℹ️  No partitions yet")
+            return 0
+        print(f"{'index':40} {'phase':6} {'action':10} {'docs':>10} {'size':>9}")
+        for row in rows:
+            print(f"{row['index']:40} {row['phase'] or '-':6} {row['action'] or '-':10} "
+                  f"{row['docs'] or 0:10d} {(row['size_bytes'] or 0) / 2**20:6.0f} MB")
+        return 0
+    finally:
+        await es_client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,112 @@
+"""
+Vector Field Settings
+dense_vector mappings for content and image embeddings, built from the
+rag.vectors config: HNSW quantization (index_options) and Matryoshka
+dimension truncation
+
+Memory needed to keep a field's vectors in the page cache (per vector):
+    hnsw       4 * dims          (float32)
+    int8_hnsw  dims + 4
+    int4_hnsw  dims / 2 + 4
+    bbq_hnsw   dims / 8 + 14     (Elasticsearch 8.16+)
+plus about 4 * m bytes for the HNSW graph. Quantized types keep the float
+vectors on disk for rescoring, but searches only page in the quantized copy.
+"""
+
+import math
+from typing import Dict, Any, List, Optional
+
+from config_manager import get_config_manager
+
+VECTOR_INDEX_TYPES = (
+    'hnsw', 'int8_hnsw', 'int4_hnsw', 'bbq_hnsw',
+    'flat', 'int8_flat', 'int4_flat', 'bbq_flat'
+)
+
+# Index types that take a confidence_interval for scalar quantization
+SCALAR_QUANTIZED_TYPES = ('int8_hnsw', 'int4_hnsw', 'int8_flat', 'int4_flat')
+
+# Models trained so that a prefix of the embedding is itself a usable embedding
+MATRYOSHKA_MODELS = {
+    'text-embedding-3-large': 3072,
+    'text-embedding-3-small': 1536,
+    'nomic-embed-text-v1.5': 768
+}
+
+
+def vector_config(kind: str) -> Dict[str, Any]:
+    """Settings of a vector field ('content' or 'image') with defaults applied"""
+    config = get_config_manager()
+    settings = dict(config.get(f'rag.vectors.{kind}', {}) or {})
+    default_dims = config.get('rag.embedding_dimensions', 1536) if kind == 'content' else 512
+    settings.setdefault('dims', default_dims)
+    settings.setdefault('index_type', 'int8_hnsw')
+    settings.setdefault('m', 16)
+    settings.setdefault('ef_construction', 100)
+    return settings
+
+
+def index_options(index_type: str, m: int = 16, ef_construction: int = 100,
+                  confidence_interval: Optional[float] = None) -> Dict[str, Any]:
+    """index_options of a dense_vector field"""
+    if index_type not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{index_type}', expected one of {VECTOR_INDEX_TYPES}")
+
+    options: Dict[str, Any] = {'type': index_type}
+    if index_type.endswith('_hnsw') or index_type == 'hnsw':
+        options['m'] = m
+        options['ef_construction'] = ef_construction
+    if confidence_interval is not None and index_type in SCALAR_QUANTIZED_TYPES:
+        options['confidence_interval'] = confidence_interval
+    return options
+
+
+def dense_vector_mapping(kind: str) -> Dict[str, Any]:
+    """dense_vector mapping of a vector field from config"""
+    settings = vector_config(kind)
+    return {
+        "type": "dense_vector",
+        "dims": settings['dims'],
+        "index": True,
+        "similarity": "cosine",
+        "index_options": index_options(
+            settings['index_type'], settings['m'], settings['ef_construction'],
+            settings.get('confidence_interval')
+        )
+    }
+
+
+def estimated_vector_memory(num_vectors: int, dims: int, index_type: str, m: int = 16) -> int:
+    """Bytes of page cache a field needs for fast kNN search (see module docstring)"""
+    per_vector = {
+        'hnsw': 4 * dims,
+        'flat': 4 * dims,
+        'int8_hnsw': dims + 4,
+        'int8_flat': dims + 4,
+        'int4_hnsw': math.ceil(dims / 2) + 4,
+        'int4_flat': math.ceil(dims / 2) + 4,
+        'bbq_hnsw': math.ceil(dims / 8) + 14,
+        'bbq_flat': math.ceil(dims / 8) + 14
+    }[index_type]
+    graph = 4 * m if 'hnsw' in index_type else 0
+    return num_vectors * (per_vector + graph)
+
+
+def truncate_embedding(vector: List[float], dims: int, model: Optional[str] = None) -> List[float]:
+    """
+    Shorten an embedding to the index dimensions
+
+    Only valid for Matryoshka models, whose leading dimensions carry the most
+    information; the prefix is re-normalized to unit length. For OpenAI
+    text-embedding-3 models, prefer requesting `dimensions` from the API.
+    """
+    if len(vector) == dims:
+        return vector
+    if len(vector) < dims:
+        raise ValueError(f"Embedding has {len(vector)} dimensions, index expects {dims}")
+    if model and model not in MATRYOSHKA_MODELS:
+        raise ValueError(f"{model} is not a Matryoshka model; its embeddings cannot be truncated")
+
+    prefix = vector[:dims]
+    norm = math.sqrt(sum(x * x for x in prefix)) or 1.0
+    return [x / norm for x in prefix]
@@ -76,7 +76,32 @@ CREATE TABLE IF NOT EXISTS search_queries (
     num_results INTEGER,
     took_ms INTEGER,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    filters JSONB
+    filters JSONB,
+    result_sources JSONB
+);
+
+-- Per-source hit counts of each search (read by the M365 sync scheduler)
+ALTER TABLE search_queries ADD COLUMN IF NOT EXISTS result_sources JSONB;
+
+-- Content-addressed MinIO objects (objects/<2 hex>/<sha256>) and their references
+-- (also created on demand by api/content_store.py)
+CREATE TABLE IF NOT EXISTS blob_objects (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    content_type VARCHAR(255),
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS blob_refs (
+    source VARCHAR(50) NOT NULL,
+    m365_id VARCHAR(255) NOT NULL,
+    path TEXT,
+    sha256 CHAR(64) NOT NULL REFERENCES blob_objects(sha256),
+    source_hash VARCHAR(255),
+    metadata JSONB,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, m365_id)
 );
 
 -- Create indexes
@@ -101,6 +126,9 @@ CREATE INDEX IF NOT EXISTS idx_audit_logs_created_at ON audit_logs(created_at);
 CREATE INDEX IF NOT EXISTS idx_search_queries_user_id ON search_queries(user_id);
 CREATE INDEX IF NOT EXISTS idx_search_queries_created_at ON search_queries(created_at);
 
+CREATE INDEX IF NOT EXISTS idx_blob_refs_sha256 ON blob_refs(sha256);
+CREATE INDEX IF NOT EXISTS idx_blob_refs_path ON blob_refs(path);
+
 -- Create default admin user (password: admin - CHANGE IN PRODUCTION!)
 INSERT INTO users (username, email, hashed_password, full_name, is_admin)
 VALUES (
@@ -0,0 +1,251 @@
+"""
+Offline tests for bulk-load mode's shared lease and finishing claim
+Run with: pytest test_bulk_load.py -v
+
+An in-memory fake stands in for Elasticsearch: the state document honors
+op_type=create and if_seq_no/if_primary_term like the real index API.
+"""
+
+import sys
+import copy
+import time
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from elasticsearch import NotFoundError, ConflictError  # type: ignore
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+import bulk_load  # noqa: E402
+from bulk_load import BulkLoadMode, recover_bulk_loads  # noqa: E402
+
+ORIGINAL_SETTINGS = {'refresh_interval': '1s', 'number_of_replicas': '1', 'translog.durability': 'request'}
+LOAD_SETTINGS = {'refresh_interval': '-1', 'number_of_replicas': 0, 'translog.durability': 'async'}
+
+
+def _api_error(error_class, status: int):
+    return error_class(f'{status}', SimpleNamespace(status=status), {})
+
+
+class FakeIndices:
+    def __init__(self, client: 'FakeElasticsearch'):
+        self.client = client
+        self.settings = dict(ORIGINAL_SETTINGS)
+        self.calls = []
+        # Set to block refresh() until the test releases it
+        self.refresh_gate = None
+
+    async def exists(self, index):
+        return index in self.client.state_indices
+
+    async def create(self, index, body):
+        self.client.state_indices.add(index)
+
+    async def get_settings(self, index):
+        return {'documents-v1': {'settings': {'index': dict(self.settings)}}}
+
+    async def put_settings(self, index, settings):
+        self.calls.append(('put_settings', dict(settings)))
+        for name, value in settings.items():
+            name = name[len('index.'):]
+            if value is None:
+                self.settings.pop(name, None)
+            else:
+                self.settings[name] = value
+
+    async def refresh(self, index):
+        self.calls.append(('refresh', index))
+        if self.refresh_gate:
+            await self.refresh_gate.wait()
+
+    async def forcemerge(self, index, **kwargs):
+        self.calls.append(('forcemerge', kwargs))
+
+
+class FakeElasticsearch:
+    """State documents with sequence numbers, and one index's settings"""
+
+    def __init__(self):
+        self.documents = {}
+        self.seq_no = 0
+        self.state_indices = set()
+        self.indices = FakeIndices(self)
+
+    def options(self, **kwargs):
+        return self
+
+    async def get(self, index, id):
+        if (index, id) not in self.documents:
+            raise _api_error(NotFoundError, 404)
+        seq_no, doc = self.documents[(index, id)]
+        return {'_source': copy.deepcopy(doc), '_seq_no': seq_no, '_primary_term': 1}
+
+    def _check(self, key, op_type=None, if_seq_no=None, if_primary_term=None):
+        current = self.documents.get(key)
+        if op_type == 'create' and current is not None:
+            raise _api_error(ConflictError, 409)
+        if if_seq_no is not None and (current is None or current[0] != if_seq_no or if_primary_term != 1):
+            raise _api_error(ConflictError, 409)
+
+    async def index(self, index, id, document, op_type=None, if_seq_no=None, if_primary_term=None, refresh=None):
+        self._check((index, id), op_type, if_seq_no, if_primary_term)
+        self.seq_no += 1
+        self.documents[(index, id)] = (self.seq_no, copy.deepcopy(document))
+
+    async def delete(self, index, id, if_seq_no=None, if_primary_term=None, refresh=None):
+        if (index, id) not in self.documents:
+            raise _api_error(NotFoundError, 404)
+        self._check((index, id), None, if_seq_no, if_primary_term)
+        del self.documents[(index, id)]
+
+    async def search(self, index, query, size):
+        if index not in self.state_indices:
+            raise _api_error(NotFoundError, 404)
+        return {'hits': {'hits': [
+            {'_id': doc_id, '_source': copy.deepcopy(doc)}
+            for (state_index, doc_id), (_, doc) in self.documents.items() if state_index == index
+        ]}}
+
+    def state(self, index_name='documents'):
+        entry = self.documents.get(('bulk_load_state', index_name))
+        return entry[1] if entry else None
+
+    def update_state(self, index_name='documents', **changes):
+        seq_no, doc = self.documents[('bulk_load_state', index_name)]
+        doc.update(changes)
+        self.seq_no += 1
+        self.documents[('bulk_load_state', index_name)] = (self.seq_no, doc)
+
+
+def _mode(client: FakeElasticsearch, holder: str) -> BulkLoadMode:
+    mode = BulkLoadMode(client, 'documents', holder=holder)
+    mode.state_index = 'bulk_load_state'
+    mode.load_settings = dict(LOAD_SETTINGS)
+    mode.forcemerge = True
+    mode.forcemerge_max_segments = None
+    return mode
+
+
+@pytest.fixture(autouse=True)
+def fast_finish_poll(monkeypatch):
+    monkeypatch.setattr(bulk_load, 'FINISH_POLL_SECONDS', 0.01)
+
+
+class TestBulkLoadMode:
+    """Shared loader lease, restore by the last loader, finishing claims"""
+
+    @pytest.mark.asyncio
+    async def test_overlapping_loaders_share_one_period(self):
+        client = FakeElasticsearch()
+        first, second = _mode(client, 'loader-a'), _mode(client, 'loader-b')
+
+        await first.enter()
+        await second.enter()
+        state = client.state()
+        assert set(state['holders']) == {'loader-a', 'loader-b'}
+        # The second loader keeps the recorded originals, not the bulk settings
+        assert state['original'] == ORIGINAL_SETTINGS
+        assert client.indices.settings == LOAD_SETTINGS
+
+        await first.exit()
+        assert set(client.state()['holders']) == {'loader-b'}
+        assert 'finishing' not in client.state()
+        assert client.indices.settings == LOAD_SETTINGS
+        assert not any(call[0] == 'refresh' for call in client.indices.calls)
+
+        await second.exit()
+        assert client.state() is None
+        assert client.indices.settings == ORIGINAL_SETTINGS
+
+    @pytest.mark.asyncio
+    async def test_last_loader_restores_replicas_last(self):
+        client = FakeElasticsearch()
+        loader = _mode(client, 'loader-a')
+
+        await loader.enter()
+        client.indices.calls.clear()
+        await loader.exit()
+
+        names = [call[0] for call in client.indices.calls]
+        assert names == ['put_settings', 'refresh', 'forcemerge', 'put_settings']
+        assert client.indices.calls[0][1] == {'index.refresh_interval': '1s', 'index.translog.durability': 'request'}
+        assert client.indices.calls[2][1] == {'only_expunge_deletes': True}
+        assert client.indices.calls[3][1] == {'index.number_of_replicas': '1'}
+        assert client.state() is None
+
+    @pytest.mark.asyncio
+    async def test_loader_joining_during_restore_waits(self):
+        client = FakeElasticsearch()
+        first, second = _mode(client, 'loader-a'), _mode(client, 'loader-b')
+        client.indices.refresh_gate = asyncio.Event()
+
+        await first.enter()
+        finishing = asyncio.create_task(first.exit())
+        while ('refresh', 'documents') not in client.indices.calls:
+            await asyncio.sleep(0.01)
+        assert client.state()['finishing']['holder'] == 'loader-a'
+
+        joining = asyncio.create_task(second.enter())
+        await asyncio.sleep(0.05)
+        assert not joining.done(), "a new loader must not join while the index is restored"
+
+        client.indices.refresh_gate.set()
+        await asyncio.wait_for(finishing, timeout=5)
+        await asyncio.wait_for(joining, timeout=5)
+
+        # A fresh period: originals recorded after the restore, bulk settings on
+        state = client.state()
+        assert set(state['holders']) == {'loader-b'}
+        assert state['original'] == ORIGINAL_SETTINGS
+        assert client.indices.settings == LOAD_SETTINGS
+
+        await second.exit()
+        assert client.indices.settings == ORIGINAL_SETTINGS
+
+    @pytest.mark.asyncio
+    async def test_expired_claim_is_taken_over(self):
+        client = FakeElasticsearch()
+        first, second = _mode(client, 'loader-a'), _mode(client, 'loader-b')
+        client.indices.refresh_gate = asyncio.Event()
+
+        await first.enter()
+        stalled = asyncio.create_task(first.exit())
+        while ('refresh', 'documents') not in client.indices.calls:
+            await asyncio.sleep(0.01)
+
+        # The finishing loader hangs past its claim; the next loader takes over
+        client.update_state(finishing={'holder': 'loader-a', 'until': time.time() - 1})
+        await asyncio.wait_for(second.enter(), timeout=5)
+        assert 'finishing' not in client.state()
+        assert set(client.state()['holders']) == {'loader-b'}
+
+        # The stalled restore finishes late: it must put the bulk settings
+        # back and leave the state document to the new loader
+        client.indices.refresh_gate.set()
+        await asyncio.wait_for(stalled, timeout=5)
+        assert client.state() is not None
+        assert client.indices.settings == LOAD_SETTINGS
+
+        await second.exit()
+        assert client.state() is None
+        assert client.indices.settings == ORIGINAL_SETTINGS
+
+    @pytest.mark.asyncio
+    async def test_recovery_restores_expired_loaders_only(self):
+        client = FakeElasticsearch()
+        crashed, running = _mode(client, 'loader-a'), _mode(client, 'loader-b')
+
+        await crashed.enter()
+        crashed._heartbeat.cancel()
+        assert await recover_bulk_loads(client) == 0, "a live loader must not be restored"
+
+        client.update_state(holders={'loader-a': time.time() - 1})
+        assert await recover_bulk_loads(client) == 1
+        assert client.state() is None
+        assert client.indices.settings == ORIGINAL_SETTINGS
+
+        await running.enter()
+        await running.exit()
+        assert client.indices.settings == ORIGINAL_SETTINGS
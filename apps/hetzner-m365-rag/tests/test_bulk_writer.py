@@ -0,0 +1,198 @@
+"""
+Offline tests for the shared Elasticsearch bulk writer
+Run with: pytest test_bulk_writer.py -v
+
+A stub async client answers bulk requests, so no Elasticsearch is needed.
+"""
+
+import sys
+import json
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from elasticsearch.serializer import JSONSerializer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+
+from bulk_writer import BulkWriter, DeadLetterStore  # noqa: E402
+
+
+class StubBulkClient:
+    """
+    Answers bulk requests like Elasticsearch does
+
+    Items are applied to `documents` (keyed by id) unless `statuses` holds a
+    status for the id: a list is consumed one response per request (to model
+    429s that clear up), a single int is returned every time.
+    """
+
+    def __init__(self):
+        self.transport = SimpleNamespace(
+            serializers=SimpleNamespace(get_serializer=lambda mimetype: JSONSerializer())
+        )
+        self.documents = {}
+        self.statuses = {}
+        self.requests = []
+        self.error = None
+
+    def options(self, **kwargs):
+        return self
+
+    async def bulk(self, operations, **kwargs):
+        if self.error:
+            raise self.error
+
+        lines = [json.loads(line) for line in operations]
+        self.requests.append(lines)
+        items = []
+        index = 0
+        while index < len(lines):
+            op_type, header = next(iter(lines[index].items()))
+            source = lines[index + 1] if op_type != 'delete' else None
+            index += 1 if op_type == 'delete' else 2
+            doc_id = header['_id']
+
+            status = self.statuses.get(doc_id)
+            if isinstance(status, list):
+                status = status.pop(0) if status else None
+            if status is None:
+                if op_type == 'delete':
+                    status = 200 if self.documents.pop(doc_id, None) is not None else 404
+                else:
+                    self.documents[doc_id] = source
+                    status = 201
+
+            result = {'_index': 'documents-v1', '_id': doc_id, 'status': status}
+            if status >= 400 and status != 404:
+                result['error'] = {'type': 'mapper_parsing_exception', 'reason': f'rejected {doc_id}'}
+            items.append({op_type: result})
+
+        return SimpleNamespace(body={'errors': any(
+            item[op]['status'] >= 300 for item in items for op in item
+        ), 'items': items})
+
+
+def _writer(client: StubBulkClient, tmp_path: Path, **kwargs) -> BulkWriter:
+    kwargs.setdefault('flush_interval', 0.05)
+    writer = BulkWriter(
+        client,
+        index_name='documents-write',
+        dead_letter=DeadLetterStore(str(tmp_path / 'dead_letters.jsonl')),
+        **kwargs
+    )
+    writer.initial_backoff = 0
+    return writer
+
+
+class TestBulkWriter:
+    """Batching, failure matching and dead letters"""
+
+    @pytest.mark.asyncio
+    async def test_partial_failures_are_dead_lettered(self, tmp_path):
+        client = StubBulkClient()
+        client.statuses = {'doc-3': 400, 'doc-7': 400}
+        writer = _writer(client, tmp_path, lanes=2)
+
+        for i in range(10):
+            await writer.index(f'doc-{i}', {'title': f'Document {i}'})
+        # Deleting a document that does not exist is not a failure
+        await writer.delete('missing')
+        await writer.flush()
+
+        assert writer.stats['indexed'] == 8
+        assert writer.stats['failed'] == 2
+        assert writer.stats['deleted'] == 1
+        assert set(client.documents) == {f'doc-{i}' for i in range(10)} - {'doc-3', 'doc-7'}
+
+        entries = await writer.dead_letter.take()
+        assert sorted(entry['action']['_id'] for entry in entries) == ['doc-3', 'doc-7']
+        for entry in entries:
+            # The original action is kept, with its body, for replay
+            assert entry['action']['_source']['title'] == f"Document {entry['action']['_id'][4:]}"
+            assert entry['error']['type'] == 'mapper_parsing_exception'
+
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_rejections_are_retried(self, tmp_path):
+        client = StubBulkClient()
+        client.statuses = {'busy': [429, 429]}
+        writer = _writer(client, tmp_path, lanes=1)
+
+        await writer.index('busy', {'title': 'Busy'})
+        await writer.flush()
+
+        assert client.documents == {'busy': {'title': 'Busy'}}
+        assert writer.stats['failed'] == 0
+        assert writer.dead_letter.count() == 0
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_request_errors_dead_letter_the_batch(self, tmp_path):
+        client = StubBulkClient()
+        client.error = ConnectionError('connection refused')
+        writer = _writer(client, tmp_path, lanes=1)
+
+        await writer.index('a', {'title': 'A'})
+        await writer.delete('b')
+        await writer.flush()
+
+        assert writer.stats['failed'] == 2
+        assert writer.dead_letter.count() == 2
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_replay_requeues_dead_letters(self, tmp_path):
+        client = StubBulkClient()
+        client.statuses = {'doc-1': 400, 'doc-2': 400}
+        writer = _writer(client, tmp_path, lanes=2)
+
+        for i in range(4):
+            await writer.index(f'doc-{i}', {'title': f'Document {i}'})
+        await writer.flush()
+        assert writer.dead_letter.count() == 2
+
+        # Still rejected: the actions go back to the store
+        result = await writer.replay_dead_letters(limit=1)
+        assert result == {'replayed': 1, 'failed': 1, 'remaining': 2}
+
+        client.statuses = {}
+        result = await writer.replay_dead_letters()
+        assert result == {'replayed': 2, 'failed': 0, 'remaining': 0}
+        assert set(client.documents) == {f'doc-{i}' for i in range(4)}
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_flush_drains_every_lane_in_order(self, tmp_path):
+        client = StubBulkClient()
+        writer = _writer(client, tmp_path, lanes=4, chunk_size=7)
+
+        for i in range(50):
+            await writer.index(f'doc-{i}', {'version': 1})
+        for i in range(0, 50, 2):
+            # Same id, same lane: the update and delete land after the index
+            await writer.index(f'doc-{i}', {'version': 2})
+            await writer.delete(f'doc-{i}')
+        await writer.flush()
+
+        assert set(client.documents) == {f'doc-{i}' for i in range(1, 50, 2)}
+        assert all(document == {'version': 1} for document in client.documents.values())
+        assert writer.get_statistics()['queue_depth'] == 0
+        assert max(len(request) for request in client.requests) <= 7 * 2
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_close_sends_partial_batches(self, tmp_path):
+        client = StubBulkClient()
+        # Batches would otherwise wait a minute for more actions
+        writer = _writer(client, tmp_path, lanes=4, flush_interval=60)
+
+        for i in range(20):
+            await writer.index(f'doc-{i}', {'title': f'Document {i}'})
+        await asyncio.wait_for(writer.close(), timeout=5)
+
+        assert len(client.documents) == 20
+        assert writer.stats['indexed'] == 20
+        assert not writer._workers